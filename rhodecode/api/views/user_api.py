@@ -25,6 +25,8 @@ from rhodecode.api import (
     jsonrpc_method, JSONRPCError, JSONRPCForbidden, JSONRPCValidationError)
 from rhodecode.api.utils import (
     Optional, OAttr, has_superadmin_permission, get_user_or_error, store_update)
+from rhodecode.apps.ssh_support import SshKeyFileChangeEvent
+from rhodecode.events import trigger
 from rhodecode.lib import audit_logger
 from rhodecode.lib.auth import AuthUser, PasswordGenerator
 from rhodecode.lib.exceptions import DefaultUserException
@@ -398,6 +400,9 @@ def update_user(request, apiuser, userid, username=Optional(None),
             'user.edit', action_data={'old_data': old_data},
             user=apiuser)
         Session().commit()
+        if old_data['active'] != user.active:
+            # keys of inactive users don't grant SSH access
+            trigger(SshKeyFileChangeEvent(), request.registry)
         return {
             'msg': 'updated user ID:%s %s' % (user.user_id, user.username),
             'user': user.get_api_data(include_secrets=True)
@@ -467,6 +472,7 @@ def delete_user(request, apiuser, userid):
             user=apiuser)
 
         Session().commit()
+        trigger(SshKeyFileChangeEvent(), request.registry)
         return {
             'msg': 'deleted user ID:%s %s' % (user.user_id, user.username),
             'user': None
@@ -27,7 +27,8 @@ from pyramid.httpexceptions import HTTPFound, HTTPForbidden, HTTPBadRequest
 
 from rhodecode.lib import helpers as h, diffs, rc_cache
 from rhodecode.lib.utils2 import (
-    StrictAttributeDict, str2bool, safe_int, datetime_to_time, safe_unicode)
+    StrictAttributeDict, str2bool, safe_int, datetime_to_time, safe_unicode,
+    sha1_safe)
 from rhodecode.lib.markup_renderer import MarkupRenderer, relative_links
 from rhodecode.lib.vcs.backends.base import EmptyCommit
 from rhodecode.lib.vcs.exceptions import RepositoryRequirementError
@@ -96,6 +97,96 @@ def _format_ref_id_svn(name, raw_id):
     return '%s@%s' % (name, raw_id)
 
 
+README_CACHE_NAMESPACE = 'cache_repo.readme'
+
+
+def render_readme(commit, readme_node):
+    """
+    Returns HTML of `readme_node` of `commit`. Rendered readmes are stored
+    in a region shared by all repositories, by the id of their content and
+    the renderer, so readmes which didn't change between commits or forks
+    are rendered only once.
+    """
+    renderer = MarkupRenderer()
+    render = renderer.get_renderer(readme_node.path)
+    content_id = commit.get_file_id(readme_node.path) or sha1_safe(
+        readme_node.content)
+
+    region = rc_cache.get_or_create_region('cache_repo', README_CACHE_NAMESPACE)
+    cache_key = rc_cache.make_key(
+        region.actual_backend, README_CACHE_NAMESPACE,
+        'readme_html:{}:{}:{}'.format(
+            rc_cache.README_CACHE_VER, render.__name__, content_id))
+
+    def generate_readme_html():
+        log.debug('Rendering README file `%s` of %s', readme_node.path, commit)
+        return render(readme_node.content)
+
+    return region.get_or_create(cache_key, generate_readme_html)
+
+
+def render_readme_or_none(commit, readme_node, relative_urls):
+    log.debug('Found README file `%s` rendering...', readme_node.path)
+    try:
+        html_source = render_readme(commit, readme_node)
+        if relative_urls:
+            return relative_links(html_source, relative_urls)
+        return html_source
+    except Exception:
+        log.exception(
+            "Exception while trying to render the README")
+
+
+def get_readme_data(db_repo, renderer_type, commit_id=None, path='/'):
+    """
+    Returns the rendered README and its filename found at `path` of
+    `commit_id`, or of the landing commit. Results are cached per commit.
+    """
+    log.debug('Looking for README file at path %s', path)
+    if commit_id:
+        landing_commit_id = commit_id
+    else:
+        landing_commit = db_repo.get_landing_commit()
+        if isinstance(landing_commit, EmptyCommit):
+            return None, None
+        landing_commit_id = landing_commit.raw_id
+
+    cache_namespace_uid = 'cache_repo.{}'.format(db_repo.repo_id)
+    region = rc_cache.get_or_create_region('cache_repo', cache_namespace_uid)
+    start = time.time()
+
+    @region.conditional_cache_on_arguments(namespace=cache_namespace_uid)
+    def generate_repo_readme(repo_id, _commit_id, _repo_name, _readme_search_path, _renderer_type):
+        readme_data = None
+        readme_filename = None
+
+        commit = db_repo.get_commit(_commit_id)
+        log.debug("Searching for a README file at commit %s.", _commit_id)
+        readme_node = ReadmeFinder(_renderer_type).search(commit, path=_readme_search_path)
+
+        if readme_node:
+            log.debug('Found README node: %s', readme_node)
+            relative_urls = {
+                'raw': h.route_path(
+                    'repo_file_raw', repo_name=_repo_name,
+                    commit_id=commit.raw_id, f_path=readme_node.path),
+                'standard': h.route_path(
+                    'repo_files', repo_name=_repo_name,
+                    commit_id=commit.raw_id, f_path=readme_node.path),
+            }
+            readme_data = render_readme_or_none(commit, readme_node, relative_urls)
+            readme_filename = readme_node.unicode_path
+
+        return readme_data, readme_filename
+
+    readme_data, readme_filename = generate_repo_readme(
+        db_repo.repo_id, landing_commit_id, db_repo.repo_name, path, renderer_type,)
+    compute_time = time.time() - start
+    log.debug('Repo README for path %s generated and computed in %.4fs',
+              path, compute_time)
+    return readme_data, readme_filename
+
+
 class TemplateArgs(StrictAttributeDict):
     pass
 
@@ -325,62 +416,10 @@ class RepoAppView(BaseAppView):
         return settings.get(settings_key, default)
 
     def _get_readme_data(self, db_repo, renderer_type, commit_id=None, path='/'):
-        log.debug('Looking for README file at path %s', path)
-        if commit_id:
-            landing_commit_id = commit_id
-        else:
-            landing_commit = db_repo.get_landing_commit()
-            if isinstance(landing_commit, EmptyCommit):
-                return None, None
-            landing_commit_id = landing_commit.raw_id
-
-        cache_namespace_uid = 'cache_repo.{}'.format(db_repo.repo_id)
-        region = rc_cache.get_or_create_region('cache_repo', cache_namespace_uid)
-        start = time.time()
-
-        @region.conditional_cache_on_arguments(namespace=cache_namespace_uid)
-        def generate_repo_readme(repo_id, _commit_id, _repo_name, _readme_search_path, _renderer_type):
-            readme_data = None
-            readme_filename = None
-
-            commit = db_repo.get_commit(_commit_id)
-            log.debug("Searching for a README file at commit %s.", _commit_id)
-            readme_node = ReadmeFinder(_renderer_type).search(commit, path=_readme_search_path)
-
-            if readme_node:
-                log.debug('Found README node: %s', readme_node)
-                relative_urls = {
-                    'raw': h.route_path(
-                        'repo_file_raw', repo_name=_repo_name,
-                        commit_id=commit.raw_id, f_path=readme_node.path),
-                    'standard': h.route_path(
-                        'repo_files', repo_name=_repo_name,
-                        commit_id=commit.raw_id, f_path=readme_node.path),
-                }
-                readme_data = self._render_readme_or_none(commit, readme_node, relative_urls)
-                readme_filename = readme_node.unicode_path
-
-            return readme_data, readme_filename
-
-        readme_data, readme_filename = generate_repo_readme(
-            db_repo.repo_id, landing_commit_id, db_repo.repo_name, path, renderer_type,)
-        compute_time = time.time() - start
-        log.debug('Repo README for path %s generated and computed in %.4fs',
-                  path, compute_time)
-        return readme_data, readme_filename
+        return get_readme_data(db_repo, renderer_type, commit_id, path)
 
     def _render_readme_or_none(self, commit, readme_node, relative_urls):
-        log.debug('Found README file `%s` rendering...', readme_node.path)
-        renderer = MarkupRenderer()
-        try:
-            html_source = renderer.render(
-                readme_node.content, filename=readme_node.path)
-            if relative_urls:
-                return relative_links(html_source, relative_urls)
-            return html_source
-        except Exception:
-            log.exception(
-                "Exception while trying to render the README")
+        return render_readme_or_none(commit, readme_node, relative_urls)
 
     def get_recache_flag(self):
         for flag_name in ['force_recache', 'force-recache', 'no-cache']:
@@ -389,6 +428,7 @@ class RepoAppView(BaseAppView):
                 return True
         return False
 
+    @classmethod
     def get_commit_preload_attrs(cls):
         pre_load = ['author', 'branch', 'date', 'message', 'parents',
                     'obsolete', 'phase', 'hidden']
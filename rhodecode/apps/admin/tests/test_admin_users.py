@@ -18,9 +18,11 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import mock
 import pytest
 from sqlalchemy.orm.exc import NoResultFound
 
+from rhodecode.apps.ssh_support import SshKeyFileChangeEvent
 from rhodecode.lib import auth
 from rhodecode.lib import helpers as h
 from rhodecode.model.db import User, UserApiKeys, UserEmailMap, Repository
@@ -472,6 +474,33 @@ class TestAdminUsersView(TestController):
         del params['csrf_token']
         assert params == updated_params
 
+    @pytest.mark.parametrize('active, triggered', [
+        (False, True),
+        (True, False),
+    ])
+    def test_deactivation_clears_ssh_key_lookups(
+            self, active, triggered, user_util):
+        self.log_user()
+        usr = user_util.create_user(password='qweqwe')
+        Session().commit()
+
+        params = usr.get_api_data()
+        params.update({
+            'active': active,
+            'password_confirmation': '',
+            'new_password': '',
+            'language': params['language'] or 'en',
+            'csrf_token': self.csrf_token,
+        })
+        with mock.patch('rhodecode.apps.admin.views.users.trigger') as trigger:
+            self.app.post(
+                route_path('user_update', user_id=usr.user_id), params)
+
+        ssh_events = [
+            call for call in trigger.call_args_list
+            if isinstance(call[0][0], SshKeyFileChangeEvent)]
+        assert bool(ssh_events) == triggered
+
     def test_update_and_migrate_password(
             self, autologin_user, real_crypto_backend, user_util):
 
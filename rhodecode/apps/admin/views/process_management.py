@@ -72,6 +72,19 @@ class AdminProcessManagementView(BaseAppView):
 
         return proc_list
 
+    def get_worker_stats(self):
+        from rhodecode.lib.shared_stats import get_shared_stats
+
+        shared_stats = get_shared_stats()
+        if not shared_stats:
+            return {}
+        try:
+            workers = shared_stats.read()['workers']
+        except Exception:
+            log.exception('Failed to read shared stats')
+            return {}
+        return dict((worker['pid'], worker) for worker in workers)
+
     def get_workers(self):
         workers = None
         try:
@@ -92,6 +105,7 @@ class AdminProcessManagementView(BaseAppView):
         c.navlist = navigation_list(self.request)
         c.gunicorn_processes = self.get_processes()
         c.gunicorn_workers = self.get_workers()
+        c.worker_stats = self.get_worker_stats()
         return self._get_template_context(c)
 
     @LoginRequired()
@@ -100,6 +114,7 @@ class AdminProcessManagementView(BaseAppView):
         _ = self.request.translate
         c = self.load_default_context()
         c.gunicorn_processes = self.get_processes()
+        c.worker_stats = self.get_worker_stats()
         return self._get_template_context(c)
 
     @LoginRequired()
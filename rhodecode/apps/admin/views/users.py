@@ -332,6 +332,9 @@ class UsersView(UserAppView):
                 user=c.rhodecode_user)
 
             Session().commit()
+            if old_values['active'] != c.user.active:
+                # keys of inactive users don't grant SSH access
+                trigger(SshKeyFileChangeEvent(), self.request.registry)
             h.flash(_('User updated successfully'), category='success')
         except formencode.Invalid as errors:
             data = render(
@@ -460,6 +463,7 @@ class UsersView(UserAppView):
                 user=c.rhodecode_user)
 
             Session().commit()
+            trigger(SshKeyFileChangeEvent(), self.request.registry)
             set_handle_flash_repos()
             set_handle_flash_repo_groups()
             set_handle_flash_user_groups()
@@ -60,5 +60,14 @@ def admin_routes(config):
         route_name='ops_healthcheck', request_method='GET',
         renderer='json_ext')
 
+    config.add_route(
+        name='ops_stats',
+        pattern='/stats')
+    config.add_view(
+        OpsView,
+        attr='ops_stats',
+        route_name='ops_stats', request_method='GET',
+        renderer='json_ext')
+
 def includeme(config):
     config.include(admin_routes, route_prefix=ADMIN_PREFIX + '/ops')
@@ -26,7 +26,7 @@ from pyramid.httpexceptions import HTTPFound
 
 from rhodecode.apps._base import BaseAppView
 from rhodecode.lib import helpers as h
-from rhodecode.lib.auth import LoginRequired
+from rhodecode.lib.auth import LoginRequired, HasPermissionAllDecorator
 from rhodecode.model.db import UserApiKeys
 
 log = logging.getLogger(__name__)
@@ -95,3 +95,17 @@ class OpsView(BaseAppView):
 
         return {'healthcheck': health_spec}
 
+
+    @LoginRequired(auth_token_access=[UserApiKeys.ROLE_HTTP])
+    @HasPermissionAllDecorator('hg.admin')
+    def ops_stats(self):
+        """
+        Request stats of all workers of this instance, read from the shared
+        stats file
+        """
+        from rhodecode.lib.shared_stats import get_shared_stats
+
+        shared_stats = get_shared_stats()
+        if not shared_stats:
+            return {'stats': None, 'error': 'shared stats are disabled'}
+        return {'stats': shared_stats.read()}
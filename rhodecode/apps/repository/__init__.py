@@ -326,6 +326,15 @@ def includeme(config):
         route_name='repo_files_nodelist', request_method='GET',
         renderer='json_ext', xhr=True)
 
+    config.add_route(
+        name='repo_files_nodesearch',
+        pattern='/{repo_name:.*?[^/]}/nodesearch/{commit_id}/{f_path:.*}', repo_route=True)
+    config.add_view(
+        RepoFilesView,
+        attr='repo_nodesearch',
+        route_name='repo_files_nodesearch', request_method='GET',
+        renderer='json_ext', xhr=True)
+
     config.add_route(
         name='repo_file_raw',
         pattern='/{repo_name:.*?[^/]}/raw/{commit_id}/{f_path:.*}', repo_route=True)
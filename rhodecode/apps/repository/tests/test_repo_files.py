@@ -23,11 +23,15 @@ import os
 import mock
 import pytest
 
+import rhodecode
 from rhodecode.apps.repository.tests.test_repo_compare import ComparePage
+from rhodecode.apps.repository.views import repo_files
 from rhodecode.apps.repository.views.repo_files import RepoFilesView
 from rhodecode.lib import helpers as h
 from rhodecode.lib.compat import OrderedDict
 from rhodecode.lib.ext_json import json
+from rhodecode.lib.middleware.response_compression import (
+    PRECOMPRESSED_LEVEL, get_compression_settings)
 from rhodecode.lib.vcs import nodes
 
 from rhodecode.lib.vcs.conf import settings
@@ -61,6 +65,7 @@ def route_path(name, params=None, **kwargs):
         'repo_files:annotated': '/{repo_name}/annotate/{commit_id}/{f_path}',
         'repo_files:annotated_previous': '/{repo_name}/annotate-previous/{commit_id}/{f_path}',
         'repo_files_nodelist': '/{repo_name}/nodelist/{commit_id}/{f_path}',
+        'repo_files_nodesearch': '/{repo_name}/nodesearch/{commit_id}/{f_path}',
         'repo_file_raw': '/{repo_name}/raw/{commit_id}/{f_path}',
         'repo_file_download': '/{repo_name}/download/{commit_id}/{f_path}',
         'repo_file_history': '/{repo_name}/history/{commit_id}/{f_path}',
@@ -367,6 +372,24 @@ class TestFilesViews(object):
         nodes = response.json['nodes']
         assert {'name': 'docs/api/index.rst', 'type': 'file'} in nodes
 
+    def test_tree_search_uncached_uses_configured_compression_level(
+            self, backend, xhr_header):
+        commit = backend.repo.get_commit(commit_idx=173)
+        environ = dict(xhr_header, HTTP_ACCEPT_ENCODING='gzip')
+        with mock.patch.dict(rhodecode.CONFIG, {
+                'rc_cache.cache_repo.expiration_time': '0'}), \
+                mock.patch('rhodecode.apps.repository.views.repo_files.compress',
+                           wraps=repo_files.compress) as compress:
+            response = self.app.get(
+                route_path('repo_files_nodelist',
+                           repo_name=backend.repo_name,
+                           commit_id=commit.raw_id, f_path='/docs/api'),
+                extra_environ=environ)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        level = compress.call_args[0][2]
+        assert level == get_compression_settings(rhodecode.CONFIG)['level']
+        assert level != PRECOMPRESSED_LEVEL
+
     def test_tree_search_at_path_missing_xhr(self, backend):
         self.app.get(
             route_path('repo_files_nodelist',
@@ -374,6 +397,27 @@ class TestFilesViews(object):
                        commit_id='tip', f_path='/docs'),
             status=404)
 
+    def test_node_search(self, backend, xhr_header):
+        commit = backend.repo.get_commit(commit_idx=173)
+        response = self.app.get(
+            route_path('repo_files_nodesearch',
+                       repo_name=backend.repo_name,
+                       commit_id=commit.raw_id, f_path='/docs',
+                       params={'q': 'apiindex', 'limit': 1}),
+            extra_environ=xhr_header)
+        assert response.json['results'] == [{
+            'name': 'docs/api/index.rst', 'type': 'file',
+            'highlight': [5, 6, 7, 9, 10, 11, 12, 13]}]
+        assert response.json['total'] >= 1
+
+    def test_node_search_missing_xhr(self, backend):
+        self.app.get(
+            route_path('repo_files_nodesearch',
+                       repo_name=backend.repo_name,
+                       commit_id='tip', f_path='/',
+                       params={'q': 'docs'}),
+            status=404)
+
     def test_nodetree(self, backend, xhr_header):
         commit = backend.repo.get_commit(commit_idx=173)
         response = self.app.get(
@@ -469,6 +513,42 @@ class TestRawFileHandling(object):
 
         assert response.content_type == "text/plain"
 
+    def test_file_raw_at_commit_is_immutable(self, backend):
+        commit = backend.repo.get_commit(commit_idx=173)
+        url = route_path('repo_file_raw', repo_name=backend.repo_name,
+                         commit_id=commit.raw_id, f_path='vcs/nodes.py')
+        response = self.app.get(url)
+
+        assert 'immutable' in response.headers['Cache-Control']
+        assert response.headers['Accept-Ranges'] == 'bytes'
+        assert response.content_length == len(response.body)
+
+        etag = response.headers['ETag']
+        response = self.app.get(
+            url, headers={'If-None-Match': etag}, status=304)
+        assert response.body == ''
+        assert response.headers['ETag'] == etag
+
+    def test_file_raw_at_branch_is_revalidated(self, backend):
+        response = self.app.get(
+            route_path('repo_file_raw', repo_name=backend.repo_name,
+                       commit_id='tip', f_path='vcs/nodes.py'))
+
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        assert response.headers['ETag']
+
+    def test_download_file_range(self, backend):
+        commit = backend.repo.get_commit(commit_idx=173)
+        url = route_path('repo_file_download', repo_name=backend.repo_name,
+                         commit_id=commit.raw_id, f_path='vcs/nodes.py')
+        full = self.app.get(url).body
+
+        response = self.app.get(
+            url, headers={'Range': 'bytes=100-199'}, status=206)
+        assert response.body == full[100:200]
+        assert response.headers['Content-Range'] == \
+            'bytes 100-199/{}'.format(len(full))
+
     def test_file_raw_binary(self, backend):
         commit = backend.repo.get_commit()
         response = self.app.get(
@@ -36,35 +36,40 @@ from rhodecode.model.db import UserApiKeys, CacheKey
 log = logging.getLogger(__name__)
 
 
-class RepoFeedView(RepoAppView):
-    def load_default_context(self):
-        c = self._get_local_tmpl_context()
-        self._load_defaults()
-        return c
-
-    def _get_config(self):
-        import rhodecode
-        config = rhodecode.CONFIG
-
-        return {
-            'language': 'en-us',
-            'feed_ttl': '5',  # TTL of feed,
-            'feed_include_diff':
-                str2bool(config.get('rss_include_diff', False)),
-            'feed_items_per_page':
-                safe_int(config.get('rss_items_per_page', 20)),
-            'feed_diff_limit':
-                # we need to protect from parsing huge diffs here other way
-                # we can kill the server
-                safe_int(config.get('rss_cut_off_limit', 32 * 1024)),
-        }
-
-    def _load_defaults(self):
-        _ = self.request.translate
-        config = self._get_config()
+def get_feed_config():
+    import rhodecode
+    config = rhodecode.CONFIG
+
+    return {
+        'language': 'en-us',
+        'feed_ttl': '5',  # TTL of feed,
+        'feed_include_diff':
+            str2bool(config.get('rss_include_diff', False)),
+        'feed_items_per_page':
+            safe_int(config.get('rss_items_per_page', 20)),
+        'feed_diff_limit':
+            # we need to protect from parsing huge diffs here other way
+            # we can kill the server
+            safe_int(config.get('rss_cut_off_limit', 32 * 1024)),
+    }
+
+
+class RepoFeedGenerator(object):
+    """
+    Generates the atom and rss feeds of the latest commits of a repository,
+    feeds are cached per head commit unless path permissions apply.
+    """
+
+    def __init__(self, request, db_repo, vcs_repo, path_filter):
+        _ = request.translate
+        config = get_feed_config()
+        self.request = request
+        self.db_repo = db_repo
+        self.vcs_repo = vcs_repo
+        self.path_filter = path_filter
         # common values for feeds
         self.description = _('Changes on %s repository')
-        self.title = _('%s %s feed') % (self.db_repo_name, '%s')
+        self.title = _('%s %s feed') % (db_repo.repo_name, '%s')
         self.language = config["language"]
         self.ttl = config["feed_ttl"]
         self.feed_include_diff = config['feed_include_diff']
@@ -104,10 +109,10 @@ class RepoFeedView(RepoAppView):
 
     def _get_commits(self):
         pre_load = ['author', 'branch', 'date', 'message', 'parents']
-        if self.rhodecode_vcs_repo.is_empty():
+        if self.vcs_repo.is_empty():
             return []
 
-        collection = self.rhodecode_vcs_repo.get_commits(
+        collection = self.vcs_repo.get_commits(
             branch_name=None, show_hidden=False, pre_load=pre_load,
             translate_tags=False)
 
@@ -116,16 +121,33 @@ class RepoFeedView(RepoAppView):
     def uid(self, repo_id, commit_id):
         return '{}:{}'.format(md5_safe(repo_id), md5_safe(commit_id))
 
-    @LoginRequired(auth_token_access=[UserApiKeys.ROLE_FEED])
-    @HasRepoPermissionAnyDecorator(
-        'repository.read', 'repository.write', 'repository.admin')
-    def atom(self):
+    def _fill_feed(self, feed, repo_id, repo_name):
+        for commit in reversed(self._get_commits()):
+            date = self._set_timezone(commit.date)
+            feed.add_item(
+                unique_id=self.uid(repo_id, commit.raw_id),
+                title=self._get_title(commit),
+                author_name=commit.author,
+                description=self._get_description(commit),
+                link=h.route_url(
+                    'repo_commit', repo_name=repo_name,
+                    commit_id=commit.raw_id),
+                pubdate=date,)
+        return feed.content_type, feed.writeString('utf-8')
+
+    def _feed_kwargs(self, feed_type, repo_name):
+        return dict(
+            title=self.title % feed_type,
+            link=h.route_url('repo_summary', repo_name=repo_name),
+            description=self.description % repo_name,
+            language=self.language,
+            ttl=self.ttl
+        )
+
+    def generate(self, feed_type, force_recache=False):
         """
-        Produce an atom-1.0 feed via feedgenerator module
+        Returns the content type and the content of the `atom` or `rss` feed
         """
-        self.load_default_context()
-        force_recache = self.get_recache_flag()
-
         cache_namespace_uid = 'cache_repo_feed.{}'.format(self.db_repo.repo_id)
         condition = not (self.path_filter.is_enabled or force_recache)
         region = rc_cache.get_or_create_region('cache_repo', cache_namespace_uid)
@@ -133,36 +155,51 @@ class RepoFeedView(RepoAppView):
         @region.conditional_cache_on_arguments(namespace=cache_namespace_uid,
                                                condition=condition)
         def generate_atom_feed(repo_id, _repo_name, _commit_id, _feed_type):
-            feed = Atom1Feed(
-                title=self.title % 'atom',
-                link=h.route_url('repo_summary', repo_name=_repo_name),
-                description=self.description % _repo_name,
-                language=self.language,
-                ttl=self.ttl
-            )
-
-            for commit in reversed(self._get_commits()):
-                date = self._set_timezone(commit.date)
-                feed.add_item(
-                    unique_id=self.uid(repo_id, commit.raw_id),
-                    title=self._get_title(commit),
-                    author_name=commit.author,
-                    description=self._get_description(commit),
-                    link=h.route_url(
-                        'repo_commit', repo_name=_repo_name,
-                        commit_id=commit.raw_id),
-                    pubdate=date,)
-
-            return feed.content_type, feed.writeString('utf-8')
+            feed = Atom1Feed(**self._feed_kwargs('atom', _repo_name))
+            return self._fill_feed(feed, repo_id, _repo_name)
+
+        @region.conditional_cache_on_arguments(namespace=cache_namespace_uid,
+                                               condition=condition)
+        def generate_rss_feed(repo_id, _repo_name, _commit_id, _feed_type):
+            feed = Rss201rev2Feed(**self._feed_kwargs('rss', _repo_name))
+            return self._fill_feed(feed, repo_id, _repo_name)
+
+        generate_feed = {
+            'atom': generate_atom_feed,
+            'rss': generate_rss_feed,
+        }[feed_type]
 
         commit_id = self.db_repo.changeset_cache.get('raw_id')
-        content_type, feed = generate_atom_feed(
-            self.db_repo.repo_id, self.db_repo.repo_name, commit_id, 'atom')
+        return generate_feed(
+            self.db_repo.repo_id, self.db_repo.repo_name, commit_id, feed_type)
+
+
+class RepoFeedView(RepoAppView):
+    def load_default_context(self):
+        c = self._get_local_tmpl_context()
+        return c
+
+    def _get_feed_response(self, feed_type):
+        self.load_default_context()
+        feed_generator = RepoFeedGenerator(
+            self.request, self.db_repo, self.rhodecode_vcs_repo,
+            self.path_filter)
+        content_type, feed = feed_generator.generate(
+            feed_type, force_recache=self.get_recache_flag())
 
         response = Response(feed)
         response.content_type = content_type
         return response
 
+    @LoginRequired(auth_token_access=[UserApiKeys.ROLE_FEED])
+    @HasRepoPermissionAnyDecorator(
+        'repository.read', 'repository.write', 'repository.admin')
+    def atom(self):
+        """
+        Produce an atom-1.0 feed via feedgenerator module
+        """
+        return self._get_feed_response('atom')
+
     @LoginRequired(auth_token_access=[UserApiKeys.ROLE_FEED])
     @HasRepoPermissionAnyDecorator(
         'repository.read', 'repository.write', 'repository.admin')
@@ -170,41 +207,4 @@ class RepoFeedView(RepoAppView):
         """
         Produce an rss2 feed via feedgenerator module
         """
-        self.load_default_context()
-        force_recache = self.get_recache_flag()
-
-        cache_namespace_uid = 'cache_repo_feed.{}'.format(self.db_repo.repo_id)
-        condition = not (self.path_filter.is_enabled or force_recache)
-        region = rc_cache.get_or_create_region('cache_repo', cache_namespace_uid)
-
-        @region.conditional_cache_on_arguments(namespace=cache_namespace_uid,
-                                               condition=condition)
-        def generate_rss_feed(repo_id, _repo_name, _commit_id, _feed_type):
-            feed = Rss201rev2Feed(
-                title=self.title % 'rss',
-                link=h.route_url('repo_summary', repo_name=_repo_name),
-                description=self.description % _repo_name,
-                language=self.language,
-                ttl=self.ttl
-            )
-
-            for commit in reversed(self._get_commits()):
-                date = self._set_timezone(commit.date)
-                feed.add_item(
-                    unique_id=self.uid(repo_id, commit.raw_id),
-                    title=self._get_title(commit),
-                    author_name=commit.author,
-                    description=self._get_description(commit),
-                    link=h.route_url(
-                        'repo_commit', repo_name=_repo_name,
-                        commit_id=commit.raw_id),
-                    pubdate=date,)
-            return feed.content_type, feed.writeString('utf-8')
-
-        commit_id = self.db_repo.changeset_cache.get('raw_id')
-        content_type, feed = generate_rss_feed(
-            self.db_repo.repo_id, self.db_repo.repo_name, commit_id, 'rss')
-
-        response = Response(feed)
-        response.content_type = content_type
-        return response
+        return self._get_feed_response('rss')
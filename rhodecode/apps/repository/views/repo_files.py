@@ -21,7 +21,6 @@
 import itertools
 import logging
 import os
-import shutil
 import tempfile
 import collections
 import urllib
@@ -38,8 +37,18 @@ from rhodecode.apps._base import RepoAppView
 
 from rhodecode.lib import diffs, helpers as h, rc_cache
 from rhodecode.lib import audit_logger
+from rhodecode.lib import http_caching
+from rhodecode.lib.path_search import get_path_search
+from rhodecode.lib.archive_cache import (
+    CachedArchive, StreamingArchive, get_archive_cache, get_archive_settings,
+    iter_file)
+from rhodecode.lib.file_tree import FileTreeCache, get_dir_entries
 from rhodecode.lib.view_utils import parse_path_ref
 from rhodecode.lib.exceptions import NonRelativePathError
+from rhodecode.lib.ext_json import json
+from rhodecode.lib.middleware.response_compression import (
+    PRECOMPRESSED_LEVEL, accepts_precompressed, compress,
+    get_compression_settings, precompressed_response)
 from rhodecode.lib.codeblocks import (
     filenode_as_lines_tokens, filenode_as_annotated_lines_tokens)
 from rhodecode.lib.utils2 import (
@@ -61,6 +70,50 @@ from rhodecode.model.db import Repository
 log = logging.getLogger(__name__)
 
 
+def get_file_tree(request, db_repo, tmpl_context, commit_id, f_path,
+                  full_load=False, at_rev=None, force_recache=False):
+    """
+    Renders the file browser tree of `f_path` at `commit_id`, `tmpl_context`
+    needs the commit and the node of the path as `c.commit` and `c.file`.
+    """
+    repo_id = db_repo.repo_id
+
+    cache_seconds = safe_int(
+        rhodecode.CONFIG.get('rc_cache.cache_repo.expiration_time'))
+    cache_on = not force_recache and cache_seconds > 0
+    log.debug(
+        'Computing FILE TREE for repo_id %s commit_id `%s` and path `%s`'
+        'with caching: %s[TTL: %ss]' % (
+            repo_id, commit_id, f_path, cache_on, cache_seconds or 0))
+
+    cache_namespace_uid = 'cache_repo.{}'.format(repo_id)
+    region = rc_cache.get_or_create_region('cache_repo', cache_namespace_uid)
+    entries_cache = None
+    if cache_on:
+        entries_cache = FileTreeCache(
+            region, cache_namespace_uid, rc_cache.FILE_TREE_CACHE_VER)
+
+    @region.conditional_cache_on_arguments(namespace=cache_namespace_uid, condition=cache_on)
+    def compute_file_tree(ver, _name_hash, _repo_id, _commit_id, _f_path, _full_load, _at_rev):
+        log.debug('Generating cached file tree at ver:%s for repo_id: %s, %s, %s',
+                  ver, _repo_id, _commit_id, _f_path)
+
+        c = tmpl_context['c']
+        c.full_load = _full_load
+        c.file_tree_nodes = c.file
+        if _full_load:
+            # sizes and last commits, derived from the nearest cached commit
+            c.file_tree_nodes = get_dir_entries(
+                c.commit, c.file.path, cache=entries_cache)
+        return render(
+            'rhodecode:templates/files/files_browser_tree.mako',
+            tmpl_context, request, _at_rev)
+
+    return compute_file_tree(
+        rc_cache.FILE_TREE_CACHE_VER, db_repo.repo_name_hash,
+        db_repo.repo_id, commit_id, f_path, full_load, at_rev)
+
+
 class RepoFilesView(RepoAppView):
 
     @staticmethod
@@ -250,34 +303,10 @@ class RepoFilesView(RepoAppView):
         return branch_name, sha_commit_id, is_head
 
     def _get_tree_at_commit(self, c, commit_id, f_path, full_load=False, at_rev=None):
-
-        repo_id = self.db_repo.repo_id
-        force_recache = self.get_recache_flag()
-
-        cache_seconds = safe_int(
-            rhodecode.CONFIG.get('rc_cache.cache_repo.expiration_time'))
-        cache_on = not force_recache and cache_seconds > 0
-        log.debug(
-            'Computing FILE TREE for repo_id %s commit_id `%s` and path `%s`'
-            'with caching: %s[TTL: %ss]' % (
-                repo_id, commit_id, f_path, cache_on, cache_seconds or 0))
-
-        cache_namespace_uid = 'cache_repo.{}'.format(repo_id)
-        region = rc_cache.get_or_create_region('cache_repo', cache_namespace_uid)
-
-        @region.conditional_cache_on_arguments(namespace=cache_namespace_uid, condition=cache_on)
-        def compute_file_tree(ver, _name_hash, _repo_id, _commit_id, _f_path, _full_load, _at_rev):
-            log.debug('Generating cached file tree at ver:%s for repo_id: %s, %s, %s',
-                      ver, _repo_id, _commit_id, _f_path)
-
-            c.full_load = _full_load
-            return render(
-                'rhodecode:templates/files/files_browser_tree.mako',
-                self._get_template_context(c), self.request, _at_rev)
-
-        return compute_file_tree(
-            rc_cache.FILE_TREE_CACHE_VER, self.db_repo.repo_name_hash,
-            self.db_repo.repo_id, commit_id, f_path, full_load, at_rev)
+        return get_file_tree(
+            self.request, self.db_repo, self._get_template_context(c),
+            commit_id, f_path, full_load=full_load, at_rev=at_rev,
+            force_recache=self.get_recache_flag())
 
     def _get_archive_spec(self, fname):
         log.debug('Detecting archive spec for: `%s`', fname)
@@ -404,42 +433,54 @@ class RepoFilesView(RepoAppView):
         # remove extension from our archive directory name
         archive_dir_name = response_archive_name[:-len(ext)]
 
+        # archive urls always use the full commit sha, so the archive never
+        # changes, clients which already have it get a 304
+        etag = http_caching.make_etag(commit.raw_id, archive_name)
+        if http_caching.is_not_modified(self.request, etag=etag):
+            return http_caching.not_modified_response(etag=etag, immutable=True)
+
         use_cached_archive = False
-        archive_cache_dir = CONFIG.get('archive_cache_dir')
-        archive_cache_enabled = archive_cache_dir and not self.request.GET.get('no_cache')
-        cached_archive_path = None
-
-        if archive_cache_enabled:
-            # check if we it's ok to write, and re-create the archive cache
-            if not os.path.isdir(CONFIG['archive_cache_dir']):
-                os.makedirs(CONFIG['archive_cache_dir'])
-
-            cached_archive_path = os.path.join(
-                CONFIG['archive_cache_dir'], archive_name)
-            if os.path.isfile(cached_archive_path):
-                log.debug('Found cached archive in %s', cached_archive_path)
-                fd, archive = None, cached_archive_path
-                use_cached_archive = True
-            else:
-                log.debug('Archive %s is not yet cached', archive_name)
+        archive_settings = get_archive_settings(CONFIG)
+        archive_cache = None
+        if archive_settings['cache_dir'] and not self.request.GET.get('no_cache'):
+            archive_cache = get_archive_cache()
+
+        def generate_archive(archive_path):
+            commit.archive_repo(archive_path, archive_dir_name=archive_dir_name,
+                                kind=fileformat, subrepos=subrepos,
+                                archive_at_path=at_path)
 
-        # generate new archive, as previous was not found in the cache
-        if not use_cached_archive:
-            _dir = os.path.abspath(archive_cache_dir) if archive_cache_dir else None
-            fd, archive = tempfile.mkstemp(dir=_dir)
-            log.debug('Creating new temp archive in %s', archive)
+        def get_chunked_archive(archive_path):
             try:
-                commit.archive_repo(archive, archive_dir_name=archive_dir_name,
-                                    kind=fileformat, subrepos=subrepos,
-                                    archive_at_path=at_path)
-            except ImproperArchiveTypeError:
-                return _('Unknown archive type')
-            if archive_cache_enabled:
-                # if we generated the archive and we have cache enabled
-                # let's use this for future
-                log.debug('Storing new archive in %s', cached_archive_path)
-                shutil.move(archive, cached_archive_path)
-                archive = cached_archive_path
+                for data in iter_file(archive_path):
+                    yield data
+            finally:
+                log.debug('Destroying temp archive %s', archive_path)
+                os.remove(archive_path)
+
+        try:
+            if archive_cache:
+                # generated once for all concurrent requests, streamed to
+                # all of them while it's generated
+                app_iter, use_cached_archive = archive_cache.get_archive(
+                    archive_name, generate_archive,
+                    streaming=archive_settings['streaming'])
+            elif archive_settings['streaming']:
+                # send the archive while it's generated
+                app_iter = StreamingArchive(generate_archive)
+                app_iter.start()
+            else:
+                fd, archive = tempfile.mkstemp()
+                os.close(fd)
+                log.debug('Creating new temp archive in %s', archive)
+                try:
+                    generate_archive(archive)
+                except Exception:
+                    os.remove(archive)
+                    raise
+                app_iter = get_chunked_archive(archive)
+        except ImproperArchiveTypeError:
+            return _('Unknown archive type')
 
         # store download action
         audit_logger.store_web(
@@ -453,22 +494,13 @@ class RepoFilesView(RepoAppView):
             commit=True
         )
 
-        def get_chunked_archive(archive_path):
-            with open(archive_path, 'rb') as stream:
-                while True:
-                    data = stream.read(16 * 1024)
-                    if not data:
-                        if fd:  # fd means we used temporary file
-                            os.close(fd)
-                        if not archive_cache_enabled:
-                            log.debug('Destroying temp archive %s', archive_path)
-                            os.remove(archive_path)
-                        break
-                    yield data
-
-        response = Response(app_iter=get_chunked_archive(archive))
+        response = Response(app_iter=app_iter)
         response.content_disposition = str('attachment; filename=%s' % response_archive_name)
         response.content_type = str(content_type)
+        if isinstance(app_iter, CachedArchive):
+            # byte ranges are only served from the stored archive
+            response.content_length = app_iter.size
+        http_caching.set_caching_headers(response, etag=etag, immutable=True)
 
         return response
 
@@ -810,6 +842,18 @@ class RepoFilesView(RepoAppView):
                "filename=\"{}\"; " \
                "filename*=UTF-8\'\'{}".format(safe_path, encoded_path)
 
+    def _get_file_caching(self, commit_id, commit, file_node):
+        """
+        Returns the caching headers of `file_node` at `commit`, requested as
+        `commit_id`. Large files are identified by their own path.
+        """
+        return {
+            'etag': http_caching.make_etag(
+                commit.raw_id, file_node.path, file_node.is_largefile()),
+            'last_modified': commit.date,
+            'immutable': http_caching.is_commit_addressed(commit_id, commit),
+        }
+
     @LoginRequired()
     @HasRepoPermissionAnyDecorator(
         'repository.read', 'repository.write', 'repository.admin')
@@ -824,6 +868,10 @@ class RepoFilesView(RepoAppView):
         commit = self._get_commit_or_redirect(commit_id)
         file_node = self._get_filenode_or_redirect(commit, f_path)
 
+        caching = self._get_file_caching(commit_id, commit, file_node)
+        if http_caching.is_not_modified(self.request, **caching):
+            return http_caching.not_modified_response(**caching)
+
         raw_mimetype_mapping = {
             # map original mimetype to a mimetype used for "show as raw"
             # you can also provide a content-disposition to override the
@@ -867,6 +915,8 @@ class RepoFilesView(RepoAppView):
         response = Response(app_iter=stream_content)
         response.content_disposition = disposition
         response.content_type = mimetype
+        response.content_length = file_node.size
+        http_caching.set_caching_headers(response, **caching)
 
         charset = self._get_default_encoding(c)
         if charset:
@@ -892,6 +942,10 @@ class RepoFilesView(RepoAppView):
                 # overwrite our pointer with the REAL large-file
                 file_node = lf_node
 
+        caching = self._get_file_caching(commit_id, commit, file_node)
+        if http_caching.is_not_modified(self.request, **caching):
+            return http_caching.not_modified_response(**caching)
+
         disposition = self._get_attachement_headers(f_path)
 
         stream_content = file_node.stream_bytes()
@@ -899,6 +953,8 @@ class RepoFilesView(RepoAppView):
         response = Response(app_iter=stream_content)
         response.content_disposition = disposition
         response.content_type = file_node.mimetype
+        response.content_length = file_node.size
+        http_caching.set_caching_headers(response, **caching)
 
         charset = self._get_default_encoding(c)
         if charset:
@@ -906,7 +962,8 @@ class RepoFilesView(RepoAppView):
 
         return response
 
-    def _get_nodelist_at_commit(self, repo_name, repo_id, commit_id, f_path):
+    def _get_nodelist_at_commit(self, repo_name, repo_id, commit_id, f_path,
+                                compressed=False):
 
         cache_seconds = safe_int(
             rhodecode.CONFIG.get('rc_cache.cache_repo.expiration_time'))
@@ -934,6 +991,23 @@ class RepoFilesView(RepoAppView):
 
             return _d + _f
 
+        # the higher level pays off only if the result is compressed once
+        if cache_on:
+            level = PRECOMPRESSED_LEVEL
+        else:
+            level = get_compression_settings(
+                self.request.registry.settings)['level']
+
+        @region.conditional_cache_on_arguments(namespace=cache_namespace_uid, condition=cache_on)
+        def compute_file_search_compressed(_name_hash, _repo_id, _commit_id, _f_path):
+            # whole response body, compressed once per commit, not per request
+            nodes = compute_file_search(_name_hash, _repo_id, _commit_id, _f_path)
+            return compress(json.dumps({'nodes': nodes}), 'gzip', level)
+
+        if compressed:
+            return compute_file_search_compressed(
+                self.db_repo.repo_name_hash, self.db_repo.repo_id, commit_id, f_path)
+
         result = compute_file_search(self.db_repo.repo_name_hash, self.db_repo.repo_id,
                                      commit_id, f_path)
         return filter(lambda n: self.path_filter.path_access_allowed(n['name']), result)
@@ -947,10 +1021,38 @@ class RepoFilesView(RepoAppView):
         commit_id, f_path = self._get_commit_and_path()
         commit = self._get_commit_or_redirect(commit_id)
 
+        # precompressed nodes can be shared only if there are no path permissions
+        if not self.path_filter.permission_checker and \
+                accepts_precompressed(self.request):
+            body = self._get_nodelist_at_commit(
+                self.db_repo_name, self.db_repo.repo_id, commit.raw_id, f_path,
+                compressed=True)
+            return precompressed_response(self.request, body)
+
         metadata = self._get_nodelist_at_commit(
             self.db_repo_name, self.db_repo.repo_id, commit.raw_id, f_path)
         return {'nodes': metadata}
 
+    @LoginRequired()
+    @HasRepoPermissionAnyDecorator(
+        'repository.read', 'repository.write', 'repository.admin')
+    def repo_nodesearch(self):
+        self.load_default_context()
+
+        commit_id, f_path = self._get_commit_and_path()
+        commit = self._get_commit_or_redirect(commit_id)
+        query = self.request.GET.get('q', '')
+        limit = max(1, min(safe_int(self.request.GET.get('limit'), 20), 100))
+
+        def get_paths():
+            return ScmModel().get_commit_paths(self.db_repo, commit, f_path)
+
+        path_search = get_path_search(
+            (self.db_repo.repo_id, commit.raw_id, f_path), get_paths)
+        results, total = path_search.search(
+            query, limit=limit, path_filter=self.path_filter)
+        return {'results': results, 'total': total}
+
     def _create_references(self, branches_or_tags, symbolic_reference, f_path, ref_type):
         items = []
         for name, commit_id in branches_or_tags.items():
@@ -188,7 +188,7 @@ class RepoSummaryView(RepoAppView):
             try:
                 commit = self.db_repo.get_commit(commit_id)
 
-                for node in commit.get_filenodes_generator():
+                for node in commit.get_light_filenodes(pre_load=['size']):
                     size += node.size
                     if not _show_stats:
                         continue
@@ -22,9 +22,12 @@ import logging
 
 from . import config_keys
 from .events import SshKeyFileChangeEvent
-from .subscribers import generate_ssh_authorized_keys_file_subscriber
+from .subscribers import (
+    generate_ssh_authorized_keys_file_subscriber,
+    clear_ssh_key_lookup_cache_subscriber)
 
-from rhodecode.config.middleware import _bool_setting, _string_setting
+from rhodecode.config.utils import (
+    _bool_setting, _string_setting, _int_setting)
 
 log = logging.getLogger(__name__)
 
@@ -45,6 +48,9 @@ def _sanitize_settings_and_apply_defaults(settings):
                     lower=False)
     _string_setting(settings, config_keys.authorized_keys_line_ssh_opts, '',
                     lower=False)
+    _string_setting(settings, config_keys.authorized_keys_generation_mode,
+                    'full')
+    _int_setting(settings, config_keys.authorized_keys_command_cache_ttl, 60)
 
     _string_setting(settings, config_keys.ssh_hg_bin,
                     '~/.rccontrol/vcsserver-1/profile/bin/hg',
@@ -65,3 +71,7 @@ def includeme(config):
     if settings[config_keys.generate_authorized_keyfile]:
         config.add_subscriber(
             generate_ssh_authorized_keys_file_subscriber, SshKeyFileChangeEvent)
+
+    # lookups done by `rc-ssh-authorized-keys` command are cached, flush them
+    config.add_subscriber(
+        clear_ssh_key_lookup_cache_subscriber, SshKeyFileChangeEvent)
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+`AuthorizedKeysCommand` for sshd, resolves a single offered key into an
+authorized_keys entry running the ssh wrapper. Example sshd_config::
+
+    AuthorizedKeysCommand /path/to/rc-ssh-authorized-keys /path/to/rhodecode.ini %t %k
+    AuthorizedKeysCommandUser rhodecode
+"""
+
+import os
+import sys
+import stat
+import time
+import hashlib
+import logging
+import tempfile
+
+import click
+
+log = logging.getLogger(__name__)
+
+
+class KeyLookupCache(object):
+    """
+    Small file based cache of fingerprint lookups, shared between the
+    short-lived command processes. Misses (unknown keys) are cached as well.
+
+    The cached lines grant SSH access, so the cache directory and its entries
+    are only trusted if they are owned by the user running the command, and
+    not writable by anyone else.
+    """
+
+    def __init__(self, cache_dir, ttl):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+
+    def _path(self, fingerprint):
+        return os.path.join(
+            self.cache_dir, hashlib.sha1(fingerprint).hexdigest())
+
+    @staticmethod
+    def _is_private(st):
+        return st.st_uid == os.geteuid() and \
+            not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+    def _is_private_dir(self):
+        try:
+            st = os.lstat(self.cache_dir)
+        except OSError:
+            return False
+        return stat.S_ISDIR(st.st_mode) and self._is_private(st)
+
+    def get(self, fingerprint, key_data=None):
+        """
+        Returns a tuple of (hit, entry line). Entries which don't contain the
+        offered `key_data` aren't used.
+        """
+        if self.ttl <= 0 or not self._is_private_dir():
+            return False, None
+        try:
+            fd = os.open(
+                self._path(fingerprint), os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return False, None
+        with os.fdopen(fd, 'rb') as f:
+            st = os.fstat(fd)
+            if not (stat.S_ISREG(st.st_mode) and self._is_private(st)):
+                log.warning('Ignoring key lookup cache entry of %s, it is not '
+                            'private to this user', fingerprint)
+                return False, None
+            if time.time() - st.st_mtime > self.ttl:
+                return False, None
+            line = f.read()
+        if line and key_data and key_data not in line:
+            return False, None
+        return True, line
+
+    def set(self, fingerprint, line):
+        if self.ttl <= 0:
+            return
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir, 0o700)
+            if not self._is_private_dir():
+                log.warning('Not caching key lookups in %s, it is not private '
+                            'to this user', self.cache_dir)
+                return
+            fd, tmp_path = tempfile.mkstemp('.key_lookup', dir=self.cache_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(line or '')
+            os.rename(tmp_path, self._path(fingerprint))
+        except (OSError, IOError):
+            # the command can run as a different user than the web app
+            log.warning('Failed to store key lookup in %s', self.cache_dir)
+
+
+def get_key_fingerprint(key_type, key_data):
+    from rhodecode.model.ssh_key import SshKeyModel
+    key = SshKeyModel().parse_key('{} {}'.format(key_type, key_data))
+    return key.hash_md5()
+
+
+def lookup_authorized_key_line(settings, ini_path, fingerprint):
+    from rhodecode.apps.ssh_support import config_keys, utils
+    from rhodecode.config.utils import initialize_database
+
+    initialize_database(settings)
+    user_key = utils.get_active_key_by_fingerprint(fingerprint)
+    if not user_key:
+        return ''
+
+    ssh_wrapper_cmd = utils.get_wrapper_cmd(
+        settings[config_keys.wrapper_cmd],
+        settings[config_keys.wrapper_allow_shell],
+        settings[config_keys.enable_debug_logging])
+
+    return utils.format_authorized_key_line(
+        user_key, ssh_wrapper_cmd, ini_path,
+        settings[config_keys.authorized_keys_line_ssh_opts])
+
+
+@click.command()
+@click.argument('ini_path', type=click.Path(exists=True))
+@click.argument('key_type')
+@click.argument('key_data')
+@click.option('--debug', is_flag=True, help='Enabled detailed output logging')
+def main(ini_path, key_type, key_data, debug):
+    from rhodecode.apps.ssh_support import (
+        config_keys, utils, _sanitize_settings_and_apply_defaults)
+    from rhodecode.apps.ssh_support.lib.ssh_wrapper import setup_custom_logging
+    from rhodecode.lib.pyramid_utils import get_app_config
+
+    setup_custom_logging(ini_path, debug)
+    ini_path = os.path.abspath(ini_path)
+
+    try:
+        fingerprint = get_key_fingerprint(key_type, key_data)
+    except Exception:
+        log.warning('Unable to parse offered key of type %s', key_type)
+        sys.exit(0)
+
+    settings = get_app_config(ini_path)
+    _sanitize_settings_and_apply_defaults(settings)
+    # lookups are only cached in the configured cache_dir, never in a shared
+    # location like the system temp directory
+    cache_dir = settings.get('cache_dir')
+    cache_ttl = settings[config_keys.authorized_keys_command_cache_ttl]
+    cache = KeyLookupCache(
+        utils.get_key_lookup_cache_dir(cache_dir or ''),
+        cache_ttl if cache_dir else 0)
+
+    hit, line = cache.get(fingerprint, key_data=key_data)
+    if not hit:
+        try:
+            line = lookup_authorized_key_line(settings, ini_path, fingerprint)
+        except Exception:
+            log.exception('Failed to lookup key with fingerprint %s', fingerprint)
+            sys.exit(1)
+        cache.set(fingerprint, line)
+
+    log.debug('Key lookup for %s, cached: %s, found: %s',
+              fingerprint, hit, bool(line))
+    if line:
+        sys.stdout.write(line)
+    sys.exit(0)
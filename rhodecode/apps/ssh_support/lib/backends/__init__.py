@@ -39,7 +39,7 @@ class SshWrapper(object):
     svn_cmd_pat = re.compile(r'^svnserve -t')
 
     def __init__(self, command, connection_info, mode,
-                 user, user_id, key_id, shell, ini_path, env):
+                 user, user_id, key_id, shell, ini_path, env, slim=False):
         self.command = command
         self.connection_info = connection_info
         self.mode = mode
@@ -49,6 +49,7 @@ class SshWrapper(object):
         self.shell = shell
         self.ini_path = ini_path
         self.env = env
+        self.slim = slim
 
         self.config = self.parse_config(ini_path)
         self.server_impl = None
@@ -137,6 +138,22 @@ class SshWrapper(object):
 
         return vcs_type, repo_name, mode
 
+    def get_user_permissions(self, auth_user, vcs, repo_name):
+        """
+        Returns repository permissions and branch permissions of the given
+        repository. In slim mode only the permission of the accessed repository
+        is computed, using a scoped and cached permission calculation. SVN
+        extracts the repository name later from the input stream, so it
+        always uses the full permission tree.
+        """
+        if self.slim and repo_name and vcs != 'svn':
+            perms = auth_user.permissions_with_scope({'repo_name': repo_name})
+            return perms['repositories'], auth_user.get_branch_permissions(
+                repo_name, perms=perms)
+
+        permissions = auth_user.permissions['repositories']
+        return permissions, auth_user.get_branch_permissions(repo_name)
+
     def serve(self, vcs, repo, mode, user, permissions, branch_permissions):
         store = ScmModel().repos_path
 
@@ -217,8 +234,8 @@ class SshWrapper(object):
                 return exit_code
 
             auth_user = user.AuthUser()
-            permissions = auth_user.permissions['repositories']
-            repo_branch_permissions = auth_user.get_branch_permissions(scm_repo)
+            permissions, repo_branch_permissions = self.get_user_permissions(
+                auth_user, scm_detected, scm_repo)
             try:
                 exit_code, is_updated = self.serve(
                     scm_detected, scm_repo, scm_mode, user, permissions,
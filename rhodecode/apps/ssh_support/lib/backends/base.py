@@ -23,6 +23,7 @@ import sys
 import json
 import logging
 
+from rhodecode.lib import repo_warmup
 from rhodecode.lib.hooks_daemon import prepare_callback_daemon
 from rhodecode.lib.vcs.conf import settings as vcs_settings
 from rhodecode.model.scm import ScmModel
@@ -56,6 +57,7 @@ class VcsServer(object):
         :param repo_name: full repo name, also a cache key
         """
         ScmModel().mark_for_invalidation(repo_name)
+        repo_warmup.schedule_warmup(repo_name)
 
     def has_write_perm(self):
         permission = self.user_permissions.get(self.repo_name)
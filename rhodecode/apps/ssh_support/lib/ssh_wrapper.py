@@ -21,12 +21,21 @@
 import os
 import sys
 import logging
+import contextlib
 
 import click
 
 from pyramid.paster import setup_logging
 
-from rhodecode.lib.pyramid_utils import bootstrap
+import rhodecode
+from rhodecode.config import utils as config_utils
+from rhodecode.lib import rc_cache
+from rhodecode.lib.utils import load_rcextensions
+from rhodecode.lib.utils2 import str2bool
+from rhodecode.lib.vcs import connect_vcs
+from rhodecode.lib.pyramid_utils import (
+    bootstrap, get_app_config, BootstrappedRequest)
+from rhodecode.model import meta
 from .backends import SshWrapper
 
 log = logging.getLogger(__name__)
@@ -46,6 +55,59 @@ def setup_custom_logging(ini_path, debug):
         logger.handlers = [null]
 
 
+def configure_celery(settings, ini_path):
+    """
+    Same celery setup as the one of the web application, so tasks started
+    by the hooks are queued instead of running in the wrapper process.
+    """
+    rhodecode.CELERY_ENABLED = str2bool(settings.get('use_celery'))
+    if rhodecode.CELERY_ENABLED:
+        # celery is imported only when it's used
+        from rhodecode.lib.celerylib.loader import setup_celery_app
+        log.debug('Configuring celery based on `%s` file', ini_path)
+        setup_celery_app(
+            app=None, root=None, request=None, registry=None, closer=None,
+            ini_location=ini_path)
+
+
+@contextlib.contextmanager
+def slim_bootstrap(ini_path, env=None):
+    """
+    Minimal replacement of the pyramid `bootstrap` used in the slim mode.
+    Instead of creating the whole web application it only sets up what the
+    SSH backends need: database, vcs, cache regions, celery and a blank
+    request.
+    """
+    if env:
+        os.environ.update(env)
+
+    settings = dict(get_app_config(ini_path))
+    config_utils._list_setting(settings, 'default_encoding', 'UTF-8')
+    config_utils._sanitize_vcs_settings(settings)
+    config_utils._sanitize_cache_settings(settings)
+
+    config_utils.initialize_database(settings)
+    load_rcextensions(root_path=settings['here'])
+    config_utils.configure_vcs(settings)
+    rc_cache.configure_dogpile_cache(settings)
+
+    rhodecode.PYRAMID_SETTINGS = settings
+    rhodecode.CONFIG = settings
+    rhodecode.CONFIG['default_user_id'] = config_utils.get_default_user_id()
+    configure_celery(settings, ini_path)
+
+    if settings['vcs.server.enable']:
+        connect_vcs(settings['vcs.server'],
+                    config_utils.get_vcs_server_protocol(settings))
+
+    base_url = settings.get('app.base_url') or 'http://rhodecode.local'
+    request = BootstrappedRequest.blank('/', base_url=base_url)
+    try:
+        yield {'request': request, 'registry': None, 'root': None}
+    finally:
+        meta.Session.remove()
+
+
 @click.command()
 @click.argument('ini_path', type=click.Path(exists=True))
 @click.option(
@@ -57,7 +119,9 @@ def setup_custom_logging(ini_path, debug):
 @click.option('--key-id', help='ID of the key from the database')
 @click.option('--shell', '-s', is_flag=True, help='Allow Shell')
 @click.option('--debug', is_flag=True, help='Enabled detailed output logging')
-def main(ini_path, mode, user, user_id, key_id, shell, debug):
+@click.option('--slim', is_flag=True,
+              help='Skip loading the web application, use a minimal environment')
+def main(ini_path, mode, user, user_id, key_id, shell, debug, slim):
     setup_custom_logging(ini_path, debug)
 
     command = os.environ.get('SSH_ORIGINAL_COMMAND', '')
@@ -68,11 +132,13 @@ def main(ini_path, mode, user, user_id, key_id, shell, debug):
             'of this script.')
     connection_info = os.environ.get('SSH_CONNECTION', '')
 
-    with bootstrap(ini_path, env={'RC_CMD_SSH_WRAPPER': '1'}) as env:
+    bootstrap_env = slim_bootstrap if slim else bootstrap
+
+    with bootstrap_env(ini_path, env={'RC_CMD_SSH_WRAPPER': '1'}) as env:
         try:
             ssh_wrapper = SshWrapper(
                 command, connection_info, mode,
-                user, user_id, key_id, shell, ini_path, env)
+                user, user_id, key_id, shell, ini_path, env, slim=slim)
         except Exception:
             log.exception('Failed to execute SshWrapper')
             sys.exit(-5)
@@ -21,7 +21,7 @@
 import logging
 
 
-from .utils import generate_ssh_authorized_keys_file
+from .utils import generate_ssh_authorized_keys_file, clear_key_lookup_cache
 
 
 log = logging.getLogger(__name__)
@@ -34,3 +34,11 @@ def generate_ssh_authorized_keys_file_subscriber(event):
     ssh keys management
     """
     generate_ssh_authorized_keys_file(event.request.registry)
+
+
+def clear_ssh_key_lookup_cache_subscriber(event):
+    """
+    Subscriber to the `SshKeyFileChangeEvent`. Clears the cached key lookups
+    of the `rc-ssh-authorized-keys` AuthorizedKeysCommand.
+    """
+    clear_key_lookup_cache(event.request.registry)
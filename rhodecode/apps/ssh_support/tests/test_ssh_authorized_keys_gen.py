@@ -69,3 +69,106 @@ class TestSshKeyFileGeneration(object):
 
                     if ssh_opts:
                         assert ssh_opts in content
+
+    def test_update_keyfile_incrementally(self, tmpdir):
+        authorized_keys_file_path = os.path.join(str(tmpdir), 'authorized_keys')
+
+        def key(key_id, username):
+            return AttributeDict({
+                'ssh_key_id': key_id,
+                'user': AttributeDict(username=username, user_id=key_id),
+                'ssh_key_data': 'ssh-rsa {}_KEY'.format(username.upper())})
+
+        keys = {1: key(1, 'admin'), 2: key(2, 'user')}
+
+        def get_keys_by_ids(key_ids):
+            return [keys[key_id] for key_id in key_ids]
+
+        def generate(**kwargs):
+            patches = {
+                'get_all_active_keys': mock.Mock(return_value=keys.values()),
+                'get_active_key_ids': mock.Mock(return_value=keys.keys()),
+                'get_active_keys_by_ids': mock.Mock(side_effect=get_keys_by_ids),
+            }
+            patches.update(kwargs)
+            with mock.patch.multiple(
+                    'rhodecode.apps.ssh_support.utils', **patches):
+                utils._update_ssh_authorized_keys_file(
+                    authorized_keys_file_path, '/tmp/sshwrapper.py',
+                    False, None, False)
+            with open(authorized_keys_file_path) as f:
+                return f.read()
+
+        with mock.patch.dict('rhodecode.CONFIG', {'__file__': '/tmp/file.ini'}):
+            # file without options signature, generated fully
+            content = generate()
+            assert 'ADMIN_KEY' in content
+            assert 'USER_KEY' in content
+
+            # nothing changed, file is not touched
+            content = generate(_write_authorized_keys_file=mock.Mock(
+                side_effect=Exception('should not write')))
+
+            del keys[1]
+            keys[3] = key(3, 'new')
+            content = generate(get_all_active_keys=mock.Mock(
+                side_effect=Exception('should not do a full reload')))
+            assert 'ADMIN_KEY' not in content
+            assert 'USER_KEY' in content
+            assert 'NEW_KEY' in content
+            assert '--key-id=3"' in content
+
+
+class TestKeyLookupCache(object):
+
+    def test_cache_hit_and_miss(self, tmpdir):
+        from rhodecode.apps.ssh_support.lib.authorized_keys_command import \
+            KeyLookupCache
+        cache = KeyLookupCache(os.path.join(str(tmpdir), 'cache'), ttl=60)
+
+        assert cache.get('MD5:aa:bb') == (False, None)
+        cache.set('MD5:aa:bb', 'entry-line\n')
+        cache.set('MD5:cc:dd', '')
+        assert cache.get('MD5:aa:bb') == (True, 'entry-line\n')
+        # misses are cached too
+        assert cache.get('MD5:cc:dd') == (True, '')
+
+    def test_cache_entry_of_other_key_is_ignored(self, tmpdir):
+        from rhodecode.apps.ssh_support.lib.authorized_keys_command import \
+            KeyLookupCache
+        cache = KeyLookupCache(os.path.join(str(tmpdir), 'cache'), ttl=60)
+
+        cache.set('MD5:aa:bb', 'command="x" ssh-rsa OTHER_KEY\n')
+        assert cache.get('MD5:aa:bb', key_data='USER_KEY') == (False, None)
+        cache.set('MD5:aa:bb', 'command="x" ssh-rsa USER_KEY\n')
+        assert cache.get('MD5:aa:bb', key_data='USER_KEY') == (
+            True, 'command="x" ssh-rsa USER_KEY\n')
+
+    @pytest.mark.parametrize('mode', [0o777, 0o770])
+    def test_cache_dir_writable_by_others_is_not_trusted(self, tmpdir, mode):
+        from rhodecode.apps.ssh_support.lib.authorized_keys_command import \
+            KeyLookupCache
+        cache_dir = os.path.join(str(tmpdir), 'cache')
+        cache = KeyLookupCache(cache_dir, ttl=60)
+        cache.set('MD5:aa:bb', 'entry-line\n')
+
+        os.chmod(cache_dir, mode)
+        assert cache.get('MD5:aa:bb') == (False, None)
+        cache.set('MD5:cc:dd', 'other-line\n')
+        assert not os.path.exists(cache._path('MD5:cc:dd'))
+
+    def test_cache_entry_writable_by_others_is_not_trusted(self, tmpdir):
+        from rhodecode.apps.ssh_support.lib.authorized_keys_command import \
+            KeyLookupCache
+        cache = KeyLookupCache(os.path.join(str(tmpdir), 'cache'), ttl=60)
+        cache.set('MD5:aa:bb', 'entry-line\n')
+
+        os.chmod(cache._path('MD5:aa:bb'), 0o666)
+        assert cache.get('MD5:aa:bb') == (False, None)
+
+    def test_cache_disabled(self, tmpdir):
+        from rhodecode.apps.ssh_support.lib.authorized_keys_command import \
+            KeyLookupCache
+        cache = KeyLookupCache(os.path.join(str(tmpdir), 'cache'), ttl=0)
+        cache.set('MD5:aa:bb', 'entry-line\n')
+        assert cache.get('MD5:aa:bb') == (False, None)
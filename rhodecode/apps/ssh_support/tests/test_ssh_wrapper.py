@@ -18,8 +18,12 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import mock
 import pytest
 
+import rhodecode
+from rhodecode.apps.ssh_support.lib import ssh_wrapper as ssh_wrapper_module
+
 
 class TestSSHWrapper(object):
 
@@ -52,3 +56,59 @@ class TestSSHWrapper(object):
         ssh_wrapper.command = command
         vcs_type, repo_name, mode = ssh_wrapper.get_repo_details(mode='auto')
         assert vcs_type == vcs
+
+    def test_get_user_permissions_slim_uses_scoped_permissions(self, ssh_wrapper):
+        ssh_wrapper.slim = True
+        auth_user = mock.Mock()
+        auth_user.permissions_with_scope.return_value = {
+            'repositories': {'repo': 'repository.read'},
+            'repository_branches': {}}
+        auth_user.get_branch_permissions.return_value = {}
+
+        permissions, branch_permissions = ssh_wrapper.get_user_permissions(
+            auth_user, 'git', 'repo')
+
+        assert permissions == {'repo': 'repository.read'}
+        auth_user.permissions_with_scope.assert_called_once_with(
+            {'repo_name': 'repo'})
+
+    @pytest.mark.parametrize('slim, vcs', [
+        (False, 'git'),
+        (True, 'svn'),
+    ])
+    def test_get_user_permissions_full_tree(self, ssh_wrapper, slim, vcs):
+        ssh_wrapper.slim = slim
+        auth_user = mock.Mock()
+        auth_user.permissions = {'repositories': {'repo': 'repository.write'}}
+        auth_user.get_branch_permissions.return_value = {}
+
+        permissions, branch_permissions = ssh_wrapper.get_user_permissions(
+            auth_user, vcs, 'repo')
+
+        assert permissions == {'repo': 'repository.write'}
+        assert not auth_user.permissions_with_scope.called
+
+
+@pytest.mark.parametrize('use_celery, enabled', [
+    ('true', True),
+    ('false', False),
+])
+def test_slim_bootstrap_configures_celery(use_celery, enabled):
+    settings = {
+        'here': '/tmp', 'use_celery': use_celery, 'vcs.server.enable': False}
+    module = 'rhodecode.apps.ssh_support.lib.ssh_wrapper.'
+    celery_enabled = rhodecode.CELERY_ENABLED
+    config, pyramid_settings = rhodecode.CONFIG, rhodecode.PYRAMID_SETTINGS
+    try:
+        with mock.patch(module + 'get_app_config', return_value=settings), \
+                mock.patch(module + 'config_utils'), \
+                mock.patch(module + 'load_rcextensions'), \
+                mock.patch(module + 'rc_cache'), \
+                mock.patch('rhodecode.lib.celerylib.loader.setup_celery_app') \
+                as setup_celery_app:
+            with ssh_wrapper_module.slim_bootstrap('/tmp/rhodecode.ini'):
+                assert rhodecode.CELERY_ENABLED is enabled
+        assert setup_celery_app.called is enabled
+    finally:
+        rhodecode.CELERY_ENABLED = celery_enabled
+        rhodecode.CONFIG, rhodecode.PYRAMID_SETTINGS = config, pyramid_settings
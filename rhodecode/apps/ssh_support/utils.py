@@ -19,13 +19,19 @@
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
 import os
+import re
 import stat
+import shutil
+import hashlib
 import logging
 import tempfile
 import datetime
+import collections
+
+from sqlalchemy.orm import contains_eager
 
 from . import config_keys
-from rhodecode.model.db import true, joinedload, User, UserSshKeys
+from rhodecode.model.db import true, User, UserSshKeys
 
 
 log = logging.getLogger(__name__)
@@ -34,32 +40,102 @@ HEADER = \
     "# This file is managed by RhodeCode, please do not edit it manually. # \n" \
     "# Current entries: {}, create date: UTC:{}.\n"
 
+# signature of the options used to generate the entries, if those change
+# the incremental mode falls back to a full re-generation of the file
+OPTIONS_HEADER = "# Options signature: {}\n"
+
 # Default SSH options for authorized_keys file, can be override via .ini
 SSH_OPTS = 'no-pty,no-port-forwarding,no-X11-forwarding,no-agent-forwarding'
 
+LINE_TMPL = '{ssh_opts},command="{wrapper_command} {ini_path} --user-id={user_id} --user={user} --key-id={user_key_id}" {key}\n'
+
+KEY_ID_PAT = re.compile(r' --key-id=(\d+)" ')
+OPTIONS_PAT = re.compile(r'^# Options signature: (\w+)$')
+
+# modes of keeping the authorized_keys file in sync with the database
+GENERATION_MODE_FULL = 'full'
+GENERATION_MODE_INCREMENTAL = 'incremental'
+GENERATION_MODES = [GENERATION_MODE_FULL, GENERATION_MODE_INCREMENTAL]
+
+
+def _active_keys_query():
+    return UserSshKeys.query() \
+        .join(User, User.user_id == UserSshKeys.user_id) \
+        .filter(User.username != User.DEFAULT_USER) \
+        .filter(User.active == true())
+
 
 def get_all_active_keys():
-    result = UserSshKeys.query() \
-        .options(joinedload(UserSshKeys.user)) \
-        .filter(UserSshKeys.user != User.get_default_user()) \
-        .filter(User.active == true()) \
+    result = _active_keys_query() \
+        .options(contains_eager(UserSshKeys.user)) \
         .all()
     return result
 
 
-def _generate_ssh_authorized_keys_file(
-        authorized_keys_file_path, ssh_wrapper_cmd, allow_shell, ssh_opts, debug):
+def get_active_key_ids():
+    result = _active_keys_query() \
+        .with_entities(UserSshKeys.ssh_key_id) \
+        .all()
+    return [row.ssh_key_id for row in result]
 
-    authorized_keys_file_path = os.path.abspath(
-        os.path.expanduser(authorized_keys_file_path))
 
-    import rhodecode
-    all_active_keys = get_all_active_keys()
+def get_active_keys_by_ids(key_ids):
+    if not key_ids:
+        return []
+    result = _active_keys_query() \
+        .options(contains_eager(UserSshKeys.user)) \
+        .filter(UserSshKeys.ssh_key_id.in_(key_ids)) \
+        .all()
+    return result
 
+
+def get_active_key_by_fingerprint(fingerprint):
+    """
+    Resolves an active key by its fingerprint, using the indexed and unique
+    fingerprint column.
+    """
+    return _active_keys_query() \
+        .options(contains_eager(UserSshKeys.user)) \
+        .filter(UserSshKeys.ssh_key_fingerprint == fingerprint) \
+        .first()
+
+
+def get_wrapper_cmd(ssh_wrapper_cmd, allow_shell, debug):
     if allow_shell:
         ssh_wrapper_cmd = ssh_wrapper_cmd + ' --shell'
     if debug:
         ssh_wrapper_cmd = ssh_wrapper_cmd + ' --debug'
+    return ssh_wrapper_cmd
+
+
+def get_options_signature(ssh_wrapper_cmd, ini_path, ssh_opts):
+    return hashlib.sha1('\0'.join(
+        [ssh_wrapper_cmd, ini_path, ssh_opts or SSH_OPTS])).hexdigest()
+
+
+def format_authorized_key_line(user_key, ssh_wrapper_cmd, ini_path, ssh_opts):
+    username = user_key.user.username
+    user_id = user_key.user.user_id
+    # replace all newline from ends and inside
+    safe_key_data = user_key.ssh_key_data\
+        .strip()\
+        .replace('\n', ' ') \
+        .replace('\t', ' ') \
+        .replace('\r', ' ')
+
+    return LINE_TMPL.format(
+        ssh_opts=ssh_opts or SSH_OPTS,
+        wrapper_command=ssh_wrapper_cmd,
+        ini_path=ini_path,
+        user_id=user_id,
+        user=username,
+        user_key_id=user_key.ssh_key_id,
+        key=safe_key_data)
+
+
+def _prepare_authorized_keys_file(authorized_keys_file_path):
+    authorized_keys_file_path = os.path.abspath(
+        os.path.expanduser(authorized_keys_file_path))
 
     if not os.path.isfile(authorized_keys_file_path):
         log.debug('Creating file at %s', authorized_keys_file_path)
@@ -69,39 +145,20 @@ def _generate_ssh_authorized_keys_file(
     if not os.access(authorized_keys_file_path, os.R_OK):
         raise OSError('Access to file {} is without read access'.format(
             authorized_keys_file_path))
+    return authorized_keys_file_path
 
-    line_tmpl = '{ssh_opts},command="{wrapper_command} {ini_path} --user-id={user_id} --user={user} --key-id={user_key_id}" {key}\n'
 
+def _write_authorized_keys_file(authorized_keys_file_path, lines, signature):
     fd, tmp_authorized_keys = tempfile.mkstemp(
         '.authorized_keys_write',
         dir=os.path.dirname(authorized_keys_file_path))
 
     now = datetime.datetime.utcnow().isoformat()
     keys_file = os.fdopen(fd, 'wb')
-    keys_file.write(HEADER.format(len(all_active_keys), now))
-    ini_path = rhodecode.CONFIG['__file__']
-
-    for user_key in all_active_keys:
-        username = user_key.user.username
-        user_id = user_key.user.user_id
-        # replace all newline from ends and inside
-        safe_key_data = user_key.ssh_key_data\
-            .strip()\
-            .replace('\n', ' ') \
-            .replace('\t', ' ') \
-            .replace('\r', ' ')
-
-        line = line_tmpl.format(
-            ssh_opts=ssh_opts or SSH_OPTS,
-            wrapper_command=ssh_wrapper_cmd,
-            ini_path=ini_path,
-            user_id=user_id,
-            user=username,
-            user_key_id=user_key.ssh_key_id,
-            key=safe_key_data)
-
+    keys_file.write(HEADER.format(len(lines), now))
+    keys_file.write(OPTIONS_HEADER.format(signature))
+    for line in lines:
         keys_file.write(line)
-        log.debug('addkey: Key added for user: `%s`', username)
     keys_file.close()
 
     # Explicitly setting read-only permissions to authorized_keys
@@ -110,6 +167,95 @@ def _generate_ssh_authorized_keys_file(
     os.rename(tmp_authorized_keys, authorized_keys_file_path)
 
 
+def _read_authorized_keys_file(authorized_keys_file_path):
+    """
+    Reads a generated authorized_keys file, returns the options signature
+    and an ordered mapping of key_id to the entry line.
+    """
+    signature = None
+    entries = collections.OrderedDict()
+    with open(authorized_keys_file_path, 'rb') as keys_file:
+        for line in keys_file:
+            if line.startswith('#'):
+                match = OPTIONS_PAT.match(line.rstrip())
+                if match:
+                    signature = match.group(1)
+                continue
+            match = KEY_ID_PAT.search(line)
+            if match:
+                entries[int(match.group(1))] = line
+    return signature, entries
+
+
+def _generate_ssh_authorized_keys_file(
+        authorized_keys_file_path, ssh_wrapper_cmd, allow_shell, ssh_opts, debug):
+
+    import rhodecode
+    authorized_keys_file_path = _prepare_authorized_keys_file(
+        authorized_keys_file_path)
+    all_active_keys = get_all_active_keys()
+
+    ssh_wrapper_cmd = get_wrapper_cmd(ssh_wrapper_cmd, allow_shell, debug)
+    ini_path = rhodecode.CONFIG['__file__']
+
+    lines = []
+    for user_key in all_active_keys:
+        lines.append(format_authorized_key_line(
+            user_key, ssh_wrapper_cmd, ini_path, ssh_opts))
+        log.debug('addkey: Key added for user: `%s`', user_key.user.username)
+
+    _write_authorized_keys_file(
+        authorized_keys_file_path, lines,
+        get_options_signature(ssh_wrapper_cmd, ini_path, ssh_opts))
+
+
+def _update_ssh_authorized_keys_file(
+        authorized_keys_file_path, ssh_wrapper_cmd, allow_shell, ssh_opts, debug):
+    """
+    Incremental version of :func:`_generate_ssh_authorized_keys_file`.
+    Only ids of active keys are fetched from the database, full rows are
+    loaded just for newly added keys, and the file is rewritten only if the
+    set of keys changed. Falls back to full generation if the file was not
+    generated with the same options.
+    """
+    import rhodecode
+    authorized_keys_file_path = _prepare_authorized_keys_file(
+        authorized_keys_file_path)
+
+    full_ssh_wrapper_cmd = get_wrapper_cmd(ssh_wrapper_cmd, allow_shell, debug)
+    ini_path = rhodecode.CONFIG['__file__']
+    signature = get_options_signature(full_ssh_wrapper_cmd, ini_path, ssh_opts)
+
+    current_signature, entries = _read_authorized_keys_file(
+        authorized_keys_file_path)
+    if current_signature != signature:
+        log.debug('authorized_keys options changed, generating full file')
+        return _generate_ssh_authorized_keys_file(
+            authorized_keys_file_path, ssh_wrapper_cmd, allow_shell, ssh_opts,
+            debug)
+
+    active_key_ids = get_active_key_ids()
+    active_key_ids_set = set(active_key_ids)
+    removed = [key_id for key_id in entries if key_id not in active_key_ids_set]
+    added = [key_id for key_id in active_key_ids if key_id not in entries]
+
+    if not removed and not added:
+        log.debug('authorized_keys file is up to date, skipping write')
+        return
+
+    for key_id in removed:
+        del entries[key_id]
+        log.debug('delkey: Key removed with id: `%s`', key_id)
+
+    for user_key in get_active_keys_by_ids(added):
+        entries[user_key.ssh_key_id] = format_authorized_key_line(
+            user_key, full_ssh_wrapper_cmd, ini_path, ssh_opts)
+        log.debug('addkey: Key added for user: `%s`', user_key.user.username)
+
+    _write_authorized_keys_file(
+        authorized_keys_file_path, entries.values(), signature)
+
+
 def generate_ssh_authorized_keys_file(registry):
     log.info('Generating new authorized key file')
 
@@ -124,9 +270,34 @@ def generate_ssh_authorized_keys_file(registry):
         config_keys.authorized_keys_line_ssh_opts)
     debug = registry.settings.get(
         config_keys.enable_debug_logging)
+    generation_mode = registry.settings.get(
+        config_keys.authorized_keys_generation_mode)
 
-    _generate_ssh_authorized_keys_file(
+    if generation_mode == GENERATION_MODE_INCREMENTAL:
+        generate_func = _update_ssh_authorized_keys_file
+    else:
+        generate_func = _generate_ssh_authorized_keys_file
+
+    generate_func(
         authorized_keys_file_path, ssh_wrapper_cmd, allow_shell, ssh_opts,
         debug)
 
     return 0
+
+
+def get_key_lookup_cache_dir(cache_dir):
+    return os.path.join(cache_dir, 'ssh_authorized_keys_command')
+
+
+def clear_key_lookup_cache(registry):
+    """
+    Removes all cached fingerprint lookups of the `rc-ssh-authorized-keys`
+    command, so key changes are visible on the next SSH connection.
+    """
+    cache_dir = registry.settings.get('cache_dir')
+    if not cache_dir:
+        return
+    lookup_cache_dir = get_key_lookup_cache_dir(cache_dir)
+    if os.path.isdir(lookup_cache_dir):
+        log.debug('Clearing ssh key lookup cache at %s', lookup_cache_dir)
+        shutil.rmtree(lookup_cache_dir, ignore_errors=True)
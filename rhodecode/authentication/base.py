@@ -592,6 +592,10 @@ class RhodeCodeExternalAuthPlugin(RhodeCodeAuthPluginBase):
 
 
 class AuthLdapBase(object):
+    # seconds for which a successful host resolve and connection check is
+    # re-used, instead of checking the server for each new connection
+    host_resolve_cache_ttl = 60
+    _resolved_hosts = {}
 
     @classmethod
     def _build_servers(cls, ldap_server_type, ldap_server, port, use_resolver=True):
@@ -605,6 +609,12 @@ class AuthLdapBase(object):
             if not full_resolve:
                 return '{}:{}'.format(host, port)
 
+            cache_key = (host, port)
+            cached = cls._resolved_hosts.get(cache_key)
+            if cached and cached[1] > time.time():
+                log.debug('LDAP: Using cached resolve of LDAP host `%s`', host)
+                return cached[0]
+
             log.debug('LDAP: Resolving IP for LDAP host `%s`', host)
             try:
                 ip = socket.gethostbyname(host)
@@ -622,7 +632,10 @@ class AuthLdapBase(object):
                 raise LdapConnectionError(
                     'Failed to connect to host: `{}:{}`'.format(host, port))
 
-            return '{}:{}'.format(host, port)
+            resolved = '{}:{}'.format(host, port)
+            cls._resolved_hosts[cache_key] = (
+                resolved, time.time() + cls.host_resolve_cache_ttl)
+            return resolved
 
         if len(ldap_server) == 1:
             # in case of single server use resolver to detect potential
@@ -22,10 +22,16 @@
 RhodeCode authentication plugin for LDAP
 """
 
+import time
+import hashlib
 import logging
+import threading
 import traceback
+import collections
 
 import colander
+
+import rhodecode
 from rhodecode.translation import _
 from rhodecode.authentication.base import (
     RhodeCodeExternalAuthPlugin, AuthLdapBase, hybrid_property)
@@ -35,7 +41,7 @@ from rhodecode.lib.colander_utils import strip_whitespace
 from rhodecode.lib.exceptions import (
     LdapConnectionError, LdapUsernameError, LdapPasswordError, LdapImportError
 )
-from rhodecode.lib.utils2 import safe_unicode, safe_str
+from rhodecode.lib.utils2 import safe_unicode, safe_str, safe_int
 from rhodecode.model.db import User
 from rhodecode.model.validators import Missing
 
@@ -53,6 +59,165 @@ class LdapError(Exception):
     pass
 
 
+POOL_DEFAULTS = {
+    # max idle connections kept per pool and worker, 0 disables pooling
+    'auth_ldap.pool_size': 5,
+    # seconds after which an idle pooled connection is closed
+    'auth_ldap.pool_max_idle': 300,
+    # seconds of idle time after which a connection is checked before use
+    'auth_ldap.pool_check_interval': 30,
+}
+
+# seconds for which a server that failed to connect is tried last
+SERVER_RETRY_DELAY = 30
+
+
+def get_pool_settings(config=None):
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    return dict(
+        (key.split('.', 1)[1], safe_int(config.get(key), default))
+        for key, default in POOL_DEFAULTS.items())
+
+
+def is_connection_error(exc):
+    """
+    Checks if exception means the connection can't be used anymore, as
+    opposed to errors like missing objects, or rejected credentials.
+    """
+    return isinstance(exc, ldap.LDAPError) and not isinstance(
+        exc, (ldap.NO_SUCH_OBJECT, ldap.INVALID_CREDENTIALS))
+
+
+class LdapConnectionPool(object):
+    """
+    Per worker pool of LDAP connections, created by the `connect` callable.
+
+    Connections idle for longer than `check_interval` are health checked with
+    a root DSE read before re-use, and closed after `max_idle` seconds.
+    """
+
+    def __init__(self, connect, size=5, max_idle=300, check_interval=30,
+                 clock=time.time):
+        self._connect = connect
+        self.size = size
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self._clock = clock
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def _close(self, ldap_conn):
+        try:
+            ldap_conn.unbind_s()
+        except Exception:
+            # for any reason this can raise exception we must catch it
+            # to not crush the server
+            pass
+
+    def _is_healthy(self, ldap_conn):
+        try:
+            ldap_conn.search_ext_s(
+                '', ldap.SCOPE_BASE, '(objectClass=*)', attrlist=['1.1'])
+            return True
+        except ldap.LDAPError:
+            log.debug('ldap: pooled connection failed health check')
+            return False
+
+    def _get(self):
+        """
+        Returns a tuple of (connection, reused)
+        """
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                ldap_conn, last_used = self._idle.pop()
+
+            idle_time = self._clock() - last_used
+            if idle_time > self.max_idle:
+                self._close(ldap_conn)
+                continue
+            if idle_time > self.check_interval and not self._is_healthy(ldap_conn):
+                self._close(ldap_conn)
+                continue
+            return ldap_conn, True
+
+        log.debug('ldap: creating new pooled connection')
+        return self._connect(), False
+
+    def _put(self, ldap_conn):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append((ldap_conn, self._clock()))
+                return
+        self._close(ldap_conn)
+
+    def run(self, func):
+        """
+        Calls `func(ldap_conn)` with a pooled connection. If a re-used
+        connection turns out to be broken, the call is retried once on a new
+        connection.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            ldap_conn, reused = self._get()
+            try:
+                result = func(ldap_conn)
+            except Exception as e:
+                if not is_connection_error(e):
+                    self._put(ldap_conn)
+                    raise
+                self._close(ldap_conn)
+                if reused and attempt == 1:
+                    log.debug('ldap: pooled connection broken, retrying')
+                    continue
+                raise
+            self._put(ldap_conn)
+            return result
+
+    def idle_count(self):
+        with self._lock:
+            return len(self._idle)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+        for ldap_conn, _last_used in idle:
+            self._close(ldap_conn)
+
+
+_pools = collections.OrderedDict()
+_pools_lock = threading.Lock()
+# keeps pools of a few recent configurations, older ones are closed
+MAX_POOLS = 4
+
+_down_servers = {}
+
+
+def get_ldap_pool(key, connect, pool_settings):
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = LdapConnectionPool(
+                connect, size=pool_settings['pool_size'],
+                max_idle=pool_settings['pool_max_idle'],
+                check_interval=pool_settings['pool_check_interval'])
+            while len(_pools) > MAX_POOLS:
+                _key, old_pool = _pools.popitem(last=False)
+                old_pool.clear()
+        return pool
+
+
+def clear_ldap_pools():
+    with _pools_lock:
+        pools = _pools.values()
+        _pools.clear()
+    for pool in pools:
+        pool.clear()
+    _down_servers.clear()
+
+
 def plugin_factory(plugin_id, *args, **kwargs):
     """
     Factory function that is called during plugin discovery.
@@ -79,7 +244,7 @@ class AuthLdap(AuthLdapBase):
                  tls_kind='PLAIN', tls_reqcert='DEMAND', tls_cert_file=None,
                  tls_cert_dir=None, ldap_version=3,
                  search_scope='SUBTREE', attr_login='uid',
-                 ldap_filter='', timeout=None):
+                 ldap_filter='', timeout=None, use_pool=False):
         if ldap == Missing:
             raise LdapImportError("Missing or incompatible ldap library")
 
@@ -113,7 +278,27 @@ class AuthLdap(AuthLdapBase):
         self.BASE_DN = safe_str(base_dn)
         self.LDAP_FILTER = safe_str(ldap_filter)
 
-    def _get_ldap_conn(self):
+        pool_settings = get_pool_settings()
+        self.pool = self.user_bind_pool = None
+        if use_pool and pool_settings['pool_size'] > 0:
+            pool_key = self._pool_key()
+            self.pool = get_ldap_pool(
+                pool_key + ('service',), self._connect_service, pool_settings)
+            # user binds never happen on service-bound connections, the
+            # connections of this pool are re-bound as the user on each use
+            self.user_bind_pool = get_ldap_pool(
+                pool_key + ('user_bind',),
+                lambda: self._get_ldap_conn(bind=False), pool_settings)
+
+    def _pool_key(self):
+        return (
+            self.ldap_server_type, tuple(self.SERVER_ADDRESSES),
+            self.LDAP_SERVER_PORT, self.TLS_KIND, self.TLS_REQCERT,
+            self.TLS_CERT_FILE, self.TLS_CERT_DIR, self.ldap_version,
+            self.timeout, self.LDAP_BIND_DN,
+            hashlib.sha1(self.LDAP_BIND_PASS).hexdigest())
+
+    def _get_ldap_conn(self, bind=True, server_addresses=None):
 
         if self.debug:
             ldap.set_option(ldap.OPT_DEBUG_LEVEL, 255)
@@ -132,7 +317,8 @@ class AuthLdap(AuthLdapBase):
 
         # init connection now
         ldap_servers = self._build_servers(
-            self.ldap_server_type,  self.SERVER_ADDRESSES, self.LDAP_SERVER_PORT)
+            self.ldap_server_type, server_addresses or self.SERVER_ADDRESSES,
+            self.LDAP_SERVER_PORT)
         log.debug('initializing LDAP connection to:%s', ldap_servers)
         ldap_conn = ldap.initialize(ldap_servers)
         ldap_conn.set_option(ldap.OPT_NETWORK_TIMEOUT, self.timeout)
@@ -147,13 +333,62 @@ class AuthLdap(AuthLdapBase):
         if self.TLS_KIND == 'START_TLS':
             ldap_conn.start_tls_s()
 
-        if self.LDAP_BIND_DN and self.LDAP_BIND_PASS:
+        if bind and self.LDAP_BIND_DN and self.LDAP_BIND_PASS:
             log.debug('Trying simple_bind with password and given login DN: %r',
                       self.LDAP_BIND_DN)
             ldap_conn.simple_bind_s(self.LDAP_BIND_DN, self.LDAP_BIND_PASS)
-        log.debug('simple_bind successful')
+            log.debug('simple_bind successful')
         return ldap_conn
 
+    def _connect_service(self):
+        """
+        Creates a new service-bound connection for the pool. Servers are tried
+        one by one, the ones which recently failed are tried last.
+        """
+        now = time.time()
+        port = self.LDAP_SERVER_PORT
+
+        def is_down(host):
+            return _down_servers.get((host, port), 0) > now
+
+        last_error = None
+        for host in sorted(self.SERVER_ADDRESSES, key=is_down):
+            try:
+                ldap_conn = self._get_ldap_conn(server_addresses=[host])
+            except (ldap.SERVER_DOWN, ldap.TIMEOUT, LdapConnectionError) as e:
+                log.warning('ldap: server `%s:%s` is not available: %s',
+                            host, port, e)
+                _down_servers[(host, port)] = time.time() + SERVER_RETRY_DELAY
+                last_error = e
+                continue
+            _down_servers.pop((host, port), None)
+            return ldap_conn
+        raise last_error
+
+    def _search_ldap_objects(self, ldap_conn, username):
+        filter_ = '(&%s(%s=%s))' % (
+            self.LDAP_FILTER, self.attr_login, username)
+        log.debug("Authenticating %r filter %s and scope: %s",
+                  self.BASE_DN, filter_, self.scope_labels.get(self.SEARCH_SCOPE))
+
+        return ldap_conn.search_ext_s(
+            self.BASE_DN, self.SEARCH_SCOPE, filter_, attrlist=['*', '+'])
+
+    def _bind_user(self, ldap_conn, ldap_objects, username, password):
+        for (dn, _attrs) in ldap_objects:
+            if dn is None:
+                continue
+
+            user_attrs = self.fetch_attrs_from_simple_bind(
+                ldap_conn, dn, username, password)
+
+            if user_attrs:
+                log.debug('Got authenticated user attributes from DN:%s', dn)
+                return dn, user_attrs
+
+        raise LdapPasswordError(
+            'Failed to authenticate user `{}` with given password'.format(username))
+
     def fetch_attrs_from_simple_bind(self, ldap_conn, dn, username, password):
         scope = ldap.SCOPE_BASE
         scope_label = self.scope_labels.get(scope)
@@ -193,18 +428,15 @@ class AuthLdap(AuthLdapBase):
 
         self.validate_password(username, password)
         self.validate_username(username)
-        scope_label = self.scope_labels.get(self.SEARCH_SCOPE)
 
         ldap_conn = None
         try:
-            ldap_conn = self._get_ldap_conn()
-            filter_ = '(&%s(%s=%s))' % (
-                self.LDAP_FILTER, self.attr_login, username)
-            log.debug("Authenticating %r filter %s and scope: %s",
-                      self.BASE_DN, filter_, scope_label)
-
-            ldap_objects = ldap_conn.search_ext_s(
-                self.BASE_DN, self.SEARCH_SCOPE, filter_, attrlist=['*', '+'])
+            if self.pool:
+                ldap_objects = self.pool.run(
+                    lambda conn: self._search_ldap_objects(conn, username))
+            else:
+                ldap_conn = self._get_ldap_conn()
+                ldap_objects = self._search_ldap_objects(ldap_conn, username)
 
             if not ldap_objects:
                 log.debug("No matching LDAP objects for authentication "
@@ -212,19 +444,13 @@ class AuthLdap(AuthLdapBase):
                 raise ldap.NO_SUCH_OBJECT()
 
             log.debug('Found %s matching ldap object[s], trying to authenticate on each one now...', len(ldap_objects))
-            for (dn, _attrs) in ldap_objects:
-                if dn is None:
-                    continue
-
-                user_attrs = self.fetch_attrs_from_simple_bind(
-                    ldap_conn, dn, username, password)
-
-                if user_attrs:
-                    log.debug('Got authenticated user attributes from DN:%s', dn)
-                    break
+            if self.user_bind_pool:
+                dn, user_attrs = self.user_bind_pool.run(
+                    lambda conn: self._bind_user(
+                        conn, ldap_objects, username, password))
             else:
-                raise LdapPasswordError(
-                    'Failed to authenticate user `{}` with given password'.format(username))
+                dn, user_attrs = self._bind_user(
+                    ldap_conn, ldap_objects, username, password)
 
         except ldap.NO_SUCH_OBJECT:
             log.debug("LDAP says no such user '%s' (%s), org_exc:",
@@ -497,6 +723,8 @@ class RhodeCodeAuthPlugin(RhodeCodeExternalAuthPlugin):
         }
 
         ldap_attrs = self.try_dynamic_binding(username, password, ldap_args)
+        # connections bound with dynamic, per user credentials can't be shared
+        ldap_args['use_pool'] = ldap_args['bind_dn'] == settings.get('dn_user')
 
         log.debug('Checking for ldap authentication.')
 
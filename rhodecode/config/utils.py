@@ -20,8 +20,12 @@
 
 import os
 import platform
+import tempfile
+
+from pyramid.settings import asbool, aslist
 
 from rhodecode.model import init_model
+from rhodecode.lib.utils2 import aslist as rhodecode_aslist
 
 
 def configure_vcs(config):
@@ -99,3 +103,172 @@ def get_default_user_id():
         .filter(User.username == User.DEFAULT_USER)\
         .scalar()
     return user_id
+
+
+def _sanitize_vcs_settings(settings):
+    """
+    Applies settings defaults and does type conversion for all VCS related
+    settings.
+    """
+    _string_setting(settings, 'vcs.svn.compatible_version', '')
+    _string_setting(settings, 'vcs.hooks.protocol', 'http')
+    _string_setting(settings, 'vcs.hooks.host', '127.0.0.1')
+    _string_setting(settings, 'vcs.scm_app_implementation', 'http')
+    _string_setting(settings, 'vcs.server', '')
+    _string_setting(settings, 'vcs.server.protocol', 'http')
+    _bool_setting(settings, 'startup.import_repos', 'false')
+    _bool_setting(settings, 'vcs.hooks.direct_calls', 'false')
+    _bool_setting(settings, 'vcs.server.enable', 'true')
+    _bool_setting(settings, 'vcs.start_server', 'false')
+    _list_setting(settings, 'vcs.backends', 'hg, git, svn')
+    _int_setting(settings, 'vcs.connection_timeout', 3600)
+    _int_setting(settings, 'vcs.slow_request_threshold_ms', 0)
+    _bool_setting(settings, 'vcs.repo_resolution_cache', 'true')
+    _int_setting(settings, 'vcs.repo_resolution_cache_check_interval', 5)
+    _bool_setting(settings, 'vcs.post_push_warmup', 'true')
+    _int_setting(settings, 'vcs.post_push_warmup_delay', 5)
+
+    # Support legacy values of vcs.scm_app_implementation. Legacy
+    # configurations may use 'rhodecode.lib.middleware.utils.scm_app_http', or
+    # disabled since 4.13 'vcsserver.scm_app' which is now mapped to 'http'.
+    scm_app_impl = settings['vcs.scm_app_implementation']
+    if scm_app_impl in ['rhodecode.lib.middleware.utils.scm_app_http', 'vcsserver.scm_app']:
+        settings['vcs.scm_app_implementation'] = 'http'
+
+
+def _sanitize_cache_settings(settings):
+    temp_store = tempfile.gettempdir()
+    default_cache_dir = os.path.join(temp_store, 'rc_cache')
+
+    # save default, cache dir, and use it for all backends later.
+    default_cache_dir = _string_setting(
+        settings,
+        'cache_dir',
+        default_cache_dir, lower=False, default_when_empty=True)
+
+    # ensure we have our dir created
+    if not os.path.isdir(default_cache_dir):
+        os.makedirs(default_cache_dir, mode=0o755)
+
+    # exception store cache
+    _string_setting(
+        settings,
+        'exception_tracker.store_path',
+        temp_store, lower=False, default_when_empty=True)
+    _bool_setting(
+        settings,
+        'exception_tracker.send_email',
+        'false')
+    _string_setting(
+        settings,
+        'exception_tracker.email_prefix',
+        '[RHODECODE ERROR]', lower=False, default_when_empty=True)
+
+    # cache_perms
+    _string_setting(
+        settings,
+        'rc_cache.cache_perms.backend',
+        'dogpile.cache.rc.file_namespace', lower=False)
+    _int_setting(
+        settings,
+        'rc_cache.cache_perms.expiration_time',
+        60)
+    _string_setting(
+        settings,
+        'rc_cache.cache_perms.arguments.filename',
+        os.path.join(default_cache_dir, 'rc_cache_1'), lower=False)
+
+    # cache_repo
+    _string_setting(
+        settings,
+        'rc_cache.cache_repo.backend',
+        'dogpile.cache.rc.file_namespace', lower=False)
+    _int_setting(
+        settings,
+        'rc_cache.cache_repo.expiration_time',
+        60)
+    _string_setting(
+        settings,
+        'rc_cache.cache_repo.arguments.filename',
+        os.path.join(default_cache_dir, 'rc_cache_2'), lower=False)
+
+    # cache_license
+    _string_setting(
+        settings,
+        'rc_cache.cache_license.backend',
+        'dogpile.cache.rc.file_namespace', lower=False)
+    _int_setting(
+        settings,
+        'rc_cache.cache_license.expiration_time',
+        5*60)
+    _string_setting(
+        settings,
+        'rc_cache.cache_license.arguments.filename',
+        os.path.join(default_cache_dir, 'rc_cache_3'), lower=False)
+
+    # cache_repo_longterm memory, 96H
+    _string_setting(
+        settings,
+        'rc_cache.cache_repo_longterm.backend',
+        'dogpile.cache.rc.memory_lru', lower=False)
+    _int_setting(
+        settings,
+        'rc_cache.cache_repo_longterm.expiration_time',
+        345600)
+    _int_setting(
+        settings,
+        'rc_cache.cache_repo_longterm.max_size',
+        10000)
+
+    # sql_cache_short
+    _string_setting(
+        settings,
+        'rc_cache.sql_cache_short.backend',
+        'dogpile.cache.rc.memory_lru', lower=False)
+    _int_setting(
+        settings,
+        'rc_cache.sql_cache_short.expiration_time',
+        30)
+    _int_setting(
+        settings,
+        'rc_cache.sql_cache_short.max_size',
+        10000)
+
+
+def _int_setting(settings, name, default):
+    settings[name] = int(settings.get(name, default))
+    return settings[name]
+
+
+def _bool_setting(settings, name, default):
+    input_val = settings.get(name, default)
+    if isinstance(input_val, unicode):
+        input_val = input_val.encode('utf8')
+    settings[name] = asbool(input_val)
+    return settings[name]
+
+
+def _list_setting(settings, name, default):
+    raw_value = settings.get(name, default)
+
+    old_separator = ','
+    if old_separator in raw_value:
+        # If we get a comma separated list, pass it to our own function.
+        settings[name] = rhodecode_aslist(raw_value, sep=old_separator)
+    else:
+        # Otherwise we assume it uses pyramids space/newline separation.
+        settings[name] = aslist(raw_value)
+    return settings[name]
+
+
+def _string_setting(settings, name, default, lower=True, default_when_empty=False):
+    value = settings.get(name, default)
+
+    if default_when_empty and not value:
+        # use default value when value is empty
+        value = default
+
+    if lower:
+        value = value.lower()
+    settings[name] = value
+    return settings[name]
@@ -20,6 +20,9 @@ import collections
 import logging
 import datetime
 
+import rhodecode
+from zope.cachedescriptors.property import Lazy as LazyProperty
+
 from rhodecode.translation import lazy_ugettext
 from rhodecode.model.db import User, Repository, Session
 from rhodecode.events.base import RhodeCodeIntegrationEvent
@@ -27,14 +30,45 @@ from rhodecode.lib.vcs.exceptions import CommitDoesNotExistError
 
 log = logging.getLogger(__name__)
 
+# attributes fetched with a single vcsserver call per commit
+COMMIT_PRE_LOAD = ['author', 'branch', 'date', 'message', 'parents']
+
+# default max number of commits serialized into a push event payload
+PUSH_EVENT_MAX_COMMITS = 1000
+
+
+def get_push_event_max_commits():
+    from rhodecode.lib.utils2 import safe_int
+    max_commits = safe_int(
+        rhodecode.CONFIG.get('events.push.max_commits'), PUSH_EVENT_MAX_COMMITS)
+    # 0 or negative means no limit
+    return max_commits if max_commits > 0 else None
 
-def _commits_as_dict(event, commit_ids, repos):
+
+def _split_ref_changes(commit_ids):
+    """
+    Splits pushed `commit_ids` into real commit ids and the `tag=>` and
+    `delete_branch=>` entries describing reference changes.
+    """
+    commits, ref_changes = [], []
+    for commit_id in commit_ids:
+        if commit_id.startswith(('tag=>', 'delete_branch=>')):
+            ref_changes.append(commit_id)
+        else:
+            commits.append(commit_id)
+    return commits, ref_changes
+
+
+def _commits_as_dict(event, commit_ids, repos, max_commits=None):
     """
     Helper function to serialize commit_ids
 
     :param event: class calling this method
     :param commit_ids: commits to get
     :param repos: list of repos to check
+    :param max_commits: optional limit of commits to serialize, only the last
+        (most recent) `max_commits` of `commit_ids` are fetched from the
+        repository. Tag and branch delete entries are always kept
     """
     from rhodecode.lib.utils2 import extract_mentioned_users
     from rhodecode.lib.helpers import (
@@ -50,6 +84,9 @@ def _commits_as_dict(event, commit_ids, repos):
     if not commit_ids:
         return []
 
+    if max_commits is not None:
+        commit_ids, ref_changes = _split_ref_changes(commit_ids)
+        commit_ids = commit_ids[-max_commits:] + ref_changes
     needed_commits = list(commit_ids)
 
     commits = []
@@ -99,7 +136,8 @@ def _commits_as_dict(event, commit_ids, repos):
 
                 else:
                     try:
-                        cs = vcs_repo.get_commit(commit_id)
+                        cs = vcs_repo.get_commit(
+                            commit_id, pre_load=COMMIT_PRE_LOAD)
                     except CommitDoesNotExistError:
                         continue  # maybe its in next repo
 
@@ -372,17 +410,33 @@ class RepoPushEvent(RepoVCSEvent):
 
     def as_dict(self):
         data = super(RepoPushEvent, self).as_dict()
+        data['push'] = self.push_data
+        return data
+
+    @LazyProperty
+    def push_data(self):
+        """
+        Serialized push data, computed once per event on first access and
+        shared by all integrations handling this event. At most
+        `events.push.max_commits` most recent commits are serialized, along
+        with all tag and branch changes, `commits_total` holds the number of
+        all pushed commits, without the tag and branch changes.
+        """
+        from rhodecode.model.repo import RepoModel
+        repo_url = RepoModel().get_url(self.repo, request=self.request)
 
         def branch_url(branch_name):
-            return '{}/changelog?branch={}'.format(
-                data['repo']['url'], branch_name)
+            return '{}/changelog?branch={}'.format(repo_url, branch_name)
 
         def tag_url(tag_name):
-            return '{}/files/{}/'.format(
-                data['repo']['url'], tag_name)
+            return '{}/files/{}/'.format(repo_url, tag_name)
 
+        max_commits = get_push_event_max_commits()
+        commits_total = len(
+            _split_ref_changes(self.pushed_commit_ids or [])[0])
         commits = _commits_as_dict(
-            self, commit_ids=self.pushed_commit_ids, repos=[self.repo])
+            self, commit_ids=self.pushed_commit_ids, repos=[self.repo],
+            max_commits=max_commits)
 
         last_branch = None
         for commit in reversed(commits):
@@ -427,10 +481,12 @@ class RepoPushEvent(RepoVCSEvent):
             for tag in tags
         ]
 
-        data['push'] = {
+        return {
             'commits': commits,
+            'commits_total': commits_total,
+            'commits_truncated': bool(
+                max_commits and commits_total > max_commits),
             'issues': issues,
             'branches': branches,
             'tags': tags,
         }
-        return data
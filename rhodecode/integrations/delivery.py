@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2012-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Delivery engine for outgoing integration HTTP calls.
+
+Events for the same integration and endpoint are coalesced within a short
+time window into a single delivery batch. Batches are executed over pooled,
+kept-alive connections, with per-endpoint concurrency and rate limits.
+Failed calls are re-queued with exponential backoff by the calling task.
+"""
+
+import time
+import atexit
+import logging
+import threading
+import urlparse
+import collections
+
+import rhodecode
+from rhodecode.lib.utils2 import safe_int, safe_float
+
+log = logging.getLogger(__name__)
+
+
+DEFAULTS = {
+    # seconds to collect events for one endpoint before sending them, 0=off
+    'webhook.coalesce_window': 0,
+    # flush a batch as soon as it reaches this many calls
+    'webhook.max_batch_size': 100,
+    # max parallel in-flight calls to a single endpoint per worker process
+    'webhook.endpoint_concurrency': 4,
+    # max calls per second to a single endpoint per worker process, 0=off
+    'webhook.endpoint_rate_limit': 0,
+    # number of re-queued delivery attempts for failed calls
+    'webhook.max_retries': 5,
+    # base in seconds of the exponential backoff between re-queued attempts
+    'webhook.retry_backoff': 10,
+}
+
+
+def get_delivery_settings(config=None):
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    return {
+        'coalesce_window': safe_float(
+            config.get('webhook.coalesce_window'),
+            DEFAULTS['webhook.coalesce_window']),
+        'max_batch_size': safe_int(
+            config.get('webhook.max_batch_size'),
+            DEFAULTS['webhook.max_batch_size']),
+        'endpoint_concurrency': safe_int(
+            config.get('webhook.endpoint_concurrency'),
+            DEFAULTS['webhook.endpoint_concurrency']),
+        'endpoint_rate_limit': safe_float(
+            config.get('webhook.endpoint_rate_limit'),
+            DEFAULTS['webhook.endpoint_rate_limit']),
+        'max_retries': safe_int(
+            config.get('webhook.max_retries'),
+            DEFAULTS['webhook.max_retries']),
+        'retry_backoff': safe_float(
+            config.get('webhook.retry_backoff'),
+            DEFAULTS['webhook.retry_backoff']),
+    }
+
+
+def endpoint_key(url):
+    """
+    Returns the key under which connections and limits are shared,
+    e.g `https://ci.example.com:8080`
+    """
+    parsed = urlparse.urlsplit(url)
+    return '{}://{}'.format(parsed.scheme.lower(), parsed.netloc.lower())
+
+
+def retry_countdown(attempt, backoff):
+    """
+    Exponential backoff for re-queued deliveries, capped at one hour.
+    """
+    return min(backoff * (2 ** attempt), 3600)
+
+
+class TokenBucket(object):
+    """
+    Simple thread-safe token bucket, `rate` tokens per second with a burst
+    of the same size. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = max(self.rate, 1.0)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self._last) * self.rate)
+            self._last = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        if self.rate <= 0:
+            return 0
+        wait = self._reserve()
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class EndpointLimiter(object):
+    """
+    Holds the concurrency semaphore and rate limiter for a single endpoint.
+    """
+
+    def __init__(self, concurrency, rate):
+        self.semaphore = threading.BoundedSemaphore(max(concurrency, 1))
+        self.bucket = TokenBucket(rate)
+
+    def __enter__(self):
+        self.semaphore.acquire()
+        self.bucket.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.semaphore.release()
+
+
+class EndpointRegistry(object):
+    """
+    Per-process registry of pooled sessions and limiters, keyed by endpoint.
+    """
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._sessions = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def _make_session(self, pool_size):
+        if self._session_factory:
+            return self._session_factory()
+        from rhodecode.integrations.types.base import requests_retry_call
+        return requests_retry_call(pool_connections=1, pool_maxsize=pool_size)
+
+    def get_session(self, url, delivery_settings):
+        key = endpoint_key(url)
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = self._make_session(
+                    max(delivery_settings['endpoint_concurrency'], 1))
+            return self._sessions[key]
+
+    def get_limiter(self, url, delivery_settings):
+        key = endpoint_key(url)
+        with self._lock:
+            if key not in self._limiters:
+                self._limiters[key] = EndpointLimiter(
+                    delivery_settings['endpoint_concurrency'],
+                    delivery_settings['endpoint_rate_limit'])
+            return self._limiters[key]
+
+    def clear(self):
+        with self._lock:
+            for session in self._sessions.values():
+                try:
+                    session.close()
+                except Exception:
+                    log.exception('Failed to close session')
+            self._sessions = {}
+            self._limiters = {}
+
+
+endpoint_registry = EndpointRegistry()
+
+
+class DeliveryCoalescer(object):
+    """
+    Collects url calls per (integration, endpoint) and hands them over to
+    `dispatch` as a single batch once the coalescing window expires, or once
+    the batch reaches `max_batch_size`. With a window of 0 calls are
+    dispatched right away.
+    """
+
+    def __init__(self, dispatch, window, max_batch_size, timer_factory=None):
+        self.dispatch = dispatch
+        self.window = window
+        self.max_batch_size = max(max_batch_size, 1)
+        self._timer_factory = timer_factory or threading.Timer
+        self._batches = collections.OrderedDict()
+        self._timers = {}
+        self._lock = threading.Lock()
+
+    def add(self, integration_key, settings, url_calls):
+        if self.window <= 0:
+            self.dispatch(url_calls, settings)
+            return
+
+        to_send = []
+        with self._lock:
+            for call in url_calls:
+                key = (integration_key, endpoint_key(call[0]))
+                if key not in self._batches:
+                    self._batches[key] = (settings, [])
+                    timer = self._timer_factory(self.window, self.flush, (key,))
+                    timer.daemon = True
+                    self._timers[key] = timer
+                    timer.start()
+
+                batch_settings, calls = self._batches[key]
+                calls.append(call)
+                if len(calls) >= self.max_batch_size:
+                    to_send.append(self._pop(key))
+
+        for batch_settings, calls in to_send:
+            self._send(batch_settings, calls)
+
+    def _pop(self, key):
+        timer = self._timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        return self._batches.pop(key)
+
+    def _send(self, settings, url_calls):
+        if not url_calls:
+            return
+        try:
+            self.dispatch(url_calls, settings)
+        except Exception:
+            log.exception('Failed to dispatch %s webhook calls', len(url_calls))
+
+    def flush(self, key=None):
+        with self._lock:
+            keys = [key] if key else self._batches.keys()
+            batches = [self._pop(k) for k in keys if k in self._batches]
+
+        for settings, calls in batches:
+            log.debug('flushing coalesced batch of %s webhook calls', len(calls))
+            self._send(settings, calls)
+
+    def pending(self):
+        with self._lock:
+            return sum(len(calls) for _s, calls in self._batches.values())
+
+
+_coalescer = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer(dispatch):
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            delivery_settings = get_delivery_settings()
+            _coalescer = DeliveryCoalescer(
+                dispatch,
+                window=delivery_settings['coalesce_window'],
+                max_batch_size=delivery_settings['max_batch_size'])
+            atexit.register(_coalescer.flush)
+        return _coalescer
+
+
+def deliver_calls(url_calls, call_func, delivery_settings,
+                  registry=None, statsd=None):
+    """
+    Executes `call_func(session, url, headers, data)` for every url call,
+    using the pooled session and limiter of the call's endpoint.
+
+    Returns a list of url calls that failed and should be retried.
+    """
+    registry = registry or endpoint_registry
+    failed = []
+
+    for call in url_calls:
+        url = call[0]
+        session = registry.get_session(url, delivery_settings)
+        limiter = registry.get_limiter(url, delivery_settings)
+
+        start = time.time()
+        try:
+            with limiter:
+                call_func(session, *call)
+        except Exception:
+            log.exception('Webhook call to %s failed', url)
+            failed.append(call)
+            if statsd:
+                statsd.incr('rhodecode.webhook.delivery.failure')
+        else:
+            if statsd:
+                statsd.incr('rhodecode.webhook.delivery.success')
+        finally:
+            if statsd:
+                statsd.timing(
+                    'rhodecode.webhook.delivery.call_time',
+                    (time.time() - start) * 1000)
+
+    return failed
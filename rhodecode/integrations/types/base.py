@@ -426,7 +426,7 @@ STATUS_500 = (500, 502, 504)
 
 def requests_retry_call(
         retries=3, backoff_factor=0.3, status_forcelist=STATUS_400+STATUS_500,
-        session=None):
+        session=None, pool_connections=10, pool_maxsize=10):
     """
     session = requests_retry_session()
     response = session.get('http://example.com')
@@ -435,6 +435,8 @@ def requests_retry_call(
     :param backoff_factor:
     :param status_forcelist:
     :param session:
+    :param pool_connections: number of per-host connection pools to cache
+    :param pool_maxsize: max number of kept-alive connections per host
     """
     session = session or requests.Session()
     retry = Retry(
@@ -444,7 +446,9 @@ def requests_retry_call(
         backoff_factor=backoff_factor,
         status_forcelist=status_forcelist,
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(
+        max_retries=retry, pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
@@ -20,6 +20,7 @@
 
 from __future__ import unicode_literals
 
+import time
 import deform.widget
 import logging
 import colander
@@ -31,8 +32,10 @@ from rhodecode.model.validation_schema.widgets import CheckboxChoiceWidgetDesc
 from rhodecode.translation import _
 from rhodecode.integrations.types.base import (
     IntegrationTypeBase, get_auth, get_web_token, get_url_vars,
-    WebhookDataHandler, WEBHOOK_URL_VARS, requests_retry_call)
-from rhodecode.lib.celerylib import run_task, async_task, RequestContextTask
+    WebhookDataHandler, WEBHOOK_URL_VARS)
+from rhodecode.integrations import delivery
+from rhodecode.lib._vendor.statsd import client_from_config
+from rhodecode.lib.celerylib import run_task, async_task
 from rhodecode.model.validation_schema import widgets
 
 log = logging.getLogger(__name__)
@@ -191,12 +194,55 @@ class WebhookIntegrationType(IntegrationTypeBase):
         url_calls = handler(event, data)
         log.debug('Webhook: calling following urls: %s', [x[0] for x in url_calls])
 
-        run_task(post_to_webhook, url_calls, self.settings)
+        coalescer = delivery.get_coalescer(dispatch_webhook_calls)
+        coalescer.add(settings_key(self.settings), self.settings, url_calls)
 
 
-@async_task(ignore_result=True, base=RequestContextTask)
-def post_to_webhook(url_calls, settings):
+def settings_key(settings):
     """
+    Key of an integration for coalescing, integrations sharing identical
+    settings can share a delivery batch.
+    """
+    return repr(sorted(
+        (k, v) for k, v in settings.items() if k not in ['events']))
+
+
+def dispatch_webhook_calls(url_calls, settings):
+    return run_task(post_to_webhook, url_calls, settings, time.time())
+
+
+def _call_webhook(settings, auth, token, session, url, headers, data):
+    call_headers = {
+        'User-Agent': 'RhodeCode-webhook-caller/{}'.format(rhodecode.__version__)
+    }  # updated below with custom ones, allows override
+    call_headers.update(headers or {})
+
+    method = settings.get('method_type') or 'post'
+    call_method = getattr(session, method)
+
+    log.debug('calling Webhook with method: %s, and auth:%s', call_method, auth)
+    if settings.get('log_data'):
+        log.debug('calling webhook with data: %s', data)
+    resp = call_method(url, json={
+        'token': token,
+        'event': data
+    }, headers=call_headers, auth=auth, timeout=60)
+    log.debug('Got Webhook response: %s', resp)
+
+    try:
+        resp.raise_for_status()  # raise exception on a failed request
+    except Exception:
+        log.error(resp.text)
+        raise
+
+
+@async_task(ignore_result=True, bind=True, max_retries=None)
+def post_to_webhook(self, url_calls, settings, enqueued_at=None, attempt=0):
+    """
+    Delivers a batch of url calls over pooled per-endpoint connections.
+    Calls that failed are re-queued with exponential backoff, up to
+    `webhook.max_retries` attempts.
+
     Example data::
 
         {'actor': {'user_id': 2, 'username': u'admin'},
@@ -234,33 +280,41 @@ def post_to_webhook(url_calls, settings):
          }
     """
 
-    call_headers = {
-        'User-Agent': 'RhodeCode-webhook-caller/{}'.format(rhodecode.__version__)
-    }  # updated below with custom ones, allows override
-
+    delivery_settings = delivery.get_delivery_settings()
+    statsd = client_from_config(rhodecode.CONFIG)
     auth = get_auth(settings)
     token = get_web_token(settings)
 
-    for url, headers, data in url_calls:
-        req_session = requests_retry_call()
-
-        method = settings.get('method_type') or 'post'
-        call_method = getattr(req_session, method)
-
-        headers = headers or {}
-        call_headers.update(headers)
-
-        log.debug('calling Webhook with method: %s, and auth:%s', call_method, auth)
-        if settings.get('log_data'):
-            log.debug('calling webhook with data: %s', data)
-        resp = call_method(url, json={
-            'token': token,
-            'event': data
-        }, headers=call_headers, auth=auth, timeout=60)
-        log.debug('Got Webhook response: %s', resp)
-
-        try:
-            resp.raise_for_status()  # raise exception on a failed request
-        except Exception:
-            log.error(resp.text)
-            raise
+    def call_func(session, url, headers, data):
+        return _call_webhook(settings, auth, token, session, url, headers, data)
+
+    failed = delivery.deliver_calls(
+        url_calls, call_func, delivery_settings, statsd=statsd)
+
+    if statsd and enqueued_at and len(failed) < len(url_calls):
+        statsd.timing('rhodecode.webhook.delivery.latency',
+                      (time.time() - enqueued_at) * 1000)
+
+    if not failed:
+        return
+
+    if self.request.called_directly:
+        # sync execution, there's no queue to re-schedule on
+        raise Exception('Failed to deliver {} of {} webhook calls'.format(
+            len(failed), len(url_calls)))
+
+    if attempt >= delivery_settings['max_retries']:
+        log.error('Giving up delivery of %s webhook calls after %s attempts',
+                  len(failed), attempt + 1)
+        if statsd:
+            statsd.incr('rhodecode.webhook.delivery.dropped', len(failed))
+        return
+
+    countdown = delivery.retry_countdown(
+        attempt, delivery_settings['retry_backoff'])
+    log.warning('Re-queueing %s failed webhook calls in %ss, attempt %s',
+                len(failed), countdown, attempt + 1)
+    if statsd:
+        statsd.incr('rhodecode.webhook.delivery.retry', len(failed))
+    raise self.retry(
+        args=(failed, settings, enqueued_at, attempt + 1), countdown=countdown)
@@ -0,0 +1,645 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Archive downloads streamed while they are generated, and the archive cache.
+
+vcsserver writes archives into a file, so the archive is written by a
+background thread into a temporary file next to its place in the archive
+cache, and the response reads that file as it grows. When the archive is
+complete the temporary file is moved into the cache atomically, failed
+archives are never cached.
+
+The cache directory is shared by all workers, so its state lives on the file
+system. Layout of `archive_cache_dir`::
+
+    <archive>              complete archives, mtime is the last access
+    .<archive>.part        archive being generated
+    .locks/NNNN.lock       generation locks, archive names hashed to buckets
+    .stats                 hit, miss and eviction counters
+
+Only one worker generates an archive at a time, concurrent requests of the
+same archive read the `.part` file of that producer, or wait for it.
+"""
+
+import os
+import time
+import json
+import errno
+import fcntl
+import logging
+import tempfile
+import threading
+
+from webob.static import FileIter
+
+import rhodecode
+from rhodecode.lib.utils2 import safe_int, sha1, str2bool
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'archive_streaming': True,
+    # MB, 0 means no limit
+    'archive_cache_max_size': 10240,
+    # days since the last download, 0 means no limit
+    'archive_cache_max_age': 0,
+    # seconds
+    'archive_cache_eviction_interval': 300,
+}
+
+CHUNK_SIZE = 16 * 1024
+POLL_INTERVAL = 0.05
+LOCK_BUCKETS = 1024
+# how long a request waits for an archive generated by another one
+WAIT_TIMEOUT = 30 * 60
+# leftovers of crashed workers
+STALE_PART_AGE = 24 * 60 * 60
+
+STATS_KEYS = ('hits', 'misses', 'waits', 'evictions', 'evicted_size')
+
+
+class ArchiveCacheError(Exception):
+    pass
+
+
+def get_archive_settings(config=None):
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    return {
+        'cache_dir': config.get('archive_cache_dir'),
+        'streaming': str2bool(config.get(
+            'archive_streaming', DEFAULTS['archive_streaming'])),
+        'max_size': safe_int(
+            config.get('archive_cache_max_size'),
+            DEFAULTS['archive_cache_max_size']) * 1024 * 1024,
+        'max_age': safe_int(
+            config.get('archive_cache_max_age'),
+            DEFAULTS['archive_cache_max_age']) * 24 * 60 * 60,
+        'eviction_interval': safe_int(
+            config.get('archive_cache_eviction_interval'),
+            DEFAULTS['archive_cache_eviction_interval']),
+    }
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _listdir(path):
+    try:
+        return os.listdir(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return []
+
+
+def _open_creating_dirs(path, flags, mode=0o600):
+    """
+    `os.open` of `path`, creating its missing directories, e.g. when the
+    cache directory was removed while the server is running.
+    """
+    try:
+        return os.open(path, flags, mode)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    _makedirs(os.path.dirname(path))
+    return os.open(path, flags, mode)
+
+
+def iter_file(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as stream:
+        while True:
+            data = stream.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+
+def _iter_growing_file(fd, is_finished, chunk_size, poll_interval):
+    """
+    Reads `fd` until `is_finished()`, waiting for more data at its end
+    """
+    while True:
+        finished = is_finished()
+        data = os.read(fd, chunk_size)
+        if data:
+            yield data
+            continue
+        if finished:
+            break
+        time.sleep(poll_interval)
+
+
+class CachedArchive(FileIter):
+    """
+    Opened archive of the cache, readable even if it's evicted meanwhile.
+    Supports reading byte ranges.
+    """
+
+    def __init__(self, path):
+        super(CachedArchive, self).__init__(open(path, 'rb'))
+        self.size = os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        self.file.close()
+
+
+class ArchiveLock(object):
+    """
+    Lock shared by all processes, based on `flock` of `path`
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def acquire(self, blocking=True, timeout=None):
+        fd = _open_creating_dirs(self.path, os.O_RDWR | os.O_CREAT)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self._fd = fd
+                return True
+            except IOError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    os.close(fd)
+                    raise
+            if not blocking or (deadline and time.time() > deadline):
+                os.close(fd)
+                return False
+            time.sleep(self.poll_interval)
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def is_locked(self):
+        """
+        Returns True if another process, or lock object, holds the lock
+        """
+        if not self.acquire(blocking=False):
+            return True
+        self.release()
+        return False
+
+
+class StreamingArchive(object):
+    """
+    Archive written by `archive_func(path)` in a thread, iterating over it
+    yields its chunks as soon as they are written. The complete archive is
+    stored at `cache_path`, if given, also if the client went away.
+    `on_finished` is called by the thread once the archive is stored or
+    removed.
+    """
+
+    def __init__(self, archive_func, cache_path=None, tmp_dir=None,
+                 tmp_path=None, on_finished=None, chunk_size=CHUNK_SIZE,
+                 poll_interval=POLL_INTERVAL):
+        self.archive_func = archive_func
+        self.cache_path = cache_path
+        self.on_finished = on_finished
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        # opened before the archive is written, so it's readable even after
+        # it was moved into the cache
+        if tmp_path:
+            _remove(tmp_path)
+            self._fd = _open_creating_dirs(
+                tmp_path, os.O_RDWR | os.O_CREAT | os.O_EXCL)
+            self.tmp_path = tmp_path
+        else:
+            if cache_path:
+                # same directory, so the final move is an atomic rename
+                tmp_dir = os.path.dirname(cache_path)
+            self._fd, self.tmp_path = tempfile.mkstemp(
+                dir=tmp_dir, prefix='.archive-', suffix='.tmp')
+        self._finished = threading.Event()
+        self._error = None
+
+    def _generate(self):
+        try:
+            self.archive_func(self.tmp_path)
+        except Exception as e:
+            log.exception('Failed to generate archive %s', self.tmp_path)
+            self._error = e
+            _remove(self.tmp_path)
+        else:
+            if self.cache_path:
+                log.debug('Storing new archive in %s', self.cache_path)
+                os.rename(self.tmp_path, self.cache_path)
+        finally:
+            if self.on_finished:
+                try:
+                    self.on_finished()
+                except Exception:
+                    log.exception('Failed to finish archive %s', self.tmp_path)
+            self._finished.set()
+
+    def _has_data(self):
+        return os.fstat(self._fd).st_size > 0
+
+    def start(self):
+        """
+        Starts writing the archive, and waits until its first bytes are
+        written. Errors of an archive that failed before that are raised.
+        """
+        thread = threading.Thread(
+            target=self._generate, name='archive-{}'.format(self.tmp_path))
+        thread.daemon = True
+        thread.start()
+
+        while not (self._finished.is_set() or self._has_data()):
+            self._finished.wait(self.poll_interval)
+        if self._error is not None and not self._has_data():
+            self.close()
+            raise self._error
+
+    def __iter__(self):
+        try:
+            for data in _iter_growing_file(
+                    self._fd, self._finished.is_set, self.chunk_size,
+                    self.poll_interval):
+                yield data
+
+            if self._error is not None:
+                # headers are already sent, the client gets a cut archive
+                raise self._error
+        finally:
+            self.close()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if not self.cache_path:
+            log.debug('Destroying temp archive %s', self.tmp_path)
+            _remove(self.tmp_path)
+
+
+class FollowingArchive(object):
+    """
+    Archive generated by another request, read from its `.part` file until
+    the producer releases `lock`.
+    """
+
+    def __init__(self, fd, lock, cache_path, chunk_size=CHUNK_SIZE,
+                 poll_interval=POLL_INTERVAL):
+        self._fd = fd
+        self.lock = lock
+        self.cache_path = cache_path
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+
+    def _is_finished(self):
+        return not self.lock.is_locked()
+
+    def _is_stored(self):
+        try:
+            cached = os.stat(self.cache_path)
+        except OSError:
+            return False
+        return cached.st_ino == os.fstat(self._fd).st_ino
+
+    def __iter__(self):
+        try:
+            for data in _iter_growing_file(
+                    self._fd, self._is_finished, self.chunk_size,
+                    self.poll_interval):
+                yield data
+
+            if not self._is_stored():
+                raise ArchiveCacheError(
+                    'Generation of archive {} failed'.format(self.cache_path))
+        finally:
+            self.close()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class ArchiveCache(object):
+    """
+    Archive cache in `cache_dir` limited to `max_size` bytes and `max_age`
+    seconds since the last download, zero means no limit.
+    """
+
+    def __init__(self, cache_dir, max_size=0, max_age=0, eviction_interval=300,
+                 wait_timeout=WAIT_TIMEOUT, clock=time.time):
+        self.cache_dir = cache_dir
+        self.lock_dir = os.path.join(cache_dir, '.locks')
+        self.stats_path = os.path.join(cache_dir, '.stats')
+        self.max_size = max_size
+        self.max_age = max_age
+        self.eviction_interval = eviction_interval
+        self.wait_timeout = wait_timeout
+        self._clock = clock
+        self._last_eviction = 0
+        self._eviction_lock = threading.Lock()
+        _makedirs(self.lock_dir)
+
+    def get_path(self, archive_name):
+        return os.path.join(self.cache_dir, archive_name)
+
+    def get_part_path(self, archive_name):
+        return os.path.join(self.cache_dir, '.{}.part'.format(archive_name))
+
+    def get_lock(self, archive_name):
+        bucket = int(sha1(archive_name)[:8], 16) % LOCK_BUCKETS
+        return ArchiveLock(
+            os.path.join(self.lock_dir, '{:04d}.lock'.format(bucket)))
+
+    def lookup(self, archive_name):
+        """
+        Returns path of the cached `archive_name`, and marks it as recently
+        used, or None if it's not cached.
+        """
+        path = self.get_path(archive_name)
+        try:
+            os.utime(path, None)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return None
+        return path
+
+    def _store(self, archive_name, archive_func, lock, streaming):
+        """
+        Generates `archive_name` while holding its `lock`, the lock is
+        released once the archive is stored or failed.
+        """
+        self.record(misses=1)
+        cache_path = self.get_path(archive_name)
+
+        def on_finished():
+            lock.release()
+            self.schedule_eviction()
+
+        if streaming:
+            archive = StreamingArchive(
+                archive_func, cache_path=cache_path,
+                tmp_path=self.get_part_path(archive_name),
+                on_finished=on_finished)
+            archive.start()
+            return archive
+
+        part_path = self.get_part_path(archive_name)
+        try:
+            archive_func(part_path)
+            os.rename(part_path, cache_path)
+        except Exception:
+            _remove(part_path)
+            raise
+        finally:
+            on_finished()
+        return CachedArchive(cache_path)
+
+    def _follow(self, archive_name, lock):
+        try:
+            fd = os.open(self.get_part_path(archive_name), os.O_RDONLY)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # already stored, or the lock is held for another archive
+            return None
+        return FollowingArchive(fd, lock, self.get_path(archive_name))
+
+    def get_archive(self, archive_name, archive_func, streaming=True):
+        """
+        Returns an iterator over the chunks of `archive_name`, and a flag if
+        it was generated by another request, or before. Missing archives are
+        generated with `archive_func(path)`, only once for all concurrent
+        requests.
+        """
+        cached_path = self.lookup(archive_name)
+        if cached_path:
+            self.record(hits=1)
+            return CachedArchive(cached_path), True
+
+        lock = self.get_lock(archive_name)
+        if not lock.acquire(blocking=False):
+            self.record(waits=1)
+            if streaming:
+                archive = self._follow(archive_name, lock)
+                if archive:
+                    log.debug('Reading archive %s generated by another '
+                              'request', archive_name)
+                    return archive, True
+
+            log.debug('Waiting for generation of archive %s', archive_name)
+            if not lock.acquire(timeout=self.wait_timeout):
+                log.warning('Timeout waiting for archive %s, generating '
+                            'it without cache', archive_name)
+                archive = StreamingArchive(archive_func)
+                archive.start()
+                return archive, False
+
+        # we hold the lock, check if it was generated while we waited
+        cached_path = self.lookup(archive_name)
+        if cached_path:
+            lock.release()
+            self.record(hits=1)
+            return CachedArchive(cached_path), True
+
+        return self._store(archive_name, archive_func, lock, streaming), False
+
+    def record(self, values=None, **counters):
+        """
+        Adds `counters`, and sets `values`, of the stats shared by all workers
+        """
+        try:
+            fd = _open_creating_dirs(
+                self.stats_path, os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                stats = self._read_stats(fd)
+                for key, value in counters.items():
+                    stats[key] = stats.get(key, 0) + value
+                stats.update(values or {})
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.ftruncate(fd, 0)
+                os.write(fd, json.dumps(stats))
+            finally:
+                os.close(fd)
+        except Exception:
+            log.exception('Failed to record archive cache stats')
+
+    def _read_stats(self, fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        data = ''
+        while True:
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            data += chunk
+        try:
+            return json.loads(data) if data else {}
+        except ValueError:
+            return {}
+
+    def get_stats(self):
+        stats = dict((key, 0) for key in STATS_KEYS)
+        stats['last_eviction'] = None
+        try:
+            fd = os.open(self.stats_path, os.O_RDONLY)
+        except OSError:
+            return stats
+        try:
+            # shared lock, so we don't read while `record` rewrites the file
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            stats.update(self._read_stats(fd))
+        finally:
+            os.close(fd)
+        return stats
+
+    def get_archives(self):
+        """
+        Returns (path, size, last access) of all cached archives
+        """
+        archives = []
+        for name in _listdir(self.cache_dir):
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            archives.append((path, stat.st_size, stat.st_mtime))
+        return archives
+
+    def _remove_stale_parts(self, now):
+        for name in _listdir(self.cache_dir):
+            if not (name.endswith('.part') or name.endswith('.tmp')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if now - os.stat(path).st_mtime > STALE_PART_AGE:
+                    log.debug('Removing stale archive part %s', path)
+                    _remove(path)
+            except OSError:
+                continue
+
+    def evict(self):
+        """
+        Removes the least recently used archives until the cache fits into
+        its limits. Returns removed paths, or None if another process is
+        already evicting.
+        """
+        lock = ArchiveLock(os.path.join(self.lock_dir, 'eviction.lock'))
+        if not lock.acquire(blocking=False):
+            return None
+        try:
+            now = self._clock()
+            archives = sorted(self.get_archives(), key=lambda a: a[2])
+            total_size = sum(size for _path, size, _atime in archives)
+
+            evicted = []
+            for path, size, last_access in archives:
+                too_old = self.max_age and now - last_access > self.max_age
+                too_big = self.max_size and total_size > self.max_size
+                if not (too_old or too_big):
+                    continue
+                try:
+                    _remove(path)
+                except OSError:
+                    log.exception('Failed to evict archive %s', path)
+                    continue
+                total_size -= size
+                evicted.append((path, size))
+
+            self._remove_stale_parts(now)
+            self.record(
+                values={'last_eviction': now}, evictions=len(evicted),
+                evicted_size=sum(size for _path, size in evicted))
+        finally:
+            lock.release()
+
+        if evicted:
+            log.info('Evicted %s archives from archive cache %s',
+                     len(evicted), self.cache_dir)
+        return [path for path, _size in evicted]
+
+    def schedule_eviction(self):
+        """
+        Runs `evict` in a background thread, at most once per eviction
+        interval of this process.
+        """
+        with self._eviction_lock:
+            now = self._clock()
+            if now - self._last_eviction < self.eviction_interval:
+                return False
+            self._last_eviction = now
+
+        def run_eviction():
+            try:
+                self.evict()
+            except Exception:
+                log.exception('Failed to evict archives from %s', self.cache_dir)
+
+        thread = threading.Thread(target=run_eviction, name='archive-eviction')
+        thread.daemon = True
+        thread.start()
+        return True
+
+
+_archive_cache = None
+_archive_cache_lock = threading.Lock()
+
+
+def get_archive_cache():
+    """
+    Returns the `ArchiveCache` of this instance, or None if archive cache
+    isn't configured.
+    """
+    global _archive_cache
+    if _archive_cache is None:
+        with _archive_cache_lock:
+            if _archive_cache is None:
+                settings = get_archive_settings()
+                archive_cache = False
+                if settings['cache_dir']:
+                    archive_cache = ArchiveCache(
+                        settings['cache_dir'],
+                        max_size=settings['max_size'],
+                        max_age=settings['max_age'],
+                        eviction_interval=settings['eviction_interval'])
+                # False marks disabled cache, so we don't re-check config
+                _archive_cache = archive_cache
+    return _archive_cache or None
@@ -32,12 +32,14 @@ import hashlib
 import itertools
 import logging
 import random
+import re
 import traceback
 from functools import wraps
 
 import ipaddress
 
 from pyramid.httpexceptions import HTTPForbidden, HTTPFound, HTTPNotFound
+from repoze.lru import LRUCache
 from sqlalchemy.orm.exc import ObjectDeletedError
 from sqlalchemy.orm import joinedload
 from zope.cachedescriptors.property import Lazy as LazyProperty
@@ -398,6 +400,78 @@ class BranchPermOriginDict(PermOriginDict):
             dict.__setitem__(self, key, patterns)
 
 
+class BranchPermMatcher(object):
+    """
+    Precompiled matcher of ordered branch permission rules. All patterns are
+    joined into a single regex, where alternation order keeps the semantics
+    of the first matching rule winning.
+
+    >>> rules = collections.OrderedDict()
+    >>> rules['stable*'] = 'branch.push'
+    >>> rules['*'] = 'branch.none'
+    >>> matcher = BranchPermMatcher(rules)
+    >>> matcher.match('stable-1.0')
+    ('`stable*`=>branch.push', 'branch.push')
+    >>> matcher.match('feature')
+    ('`*`=>branch.none', 'branch.none')
+    """
+    # python re module is limited to 100 named groups per expression
+    max_groups_per_regex = 90
+
+    def __init__(self, rules):
+        self.rules = rules.items()
+        self._regexes = []
+        for offset in range(0, len(self.rules), self.max_groups_per_regex):
+            chunk = self.rules[offset:offset + self.max_groups_per_regex]
+            self._regexes.append((offset, self._compile(chunk)))
+
+    @classmethod
+    def _translate(cls, pattern):
+        regex = fnmatch.translate(os.path.normcase(pattern))
+        # drop the end anchor and flags added by fnmatch, we add them once
+        # for the joined expression
+        if regex.endswith('\\Z(?ms)'):
+            regex = regex[:-len('\\Z(?ms)')]
+        return regex
+
+    @classmethod
+    def _compile(cls, rules):
+        alternatives = [
+            '(?P<r{}>{})\\Z'.format(idx, cls._translate(pattern))
+            for idx, (pattern, _perm) in enumerate(rules)]
+        return re.compile('(?ms)' + '|'.join(alternatives))
+
+    def match(self, branch_name):
+        """
+        Returns a tuple of (rule, branch_perm) for the first matching rule,
+        or ('', '') if none of the rules matches `branch_name`
+        """
+        branch_name = os.path.normcase(branch_name)
+        for offset, regex in self._regexes:
+            match = regex.match(branch_name)
+            if match:
+                pattern, branch_perm = self.rules[offset + int(match.lastgroup[1:])]
+                return '`{}`=>{}'.format(pattern, branch_perm), branch_perm
+        return '', ''
+
+
+_branch_perm_matchers = LRUCache(1024)
+
+
+def get_branch_perm_matcher(repo_branch_perms):
+    """
+    Returns a compiled matcher for the ordered branch rules of a repository.
+    Matchers are cached per process by the rules themselves, so any change in
+    the permission tree results in a new matcher.
+    """
+    key = tuple(repo_branch_perms.items())
+    matcher = _branch_perm_matchers.get(key)
+    if matcher is None:
+        matcher = BranchPermMatcher(repo_branch_perms)
+        _branch_perm_matchers.put(key, matcher)
+    return matcher
+
+
 class PermissionCalculator(object):
 
     def __init__(
@@ -1499,25 +1573,21 @@ class AuthUser(object):
         repo_branch_perms = branch_perms.get(repo_name)
         return repo_branch_perms or {}
 
-    def get_rule_and_branch_permission(self, repo_name, branch_name):
+    def get_rule_and_branch_permission(self, repo_name, branch_name, perms=None):
         """
         Check if this AuthUser has defined any permissions for branches. If any of
         the rules match in order, we return the matching permissions
         """
+        return self.get_branch_perm_matcher(repo_name, perms=perms).match(branch_name)
 
-        rule = default_perm = ''
-
-        repo_branch_perms = self.get_branch_permissions(repo_name=repo_name)
-        if not repo_branch_perms:
-            return rule, default_perm
-
-        # now calculate the permissions
-        for pattern, branch_perm in repo_branch_perms.items():
-            if fnmatch.fnmatch(branch_name, pattern):
-                rule = '`{}`=>{}'.format(pattern, branch_perm)
-                return rule, branch_perm
-
-        return rule, default_perm
+    def get_branch_perm_matcher(self, repo_name, perms=None):
+        """
+        Returns a cached, compiled matcher of branch rules for `repo_name`,
+        it should be re-used when checking multiple branches at once.
+        """
+        repo_branch_perms = self.get_branch_permissions(
+            repo_name=repo_name, perms=perms)
+        return get_branch_perm_matcher(repo_branch_perms)
 
     def get_notice_messages(self):
 
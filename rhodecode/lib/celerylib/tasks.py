@@ -37,7 +37,7 @@ from rhodecode.lib.celerylib import get_logger, async_task, RequestContextTask,
 from rhodecode.lib import hooks_base
 from rhodecode.lib.utils2 import safe_int, str2bool, aslist
 from rhodecode.model.db import (
-    Session, IntegrityError, true, Repository, RepoGroup, User)
+    Session, IntegrityError, true, Repository, User)
 from rhodecode.model.permission import PermissionModel
 
 
@@ -341,6 +341,36 @@ def repo_maintenance(repoid):
         log.debug('Repo `%s` not found or without a clone_url', repoid)
 
 
+@async_task(ignore_result=True)
+def warm_repo_caches(repo_id, token):
+    from pyramid.scripting import prepare
+    from rhodecode.lib import repo_warmup
+    from rhodecode.lib.celerylib.loader import celery_app
+    from rhodecode.lib.pyramid_utils import BootstrappedRequest
+
+    log = get_logger(warm_repo_caches)
+    if not repo_warmup.claim_warmup(repo_id, token):
+        log.debug('Skipping warm-up of repo `%s`, a newer one is scheduled',
+                  repo_id)
+        return
+
+    repo = Repository.get(repo_id)
+    if not repo:
+        log.debug('Repo `%s` not found, skipping warm-up', repo_id)
+        return
+
+    # template rendering and url generation need a request of the app
+    base_url = rhodecode.CONFIG.get('app.base_url') or 'http://rhodecode.local'
+    env = prepare(
+        request=BootstrappedRequest.blank('/', base_url=base_url),
+        registry=celery_app.conf['PYRAMID_REGISTRY'])
+    try:
+        executed_types = repo_warmup.RepoWarmup().execute(repo, env['request'])
+    finally:
+        env['closer']()
+    log.debug('Warmed up %s of repo `%s`', executed_types, repo.repo_name)
+
+
 @async_task(ignore_result=True)
 def check_for_update(send_email_notification=True, email_recipients=None):
     from rhodecode.model.update import UpdateModel
@@ -387,22 +417,16 @@ def beat_check(*args, **kwargs):
 
 
 def sync_last_update_for_objects(*args, **kwargs):
+    from rhodecode.model.repo import RepoModel
+    from rhodecode.model.repo_group import RepoGroupModel
+
     skip_repos = kwargs.get('skip_repos')
     if not skip_repos:
-        repos = Repository.query() \
-            .order_by(Repository.group_id.asc())
-
-        for repo in repos:
-            repo.update_commit_cache()
+        RepoModel.update_commit_cache()
 
     skip_groups = kwargs.get('skip_groups')
     if not skip_groups:
-        repo_groups = RepoGroup.query() \
-            .filter(RepoGroup.group_parent_id == None)
-
-        for root_gr in repo_groups:
-            for repo_gr in reversed(root_gr.recursive_groups()):
-                repo_gr.update_commit_cache()
+        RepoGroupModel.update_commit_cache()
 
 
 @async_task(ignore_result=True)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Entries of a directory with the size and last commit of its files, for the
+file browser.
+
+Sizes need a vcsserver call per file, and last commits a walk of the
+history. Entries are cached per commit and directory, and derived from the
+cached entries of the nearest ancestor: only files changed since that
+ancestor get new metadata. A directory which wasn't changed by a push is
+taken over as is, without any call per file.
+"""
+
+import logging
+import collections
+
+from dogpile.cache.api import NO_VALUE
+
+from rhodecode.lib import rc_cache
+from rhodecode.lib.utils2 import safe_str, safe_unicode, sha1
+from rhodecode.lib.vcs.nodes import NodeKind
+
+log = logging.getLogger(__name__)
+
+# backends where changed paths of a commit are listed against its parent
+INCREMENTAL_BACKENDS = ('git', 'hg')
+# ancestors checked for cached entries, each one costs two vcsserver calls
+MAX_ANCESTORS = 20
+
+CommitInfo = collections.namedtuple(
+    'CommitInfo', 'raw_id short_id idx date author message')
+
+
+def make_commit_info(commit):
+    return CommitInfo(
+        commit.raw_id, commit.short_id, commit.idx, commit.date,
+        commit.author, commit.message)
+
+
+class FileTreeEntry(object):
+    """
+    Node of a directory listing, with the attributes used by the file browser
+    """
+    __slots__ = ('kind', 'path', 'url', 'size', 'last_commit')
+
+    def __init__(self, kind, path, url=None, size=None, last_commit=None):
+        self.kind = kind
+        self.path = path
+        self.url = url
+        self.size = size
+        self.last_commit = last_commit
+
+    @property
+    def name(self):
+        return safe_unicode(self.path.rsplit('/', 1)[-1])
+
+    def is_file(self):
+        return self.kind == NodeKind.FILE
+
+    def is_dir(self):
+        return self.kind == NodeKind.DIR
+
+    def is_submodule(self):
+        return self.kind == NodeKind.SUBMODULE
+
+    def as_tuple(self):
+        last_commit = tuple(self.last_commit) if self.last_commit else None
+        return self.kind, self.path, self.url, self.size, last_commit
+
+    @classmethod
+    def from_tuple(cls, data):
+        kind, path, url, size, last_commit = data
+        if last_commit:
+            last_commit = CommitInfo(*last_commit)
+        return cls(kind, path, url=url, size=size, last_commit=last_commit)
+
+
+class FileTreeCache(object):
+    """
+    Stores entries of directories in a dogpile `region`, under `namespace`
+    """
+
+    def __init__(self, region, namespace, version):
+        self.region = region
+        self.namespace = namespace
+        self.version = version
+
+    def _key(self, commit_id, path):
+        return rc_cache.make_key(
+            self.region.actual_backend, self.namespace,
+            'file_tree_entries:{}:{}:{}'.format(
+                self.version, commit_id, sha1(safe_str(path))))
+
+    def get(self, commit_id, path):
+        value = self.region.get(self._key(commit_id, path))
+        if value is NO_VALUE:
+            return None
+        return value
+
+    def set(self, commit_id, path, entries):
+        self.region.set(self._key(commit_id, path), entries)
+
+
+def get_last_commit_infos(commit, paths):
+    """
+    Returns `CommitInfo` of the last commits of `paths`, found with a single
+    history walk by backends which support that.
+    """
+    pre_load = ['author', 'date', 'message', 'parents']
+    infos = {}
+    path_infos = {}
+    for path, path_commit in commit.get_path_commits(
+            paths, pre_load=pre_load).items():
+        if path_commit.raw_id not in infos:
+            infos[path_commit.raw_id] = make_commit_info(path_commit)
+        path_infos[path] = infos[path_commit.raw_id]
+    return path_infos
+
+
+def _make_entry(node, commit_info=None):
+    if node.is_submodule():
+        return FileTreeEntry(NodeKind.SUBMODULE, node.path, url=node.url)
+    if not node.is_file():
+        return FileTreeEntry(NodeKind.DIR, node.path)
+
+    if commit_info is None:
+        pre_load = ['author', 'date', 'message', 'parents']
+        commit_info = make_commit_info(
+            node.commit.get_path_commit(node.path, pre_load=pre_load))
+    return FileTreeEntry(
+        NodeKind.FILE, node.path, size=node.size, last_commit=commit_info)
+
+
+def compute_entries(commit, path):
+    """
+    Returns entries of the directory `path` of `commit`, with a size lookup
+    for every file and one lookup of the last commits of all files.
+    """
+    nodes = list(commit.get_node(path))
+    commit_infos = get_last_commit_infos(
+        commit, [node.path for node in nodes if node.is_file()])
+    return [_make_entry(node, commit_infos.get(node.path)) for node in nodes]
+
+
+def _find_cached_ancestor(commit, path, cache):
+    """
+    Returns the cached entries of `path` of the nearest first parent
+    ancestor of `commit`, and for paths changed since then the newest commit
+    which changed them. Returns None if there's no such ancestor within
+    `MAX_ANCESTORS` linear commits.
+    """
+    changed = {}
+    current = commit
+    for _ in range(MAX_ANCESTORS):
+        # last commits of a merge depend on the history of all parents
+        if len(current.parents) != 1:
+            return None
+        for changed_path in current.affected_files:
+            changed.setdefault(safe_str(changed_path), current)
+
+        current = current.parents[0]
+        entries = cache.get(current.raw_id, path)
+        if entries is not None:
+            log.debug('Deriving file tree entries of %s:%s from %s',
+                      commit, path, current)
+            return entries, changed
+    return None
+
+
+def derive_entries(commit, path, cache):
+    """
+    Returns entries of `path` of `commit` derived from a cached ancestor, or
+    None if there's none.
+    """
+    if commit.repository.alias not in INCREMENTAL_BACKENDS:
+        return None
+    found = _find_cached_ancestor(commit, path, cache)
+    if found is None:
+        return None
+    entries, changed = found
+    entries = [FileTreeEntry.from_tuple(entry) for entry in entries]
+
+    prefix = path + '/' if path else ''
+    if not any(changed_path.startswith(prefix) for changed_path in changed):
+        return entries
+
+    previous = dict((entry.path, entry) for entry in entries)
+    nodes = list(commit.get_node(path))
+    infos = {}
+    commit_infos = {}
+    unknown_paths = []
+    for node in nodes:
+        if not node.is_file():
+            continue
+        if node.path in changed:
+            changed_commit = changed[node.path]
+            if changed_commit.raw_id not in infos:
+                infos[changed_commit.raw_id] = make_commit_info(changed_commit)
+            commit_infos[node.path] = infos[changed_commit.raw_id]
+        elif node.path not in previous or not previous[node.path].is_file():
+            unknown_paths.append(node.path)
+    if unknown_paths:
+        commit_infos.update(get_last_commit_infos(commit, unknown_paths))
+
+    derived = []
+    for node in nodes:
+        entry = previous.get(node.path)
+        if node.is_file() and node.path not in commit_infos \
+                and entry is not None and entry.is_file():
+            derived.append(entry)
+        else:
+            derived.append(_make_entry(node, commit_infos.get(node.path)))
+    return derived
+
+
+def get_dir_entries(commit, path, cache=None):
+    """
+    Returns `FileTreeEntry` objects of the directory `path` of `commit`,
+    using and filling `cache` if given.
+    """
+    path = safe_str(path).strip('/')
+    if cache is None:
+        return compute_entries(commit, path)
+
+    entries = cache.get(commit.raw_id, path)
+    if entries is not None:
+        return [FileTreeEntry.from_tuple(entry) for entry in entries]
+
+    result = derive_entries(commit, path, cache)
+    if result is None:
+        result = compute_entries(commit, path)
+    cache.set(commit.raw_id, path, [entry.as_tuple() for entry in result])
+    return result
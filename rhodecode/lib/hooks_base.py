@@ -141,10 +141,12 @@ def pre_push(extras):
                         is_forced = bool(entry['pruned_sha'])
                         affected_branches.append([entry['name'], is_forced])
 
+            # compile the branch rules once, and check all pushed branches
+            branch_perm_matcher = auth_user.get_branch_perm_matcher(
+                extras.repository)
             for branch_name, is_forced in affected_branches:
 
-                rule, branch_perm = auth_user.get_rule_and_branch_permission(
-                    extras.repository, branch_name)
+                rule, branch_perm = branch_perm_matcher.match(branch_name)
                 if not branch_perm:
                     # no branch permission found for this branch, just keep checking
                     continue
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+HTTP caching of content addressed by a commit, like raw files and archives.
+
+Content at a full commit sha never changes, so it's sent as immutable.
+Content at a branch, tag or short sha is revalidated by clients with its
+ETag only, its commit date can go back in time when the reference is moved,
+so it isn't a valid Last-Modified. Responses are marked `private`, as they
+are permission checked.
+"""
+
+from pyramid.httpexceptions import HTTPNotModified
+from webob.datetime_utils import parse_date, serialize_date
+
+from rhodecode.lib.utils2 import safe_str, sha1
+
+# one year, the longest max-age allowed by RFC 7234
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def is_commit_addressed(commit_id, commit):
+    """
+    Returns True if `commit_id` from the URL is the full id of `commit`, so
+    the content can't change anymore.
+    """
+    return commit_id == commit.raw_id
+
+
+def make_etag(*parts):
+    """
+    Returns a strong ETag for content identified by `parts`, e.g. the commit
+    id and path of a file.
+    """
+    return sha1(':'.join(safe_str(part) for part in parts))
+
+
+def is_not_modified(request, etag=None, last_modified=None, immutable=False):
+    """
+    Returns True if the client of `request` already has the content of
+    `etag` or `last_modified`. If-None-Match takes precedence, like in
+    webob's conditional responses. `last_modified` is only used for
+    `immutable` content.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if request.if_none_match and etag:
+        return etag in request.if_none_match
+    if immutable and request.if_modified_since and last_modified:
+        # compare with the precision of the header
+        return parse_date(serialize_date(last_modified)) <= \
+            request.if_modified_since
+    return False
+
+
+def set_caching_headers(response, etag=None, last_modified=None,
+                        immutable=False):
+    """
+    Sets caching headers of `response`, and enables handling of conditional
+    and range requests by webob. Byte ranges are served if the response has
+    a `content_length`, it has to be set before.
+    """
+    if etag:
+        response.etag = etag
+    if last_modified and immutable:
+        response.last_modified = last_modified
+    if immutable:
+        response.cache_control = 'private, max-age={}, immutable'.format(
+            IMMUTABLE_MAX_AGE)
+    else:
+        response.cache_control = 'private, no-cache'
+    if response.content_length is not None:
+        response.accept_ranges = 'bytes'
+    response.conditional_response = True
+    return response
+
+
+def not_modified_response(etag=None, last_modified=None, immutable=False):
+    response = HTTPNotModified()
+    set_caching_headers(
+        response, etag=etag, last_modified=last_modified, immutable=immutable)
+    response.accept_ranges = None
+    return response
@@ -18,6 +18,8 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 import re
+import array
+import bisect
 
 import pygments.filter
 import pygments.filters
@@ -27,6 +29,11 @@ HL_BEG_MARKER = '__RCSearchHLMarkBEG__'
 HL_END_MARKER = '__RCSearchHLMarkEND__'
 HL_MARKER_RE = '{}(.*?){}'.format(HL_BEG_MARKER, HL_END_MARKER)
 
+# characters normalized to spaces, except line boundaries of str.splitlines()
+# and unicode.splitlines(), so phrases never match across lines
+_STR_NON_WORD = '[^\\w\n\r]'
+_UNICODE_NON_WORD = u'[^\\w\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]'
+
 
 class ElasticSearchHLFilter(pygments.filters.Filter):
     _names = [HL_BEG_MARKER, HL_END_MARKER]
@@ -151,6 +158,50 @@ def normalize_text_for_matching(x):
     return re.sub(r'[^\w]', ' ', x.lower())
 
 
+def get_line_starts(text):
+    """
+    Returns an array with the offsets where lines of `text` start, as split
+    by `text.splitlines()`, followed by the length of `text`, and the number
+    of lines.
+    """
+    starts = array.array('L', [0])
+    position = 0
+    for length in map(len, text.splitlines(True)):
+        position += length
+        starts.append(position)
+    return starts, len(starts) - 1
+
+
+def _get_line(text, starts, line_number):
+    line = text[starts[line_number - 1]:starts[line_number]].splitlines()
+    return line[0] if line else text[:0]
+
+
+def _compile_phrases(phrases, non_word):
+    """
+    Returns a regex matching any of normalized `phrases` in lower cased text,
+    without normalizing it
+    """
+    patterns = []
+    for phrase in phrases:
+        patterns.append(''.join(
+            non_word if char == ' ' else re.escape(char) for char in phrase))
+    return re.compile('|'.join(patterns))
+
+
+def _iter_matched_line_numbers(regex, text, starts, total_lines):
+    """
+    Yields numbers of lines spanned by matches of `regex` in `text`, in order
+    """
+    last = 0
+    for match in regex.finditer(text):
+        first = max(bisect.bisect_right(starts, match.start()), last + 1)
+        last = min(bisect.bisect_right(
+            starts, max(match.end() - 1, match.start())), total_lines)
+        for line_number in xrange(first, last + 1):
+            yield line_number
+
+
 def get_matching_line_offsets(lines, terms=None, markers=None):
     """ Return a set of `lines` indices (starting from 1) matching a
     text search query, along with `context` lines above/below matching lines
@@ -158,7 +209,8 @@ def get_matching_line_offsets(lines, terms=None, markers=None):
     :param lines: list of strings representing lines
     :param terms: search term string to match in lines eg. 'some text'
     :param markers: instead of terms, use highlight markers instead that
-        mark beginning and end for matched item. eg. ['START(.*?)END']
+        mark beginning and end for matched item. eg. ['START(.*?)END'],
+        `^` and `$` in markers match only next to newline characters
 
      eg.
 
@@ -173,25 +225,63 @@ def get_matching_line_offsets(lines, terms=None, markers=None):
     get_matching_line_offsets(text, 'text', context=1)
     6, {3: [(5, 9)], 6: [(0, 4)]]
 
+    All phrases or markers are first matched together in a single pass over
+    the whole text, and matches are mapped to lines with a binary search over
+    the line starts. Offsets are then computed only for the matched lines.
     """
+    text = lines
     matching_lines = {}
-    line_index = 0
+    starts, total_lines = get_line_starts(text)
 
     if terms:
         phrases = [normalize_text_for_matching(phrase)
                    for phrase in extract_phrases(terms)]
-
-        for line_index, line in enumerate(lines.splitlines(), start=1):
-            normalized_line = normalize_text_for_matching(line)
-            match_offsets = get_matching_phrase_offsets(normalized_line, phrases)
+        if not phrases:
+            return total_lines, matching_lines
+        if isinstance(text, unicode):
+            regex = _compile_phrases(phrases, _UNICODE_NON_WORD)
+        else:
+            regex = _compile_phrases(phrases, _STR_NON_WORD)
+        for line_number in _iter_matched_line_numbers(
+                regex, text.lower(), starts, total_lines):
+            normalized_line = normalize_text_for_matching(
+                _get_line(text, starts, line_number))
+            match_offsets = get_matching_phrase_offsets(
+                normalized_line, phrases)
             if match_offsets:
-                matching_lines[line_index] = match_offsets
+                matching_lines[line_number] = match_offsets
 
     else:
         markers = markers or [HL_MARKER_RE]
-        for line_index, line in enumerate(lines.splitlines(), start=1):
-            match_offsets = get_matching_markers_offsets(line, markers=markers)
+        regex = re.compile(
+            '|'.join('(?:{})'.format(mark) for mark in markers), re.MULTILINE)
+        for line_number in _iter_matched_line_numbers(
+                regex, text, starts, total_lines):
+            match_offsets = get_matching_markers_offsets(
+                _get_line(text, starts, line_number), markers=markers)
             if match_offsets:
-                matching_lines[line_index] = match_offsets
+                matching_lines[line_number] = match_offsets
 
-    return line_index, matching_lines
+    return total_lines, matching_lines
+
+
+def get_lines_of_interest(matching_lines, total_lines, max_lines=10,
+                          line_context=3):
+    """
+    Returns numbers of lines to show around the first matching lines, until
+    there are at least `max_lines` of them, and the number of shown matching
+    lines.
+
+    :param matching_lines: line numbers as returned by
+        `get_matching_line_offsets`
+    """
+    shown_matching_lines = 0
+    lines_of_interest = set()
+    for line_number in sorted(matching_lines):
+        if len(lines_of_interest) >= max_lines:
+            break
+        lines_of_interest.update(xrange(
+            max(line_number - line_context, 0),
+            min(line_number + line_context, total_lines + 1)))
+        shown_matching_lines += 1
+    return lines_of_interest, shown_matching_lines
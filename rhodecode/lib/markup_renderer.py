@@ -311,6 +311,12 @@ class MarkupRenderer(object):
         readme_data = renderer(source)
         return readme_data
 
+    def get_renderer(self, filename):
+        """
+        Returns the renderer function which `render` uses for `filename`
+        """
+        return self._detect_renderer(None, filename)
+
     @classmethod
     def _flavored_markdown(cls, text):
         """
@@ -24,6 +24,8 @@ import logging
 import rhodecode
 from rhodecode.lib.auth import AuthUser
 from rhodecode.lib.base import get_ip_addr, get_access_path, get_user_agent
+from rhodecode.lib.middleware.vcs import get_request_kind
+from rhodecode.lib.shared_stats import get_shared_stats
 from rhodecode.lib.utils2 import safe_str, get_current_rhodecode_user
 
 
@@ -43,9 +45,32 @@ class RequestWrapperTween(object):
             user = AuthUser.repr_user(ip=get_ip_addr(request.environ))
         return user
 
+    def _get_endpoint_name(self, request):
+        matched_route = getattr(request, 'matched_route', None)
+        if matched_route:
+            return matched_route.name
+        # VCS requests are recorded by the VCS middleware, they never get here
+        return get_request_kind(request.environ) or 'not_found'
+
+    def _record_shared_stats(self, shared_stats, request, response, total):
+        try:
+            error = response is None or response.status_int >= 500
+            shared_stats.request_finished(
+                self._get_endpoint_name(request), total, error=error)
+        except Exception:
+            log.exception('Failed to record request in shared stats')
+
     def __call__(self, request):
         start = time.time()
         log.debug('Starting request time measurement')
+        shared_stats = get_shared_stats()
+        if shared_stats:
+            try:
+                shared_stats.request_started()
+            except Exception:
+                log.exception('Failed to record request in shared stats')
+                shared_stats = None
+        response = None
         try:
             response = self.handler(request)
         finally:
@@ -56,6 +81,9 @@ class RequestWrapperTween(object):
             if statsd:
                 statsd.timing('rhodecode.req.timing', total)
                 statsd.incr('rhodecode.req.count')
+            if shared_stats:
+                self._record_shared_stats(
+                    shared_stats, request, response, total)
 
             log.info(
                 'Req[%4s] %s %s Request to %s time: %.4fs [%s], RhodeCode %s',
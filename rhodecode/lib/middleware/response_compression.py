@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Compression of data responses, like the JSON of the file search, refs or
+data grids. Unlike the `gzip_responses` WSGI middleware it only compresses
+the configured content types above a minimal size, streams compression of
+iterable responses and leaves VCS protocol responses alone.
+"""
+
+import zlib
+import logging
+
+from rhodecode.lib.utils2 import aslist, safe_int, str2bool
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'response_compression.enabled': True,
+    'response_compression.min_size': 1024,
+    'response_compression.level': 5,
+    'response_compression.content_types': 'application/json',
+}
+
+# in order of preference
+ENCODINGS = ('gzip', 'deflate')
+
+# level of payloads compressed once and cached, e.g. the file search nodes
+PRECOMPRESSED_LEVEL = 9
+
+
+def get_compression_settings(config):
+    return {
+        'enabled': str2bool(config.get(
+            'response_compression.enabled',
+            DEFAULTS['response_compression.enabled'])),
+        'min_size': safe_int(
+            config.get('response_compression.min_size'),
+            DEFAULTS['response_compression.min_size']),
+        'level': safe_int(
+            config.get('response_compression.level'),
+            DEFAULTS['response_compression.level']),
+        'content_types': aslist(config.get(
+            'response_compression.content_types',
+            DEFAULTS['response_compression.content_types']), sep=','),
+    }
+
+
+def get_accepted_encoding(request):
+    """
+    Returns the preferred compression encoding accepted by the client of
+    `request`, or None.
+    """
+    if not request.headers.get('Accept-Encoding'):
+        return None
+    offers = request.accept_encoding.acceptable_offers(ENCODINGS)
+    if not offers:
+        return None
+    return offers[0][0]
+
+
+def _compressobj(encoding, level):
+    # 16 + MAX_WBITS makes zlib write the gzip header and trailer
+    wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def compress(data, encoding='gzip', level=DEFAULTS['response_compression.level']):
+    compressor = _compressobj(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def iter_compressed(app_iter, encoding, level):
+    """
+    Compresses chunks of `app_iter` as they are produced
+    """
+    compressor = _compressobj(encoding, level)
+    try:
+        for chunk in app_iter:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+    finally:
+        close = getattr(app_iter, 'close', None)
+        if close:
+            close()
+
+
+def _add_vary(response):
+    vary = list(response.vary or [])
+    if 'accept-encoding' not in [v.lower() for v in vary]:
+        response.vary = vary + ['Accept-Encoding']
+
+
+def _mark_compressed(response, encoding):
+    response.content_encoding = encoding
+    if response.etag and response.etag_strong:
+        # compressed body isn't byte equal to the identity one anymore
+        response.etag = (response.etag, False)
+
+
+def accepts_precompressed(request):
+    """
+    Returns True if a gzip body, compressed ahead of time, can be sent as the
+    response to `request`.
+    """
+    settings = get_compression_settings(request.registry.settings)
+    return settings['enabled'] and get_accepted_encoding(request) == 'gzip'
+
+
+def precompressed_response(request, body, content_type='application/json'):
+    """
+    Returns the response of `request` with a gzip `body`, see
+    `accepts_precompressed`.
+    """
+    response = request.response
+    response.content_type = content_type
+    response.body = body
+    response.content_encoding = 'gzip'
+    _add_vary(response)
+    return response
+
+
+class ResponseCompressionTween(object):
+    def __init__(self, handler, registry):
+        self.handler = handler
+        self.settings = get_compression_settings(registry.settings)
+        self.content_types = frozenset(self.settings['content_types'])
+
+    def _is_compressible(self, request, response):
+        if request.method == 'HEAD' or response.status_int != 200:
+            return False
+        if response.content_encoding or 'Content-Range' in response.headers:
+            return False
+        return response.content_type in self.content_types
+
+    def __call__(self, request):
+        response = self.handler(request)
+        if not self.settings['enabled']:
+            return response
+        if not self._is_compressible(request, response):
+            return response
+
+        _add_vary(response)
+        encoding = get_accepted_encoding(request)
+        if not encoding:
+            return response
+
+        level = self.settings['level']
+        if isinstance(response.app_iter, (list, tuple)):
+            body = response.body
+            if len(body) < self.settings['min_size']:
+                return response
+            response.body = compress(body, encoding, level)
+            log.debug('Compressed %s response from %s to %s bytes',
+                      encoding, len(body), response.content_length)
+        else:
+            content_length = response.content_length
+            if content_length is not None and \
+                    content_length < self.settings['min_size']:
+                return response
+            response.app_iter = iter_compressed(
+                response.app_iter, encoding, level)
+            response.content_length = None
+
+        _mark_compressed(response, encoding)
+        return response
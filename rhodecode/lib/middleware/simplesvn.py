@@ -60,9 +60,9 @@ class SimpleSvnApp(object):
         stream = False
 
         if req_method in ['MKCOL'] or has_content_length:
-            data_processed = False
             # read chunk to check if we have txn-with-props
             initial_data = data.read(1024)
+            content_length = safe_int(environ.get('CONTENT_LENGTH'))
             if initial_data.startswith('(create-txn-with-props'):
                 data = initial_data + data.read()
                 # store on-the-fly our rc_extra using svn revision properties
@@ -73,12 +73,13 @@ class SimpleSvnApp(object):
                 # header defines data length, and serialized data
                 skel = ' rc-scm-extras {} {}'.format(rc_data_len, rc_data)
                 data = data[:-2] + skel + '))'
-                data_processed = True
-
-            if not data_processed:
+            elif content_length:
                 # NOTE(johbo): Avoid that we end up with sending the request in chunked
                 # transfer encoding (mainly on Gunicorn). If we know the content
-                # length, then we should transfer the payload in one request.
+                # length, the body is streamed with it, not buffered in memory.
+                data = simplevcs.PeekedStream(
+                    initial_data, data, length=content_length)
+            else:
                 data = initial_data + data.read()
 
         if req_method in ['GET', 'PUT'] or transfer_encoding == 'chunked':
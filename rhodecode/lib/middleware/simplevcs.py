@@ -28,7 +28,6 @@ import re
 import logging
 import importlib
 from functools import wraps
-from StringIO import StringIO
 from lxml import etree
 
 import time
@@ -40,7 +39,7 @@ from zope.cachedescriptors.property import Lazy as LazyProperty
 
 import rhodecode
 from rhodecode.authentication.base import authenticate, VCS_TYPE, loadplugin
-from rhodecode.lib import rc_cache
+from rhodecode.lib import rc_cache, repo_warmup, request_timing
 from rhodecode.lib.auth import AuthUser, HasPermissionAnyMiddleware
 from rhodecode.lib.base import (
     BasicAuth, get_ip_addr, get_user_agent, vcs_operation_context)
@@ -48,8 +47,10 @@ from rhodecode.lib.exceptions import (UserCreationError, NotAllowedToCreateUserE
 from rhodecode.lib.hooks_daemon import prepare_callback_daemon
 from rhodecode.lib.middleware import appenlight
 from rhodecode.lib.middleware.utils import scm_app_http
+from rhodecode.lib.repo_resolution import get_resolution_cache
 from rhodecode.lib.utils import is_valid_repo, SLUG_RE
-from rhodecode.lib.utils2 import safe_str, fix_PATH, str2bool, safe_unicode
+from rhodecode.lib.utils2 import (
+    safe_str, fix_PATH, str2bool, safe_unicode, safe_int)
 from rhodecode.lib.vcs.conf import settings as vcs_settings
 from rhodecode.lib.vcs.backends import base
 
@@ -62,6 +63,33 @@ from rhodecode.model.settings import SettingsModel, VcsSettingsModel
 log = logging.getLogger(__name__)
 
 
+SVN_TXN_ID_PAT = re.compile(r'/txn/(?P<txn_id>.*)')
+# max bytes of a MERGE body inspected for the svn txn_id, the `source`
+# element is sent first, followed by a possibly large list of lock tokens
+SVN_TXN_ID_MAX_PEEK = 64 * 1024
+
+
+def _get_svn_txn_id(acl_repo_name, href_el):
+    """
+    Returns txn_id for a `{DAV:}href` element of `{DAV:}source`, that is
+    a direct child of the document root, or None.
+    """
+    if href_el.tag != '{DAV:}href' or not href_el.text:
+        return None
+    source_el = href_el.getparent()
+    if source_el is None or source_el.tag != '{DAV:}source':
+        return None
+    root_el = source_el.getparent()
+    if root_el is None or root_el.getparent() is not None:
+        return None
+
+    match = SVN_TXN_ID_PAT.search(href_el.text)
+    if match:
+        svn_tx_id = match.groupdict()['txn_id']
+        return rc_cache.utils.compute_key_from_params(
+            acl_repo_name, svn_tx_id)
+
+
 def extract_svn_txn_id(acl_repo_name, data):
     """
     Helper method for extraction of svn txn_id from submitted XML data during
@@ -69,20 +97,100 @@ def extract_svn_txn_id(acl_repo_name, data):
     """
     try:
         root = etree.fromstring(data)
-        pat = re.compile(r'/txn/(?P<txn_id>.*)')
         for el in root:
             if el.tag == '{DAV:}source':
                 for sub_el in el:
-                    if sub_el.tag == '{DAV:}href':
-                        match = pat.search(sub_el.text)
-                        if match:
-                            svn_tx_id = match.groupdict()['txn_id']
-                            txn_id = rc_cache.utils.compute_key_from_params(
-                                acl_repo_name, svn_tx_id)
-                            return txn_id
+                    txn_id = _get_svn_txn_id(acl_repo_name, sub_el)
+                    if txn_id:
+                        return txn_id
+    except Exception:
+        log.exception('Failed to extract txn_id')
+
+
+class PeekedStream(object):
+    """
+    File like object, which returns already consumed `head` data followed
+    by the rest of the underlying `stream`. An optional `length` of the whole
+    data is exposed as `len`, so `requests` sends it with a Content-Length
+    instead of chunked.
+    """
+
+    def __init__(self, head, stream, length=None):
+        self.head = head
+        self.stream = stream
+        if length is not None:
+            self.len = length
+
+    def _take_head(self, size):
+        data, self.head = self.head[:size], self.head[size:]
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            return self._take_head(len(self.head)) + self.stream.read()
+        data = self._take_head(size)
+        if len(data) < size:
+            data += self.stream.read(size - len(data))
+        return data
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        newline = self.head.find('\n')
+        if newline != -1 and (size < 0 or newline < size):
+            return self._take_head(newline + 1)
+
+        data = self._take_head(len(self.head) if size < 0 else size)
+        if size < 0:
+            return data + self.stream.readline()
+        if len(data) < size:
+            data += self.stream.readline(size - len(data))
+        return data
+
+    def readlines(self, hint=None):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+
+def peek_svn_txn_id(acl_repo_name, stream, max_peek=SVN_TXN_ID_MAX_PEEK,
+                    chunk_size=8 * 1024):
+    """
+    Incrementally parses the beginning of an svn MERGE request body to
+    extract the txn_id, reading at most `max_peek` bytes of the `stream`.
+
+    Returns a tuple of (txn_id, stream), the returned stream replays the
+    peeked data followed by the rest of the original stream.
+    """
+    parser = etree.XMLPullParser(events=('end',))
+    chunks = []
+    peeked = 0
+    txn_id = None
+    try:
+        while txn_id is None and peeked < max_peek:
+            chunk = stream.read(min(chunk_size, max_peek - peeked))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            peeked += len(chunk)
+
+            parser.feed(chunk)
+            for _event, el in parser.read_events():
+                txn_id = _get_svn_txn_id(acl_repo_name, el)
+                if txn_id:
+                    break
     except Exception:
         log.exception('Failed to extract txn_id')
 
+    if txn_id is None:
+        log.debug('No svn txn_id found in first %s bytes of request', peeked)
+    return txn_id, PeekedStream(''.join(chunks), stream)
+
 
 def initialize_generator(factory):
     """
@@ -240,9 +348,19 @@ class SimpleVCS(object):
         data = repo_name.split('/')
         if len(data) >= 2:
             from rhodecode.model.repo import RepoModel
-            by_id_match = RepoModel().get_repo_by_id(repo_name)
-            if by_id_match:
-                data[1] = by_id_match.repo_name
+            resolution_cache = get_resolution_cache()
+            if resolution_cache:
+                repo_id = RepoModel()._extract_id_from_repo_name(repo_name)
+                by_id_name = None
+                if repo_id:
+                    by_id_name = resolution_cache.get_repo_name_by_id(
+                        safe_int(repo_id))
+                if by_id_name:
+                    data[1] = by_id_name
+            else:
+                by_id_match = RepoModel().get_repo_by_id(repo_name)
+                if by_id_match:
+                    data[1] = by_id_match.repo_name
 
         return safe_str('/'.join(data))
 
@@ -253,8 +371,24 @@ class SimpleVCS(object):
         :param repo_name: full repo name, also a cache key
         """
         ScmModel().mark_for_invalidation(repo_name)
+        repo_warmup.schedule_warmup(repo_name)
 
     def is_valid_and_existing_repo(self, repo_name, base_path, scm_type):
+        resolution_cache = get_resolution_cache()
+        if resolution_cache:
+            resolved = resolution_cache.get_repo(repo_name, base_path)
+            if not resolved:
+                log.debug('Repository `%s` not found inside the database.',
+                          repo_name)
+                return False
+
+            if resolved.repo_type != scm_type:
+                log.warning(
+                    'Repository `%s` have incorrect scm_type, expected %s got %s',
+                    repo_name, resolved.repo_type, scm_type)
+                return False
+            return resolved.valid
+
         db_repo = Repository.get_by_repo_name(repo_name)
         if not db_repo:
             log.debug('Repository `%s` not found inside the database.',
@@ -273,6 +407,12 @@ class SimpleVCS(object):
             repo_name, base_path,
             explicit_scm=scm_type, expect_scm=scm_type, config=config)
 
+    def _get_default_user(self):
+        resolution_cache = get_resolution_cache()
+        if resolution_cache:
+            return resolution_cache.get_default_user()
+        return User.get_default_user()
+
     def valid_and_active_user(self, user):
         """
         Checks if that user is not empty, and if it's actually object it checks
@@ -389,14 +529,20 @@ class SimpleVCS(object):
         return plugin_cache_active, cache_ttl
 
     def __call__(self, environ, start_response):
+        request_timing.start_timing(
+            environ, self.SCM, description='{} {}'.format(
+                environ.get('REQUEST_METHOD'), environ.get('PATH_INFO')))
         try:
-            return self._handle_request(environ, start_response)
+            with request_timing.timing_span('handle_request', environ):
+                response = self._handle_request(environ, start_response)
         except Exception:
             log.exception("Exception while handling request")
             appenlight.track_exception(environ)
-            return HTTPInternalServerError()(environ, start_response)
+            response = HTTPInternalServerError()(environ, start_response)
         finally:
             meta.Session.remove()
+        # timing is reported once the response is fully sent
+        return request_timing.TimedResponse(response, environ)
 
     def _handle_request(self, environ, start_response):
         if not self._check_ssl(environ, start_response):
@@ -446,18 +592,19 @@ class SimpleVCS(object):
         detect_force_push = False
         check_branch_perms = False
         if action in ['pull', 'push']:
-            user_obj = anonymous_user = User.get_default_user()
+            user_obj = anonymous_user = self._get_default_user()
             auth_user = user_obj.AuthUser()
             username = anonymous_user.username
             if anonymous_user.active:
                 plugin_cache_active, cache_ttl = self._get_default_cache_ttl()
                 # ONLY check permissions if the user is activated
-                anonymous_perm = self._check_permission(
-                    action, anonymous_user, auth_user, self.acl_repo_name, ip_addr,
-                    plugin_id='anonymous_access',
-                    plugin_cache_active=plugin_cache_active,
-                    cache_ttl=cache_ttl,
-                )
+                with request_timing.timing_span('check_permission', environ):
+                    anonymous_perm = self._check_permission(
+                        action, anonymous_user, auth_user, self.acl_repo_name, ip_addr,
+                        plugin_id='anonymous_access',
+                        plugin_cache_active=plugin_cache_active,
+                        cache_ttl=cache_ttl,
+                    )
             else:
                 anonymous_perm = False
 
@@ -478,9 +625,10 @@ class SimpleVCS(object):
 
                 # try to auth based on environ, container auth methods
                 log.debug('Running PRE-AUTH for container based authentication')
-                pre_auth = authenticate(
-                    '', '', environ, VCS_TYPE, registry=self.registry,
-                    acl_repo_name=self.acl_repo_name)
+                with request_timing.timing_span('auth', environ):
+                    pre_auth = authenticate(
+                        '', '', environ, VCS_TYPE, registry=self.registry,
+                        acl_repo_name=self.acl_repo_name)
                 if pre_auth and pre_auth.get('username'):
                     username = pre_auth['username']
                 log.debug('PRE-AUTH got %s as username', username)
@@ -498,7 +646,8 @@ class SimpleVCS(object):
                     self.authenticate.realm = self.authenticate.get_rc_realm()
 
                     try:
-                        auth_result = self.authenticate(environ)
+                        with request_timing.timing_span('auth', environ):
+                            auth_result = self.authenticate(environ)
                     except (UserCreationError, NotAllowedToCreateUserError) as e:
                         log.error(e)
                         reason = safe_str(e)
@@ -537,15 +686,17 @@ class SimpleVCS(object):
                     return HTTPNotAcceptable(reason)(environ, start_response)
 
                 # check permissions for this repository
-                perm = self._check_permission(
-                    action, user, auth_user, self.acl_repo_name, ip_addr,
-                    plugin, plugin_cache_active, cache_ttl)
+                with request_timing.timing_span('check_permission', environ):
+                    perm = self._check_permission(
+                        action, user, auth_user, self.acl_repo_name, ip_addr,
+                        plugin, plugin_cache_active, cache_ttl)
                 if not perm:
                     return HTTPForbidden()(environ, start_response)
                 environ['rc_auth_user_id'] = user_id
 
             if action == 'push':
-                perms = auth_user.get_branch_permissions(self.acl_repo_name)
+                with request_timing.timing_span('check_permission', environ):
+                    perms = auth_user.get_branch_permissions(self.acl_repo_name)
                 if perms:
                     check_branch_perms = True
                     detect_force_push = True
@@ -592,14 +743,14 @@ class SimpleVCS(object):
         txn_id = ''
         if 'CONTENT_LENGTH' in environ and environ['REQUEST_METHOD'] == 'MERGE':
             # case for SVN, we want to re-use the callback daemon port
-            # so we use the txn_id, for this we peek the body, and still save
-            # it as wsgi.input
-            data = environ['wsgi.input'].read()
-            environ['wsgi.input'] = StringIO(data)
-            txn_id = extract_svn_txn_id(self.acl_repo_name, data)
-
-        callback_daemon, extras = self._prepare_callback_daemon(
-            extras, environ, action, txn_id=txn_id)
+            # so we use the txn_id, for this we peek the beginning of the body,
+            # and replay it together with the rest of wsgi.input
+            txn_id, environ['wsgi.input'] = peek_svn_txn_id(
+                self.acl_repo_name, environ['wsgi.input'])
+
+        with request_timing.timing_span('callback_daemon', environ):
+            callback_daemon, extras = self._prepare_callback_daemon(
+                extras, environ, action, txn_id=txn_id)
         log.debug('HOOKS extras is %s', extras)
 
         http_scheme = self._get_http_scheme(environ)
@@ -610,7 +761,8 @@ class SimpleVCS(object):
             app.rc_extras = extras
 
             try:
-                response = app(environ, start_response)
+                with request_timing.timing_span('vcsserver', environ):
+                    response = app(environ, start_response)
             finally:
                 # This statement works together with the decorator
                 # "initialize_generator" above. The decorator ensures that
@@ -621,14 +773,17 @@ class SimpleVCS(object):
                 # generator is actually used.
                 yield "__init__"
 
-            # iter content
-            for chunk in response:
-                yield chunk
+            # iter content, this includes the time the client takes to
+            # consume it, so it's not counted as vcsserver time
+            with request_timing.timing_span('stream_response', environ):
+                for chunk in response:
+                    yield chunk
 
             try:
                 # invalidate cache on push
                 if action == 'push':
-                    self._invalidate_cache(self.url_repo_name)
+                    with request_timing.timing_span('invalidate_cache', environ):
+                        self._invalidate_cache(self.url_repo_name)
             finally:
                 meta.Session.remove()
 
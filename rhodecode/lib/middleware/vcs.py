@@ -18,11 +18,10 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
-import gzip
-import shutil
+import zlib
 import logging
-import tempfile
 import urlparse
+import functools
 
 from webob.exc import HTTPNotFound
 
@@ -31,6 +30,7 @@ from rhodecode.lib.middleware.appenlight import wrap_in_appenlight_if_enabled
 from rhodecode.lib.middleware.simplegit import SimpleGit, GIT_PROTO_PAT
 from rhodecode.lib.middleware.simplehg import SimpleHg
 from rhodecode.lib.middleware.simplesvn import SimpleSvn
+from rhodecode.lib.shared_stats import SharedStatsMiddleware
 from rhodecode.model.settings import VcsSettingsModel
 
 log = logging.getLogger(__name__)
@@ -38,12 +38,47 @@ log = logging.getLogger(__name__)
 VCS_TYPE_KEY = '_rc_vcs_type'
 VCS_TYPE_SKIP = '_rc_vcs_skip'
 
+# kind of request, detected once and stored in the environ for later layers
+REQUEST_KIND_KEY = '_rc_request_kind'
+REQUEST_KIND_VCS = 'vcs'
+REQUEST_KIND_WEB = 'web'
+REQUEST_KIND_STATIC = 'static'
+REQUEST_KIND_API = 'api'
+
+
+def _is_git_request(environ):
+    path_info = environ['PATH_INFO']
+    # every path matching GIT_PROTO_PAT contains one of those, the substring
+    # checks are much cheaper than the regex for all non git requests
+    if '/info/' in path_info or '/git-' in path_info:
+        return GIT_PROTO_PAT.match(path_info)
+    return None
+
+
+def _is_hg_request(environ):
+    http_accept = environ.get('HTTP_ACCEPT')
+    if http_accept and http_accept.startswith('application/mercurial'):
+        query = urlparse.parse_qs(environ['QUERY_STRING'])
+        return 'cmd' in query
+    return False
+
+
+def _is_svn_request(environ):
+    http_dav = environ.get('HTTP_DAV', '')
+    magic_path_segment = rhodecode.CONFIG.get(
+        'rhodecode_subversion_magic_path', '/!svn')
+    return (
+        'subversion' in http_dav or
+        magic_path_segment in environ['PATH_INFO']
+        or environ.get('REQUEST_METHOD') in ('PROPFIND', 'PROPPATCH')
+    )
+
 
 def is_git(environ):
     """
     Returns True if requests should be handled by GIT wsgi middleware
     """
-    is_git_path = GIT_PROTO_PAT.match(environ['PATH_INFO'])
+    is_git_path = _is_git_request(environ)
     log.debug(
         'request path: `%s` detected as GIT PROTOCOL %s', environ['PATH_INFO'],
         is_git_path is not None)
@@ -56,15 +91,7 @@ def is_hg(environ):
     Returns True if requests target is mercurial server - header
     ``HTTP_ACCEPT`` of such request would start with ``application/mercurial``.
     """
-    is_hg_path = False
-
-    http_accept = environ.get('HTTP_ACCEPT')
-
-    if http_accept and http_accept.startswith('application/mercurial'):
-        query = urlparse.parse_qs(environ['QUERY_STRING'])
-        if 'cmd' in query:
-            is_hg_path = True
-
+    is_hg_path = _is_hg_request(environ)
     log.debug(
         'request path: `%s` detected as HG PROTOCOL %s', environ['PATH_INFO'],
         is_hg_path)
@@ -76,15 +103,7 @@ def is_svn(environ):
     """
     Returns True if requests target is Subversion server
     """
-
-    http_dav = environ.get('HTTP_DAV', '')
-    magic_path_segment = rhodecode.CONFIG.get(
-        'rhodecode_subversion_magic_path', '/!svn')
-    is_svn_path = (
-        'subversion' in http_dav or
-        magic_path_segment in environ['PATH_INFO']
-        or environ['REQUEST_METHOD'] in ['PROPFIND', 'PROPPATCH']
-    )
+    is_svn_path = _is_svn_request(environ)
     log.debug(
         'request path: `%s` detected as SVN PROTOCOL %s', environ['PATH_INFO'],
         is_svn_path)
@@ -92,6 +111,121 @@ def is_svn(environ):
     return is_svn_path
 
 
+class GunzipStream(object):
+    """
+    File like object decompressing a gzip encoded stream on the fly.
+
+    Unlike `gzip.GzipFile` it doesn't require `seek` or `tell` on the
+    underlying stream, so `wsgi.input` can be wrapped directly. Only a single
+    chunk of compressed input and the decompressed data requested by the
+    reader are held in memory at any time.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, fileobj, chunk_size=None):
+        self.fileobj = fileobj
+        self.chunk_size = chunk_size or self.chunk_size
+        self._decompressor = self._new_decompressor()
+        self._member_started = False
+        # compressed data not yet fed into the decompressor
+        self._pending = b''
+        # decompressed data not yet returned to the reader
+        self._buffer = b''
+        self._eof = False
+
+    def _new_decompressor(self):
+        # 16 + MAX_WBITS makes zlib expect the gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def _member_finished(self):
+        # data fed after the end of a gzip member ends up in `unused_data`,
+        # check on a copy to not disturb the real decompressor
+        probe = self._decompressor.copy()
+        try:
+            probe.decompress(b'\x00')
+        except zlib.error:
+            return False
+        return bool(probe.unused_data)
+
+    def _fill(self, size):
+        """
+        Decompresses data until at least `size` bytes are buffered, or the
+        stream is exhausted. A `size` below 0 reads the whole stream.
+        """
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            if not self._pending:
+                self._pending = self.fileobj.read(self.chunk_size)
+                if not self._pending:
+                    self._eof = True
+                    if self._member_started and not self._member_finished():
+                        raise EOFError(
+                            'Compressed stream ended before the '
+                            'end-of-stream marker was reached')
+                    break
+
+            if not self._member_started:
+                # skip zero padding allowed between and after gzip members
+                self._pending = self._pending.lstrip(b'\x00')
+                if not self._pending:
+                    continue
+
+            max_length = 0 if size < 0 else max(size - len(self._buffer), 1)
+            self._member_started = True
+            self._buffer += self._decompressor.decompress(
+                self._pending, max_length)
+            self._pending = self._decompressor.unconsumed_tail
+
+            unused_data = self._decompressor.unused_data
+            if unused_data:
+                # end of a gzip member, the next one may follow
+                self._pending = unused_data
+                self._decompressor = self._new_decompressor()
+                self._member_started = False
+
+    def _take(self, size):
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            self._fill(-1)
+            return self._take(len(self._buffer))
+        self._fill(size)
+        return self._take(size)
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        while True:
+            newline = self._buffer.find(b'\n')
+            if newline != -1:
+                end = newline + 1
+                break
+            if self._eof or 0 <= size <= len(self._buffer):
+                end = len(self._buffer)
+                break
+            self._fill(len(self._buffer) + self.chunk_size)
+
+        if size >= 0:
+            end = min(end, size)
+        return self._take(end)
+
+    def readlines(self, hint=None):
+        return list(self)
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                break
+            yield line
+
+    def close(self):
+        close = getattr(self.fileobj, 'close', None)
+        if close:
+            close()
+
+
 class GunzipMiddleware(object):
     """
     WSGI middleware that unzips gzip-encoded requests before
@@ -106,19 +240,8 @@ class GunzipMiddleware(object):
 
         if b'gzip' in accepts_encoding_header:
             log.debug('gzip detected, now running gunzip wrapper')
-            wsgi_input = environ['wsgi.input']
-
-            if not hasattr(environ['wsgi.input'], 'seek'):
-                # The gzip implementation in the standard library of Python 2.x
-                # requires the '.seek()' and '.tell()' methods to be available
-                # on the input stream.  Read the data into a temporary file to
-                # work around this limitation.
-
-                wsgi_input = tempfile.SpooledTemporaryFile(64 * 1024 * 1024)
-                shutil.copyfileobj(environ['wsgi.input'], wsgi_input)
-                wsgi_input.seek(0)
-
-            environ['wsgi.input'] = gzip.GzipFile(fileobj=wsgi_input, mode='r')
+            # decompress on the fly, without spooling the whole body first
+            environ['wsgi.input'] = GunzipStream(environ['wsgi.input'])
             # since we "Ungzipped" the content we say now it's no longer gzip
             # content encoding
             del environ['HTTP_CONTENT_ENCODING']
@@ -139,6 +262,14 @@ def is_vcs_call(environ):
     return False
 
 
+def get_request_kind(environ):
+    """
+    Returns kind of request stored by `RequestClassifier`, or None if the
+    request wasn't classified yet.
+    """
+    return environ.get(REQUEST_KIND_KEY)
+
+
 def get_path_elem(route_path):
     if not route_path:
         return None
@@ -151,61 +282,146 @@ def get_path_elem(route_path):
     return None
 
 
-def detect_vcs_request(environ, backends):
-    checks = {
-        'hg': (is_hg, SimpleHg),
-        'git': (is_git, SimpleGit),
-        'svn': (is_svn, SimpleSvn),
-    }
-    handler = None
-    # List of path views first chunk we don't do any checks
-    white_list = [
+class PathPrefixTrie(object):
+    """
+    Maps paths to values, comparing whole path segments. A value is either
+    registered for a path prefix, matching the path and everything below it,
+    or for the exact path only. The longest match wins.
+    """
+    _PREFIX = '/prefix'
+    _EXACT = '/exact'
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, path, value, exact=False):
+        segments = path.strip('/').split('/')
+        node = self._root
+        for segment in segments:
+            node = node.setdefault(segment, {})
+        node[self._EXACT if exact else self._PREFIX] = value
+
+    def lookup(self, path, default=None):
+        path = path.lstrip('/')
+        node = self._root
+        found = default
+        start = 0
+        # walk segment by segment, most paths leave the trie at the first one
+        while True:
+            end = path.find('/', start)
+            segment = path[start:] if end == -1 else path[start:end]
+            node = node.get(segment)
+            if node is None:
+                return found
+            if end == -1:
+                return node.get(self._EXACT, node.get(self._PREFIX, found))
+            found = node.get(self._PREFIX, found)
+            start = end + 1
+
+
+class RequestClassifier(object):
+    """
+    Decides in a single pass if a request is a VCS, web, static or API
+    request. Known non VCS paths are resolved with a prefix trie, so the VCS
+    protocol checks only run for paths that can be a repository.
+
+    The result is stored in the environ under `REQUEST_KIND_KEY`, and for
+    compatibility the VCS type, or the skip marker, under `VCS_TYPE_KEY`.
+    """
+
+    # paths for which we don't do any VCS detection
+    skip_vcs_paths = [
+        # (path, kind, exact)
+
         # e.g /_file_store/download
-        '_file_store',
+        ('_file_store', REQUEST_KIND_WEB, False),
 
         # static files no detection
-        '_static',
+        ('_static', REQUEST_KIND_STATIC, False),
 
         # skip ops ping, status
-        '_admin/ops/ping',
-        '_admin/ops/status',
+        ('_admin/ops/ping', REQUEST_KIND_WEB, True),
+        ('_admin/ops/status', REQUEST_KIND_WEB, True),
 
         # full channelstream connect should be VCS skipped
-        '_admin/channelstream/connect',
+        ('_admin/channelstream/connect', REQUEST_KIND_WEB, True),
     ]
 
-    path_info = environ['PATH_INFO']
-
-    path_elem = get_path_elem(path_info)
-
-    if path_elem in white_list:
-        log.debug('path `%s` in whitelist, skipping...', path_info)
-        return handler
+    # the checks don't log, classify() logs the final result once
+    checks = {
+        'hg': _is_hg_request,
+        'git': _is_git_request,
+        'svn': _is_svn_request,
+    }
 
-    path_url = path_info.lstrip('/')
-    if path_url in white_list:
-        log.debug('full url path `%s` in whitelist, skipping...', path_url)
-        return handler
+    def __init__(self, backends, api_url='/_admin/api'):
+        self.backends = [b for b in backends if b in self.checks]
+        self._vcs_checks = [(b, self.checks[b]) for b in self.backends]
+        self.trie = PathPrefixTrie()
+        for path, kind, exact in self.skip_vcs_paths:
+            self.trie.add(path, kind, exact=exact)
+        if api_url:
+            self.trie.add(api_url, REQUEST_KIND_API, exact=True)
 
+    def classify(self, environ, detect_vcs=True):
+        """
+        Returns a tuple of (request kind, vcs type), where vcs type is the
+        `VCS_TYPE_SKIP` marker for non VCS requests.
+        """
+        kind = get_request_kind(environ)
+        if kind is not None:
+            return kind, environ.get(VCS_TYPE_KEY, VCS_TYPE_SKIP)
+
+        kind = self.trie.lookup(environ['PATH_INFO'])
+        vcs_type = VCS_TYPE_SKIP
+        if kind is None:
+            kind = REQUEST_KIND_WEB
+            if detect_vcs:
+                for backend, vcs_check in self._vcs_checks:
+                    if vcs_check(environ):
+                        kind, vcs_type = REQUEST_KIND_VCS, backend
+                        log.debug('request path: `%s` detected as %s PROTOCOL',
+                                  environ['PATH_INFO'], backend.upper())
+                        break
+
+        environ[REQUEST_KIND_KEY] = kind
+        environ[VCS_TYPE_KEY] = vcs_type
+        return kind, vcs_type
+
+
+_classifiers = {}
+
+
+def get_request_classifier(backends, api_url=None):
+    key = (tuple(backends or []), api_url)
+    classifier = _classifiers.get(key)
+    if classifier is None:
+        kwargs = {'api_url': api_url} if api_url else {}
+        classifier = _classifiers[key] = RequestClassifier(key[0], **kwargs)
+    return classifier
+
+
+def detect_vcs_request(environ, backends, api_url=None):
+    handlers = {
+        'hg': SimpleHg,
+        'git': SimpleGit,
+        'svn': SimpleSvn,
+    }
     if VCS_TYPE_KEY in environ:
-        raw_type = environ[VCS_TYPE_KEY]
-        if raw_type == VCS_TYPE_SKIP:
+        # classified already, or explicitly marked by an earlier layer
+        vcs_type = environ[VCS_TYPE_KEY]
+        if vcs_type == VCS_TYPE_SKIP:
             log.debug('got `skip` marker for vcs detection, skipping...')
-            return handler
-
-        _check, handler = checks.get(raw_type) or [None, None]
-        if handler:
-            log.debug('got handler:%s from environ', handler)
-
-    if not handler:
-        log.debug('request start: checking if request for `%s` is of VCS type in order: %s', path_elem, backends)
-        for vcs_type in backends:
-            vcs_check, _handler = checks[vcs_type]
-            if vcs_check(environ):
-                log.debug('vcs handler found %s', _handler)
-                handler = _handler
-                break
-
+            return None
+        if vcs_type in handlers:
+            log.debug('got handler:%s from environ', handlers[vcs_type])
+            return handlers[vcs_type]
+
+    _kind, vcs_type = get_request_classifier(
+        backends, api_url).classify(environ)
+    handler = handlers.get(vcs_type)
+    if handler:
+        log.debug('vcs handler found %s', handler)
     return handler
 
 
@@ -238,47 +454,56 @@ class VCSMiddleware(object):
     def _get_handler_app(self, environ):
         app = None
         log.debug('VCSMiddleware: detecting vcs type.')
-        handler = detect_vcs_request(environ, self.check_middlewares)
+        handler = detect_vcs_request(
+            environ, self.check_middlewares,
+            self.config.get('rhodecode.api.url'))
         if handler:
             app = handler(self.config, self.registry)
 
         return app
 
+    def _handle_vcs_request(self, vcs_handler, environ, start_response):
+        # translate the _REPO_ID into real repo NAME for usage
+        # in middleware
+        environ['PATH_INFO'] = vcs_handler._get_by_id(environ['PATH_INFO'])
+
+        # Set acl, url and vcs repo names.
+        vcs_handler.set_repo_names(environ)
+
+        # register repo config back to the handler
+        vcs_conf = self.vcs_config(vcs_handler.acl_repo_name)
+        # maybe damaged/non existent settings. We still want to
+        # pass that point to validate on is_valid_and_existing_repo
+        # and return proper HTTP Code back to client
+        if vcs_conf:
+            vcs_handler.repo_vcs_config = vcs_conf
+
+        # check for type, presence in database and on filesystem
+        if not vcs_handler.is_valid_and_existing_repo(
+                vcs_handler.acl_repo_name,
+                vcs_handler.base_path,
+                vcs_handler.SCM):
+            return HTTPNotFound()(environ, start_response)
+
+        environ['REPO_NAME'] = vcs_handler.url_repo_name
+
+        # Wrap handler in middlewares if they are enabled.
+        vcs_handler = self.wrap_in_gzip_if_enabled(
+            vcs_handler, self.config)
+        vcs_handler, _ = wrap_in_appenlight_if_enabled(
+            vcs_handler, self.config, self.appenlight_client)
+
+        return vcs_handler(environ, start_response)
+
     def __call__(self, environ, start_response):
         # check if we handle one of interesting protocols, optionally extract
         # specific vcsSettings and allow changes of how things are wrapped
         vcs_handler = self._get_handler_app(environ)
         if vcs_handler:
-            # translate the _REPO_ID into real repo NAME for usage
-            # in middleware
-            environ['PATH_INFO'] = vcs_handler._get_by_id(environ['PATH_INFO'])
-
-            # Set acl, url and vcs repo names.
-            vcs_handler.set_repo_names(environ)
-
-            # register repo config back to the handler
-            vcs_conf = self.vcs_config(vcs_handler.acl_repo_name)
-            # maybe damaged/non existent settings. We still want to
-            # pass that point to validate on is_valid_and_existing_repo
-            # and return proper HTTP Code back to client
-            if vcs_conf:
-                vcs_handler.repo_vcs_config = vcs_conf
-
-            # check for type, presence in database and on filesystem
-            if not vcs_handler.is_valid_and_existing_repo(
-                    vcs_handler.acl_repo_name,
-                    vcs_handler.base_path,
-                    vcs_handler.SCM):
-                return HTTPNotFound()(environ, start_response)
-
-            environ['REPO_NAME'] = vcs_handler.url_repo_name
-
-            # Wrap handler in middlewares if they are enabled.
-            vcs_handler = self.wrap_in_gzip_if_enabled(
-                vcs_handler, self.config)
-            vcs_handler, _ = wrap_in_appenlight_if_enabled(
-                vcs_handler, self.config, self.appenlight_client)
-
-            return vcs_handler(environ, start_response)
+            # VCS requests don't reach the pyramid request wrapper tween
+            app = SharedStatsMiddleware(
+                functools.partial(self._handle_vcs_request, vcs_handler),
+                'vcs.{}'.format(vcs_handler.SCM))
+            return app(environ, start_response)
 
         return self.application(environ, start_response)
@@ -0,0 +1,385 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Persistent index of all paths of a commit, for the file finder.
+
+Listing all paths of a commit by walking it needs a vcsserver call and node
+objects per directory. The index is built once per tree id, from a listing of
+the whole tree, or from the index of the parent commit and the changes of the
+commit. It's stored in a file which is memory mapped by all workers::
+
+    header | entries | restarts
+
+    header:   magic, count, restart interval, entries size, restarts count
+    entry:    shared prefix length, suffix length, kind, suffix
+    restarts: offsets of every Nth entry, stored without a shared prefix
+
+Entries are sorted, so paths under a directory are next to each other, and
+found by a binary search over the restart entries.
+"""
+
+import os
+import mmap
+import errno
+import struct
+import logging
+import tempfile
+import threading
+
+import rhodecode
+from rhodecode.lib.utils2 import safe_int, safe_str, str2bool
+from rhodecode.lib.vcs.utils.paths import get_unique_dirs_for_paths
+
+log = logging.getLogger(__name__)
+
+MAGIC = 'RCPATHS1'
+KIND_DIR = 0
+KIND_FILE = 1
+RESTART_INTERVAL = 16
+# backends where directories exist only because of files in them
+INCREMENTAL_BACKENDS = ('git', 'hg')
+
+DEFAULTS = {
+    'path_index.enabled': True,
+    'path_index.dir': '',
+    'path_index.max_per_repo': 100,
+}
+
+_HEADER = struct.Struct('<8sIIII')
+_ENTRY = struct.Struct('<HHB')
+
+
+def build_index(dir_paths, file_paths, restart_interval=RESTART_INTERVAL):
+    """
+    Returns the serialized index of `dir_paths` and `file_paths`
+    """
+    entries = sorted(
+        [(safe_str(path), KIND_DIR) for path in dir_paths] +
+        [(safe_str(path), KIND_FILE) for path in file_paths])
+
+    chunks = []
+    restarts = []
+    offset = 0
+    previous = ''
+    for idx, (path, kind) in enumerate(entries):
+        if idx % restart_interval == 0:
+            restarts.append(offset)
+            shared = 0
+        else:
+            shared = _shared_prefix_length(previous, path)
+        suffix = path[shared:]
+        chunks.append(_ENTRY.pack(shared, len(suffix), kind))
+        chunks.append(suffix)
+        offset += _ENTRY.size + len(suffix)
+        previous = path
+
+    header = _HEADER.pack(
+        MAGIC, len(entries), restart_interval, offset, len(restarts))
+    footer = struct.pack('<{}I'.format(len(restarts)), *restarts)
+    return ''.join([header] + chunks + [footer])
+
+
+def _shared_prefix_length(first, second):
+    # binary search, slice comparisons are much faster than a loop over chars
+    low, high = 0, min(len(first), len(second), 0xFFFF)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if first[:mid] == second[:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class PathIndex(object):
+    """
+    Read access to a serialized index, `data` can be a string or a mmap
+    """
+
+    def __init__(self, data):
+        magic, count, interval, size, restarts = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a path index')
+        self._data = data
+        self._count = count
+        self._start = _HEADER.size
+        self._end = self._start + size
+        self._restarts = struct.unpack_from(
+            '<{}I'.format(restarts), data, self._end)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        """
+        Yields (path, kind) of all entries, sorted by path
+        """
+        return self._iter_from(0)
+
+    def _iter_from(self, offset):
+        data = self._data
+        unpack_from = _ENTRY.unpack_from
+        entry_size = _ENTRY.size
+        position = self._start + offset
+        end = self._end
+        path = ''
+        while position < end:
+            shared, length, kind = unpack_from(data, position)
+            position += entry_size
+            path = path[:shared] + data[position:position + length]
+            position += length
+            yield path, kind
+
+    def _restart_path(self, restart):
+        position = self._start + self._restarts[restart]
+        _shared, length, _kind = _ENTRY.unpack_from(self._data, position)
+        position += _ENTRY.size
+        return self._data[position:position + length]
+
+    def _find_restart(self, path):
+        """
+        Returns offset of the last restart entry before `path`
+        """
+        low, high = 0, len(self._restarts)
+        while low < high:
+            mid = (low + high) // 2
+            if self._restart_path(mid) < path:
+                low = mid + 1
+            else:
+                high = mid
+        return self._restarts[max(low - 1, 0)] if self._restarts else 0
+
+    def iter_prefix(self, prefix):
+        """
+        Yields (path, kind) of entries starting with `prefix`
+        """
+        prefix = safe_str(prefix)
+        for path, kind in self._iter_from(self._find_restart(prefix)):
+            if path.startswith(prefix):
+                yield path, kind
+            elif path > prefix:
+                break
+
+    def list_paths(self, root_path=''):
+        """
+        Returns lists of directory and file paths under `root_path`
+        """
+        root_path = safe_str(root_path).strip('/')
+        prefix = root_path + '/' if root_path else ''
+        dir_paths = []
+        file_paths = []
+        for path, kind in self.iter_prefix(prefix):
+            if kind == KIND_FILE:
+                file_paths.append(path)
+            else:
+                dir_paths.append(path)
+        return dir_paths, file_paths
+
+    def list_dir(self, path=''):
+        """
+        Returns lists of the directory and file paths directly in `path`
+        """
+        path = safe_str(path).strip('/')
+        depth = path.count('/') + 1 if path else 0
+        dir_paths, file_paths = self.list_paths(path)
+        return ([p for p in dir_paths if p.count('/') == depth],
+                [p for p in file_paths if p.count('/') == depth])
+
+    def derive(self, added_paths, removed_paths):
+        """
+        Returns paths of a commit changing `added_paths` and `removed_paths`
+        of the commit of this index. Only for backends where directories
+        exist because of files in them.
+        """
+        file_paths = set(path for path, kind in self if kind == KIND_FILE)
+        file_paths.difference_update(safe_str(p) for p in removed_paths)
+        file_paths.update(safe_str(p) for p in added_paths)
+        dir_paths = get_unique_dirs_for_paths(file_paths)
+        return dir_paths, file_paths
+
+
+def get_path_index_settings(config=None):
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    index_dir = config.get('path_index.dir') or DEFAULTS['path_index.dir']
+    if not index_dir:
+        cache_dir = config.get('cache_dir') or os.path.join(
+            tempfile.gettempdir(), 'rc_cache')
+        index_dir = os.path.join(cache_dir, 'path_index')
+
+    return {
+        'enabled': str2bool(config.get(
+            'path_index.enabled', DEFAULTS['path_index.enabled'])),
+        'dir': index_dir,
+        'max_per_repo': safe_int(
+            config.get('path_index.max_per_repo'),
+            DEFAULTS['path_index.max_per_repo']),
+    }
+
+
+class PathIndexStore(object):
+    """
+    Path indexes in `index_dir`, in a directory per repository. Only
+    `max_per_repo` least recently used indexes are kept per repository.
+    """
+
+    def __init__(self, index_dir, max_per_repo=100):
+        self.index_dir = index_dir
+        self.max_per_repo = max_per_repo
+
+    def _repo_dir(self, repo_id):
+        return os.path.join(self.index_dir, str(repo_id))
+
+    def _index_path(self, repo_id, key):
+        return os.path.join(self._repo_dir(repo_id), '{}.idx'.format(key))
+
+    def get(self, repo_id, key):
+        """
+        Returns the stored `PathIndex` of `key`, or None
+        """
+        path = self._index_path(repo_id, key)
+        try:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # marks the index as recently used
+            os.utime(path, None)
+        except (IOError, OSError, ValueError) as e:
+            if getattr(e, 'errno', None) != errno.ENOENT:
+                log.warning('Failed to read path index %s: %s', path, e)
+            return None
+
+        try:
+            return PathIndex(data)
+        except (ValueError, struct.error):
+            log.warning('Removing broken path index %s', path)
+            data.close()
+            self._remove(path)
+            return None
+
+    def put(self, repo_id, key, data):
+        """
+        Stores the serialized index `data` of `key` and returns its
+        `PathIndex`
+        """
+        repo_dir = self._repo_dir(repo_id)
+        try:
+            os.makedirs(repo_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        fd, tmp_path = tempfile.mkstemp(dir=repo_dir, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.rename(tmp_path, self._index_path(repo_id, key))
+        except Exception:
+            self._remove(tmp_path)
+            raise
+
+        self.cleanup(repo_id)
+        return PathIndex(data)
+
+    def cleanup(self, repo_id):
+        """
+        Removes least recently used indexes of `repo_id` above the limit
+        """
+        if not self.max_per_repo:
+            return []
+        repo_dir = self._repo_dir(repo_id)
+        indexes = []
+        for name in os.listdir(repo_dir):
+            if not name.endswith('.idx'):
+                continue
+            path = os.path.join(repo_dir, name)
+            try:
+                indexes.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+
+        removed = []
+        indexes.sort()
+        for _mtime, path in indexes[:max(len(indexes) - self.max_per_repo, 0)]:
+            self._remove(path)
+            removed.append(path)
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+def get_commit_path_index(repo_id, commit, store):
+    """
+    Returns the `PathIndex` of `commit`, built from the index of its parent
+    if that one is stored, or from a listing of the whole commit.
+    """
+    key = commit.tree_id
+    path_index = store.get(repo_id, key)
+    if path_index is not None:
+        return path_index
+
+    paths = None
+    # submodules are changed like files, but they aren't listed as files
+    if commit.repository.alias in INCREMENTAL_BACKENDS \
+            and len(commit.parents) == 1 \
+            and not commit.changed_submodule_paths:
+        parent_index = store.get(repo_id, commit.parents[0].tree_id)
+        if parent_index is not None:
+            log.debug('Deriving path index of %s from its parent', commit)
+            paths = parent_index.derive(
+                commit.added_paths, commit.removed_paths)
+
+    if paths is None:
+        log.debug('Building path index of %s', commit)
+        paths = commit.get_paths()
+
+    data = build_index(*paths)
+    try:
+        return store.put(repo_id, key, data)
+    except Exception:
+        log.exception('Failed to store path index of %s', commit)
+        return PathIndex(data)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_path_index_store():
+    """
+    Returns the `PathIndexStore` of this instance, or None if path indexes
+    are disabled.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                settings = get_path_index_settings()
+                store = False
+                if settings['enabled']:
+                    store = PathIndexStore(
+                        settings['dir'], max_per_repo=settings['max_per_repo'])
+                # False marks disabled indexes, so we don't re-check config
+                _store = store
+    return _store or None
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Fuzzy search of the paths of a commit, for the file finder.
+
+A path matches if it contains all characters of the query in order, case
+insensitive. All paths are joined into one string, and matched by a single
+regular expression, so only matching paths are handled in Python. Every
+character class of the expression excludes the character which follows it,
+so matching never backtracks over a path more than once.
+
+Results are ranked by the distance between the first and the last matched
+character, matches in the file name first, then by shorter paths.
+"""
+
+import re
+import heapq
+import bisect
+import logging
+from array import array
+
+from repoze.lru import LRUCache
+
+from rhodecode.lib.utils2 import safe_str, safe_unicode
+
+log = logging.getLogger(__name__)
+
+MAX_QUERY_LENGTH = 128
+# searches of recently used commits kept per process
+SEARCH_CACHE_SIZE = 4
+
+
+def fuzzy_match(path, query):
+    """
+    Returns positions of the characters of `query` in `path`, matched left
+    to right, or None if `path` doesn't contain all of them in order.
+    """
+    positions = []
+    start = 0
+    for char in query:
+        position = path.find(char, start)
+        if position == -1:
+            return None
+        positions.append(position)
+        start = position + 1
+    return positions
+
+
+def _compile_query(query):
+    parts = []
+    for char in query:
+        escaped = re.escape(char)
+        parts.append(u'[^\n{0}]*{0}'.format(escaped))
+    return re.compile(
+        u'^{}[^\n]*$'.format(u''.join(parts)), re.MULTILINE | re.UNICODE)
+
+
+class PathSearch(object):
+    """
+    Search over `dir_paths` and `file_paths`, matching is case insensitive.
+    """
+
+    def __init__(self, dir_paths, file_paths):
+        self._dirs = frozenset(safe_unicode(path) for path in dir_paths)
+        self._paths = sorted(
+            self._dirs.union(safe_unicode(path) for path in file_paths))
+        self.count = len(self._paths)
+
+        # lower case paths are matched, line starts map matches to paths
+        self._line_starts = array('L')
+        lower_paths = []
+        offset = 0
+        for path in self._paths:
+            path_lower = path.lower()
+            lower_paths.append(path_lower)
+            self._line_starts.append(offset)
+            offset += len(path_lower) + 1
+        self._text_lower = u'\n'.join(lower_paths)
+
+    def _iter_candidates(self, query):
+        regex = _compile_query(query)
+        for match in regex.finditer(self._text_lower):
+            idx = bisect.bisect_right(self._line_starts, match.start()) - 1
+            yield self._paths[idx], match.group(0)
+
+    def _rank(self, path, path_lower, query):
+        positions = fuzzy_match(path_lower, query)
+        in_name = positions[0] > path_lower.rfind(u'/')
+        return (positions[-1] - positions[0], not in_name, len(path), path,
+                positions)
+
+    def search(self, query, limit=20, path_filter=None):
+        """
+        Returns the `limit` best matches of `query` as dicts with name, type
+        and positions of matched characters in the name, and the number of
+        all matches. `path_filter` removes paths the user can't access.
+        """
+        query = safe_unicode(query).replace(u'\n', u'').lower()
+        query = query[:MAX_QUERY_LENGTH]
+        if not query:
+            return [], 0
+
+        ranked = []
+        for path, path_lower in self._iter_candidates(query):
+            if path_filter and not path_filter.path_access_allowed(
+                    safe_str(path)):
+                continue
+            ranked.append(self._rank(path, path_lower, query))
+
+        results = []
+        for rank in heapq.nsmallest(limit, ranked):
+            path, positions = rank[-2:]
+            results.append({
+                'name': path,
+                'type': 'dir' if path in self._dirs else 'file',
+                'highlight': positions,
+            })
+        return results, len(ranked)
+
+
+_searches = LRUCache(SEARCH_CACHE_SIZE)
+
+
+def get_path_search(key, get_paths):
+    """
+    Returns the `PathSearch` of `key`, created from `get_paths()` which
+    returns directory and file paths, if it isn't cached in this process.
+    """
+    path_search = _searches.get(key)
+    if path_search is None:
+        log.debug('Creating path search for %s', key)
+        path_search = PathSearch(*get_paths())
+        _searches.put(key, path_search)
+    return path_search
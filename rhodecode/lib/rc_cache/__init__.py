@@ -43,12 +43,13 @@ log = logging.getLogger(__name__)
 from . import region_meta
 from .utils import (
     get_default_cache_settings, backend_key_generator, get_or_create_region,
-    clear_cache_namespace, make_region, InvalidationContext,
+    clear_cache_namespace, make_key, make_region, InvalidationContext,
     FreshRegionCache, ActiveRegionCache)
 
 
 FILE_TREE_CACHE_VER = 'v4'
 LICENSE_CACHE_VER = 'v2'
+README_CACHE_VER = 'v1'
 
 
 def configure_dogpile_cache(settings):
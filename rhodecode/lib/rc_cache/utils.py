@@ -216,16 +216,24 @@ def key_generator(backend, namespace, fn):
     fname = fn.__name__
 
     def generate_key(*args):
-        backend_prefix = getattr(backend, 'key_prefix', None) or 'backend_prefix'
-        namespace_pref = namespace or 'default_namespace'
         arg_key = compute_key_from_params(*args)
-        final_key = "{}:{}:{}_{}".format(backend_prefix, namespace_pref, fname, arg_key)
+        final_key = make_key(backend, namespace, "{}_{}".format(fname, arg_key))
 
         return final_key
 
     return generate_key
 
 
+def make_key(backend, namespace, name):
+    """
+    Builds key `name` of `namespace` the way cached functions do, so it's
+    found by `clear_cache_namespace` of that namespace
+    """
+    backend_prefix = getattr(backend, 'key_prefix', None) or 'backend_prefix'
+    namespace_pref = namespace or 'default_namespace'
+    return "{}:{}:{}".format(backend_prefix, namespace_pref, name)
+
+
 def get_or_create_region(region_name, region_namespace=None):
     from rhodecode.lib.rc_cache.backends import FileNamespaceBackend
     region_obj = region_meta.dogpile_cache_regions.get(region_name)
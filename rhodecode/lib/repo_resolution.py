@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Process local cache of the repository lookups done at the start of every VCS
+request: repo name -> database row and filesystem validity, `_<ID>` urls ->
+repo name, and the default (anonymous) user.
+
+Only positive lookups of fully created repositories are stored, so creating
+a repository never needs an invalidation. Renames, deletes, archiving and
+locking mark the `CacheKey.REPO_RESOLUTION_INVALIDATION_NAMESPACE` invalid,
+and every process re-checks this namespace at most every
+`vcs.repo_resolution_cache_check_interval` seconds.
+"""
+
+import os
+import time
+import logging
+import threading
+import collections
+
+from repoze.lru import LRUCache
+
+import rhodecode
+from rhodecode.lib.utils2 import safe_int, safe_str, str2bool
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'vcs.repo_resolution_cache': True,
+    'vcs.repo_resolution_cache_check_interval': 5,
+}
+
+RepoResolution = collections.namedtuple(
+    'RepoResolution', [
+        'repo_id', 'repo_name', 'repo_type', 'repo_path', 'repo_state',
+        'archived', 'locked', 'valid'])
+
+
+class DefaultUser(object):
+    """
+    Detached copy of the attributes of the default user used by the VCS
+    middleware, safe to keep across requests and database sessions.
+    """
+
+    def __init__(self, user_id, username, active, inherit_default_permissions):
+        self.user_id = user_id
+        self.username = username
+        self.active = active
+        self.inherit_default_permissions = inherit_default_permissions
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.user_id, user.username, user.active,
+                   user.inherit_default_permissions)
+
+    def AuthUser(self, **kwargs):
+        from rhodecode.lib.auth import AuthUser
+        return AuthUser(user_id=self.user_id, username=self.username, **kwargs)
+
+    def __repr__(self):
+        return '<DefaultUser:{} active:{}>'.format(self.user_id, self.active)
+
+
+def load_repo(repo_name, base_path):
+    """
+    Resolves `repo_name` from the database and checks it on the filesystem,
+    returns a `RepoResolution` or None if the repository doesn't exist.
+    """
+    from rhodecode.lib.utils import is_valid_repo
+    from rhodecode.model.db import Repository
+
+    db_repo = Repository.get_by_repo_name(repo_name)
+    if not db_repo:
+        return None
+
+    config = db_repo._config
+    config.set('extensions', 'largefiles', '')
+    valid = is_valid_repo(
+        repo_name, base_path, explicit_scm=db_repo.repo_type,
+        expect_scm=db_repo.repo_type, config=config)
+
+    return RepoResolution(
+        repo_id=db_repo.repo_id,
+        repo_name=db_repo.repo_name,
+        repo_type=db_repo.repo_type,
+        repo_path=os.path.join(safe_str(base_path), safe_str(repo_name)),
+        repo_state=db_repo.repo_state,
+        archived=db_repo.archived,
+        locked=tuple(db_repo.locked),
+        valid=valid)
+
+
+def load_repo_name_by_id(repo_id):
+    from rhodecode.model.db import Repository
+    db_repo = Repository.get(repo_id)
+    if db_repo:
+        return db_repo.repo_name
+    return None
+
+
+def load_default_user():
+    from rhodecode.model.db import User
+    return DefaultUser.from_user(User.get_default_user())
+
+
+def check_invalidation_namespace():
+    """
+    Returns True if the resolution caches of this process were marked as
+    invalid since the last check.
+    """
+    from rhodecode.lib import rc_cache
+    from rhodecode.model.db import CacheKey
+
+    inv_context_manager = rc_cache.InvalidationContext(
+        uid='repo_resolution',
+        invalidation_namespace=CacheKey.REPO_RESOLUTION_INVALIDATION_NAMESPACE,
+        thread_scoped=False)
+    with inv_context_manager as invalidation_context:
+        return invalidation_context.should_invalidate()
+
+
+class RepoResolutionCache(object):
+    """
+    Holds the resolved repositories and the default user of this process.
+    The invalidation namespace is checked at most every `check_interval`
+    seconds, the default user is also re-loaded at that rate, since it can be
+    changed directly in the database.
+    """
+
+    def __init__(self, check_interval=5, max_entries=10000,
+                 loaders=None, check_invalidation=check_invalidation_namespace,
+                 clock=time.time):
+        loaders = loaders or {}
+        self.check_interval = check_interval
+        self._load_repo = loaders.get('repo', load_repo)
+        self._load_repo_name_by_id = loaders.get(
+            'repo_name_by_id', load_repo_name_by_id)
+        self._load_default_user = loaders.get(
+            'default_user', load_default_user)
+        self._check_invalidation = check_invalidation
+        self._clock = clock
+        self._repos = LRUCache(max_entries)
+        self._repo_names_by_id = LRUCache(max_entries)
+        self._default_user = None
+        self._default_user_time = 0
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._repos.clear()
+            self._repo_names_by_id.clear()
+            self._default_user = None
+
+    def validate(self):
+        now = self._clock()
+        with self._lock:
+            if self._last_check is not None and \
+                    now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+
+        try:
+            invalid = self._check_invalidation()
+        except Exception:
+            log.exception('Failed to check repo resolution invalidation state')
+            invalid = True
+
+        if invalid:
+            log.debug('Repo resolution cache marked invalid, clearing it')
+            self.clear()
+
+    def get_repo(self, repo_name, base_path):
+        """
+        Returns a `RepoResolution` for `repo_name`, or None if the repository
+        doesn't exist in the database.
+        """
+        self.validate()
+        repo_path = os.path.join(safe_str(base_path), safe_str(repo_name))
+        resolved = self._repos.get(repo_name)
+        if resolved and resolved.repo_path == repo_path:
+            return resolved
+
+        from rhodecode.model.db import Repository
+        resolved = self._load_repo(repo_name, base_path)
+        if resolved and resolved.valid and \
+                resolved.repo_state == Repository.STATE_CREATED:
+            self._repos.put(repo_name, resolved)
+        return resolved
+
+    def get_repo_name_by_id(self, repo_id):
+        self.validate()
+        repo_name = self._repo_names_by_id.get(repo_id)
+        if repo_name is None:
+            repo_name = self._load_repo_name_by_id(repo_id)
+            if repo_name is not None:
+                self._repo_names_by_id.put(repo_id, repo_name)
+        return repo_name
+
+    def get_default_user(self):
+        self.validate()
+        now = self._clock()
+        with self._lock:
+            default_user = self._default_user
+            if default_user is not None and \
+                    now - self._default_user_time < self.check_interval:
+                return default_user
+
+        default_user = self._load_default_user()
+        with self._lock:
+            self._default_user = default_user
+            self._default_user_time = now
+        return default_user
+
+
+def get_resolution_settings(config=None):
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    return {
+        'enabled': str2bool(config.get(
+            'vcs.repo_resolution_cache',
+            DEFAULTS['vcs.repo_resolution_cache'])),
+        'check_interval': safe_int(
+            config.get('vcs.repo_resolution_cache_check_interval'),
+            DEFAULTS['vcs.repo_resolution_cache_check_interval']),
+    }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_resolution_cache():
+    """
+    Returns the cache of this process, or None if it's disabled
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            settings = get_resolution_settings()
+            if settings['enabled']:
+                _cache = RepoResolutionCache(
+                    check_interval=settings['check_interval'])
+            else:
+                # False marks a disabled cache, so we don't re-check config
+                _cache = False
+        return _cache or None
+
+
+def invalidate_repo_resolution():
+    """
+    Clears the resolution cache of this process and marks the caches of all
+    other processes as invalid. The mark is part of the current database
+    transaction, so it is only visible together with the change causing it.
+    """
+    from rhodecode.model.db import CacheKey, Session
+
+    if _cache:
+        _cache.clear()
+
+    Session().query(CacheKey).filter(
+        CacheKey.cache_args == CacheKey.REPO_RESOLUTION_INVALIDATION_NAMESPACE
+    ).update({
+        'cache_active': False,
+        'cache_state_uid': CacheKey.generate_new_state_uid()},
+        synchronize_session=False)
@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Post push warm-up of repository caches. After a push, caches of the new head
+are computed by a celery task, instead of by the first visitor of the
+summary, files or feed pages.
+
+Pushes arriving in bursts are de-duplicated: every push stores a new token
+in the `cache_repo` region of the repository and schedules a delayed task
+with it. A task only runs if its token is still the latest one, so only the
+last push of a burst triggers the warm-up. This requires a `cache_repo`
+backend shared between the web and celery workers, like the file or redis
+backends, otherwise warmed caches wouldn't be visible to the web workers
+anyway.
+"""
+
+import uuid
+import logging
+
+import rhodecode
+from rhodecode.lib import rc_cache
+from rhodecode.lib.utils2 import safe_int, str2bool
+from rhodecode.lib.vcs.backends.base import EmptyCommit
+
+log = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'vcs.post_push_warmup': True,
+    'vcs.post_push_warmup_delay': 5,
+}
+
+WARMUP_TOKEN_KEY = 'post_push_warmup_token'
+
+
+def get_warmup_settings(config=None):
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    return {
+        'enabled': str2bool(config.get(
+            'vcs.post_push_warmup', DEFAULTS['vcs.post_push_warmup'])),
+        'delay': safe_int(
+            config.get('vcs.post_push_warmup_delay'),
+            DEFAULTS['vcs.post_push_warmup_delay']),
+    }
+
+
+def _get_namespace(repo_id):
+    return 'cache_repo.{}'.format(repo_id)
+
+
+def _get_region(repo_id):
+    return rc_cache.get_or_create_region('cache_repo', _get_namespace(repo_id))
+
+
+def _get_token_key(region, repo_id):
+    # backends like redis share one keyspace for all namespaces
+    return rc_cache.make_key(
+        region.actual_backend, _get_namespace(repo_id), WARMUP_TOKEN_KEY)
+
+
+class WarmupTask(object):
+    human_name = 'undefined'
+
+    def __init__(self, db_repo, request, rc_config):
+        self.db_repo = db_repo
+        self.request = request
+        self.rc_config = rc_config
+
+    def run(self):
+        """Compute and store the caches of the repository"""
+        raise NotImplementedError()
+
+
+class RefsWarmup(WarmupTask):
+    human_name = 'references'
+
+    def run(self):
+        scm_repo = self.db_repo.scm_instance()
+        scm_repo.branches
+        scm_repo.tags
+        if scm_repo.alias == 'hg':
+            scm_repo.bookmarks
+
+
+class SummaryCommitsWarmup(WarmupTask):
+    human_name = 'summary commits'
+    page_size = 10
+
+    def run(self):
+        from rhodecode.apps._base import RepoAppView
+
+        scm_repo = self.db_repo.scm_instance()
+        if scm_repo.is_empty():
+            return
+        pre_load = RepoAppView.get_commit_preload_attrs()
+        commits = scm_repo.get_commits(pre_load=pre_load, translate_tags=False)
+        for commit in commits[-self.page_size:]:
+            for attr in pre_load:
+                getattr(commit, attr)
+
+
+class ReadmeWarmup(WarmupTask):
+    human_name = 'readme'
+
+    def run(self):
+        from rhodecode.apps._base import get_readme_data
+
+        renderer_type = self.rc_config.get('rhodecode_markup_renderer', 'rst')
+        get_readme_data(self.db_repo, renderer_type)
+
+
+class FileTreeWarmup(WarmupTask):
+    human_name = 'landing commit file tree'
+
+    def run(self):
+        from rhodecode.apps._base import TemplateArgs
+        from rhodecode.apps.repository.views.repo_files import get_file_tree
+
+        if self.db_repo.repo_type == 'svn':
+            # svn landing urls point to a path, not to the repository root
+            return
+
+        landing_commit = self.db_repo.get_landing_commit()
+        if isinstance(landing_commit, EmptyCommit):
+            return
+
+        # same arguments as the files page opened from the repository menu
+        landing_ref = self.db_repo.landing_ref_name
+        self.request.GET['at'] = landing_ref
+
+        c = TemplateArgs()
+        c.repo_name = self.db_repo.repo_name
+        c.rhodecode_db_repo = self.db_repo
+        c.commit = landing_commit
+        c.file = landing_commit.get_node('/')
+        tmpl_context = {'defaults': {}, 'errors': {}, 'c': c}
+        get_file_tree(
+            self.request, self.db_repo, tmpl_context, landing_commit.raw_id,
+            '/', at_rev=landing_ref)
+        # loaded right after the page, with sizes and last commits
+        get_file_tree(
+            self.request, self.db_repo, tmpl_context, landing_commit.raw_id,
+            '', full_load=True, at_rev=landing_ref)
+
+
+class FeedWarmup(WarmupTask):
+    human_name = 'feeds'
+
+    def run(self):
+        from rhodecode.apps._base import PathFilter
+        from rhodecode.apps.repository.views.repo_feed import RepoFeedGenerator
+
+        feed_generator = RepoFeedGenerator(
+            self.request, self.db_repo, self.db_repo.scm_instance(),
+            PathFilter(None))
+        for feed_type in ['atom', 'rss']:
+            feed_generator.generate(feed_type)
+
+
+class RepoWarmup(object):
+    """
+    Computes the caches of the pages usually visited right after a push
+    """
+    tasks = [
+        RefsWarmup, SummaryCommitsWarmup, ReadmeWarmup, FileTreeWarmup,
+        FeedWarmup,
+    ]
+
+    def execute(self, db_repo, request):
+        from rhodecode.model.settings import SettingsModel
+
+        rc_config = SettingsModel().get_all_settings(from_request=False)
+        executed_tasks = []
+        for task in self.tasks:
+            try:
+                task(db_repo, request, rc_config).run()
+            except Exception:
+                log.exception('Failed to warm up %s of repo %s',
+                              task.human_name, db_repo.repo_name)
+                continue
+            executed_tasks.append(task.human_name)
+        return executed_tasks
+
+
+def schedule_warmup(repo_name):
+    """
+    Schedules a delayed warm-up of the caches of `repo_name`, it replaces any
+    warm-up of this repository that didn't run yet.
+    """
+    from rhodecode.lib.celerylib import tasks
+    from rhodecode.model.db import Repository
+
+    settings = get_warmup_settings()
+    if not (settings['enabled'] and rhodecode.CELERY_ENABLED):
+        return None
+
+    repo = Repository.get_by_repo_name(repo_name)
+    if not repo:
+        return None
+
+    token = uuid.uuid4().hex
+    try:
+        region = _get_region(repo.repo_id)
+        region.set(_get_token_key(region, repo.repo_id), token)
+        # NOTE: not using run_task, it would fall back to run the warm-up
+        # synchronously within the push if celery isn't reachable
+        tasks.warm_repo_caches.apply_async(
+            args=(repo.repo_id, token), countdown=settings['delay'])
+    except Exception:
+        log.exception('Failed to schedule cache warm-up of repo %s', repo_name)
+        return None
+    log.debug('Scheduled cache warm-up of repo %s in %ss',
+              repo_name, settings['delay'])
+    return token
+
+
+def claim_warmup(repo_id, token):
+    """
+    Returns True if `token` is from the latest scheduled warm-up of this
+    repository, and marks it as done.
+    """
+    region = _get_region(repo_id)
+    token_key = _get_token_key(region, repo_id)
+    if region.get(token_key) != token:
+        return False
+    region.delete(token_key)
+    return True
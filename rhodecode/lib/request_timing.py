@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Timing spans of a single request, used to see where the time of e.g a VCS
+operation is spent. Spans are collected on the `RequestTiming` stored in the
+WSGI environ, and are also reachable for code without access to the environ,
+like the vcsserver client, via a thread local.
+
+    timing = start_timing(environ, 'git')
+    with timing_span('check_permission'):
+        ...
+    finish_timing(environ)
+"""
+
+import time
+import logging
+import threading
+import collections
+import contextlib
+
+import rhodecode
+from rhodecode.lib._vendor.statsd import client_from_config
+from rhodecode.lib.utils2 import safe_int
+
+log = logging.getLogger(__name__)
+
+ENVIRON_KEY = 'rhodecode.request_timing'
+
+_local = threading.local()
+
+
+class RequestTiming(object):
+    """
+    Collects named spans of a request, spans with the same name are summed
+    up, so memory use doesn't depend on the number of measured calls.
+    """
+
+    def __init__(self, name, description='', clock=time.time):
+        self.name = name
+        self.description = description
+        # span name -> [calls count, total time]
+        self.spans = collections.OrderedDict()
+        self._clock = clock
+        self.start = clock()
+        self.duration = None
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = self._clock()
+        try:
+            yield
+        finally:
+            self.add(name, self._clock() - start)
+
+    def add(self, name, duration):
+        span = self.spans.setdefault(name, [0, 0.0])
+        span[0] += 1
+        span[1] += duration
+
+    def totals(self):
+        """
+        Returns an ordered dict of span name -> (calls count, total time)
+        """
+        return collections.OrderedDict(
+            (name, tuple(span)) for name, span in self.spans.items())
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = self._clock() - self.start
+        return self.duration
+
+    def format_spans(self):
+        return ', '.join(
+            '{}={:.4f}s({})'.format(name, total, count)
+            for name, (count, total) in self.totals().items())
+
+
+def start_timing(environ, name, description=''):
+    timing = RequestTiming(name, description)
+    environ[ENVIRON_KEY] = timing
+    _local.timing = timing
+    return timing
+
+
+def get_timing(environ=None):
+    if environ is not None:
+        return environ.get(ENVIRON_KEY)
+    return getattr(_local, 'timing', None)
+
+
+@contextlib.contextmanager
+def timing_span(name, environ=None):
+    """
+    Measures the wrapped block as span `name` of the current request, it's
+    a no-op when no request timing was started.
+    """
+    timing = get_timing(environ)
+    if timing is None:
+        yield
+        return
+    with timing.span(name):
+        yield
+
+
+def get_slow_request_threshold(config=None):
+    """
+    Returns threshold in seconds above which requests are logged with their
+    spans, 0 disables the log.
+    """
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    return safe_int(config.get('vcs.slow_request_threshold_ms'), 0) / 1000.0
+
+
+def report_timing(timing, statsd=None, slow_threshold=0):
+    """
+    Sends the spans of `timing` as statsd timers, and logs it when it took
+    longer than `slow_threshold` seconds.
+    """
+    duration = timing.finish()
+
+    if statsd:
+        prefix = 'rhodecode.vcs.{}'.format(timing.name)
+        statsd.timing('{}.total'.format(prefix), duration * 1000)
+        for span_name, (_count, total) in timing.totals().items():
+            statsd.timing('{}.{}'.format(prefix, span_name), total * 1000)
+
+    if slow_threshold and duration >= slow_threshold:
+        log.warning(
+            'Slow %s request %s took %.4fs, spans: %s',
+            timing.name, timing.description, duration, timing.format_spans())
+
+
+def finish_timing(environ):
+    timing = environ.pop(ENVIRON_KEY, None)
+    if getattr(_local, 'timing', None) is timing:
+        _local.timing = None
+    if timing is None:
+        return
+
+    try:
+        report_timing(
+            timing, statsd=client_from_config(rhodecode.CONFIG),
+            slow_threshold=get_slow_request_threshold())
+    except Exception:
+        log.exception('Failed to report timing of %s request', timing.name)
+
+
+class TimedResponse(object):
+    """
+    Wraps a WSGI response iterable, and finishes the request timing once the
+    WSGI server has consumed and closed it.
+    """
+
+    def __init__(self, response, environ):
+        self.response = response
+        self.environ = environ
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def close(self):
+        try:
+            close = getattr(self.response, 'close', None)
+            if close:
+                close()
+        finally:
+            finish_timing(self.environ)
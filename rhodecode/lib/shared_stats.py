@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Request statistics shared between all worker processes of an instance.
+
+Stats live in a mmap of a small file. Every worker claims its own slot in it
+and is the only writer of that slot, so updates don't need any cross process
+locking. Readers, like the ops stats view, aggregate the slots of all live
+workers. Layout of the file::
+
+    header | slot 0 | slot 1 | ... | slot N
+
+    slot: pid, started, last_update, requests, in_flight, errors,
+          vcsserver_calls, vcsserver_time, endpoint 0 ... endpoint M
+
+    endpoint: name, count, total_time, histogram buckets
+"""
+
+import os
+import mmap
+import time
+import errno
+import fcntl
+import struct
+import hashlib
+import logging
+import threading
+import tempfile
+import collections
+
+import rhodecode
+from rhodecode.lib.utils2 import safe_int, safe_str, str2bool
+
+log = logging.getLogger(__name__)
+
+MAGIC = 'RCSTATS1'
+# upper bounds of the latency histogram buckets in ms, the last is +inf
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+OTHER_ENDPOINT = '__other__'
+ENDPOINT_NAME_SIZE = 48
+
+DEFAULTS = {
+    'shared_stats.enabled': True,
+    'shared_stats.file': '',
+    'shared_stats.max_workers': 64,
+    'shared_stats.max_endpoints': 64,
+}
+
+_HEADER = struct.Struct('<8sIII')
+_HEADER_SIZE = 64
+# pid, started, last_update, requests, in_flight, errors, vcs calls, vcs time
+_SLOT = struct.Struct('<qddQqQQd')
+_ENDPOINT = struct.Struct(
+    '<{}sQd{}Q'.format(ENDPOINT_NAME_SIZE, len(BUCKETS_MS) + 1))
+
+SLOT_FIELDS = (
+    'pid', 'started', 'last_update', 'requests', 'in_flight', 'errors',
+    'vcsserver_calls', 'vcsserver_time')
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _bucket_index(duration_ms):
+    for idx, upper in enumerate(BUCKETS_MS):
+        if duration_ms <= upper:
+            return idx
+    return len(BUCKETS_MS)
+
+
+class SharedStats(object):
+    """
+    Stats segment backed by a mmap of `path`. The file is created, or
+    replaced by a new one if its layout doesn't match, on first open.
+    """
+
+    def __init__(self, path, max_workers=64, max_endpoints=64,
+                 clock=time.time, pid_alive=_pid_alive):
+        self.path = path
+        self.max_workers = max_workers
+        self.max_endpoints = max_endpoints
+        self.slot_size = _SLOT.size + max_endpoints * _ENDPOINT.size
+        self.size = _HEADER_SIZE + max_workers * self.slot_size
+        self._clock = clock
+        self._pid_alive = pid_alive
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._pid = None
+        self._slot_offset = None
+        self._endpoints = {}
+
+    def _header(self):
+        return _HEADER.pack(
+            MAGIC, len(BUCKETS_MS), self.max_workers, self.max_endpoints)
+
+    def _is_current(self, fd):
+        """
+        Returns True if `fd` is still the file at `path`, another process
+        could have replaced it meanwhile.
+        """
+        try:
+            return os.fstat(fd).st_ino == os.stat(self.path).st_ino
+        except OSError:
+            return False
+
+    def _create(self):
+        """
+        Creates an initialized stats file, and moves it in place of `path`.
+        Processes still using a previous file, e.g. workers of the previous
+        deployment, keep their mapping of it. Returns fd of the new file.
+        """
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path) or None, prefix='.stats-')
+        try:
+            os.ftruncate(fd, self.size)
+            os.write(fd, self._header())
+            os.rename(tmp_path, self.path)
+        except Exception:
+            os.close(fd)
+            os.remove(tmp_path)
+            raise
+        return fd
+
+    def open(self):
+        if self._mmap is not None:
+            return
+
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        while self._mmap is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    self._open_locked(fd)
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+
+    def _open_locked(self, fd):
+        if not self._is_current(fd):
+            # replaced while we waited for the lock, retry with the new one
+            return
+        os.lseek(fd, 0, os.SEEK_SET)
+        header = os.read(fd, _HEADER.size)
+        if os.fstat(fd).st_size == self.size and header == self._header():
+            self._mmap = mmap.mmap(fd, self.size)
+            return
+
+        # never truncated in place, processes which have it mapped would
+        # crash accessing pages past its new end
+        log.debug('Initializing shared stats file %s', self.path)
+        new_fd = self._create()
+        try:
+            self._mmap = mmap.mmap(new_fd, self.size)
+        finally:
+            os.close(new_fd)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._pid = None
+        self._slot_offset = None
+
+    def _slot_offsets(self):
+        for idx in range(self.max_workers):
+            yield _HEADER_SIZE + idx * self.slot_size
+
+    def _claim_slot(self):
+        """
+        Claims a slot for the current process, slots of dead processes are
+        re-used. Returns the offset of the slot, or None if all are taken.
+        """
+        pid = os.getpid()
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            # only claiming needs a lock, it's rare and protects two starting
+            # workers from picking the same free slot
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                for offset in self._slot_offsets():
+                    slot_pid = _SLOT.unpack_from(self._mmap, offset)[0]
+                    if slot_pid == pid or not self._pid_alive(slot_pid):
+                        self._mmap[offset:offset + self.slot_size] = \
+                            '\x00' * self.slot_size
+                        now = self._clock()
+                        _SLOT.pack_into(
+                            self._mmap, offset, pid, now, now, 0, 0, 0, 0, 0.0)
+                        return offset
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+        return None
+
+    def _get_slot(self):
+        # a forked process gets its own slot
+        if self._pid != os.getpid():
+            self.open()
+            self._pid = os.getpid()
+            self._endpoints = {}
+            self._slot_offset = self._claim_slot()
+            if self._slot_offset is None:
+                log.warning('No free slot in shared stats file %s for '
+                            'process %s', self.path, self._pid)
+        return self._slot_offset
+
+    def _update_slot(self, requests=0, in_flight=0, errors=0,
+                     vcsserver_calls=0, vcsserver_time=0.0):
+        offset = self._get_slot()
+        if offset is None:
+            return None
+        values = list(_SLOT.unpack_from(self._mmap, offset))
+        values[2] = self._clock()
+        values[3] += requests
+        values[4] += in_flight
+        values[5] += errors
+        values[6] += vcsserver_calls
+        values[7] += vcsserver_time
+        _SLOT.pack_into(self._mmap, offset, *values)
+        return offset
+
+    def _endpoint_offset(self, slot_offset, name):
+        idx = self._endpoints.get(name)
+        if idx is None:
+            idx = len(self._endpoints)
+            if idx >= self.max_endpoints - 1:
+                # last entry collects everything that doesn't fit
+                idx = self.max_endpoints - 1
+                name = OTHER_ENDPOINT
+            else:
+                self._endpoints[name] = idx
+            offset = slot_offset + _SLOT.size + idx * _ENDPOINT.size
+            if not self._mmap[offset:offset + 1].strip('\x00'):
+                _ENDPOINT.pack_into(
+                    self._mmap, offset, name[:ENDPOINT_NAME_SIZE], 0, 0.0,
+                    *([0] * (len(BUCKETS_MS) + 1)))
+            return offset
+        return slot_offset + _SLOT.size + idx * _ENDPOINT.size
+
+    def request_started(self):
+        with self._lock:
+            self._update_slot(in_flight=1)
+
+    def request_finished(self, endpoint, duration, error=False):
+        """
+        Records a finished request of `endpoint` that took `duration` seconds
+        """
+        endpoint = safe_str(endpoint or 'unknown')
+        with self._lock:
+            slot_offset = self._update_slot(
+                requests=1, in_flight=-1, errors=1 if error else 0)
+            if slot_offset is None:
+                return
+            offset = self._endpoint_offset(slot_offset, endpoint)
+            values = list(_ENDPOINT.unpack_from(self._mmap, offset))
+            values[1] += 1
+            values[2] += duration
+            values[3 + _bucket_index(duration * 1000)] += 1
+            _ENDPOINT.pack_into(self._mmap, offset, *values)
+
+    def vcsserver_call(self, duration):
+        with self._lock:
+            self._update_slot(vcsserver_calls=1, vcsserver_time=duration)
+
+    def read(self):
+        """
+        Returns stats of all live workers, and their aggregates.
+        """
+        self.open()
+        workers = []
+        endpoints = collections.OrderedDict()
+        totals = collections.OrderedDict(
+            (field, 0) for field in SLOT_FIELDS[3:])
+
+        for offset in self._slot_offsets():
+            slot = dict(zip(SLOT_FIELDS, _SLOT.unpack_from(self._mmap, offset)))
+            if not self._pid_alive(slot['pid']):
+                continue
+            workers.append(slot)
+            for field in totals:
+                totals[field] += slot[field]
+
+            for idx in range(self.max_endpoints):
+                values = _ENDPOINT.unpack_from(
+                    self._mmap, offset + _SLOT.size + idx * _ENDPOINT.size)
+                name = values[0].rstrip('\x00')
+                if not name:
+                    continue
+                endpoint = endpoints.setdefault(name, {
+                    'count': 0, 'total_time': 0.0,
+                    'histogram': [0] * (len(BUCKETS_MS) + 1)})
+                endpoint['count'] += values[1]
+                endpoint['total_time'] += values[2]
+                for bucket, count in enumerate(values[3:]):
+                    endpoint['histogram'][bucket] += count
+
+        for endpoint in endpoints.values():
+            endpoint['avg_time'] = (
+                endpoint['total_time'] / endpoint['count']
+                if endpoint['count'] else 0.0)
+
+        totals['workers'] = len(workers)
+        return {
+            'buckets_ms': list(BUCKETS_MS) + ['inf'],
+            'totals': totals,
+            'workers': workers,
+            'endpoints': endpoints,
+        }
+
+
+def get_stats_settings(config=None):
+    config = config if config is not None else (rhodecode.CONFIG or {})
+    path = config.get('shared_stats.file') or DEFAULTS['shared_stats.file']
+    if not path:
+        # one file per .ini, all workers of an instance share it
+        cache_dir = config.get('cache_dir') or os.path.join(
+            tempfile.gettempdir(), 'rc_cache')
+        ini_key = hashlib.sha1(
+            safe_str(config.get('__file__') or 'rhodecode')).hexdigest()[:12]
+        path = os.path.join(
+            cache_dir, 'shared_stats', 'stats_{}.mmap'.format(ini_key))
+
+    return {
+        'enabled': str2bool(config.get(
+            'shared_stats.enabled', DEFAULTS['shared_stats.enabled'])),
+        'file': path,
+        'max_workers': safe_int(
+            config.get('shared_stats.max_workers'),
+            DEFAULTS['shared_stats.max_workers']),
+        'max_endpoints': safe_int(
+            config.get('shared_stats.max_endpoints'),
+            DEFAULTS['shared_stats.max_endpoints']),
+    }
+
+
+_stats = None
+_stats_lock = threading.Lock()
+
+
+def get_shared_stats():
+    """
+    Returns the `SharedStats` of this instance, or None if disabled or the
+    stats file can't be used.
+    """
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                settings = get_stats_settings()
+                stats = False
+                if settings['enabled']:
+                    stats = SharedStats(
+                        settings['file'],
+                        max_workers=settings['max_workers'],
+                        max_endpoints=settings['max_endpoints'])
+                    try:
+                        stats.open()
+                    except Exception:
+                        log.exception(
+                            'Failed to open shared stats file %s, shared '
+                            'stats are disabled', settings['file'])
+                        stats = False
+                # False marks disabled stats, so we don't re-check config
+                _stats = stats
+    return _stats or None
+
+
+def record_vcsserver_call(duration):
+    stats = get_shared_stats()
+    if stats:
+        try:
+            stats.vcsserver_call(duration)
+        except Exception:
+            log.exception('Failed to record vcsserver call')
+
+
+class _RecordedResponse(object):
+    """
+    Wraps a WSGI response iterable, and records the request once the WSGI
+    server has consumed and closed it.
+    """
+
+    def __init__(self, response, finish):
+        self.response = response
+        self.finish = finish
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def close(self):
+        try:
+            close = getattr(self.response, 'close', None)
+            if close:
+                close()
+        finally:
+            self.finish()
+
+
+class SharedStatsMiddleware(object):
+    """
+    Records requests of a WSGI `app` which isn't served by pyramid, and so
+    isn't seen by the request wrapper tween, under `endpoint`.
+    """
+
+    def __init__(self, app, endpoint):
+        self.app = app
+        self.endpoint = endpoint
+
+    def __call__(self, environ, start_response):
+        stats = get_shared_stats()
+        if not stats:
+            return self.app(environ, start_response)
+        try:
+            stats.request_started()
+        except Exception:
+            log.exception('Failed to record request in shared stats')
+            return self.app(environ, start_response)
+
+        start = time.time()
+        statuses = []
+
+        def recording_start_response(status, headers, exc_info=None):
+            statuses.append(status)
+            return start_response(status, headers, exc_info)
+
+        def finish(error=False):
+            if not statuses or safe_int(statuses[-1][:3], 500) >= 500:
+                error = True
+            try:
+                stats.request_finished(
+                    self.endpoint, time.time() - start, error=error)
+            except Exception:
+                log.exception('Failed to record request in shared stats')
+
+        try:
+            response = self.app(environ, recording_start_response)
+        except Exception:
+            finish(error=True)
+            raise
+        return _RecordedResponse(response, finish)
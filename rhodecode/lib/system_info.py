@@ -407,6 +407,7 @@ def storage_inodes():
 @register_sysinfo
 def storage_archives():
     import rhodecode
+    from rhodecode.lib.archive_cache import get_archive_cache
     from rhodecode.lib.utils import safe_str
     from rhodecode.lib.helpers import format_byte_size_binary
 
@@ -414,26 +415,22 @@ def storage_archives():
           'archive_cache_dir=/path/to/cache option in the .ini file'
     path = safe_str(rhodecode.CONFIG.get('archive_cache_dir', msg))
 
-    value = dict(percent=0, used=0, total=0, items=0, path=path, text='')
+    value = dict(percent=0, used=0, total=0, items=0, path=path, text='',
+                 stats={}, stats_text='')
     state = STATE_OK_DEFAULT
     try:
-        items_count = 0
-        used = 0
-        for root, dirs, files in os.walk(path):
-            if root == path:
-                items_count = len(files)
-
-            for f in files:
-                try:
-                    used += os.path.getsize(os.path.join(root, f))
-                except OSError:
-                    pass
-        value.update({
-            'percent': 100,
-            'used': used,
-            'total': used,
-            'items': items_count
-        })
+        archive_cache = get_archive_cache()
+        if archive_cache:
+            archives = archive_cache.get_archives()
+            used = sum(size for _path, size, _last_access in archives)
+            total = archive_cache.max_size or used
+            value.update({
+                'percent': 100 if not total else round(used * 100.0 / total, 1),
+                'used': used,
+                'total': total,
+                'items': len(archives),
+                'stats': archive_cache.get_stats(),
+            })
 
     except Exception as e:
         log.exception('failed to fetch archive cache storage')
@@ -442,8 +439,16 @@ def storage_archives():
     human_value = value.copy()
     human_value['used'] = format_byte_size_binary(value['used'])
     human_value['total'] = format_byte_size_binary(value['total'])
-    human_value['text'] = "{} ({} items)".format(
-        human_value['used'], value['items'])
+    human_value['text'] = "{}/{}, {}% used ({} items)".format(
+        human_value['used'], human_value['total'], value['percent'],
+        value['items'])
+    if value['stats']:
+        stats = value['stats']
+        human_value['stats_text'] = \
+            "hits: {}, misses: {}, waits: {}, evictions: {} ({})".format(
+                stats['hits'], stats['misses'], stats['waits'],
+                stats['evictions'],
+                format_byte_size_binary(stats['evicted_size']))
 
     return SysInfoRes(value=value, state=state, human_value=human_value)
 
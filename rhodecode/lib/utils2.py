@@ -207,6 +207,23 @@ def safe_int(val, default=None):
     return val
 
 
+def safe_float(val, default=None):
+    """
+    Returns float() of val if val is not convertable to float use default
+    instead
+
+    :param val:
+    :param default:
+    """
+
+    try:
+        val = float(val)
+    except (ValueError, TypeError):
+        val = default
+
+    return val
+
+
 def safe_unicode(str_, from_encoding=None, use_chardet=False):
     """
     safe unicode function. Does few trick to turn str_ into unicode
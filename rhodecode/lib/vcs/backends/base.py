@@ -1139,6 +1139,14 @@ class BaseCommit(object):
         """
         raise NotImplementedError
 
+    def get_file_id(self, path):
+        """
+        Returns id of the content of the file at the given `path`, files with
+        the same id have the same content. Backends without content ids
+        return None.
+        """
+        return None
+
     def get_path_commit(self, path, pre_load=None):
         """
         Returns last commit of the file at the given `path`.
@@ -1153,6 +1161,23 @@ class BaseCommit(object):
                     path))
         return commits[0]
 
+    def get_path_commits(self, paths, pre_load=None):
+        """
+        Returns a dict of the last commits of the given `paths`, by str path.
+        Paths without history aren't in the result. Backends override this
+        with a single walk of the history for all paths.
+
+        :param pre_load: Optional. List of commit attributes to load.
+        """
+        path_commits = {}
+        for path in paths:
+            try:
+                path_commits[safe_str(path)] = self.get_path_commit(
+                    path, pre_load=pre_load)
+            except RepositoryError:
+                continue
+        return path_commits
+
     def get_path_history(self, path, limit=None, pre_load=None):
         """
         Returns history of file as reversed list of :class:`BaseCommit`
@@ -1316,12 +1341,21 @@ class BaseCommit(object):
         """
         raise NotImplementedError
 
+    @LazyProperty
+    def changed_submodule_paths(self):
+        """
+        Returns list of paths of submodules added, changed or removed by this
+        commit. Backends without submodules in their trees return no paths.
+        """
+        return []
+
     @LazyProperty
     def size(self):
         """
         Returns total number of bytes from contents of all filenodes.
         """
-        return sum((node.size for node in self.get_filenodes_generator()))
+        return sum(
+            node.size for node in self.get_light_filenodes(pre_load=['size']))
 
     def walk(self, topurl=''):
         """
@@ -1345,6 +1379,37 @@ class BaseCommit(object):
             for node in files:
                 yield node
 
+    def get_light_filenodes(self, path='', pre_load=None):
+        """
+        Returns generator that yields ``LightFileNode`` objects of all files
+        under ``path``. Attributes in ``pre_load``, e.g. ``size``, are fetched
+        together with the listing by backends which support that.
+        """
+        from rhodecode.lib.vcs.nodes import LightFileNode
+        for topnode, dirs, files in self.walk(path):
+            for node in files:
+                yield LightFileNode(node.path, self)
+
+    @LazyProperty
+    def tree_id(self):
+        """
+        Id of the tree of this commit, commits with the same tree id have the
+        same files. Backends without tree ids use the commit id.
+        """
+        return self.raw_id
+
+    def get_paths(self):
+        """
+        Returns lists of all directory and file paths of this commit.
+        Backends override this with a listing of the whole tree at once.
+        """
+        dir_paths = []
+        file_paths = []
+        for topnode, dirs, files in self.walk():
+            dir_paths.extend(node.path for node in dirs)
+            file_paths.extend(node.path for node in files)
+        return dir_paths, file_paths
+
     #
     # Utilities for sub classes to support consistent behavior
     #
@@ -22,6 +22,7 @@
 GIT commit module
 """
 
+import os
 import re
 import stat
 from itertools import chain
@@ -38,8 +39,33 @@ from rhodecode.lib.vcs.exceptions import CommitError, NodeDoesNotExistError
 from rhodecode.lib.vcs.nodes import (
     FileNode, DirNode, NodeKind, RootNode, SubModuleNode,
     ChangedFileNodesGenerator, AddedFileNodesGenerator,
-    RemovedFileNodesGenerator, LargeFileNode)
+    RemovedFileNodesGenerator, LargeFileNode, LightFileNode)
 from rhodecode.lib.vcs.compat import configparser
+from rhodecode.lib.vcs.utils.paths import get_unique_dirs_for_paths
+
+# mode of submodule entries, `gitlink` in git trees
+SUBMODULE_MODE = 0o160000
+
+def _parse_log_names(output):
+    """
+    Yields commit id and changed paths of each commit of a
+    `git log --format=%x01%H --name-only -z` output
+    """
+    commit_id = None
+    changed_paths = []
+    for token in output.split('\0'):
+        if token.startswith('\x01') and len(token) == 41:
+            if commit_id:
+                yield commit_id, changed_paths
+            commit_id = token[1:]
+            changed_paths = []
+        elif token:
+            # paths of a commit follow its header after a newline
+            if not changed_paths and token.startswith('\n'):
+                token = token[1:]
+            changed_paths.append(token)
+    if commit_id:
+        yield commit_id, changed_paths
 
 
 class GitCommit(base.BaseCommit):
@@ -63,6 +89,8 @@ class GitCommit(base.BaseCommit):
         # mercurial specific property not supported here
         'hidden'
     ]
+    # commits of the first history batch of `get_path_commits`
+    PATH_COMMITS_BATCH = 256
 
     def __init__(self, repository, raw_id, idx, pre_load=None):
         self.repository = repository
@@ -109,6 +137,10 @@ class GitCommit(base.BaseCommit):
     def _tree_id(self):
         return self._remote[self._commit['tree']]['id']
 
+    @LazyProperty
+    def tree_id(self):
+        return self._tree_id
+
     @LazyProperty
     def id(self):
         return self.raw_id
@@ -270,6 +302,13 @@ class GitCommit(base.BaseCommit):
         tree_id, _ = self._get_tree_id_for_path(path)
         return self._remote.blob_raw_length(tree_id)
 
+    def get_file_id(self, path):
+        """
+        Returns the blob id of the file at given `path`.
+        """
+        tree_id, _ = self._get_tree_id_for_path(path)
+        return tree_id
+
     def get_path_history(self, path, limit=None, pre_load=None):
         """
         Returns history of file as reversed list of `GitCommit` objects for
@@ -282,6 +321,52 @@ class GitCommit(base.BaseCommit):
             self.repository.get_commit(commit_id=commit_id, pre_load=pre_load)
             for commit_id in hist]
 
+    def get_path_commits(self, paths, pre_load=None):
+        # one history walk for all paths, instead of a log call per path.
+        # Recent changes are the common case, so the walk is done in batches
+        # of growing size, and stops once every path is found.
+        paths = [safe_str(path).strip('/') for path in paths]
+        paths = [path for path in paths if path]
+        missing = set(paths)
+        # a pathspec per path could exceed the argument size limit for big
+        # directories, the walk is limited to their common directory instead
+        common_dir = '/'.join(os.path.commonprefix(
+            [path.split('/')[:-1] for path in paths]))
+        pathspecs = [common_dir] if common_dir else []
+        path_commit_ids = {}
+        skip, batch = 0, self.PATH_COMMITS_BATCH
+        while missing:
+            # `-c` lists files of merges which differ from all parents
+            cmd = ['log', '-c', '--name-only', '-z', '--no-renames',
+                   '--format=%x01%H', '-n', str(batch), '--skip', str(skip),
+                   self.raw_id, '--'] + pathspecs
+            stdout, _ = self.repository.run_git_command(
+                cmd, extra_env={'GIT_LITERAL_PATHSPECS': '1'})
+
+            commits_count = 0
+            for commit_id, changed_paths in _parse_log_names(stdout):
+                commits_count += 1
+                for changed_path in changed_paths:
+                    # a change of a file is also a change of its directories
+                    while changed_path:
+                        if changed_path in missing:
+                            missing.discard(changed_path)
+                            path_commit_ids[changed_path] = commit_id
+                        changed_path = changed_path.rpartition('/')[0]
+            if commits_count < batch:
+                break
+            skip += batch
+            batch *= 4
+
+        commits = {}
+        path_commits = {}
+        for path, commit_id in path_commit_ids.items():
+            if commit_id not in commits:
+                commits[commit_id] = self.repository.get_commit(
+                    commit_id=commit_id, pre_load=pre_load)
+            path_commits[path] = commits[commit_id]
+        return path_commits
+
     def get_file_annotate(self, path, pre_load=None):
         """
         Returns a generator of four element tuples with
@@ -296,6 +381,46 @@ class GitCommit(base.BaseCommit):
                 lambda: self.repository.get_commit(commit_id=commit_id, pre_load=pre_load),
                 content)
 
+    def get_paths(self):
+        # whole tree in one call, instead of a call per directory
+        stdout, _ = self.repository.run_git_command(
+            ['ls-tree', '-r', '-z', '--full-tree', self.raw_id])
+        file_paths = []
+        for entry in stdout.split('\0'):
+            if not entry:
+                continue
+            info, path = entry.split('\t', 1)
+            # submodules are listed as `commit`, they aren't files
+            if info.split(' ')[1] == 'blob':
+                file_paths.append(path)
+        dir_paths = sorted(get_unique_dirs_for_paths(file_paths))
+        return dir_paths, file_paths
+
+    def get_light_filenodes(self, path='', pre_load=None):
+        # whole subtree in one call, `-l` adds sizes of blobs to the listing
+        if not self.get_node(path).is_dir():
+            return
+        path = self._fix_path(path)
+        with_size = 'size' in (pre_load or [])
+        cmd = ['ls-tree', '-r', '-z']
+        if with_size:
+            cmd.append('-l')
+        cmd.append('{}:{}'.format(self.raw_id, path) if path else self.raw_id)
+        stdout, _ = self.repository.run_git_command(cmd)
+
+        prefix = path + '/' if path else ''
+        for entry in stdout.split('\0'):
+            if not entry:
+                continue
+            info, name = entry.split('\t', 1)
+            info = info.split()
+            # submodules are listed as `commit`, they aren't files
+            if info[1] != 'blob':
+                continue
+            yield LightFileNode(
+                prefix + name, self, mode=int(info[0], 8),
+                size=int(info[3]) if with_size else None)
+
     def get_nodes(self, path):
 
         if self._get_kind(path) != NodeKind.DIR:
@@ -324,6 +449,10 @@ class GitCommit(base.BaseCommit):
             if obj_path not in self._stat_modes:
                 self._stat_modes[obj_path] = stat_
 
+            if type_ in ('tree', 'blob') and obj_path not in self._paths:
+                # nodes don't need another lookup of their ids
+                self._paths[obj_path] = [id_, type_]
+
             if type_ == 'tree':
                 dirnodes.append(DirNode(obj_path, commit=self))
             elif type_ == 'blob':
@@ -391,12 +520,8 @@ class GitCommit(base.BaseCommit):
         return list(added.union(modified).union(deleted))
 
     @LazyProperty
-    def _changes_cache(self):
-        added = set()
-        modified = set()
-        deleted = set()
-        _r = self._remote
-
+    def _tree_changes(self):
+        changes = []
         parents = self.parents
         if not self.parents:
             parents = [base.EmptyCommit()]
@@ -405,16 +530,32 @@ class GitCommit(base.BaseCommit):
                 oid = None
             else:
                 oid = parent.raw_id
-            changes = _r.tree_changes(oid, self.raw_id)
-            for (oldpath, newpath), (_, _), (_, _) in changes:
-                if newpath and oldpath:
-                    modified.add(newpath)
-                elif newpath and not oldpath:
-                    added.add(newpath)
-                elif not newpath and oldpath:
-                    deleted.add(oldpath)
+            changes.extend(self._remote.tree_changes(oid, self.raw_id))
+        return changes
+
+    @LazyProperty
+    def _changes_cache(self):
+        added = set()
+        modified = set()
+        deleted = set()
+        for (oldpath, newpath), (_, _), (_, _) in self._tree_changes:
+            if newpath and oldpath:
+                modified.add(newpath)
+            elif newpath and not oldpath:
+                added.add(newpath)
+            elif not newpath and oldpath:
+                deleted.add(oldpath)
         return added, modified, deleted
 
+    @LazyProperty
+    def changed_submodule_paths(self):
+        paths = set()
+        for (oldpath, newpath), modes, (_, _) in self._tree_changes:
+            if any(mode and stat.S_IFMT(mode) == SUBMODULE_MODE
+                   for mode in modes):
+                paths.add(newpath or oldpath)
+        return sorted(paths)
+
     def _get_paths_for_status(self, status):
         """
         Returns sorted list of paths for given ``status``.
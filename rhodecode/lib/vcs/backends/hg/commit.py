@@ -35,7 +35,7 @@ from rhodecode.lib.vcs.exceptions import CommitError
 from rhodecode.lib.vcs.nodes import (
     AddedFileNodesGenerator, ChangedFileNodesGenerator, DirNode, FileNode,
     NodeKind, RemovedFileNodesGenerator, RootNode, SubModuleNode,
-    LargeFileNode, LARGEFILE_PREFIX)
+    LargeFileNode, LightFileNode, LARGEFILE_PREFIX)
 from rhodecode.lib.vcs.utils.paths import get_dirs_for_path
 
 
@@ -139,6 +139,9 @@ class MercurialCommit(base.BaseCommit):
     def _paths(self):
         return self._dir_paths + self._file_paths
 
+    def get_paths(self):
+        return sorted(self._dir_paths[1:]), list(self._file_paths)
+
     @LazyProperty
     def id(self):
         if self.last:
@@ -278,6 +281,24 @@ class MercurialCommit(base.BaseCommit):
                 lambda: self.repository.get_commit(commit_id=commit_id, pre_load=pre_load),
                 content)
 
+    def get_light_filenodes(self, path='', pre_load=None):
+        if not self.get_node(path).is_dir():
+            return
+        path = self._fix_path(path)
+        prefix = path + '/' if path else ''
+        pre_load = pre_load or []
+        for file_path in self._file_paths:
+            if not file_path.startswith(prefix):
+                continue
+            # paths come from the listing, so skip the checks of get_file_*
+            size = is_binary = None
+            if 'size' in pre_load:
+                size = self._remote.fctx_size(self.raw_id, file_path)
+            if 'is_binary' in pre_load:
+                is_binary = self._remote.is_binary(self.raw_id, file_path)
+            yield LightFileNode(
+                file_path, self, size=size, is_binary=is_binary)
+
     def get_nodes(self, path):
         """
         Returns combined ``DirNode`` and ``FileNode`` objects list representing
@@ -37,7 +37,7 @@ import requests
 from requests.packages.urllib3.util.retry import Retry
 
 import rhodecode
-from rhodecode.lib import rc_cache
+from rhodecode.lib import rc_cache, request_timing, shared_stats
 from rhodecode.lib.rc_cache.utils import compute_key_from_params
 from rhodecode.lib.system_info import get_cert_path
 from rhodecode.lib.vcs import exceptions, CurlSession
@@ -267,9 +267,14 @@ class RemoteRepo(object):
             if self._call_with_logging:
                 log.debug('Calling %s@%s with args:%.10240r. wire_context: %s cache_on: %s',
                           url, name, args, context_uid, cache_on)
-            return _remote_call(url, payload, EXCEPTIONS_MAP, self._session)
-
-        result = remote_call(cache_key)
+            call_start = time.time()
+            try:
+                return _remote_call(url, payload, EXCEPTIONS_MAP, self._session)
+            finally:
+                shared_stats.record_vcsserver_call(time.time() - call_start)
+
+        with request_timing.timing_span('remote_call.{}'.format(name)):
+            result = remote_call(cache_key)
         if self._call_with_logging:
             log.debug('Call %s@%s took: %.4fs. wire_context: %s',
                       url, name, time.time()-start, context_uid)
@@ -668,6 +668,86 @@ class RemovedFileNode(FileNode):
         return NodeState.REMOVED
 
 
+class LightFileNode(object):
+    """
+    Read only file node for walks over whole trees, e.g. to sum sizes of all
+    files of a commit. It has no per instance dict, and keeps only the path,
+    the commit and attributes fetched with the listing. Other attributes are
+    fetched from the commit on access. Use :meth:`get_file_node` for a full
+    ``FileNode``.
+    """
+    __slots__ = ('path', 'commit', '_mode', '_size', '_is_binary')
+
+    kind = NodeKind.FILE
+
+    def __init__(self, path, commit, mode=None, size=None, is_binary=None):
+        self.path = safe_str(path)
+        self.commit = commit
+        self._mode = mode
+        self._size = size
+        self._is_binary = is_binary
+
+    @property
+    def unicode_path(self):
+        return safe_unicode(self.path)
+
+    @property
+    def name(self):
+        return safe_unicode(self.path.rsplit('/', 1)[-1])
+
+    @property
+    def extension(self):
+        return self.name.split('.')[-1]
+
+    @property
+    def mode(self):
+        if self._mode is None:
+            self._mode = self.commit.get_file_mode(self.path)
+        return self._mode
+
+    @property
+    def size(self):
+        if self._size is None:
+            self._size = self.commit.get_file_size(self.path)
+        return self._size
+
+    @property
+    def is_binary(self):
+        if self._is_binary is None:
+            self._is_binary = self.commit.is_node_binary(self.path)
+        return self._is_binary
+
+    @property
+    def md5(self):
+        return md5(self.content_uncached())
+
+    def is_file(self):
+        return True
+
+    def is_dir(self):
+        return False
+
+    def content_uncached(self):
+        return self.commit.get_file_content(self.path)
+
+    def metadata_uncached(self):
+        """
+        Returns binary flag, md5, size and content of the file node, like
+        :meth:`FileNode.metadata_uncached`.
+        """
+        content = self.content_uncached()
+        is_binary = content and '\0' in content
+        size = len(content) if content else 0
+        return is_binary, md5(content), size, content
+
+    def get_file_node(self):
+        return FileNode(self.path, commit=self.commit, mode=self._mode)
+
+    def __repr__(self):
+        return '<%s %r @ %s>' % (self.__class__.__name__, self.path,
+                                 getattr(self.commit, 'short_id', ''))
+
+
 class DirNode(Node):
     """
     DirNode stores list of files and directories within this node.
@@ -763,12 +843,9 @@ class DirNode(Node):
 
     @LazyProperty
     def size(self):
-        size = 0
-        for root, dirs, files in self.commit.walk(self.path):
-            for f in files:
-                size += f.size
-
-        return size
+        return sum(
+            f.size for f in
+            self.commit.get_light_filenodes(self.path, pre_load=['size']))
 
     @LazyProperty
     def last_commit(self):
@@ -66,6 +66,7 @@ from rhodecode.lib.jsonalchemy import MutationObj, MutationList, JsonType, \
     JsonRaw
 from rhodecode.lib.ext_json import json
 from rhodecode.lib.caching_query import FromCache
+from rhodecode.lib.repo_resolution import invalidate_repo_resolution
 from rhodecode.lib.encrypt import AESCipher, validate_and_get_enc_data
 from rhodecode.lib.encrypt2 import Encryptor
 from rhodecode.lib.exceptions import (
@@ -2225,12 +2226,14 @@ class Repository(Base, BaseModel):
             lock_reason = cls.LOCK_AUTOMATIC
         repo.locked = [user_id, lock_time, lock_reason]
         Session().add(repo)
+        invalidate_repo_resolution()
         Session().commit()
 
     @classmethod
     def unlock(cls, repo):
         repo.locked = None
         Session().add(repo)
+        invalidate_repo_resolution()
         Session().commit()
 
     @classmethod
@@ -2428,42 +2431,32 @@ class Repository(Base, BaseModel):
         self.update_commit_cache(cs_cache={'raw_id':'0'})
         self.update_commit_cache()
 
-    def update_commit_cache(self, cs_cache=None, config=None):
+    @classmethod
+    def _get_commit_cache_from_scm(cls, scm_repo):
         """
-        Update cache of last commit for repository
-        cache_keys should be::
-
-            source_repo_id
-            short_id
-            raw_id
-            revision
-            parents
-            message
-            date
-            author
-            updated_on
-
+        Returns json of the head commit of `scm_repo`, and a flag if the
+        repository is empty, or couldn't be opened.
         """
         from rhodecode.lib.vcs.backends.base import BaseChangeset
-        from rhodecode.lib.vcs.utils.helpers import parse_datetime
-        empty_date = datetime.datetime.fromtimestamp(0)
-
-        if cs_cache is None:
-            # use no-cache version here
-            try:
-                scm_repo = self.scm_instance(cache=False, config=config)
-            except VCSError:
-                scm_repo = None
-            empty = scm_repo is None or scm_repo.is_empty()
 
-            if not empty:
-                cs_cache = scm_repo.get_commit(
-                    pre_load=["author", "date", "message", "parents", "branch"])
-            else:
-                cs_cache = EmptyCommit()
+        empty = scm_repo is None or scm_repo.is_empty()
+        if not empty:
+            cs_cache = scm_repo.get_commit(
+                pre_load=["author", "date", "message", "parents", "branch"])
+        else:
+            cs_cache = EmptyCommit()
 
         if isinstance(cs_cache, BaseChangeset):
             cs_cache = cs_cache.__json__()
+        return cs_cache, empty
+
+    def _get_new_commit_cache(self, cs_cache, empty=False):
+        """
+        Returns the new changeset cache, and the last update date of this
+        repository for json of the head commit `cs_cache`.
+        """
+        from rhodecode.lib.vcs.utils.helpers import parse_datetime
+        empty_date = datetime.datetime.fromtimestamp(0)
 
         def is_outdated(new_cs_cache):
             if (new_cs_cache['raw_id'] != self.changeset_cache['raw_id'] or
@@ -2485,10 +2478,7 @@ class Repository(Base, BaseModel):
 
             _date_latest = parse_datetime(cs_cache.get('date') or empty_date)
             cs_cache['updated_on'] = time.time()
-            self.changeset_cache = cs_cache
-            self.updated_on = last_change
-            Session().add(self)
-            Session().commit()
+            updated_on = last_change
 
         else:
             if empty:
@@ -2499,13 +2489,47 @@ class Repository(Base, BaseModel):
             _date_latest = parse_datetime(cs_cache.get('date') or empty_date)
 
             cs_cache['updated_on'] = time.time()
-            self.changeset_cache = cs_cache
-            self.updated_on = _date_latest
-            Session().add(self)
-            Session().commit()
+            updated_on = _date_latest
 
         log.debug('updated repo `%s` with new commit cache %s, and last update_date: %s',
                   self.repo_name, cs_cache, _date_latest)
+        return cs_cache, updated_on
+
+    def update_commit_cache(self, cs_cache=None, config=None):
+        """
+        Update cache of last commit for repository
+        cache_keys should be::
+
+            source_repo_id
+            short_id
+            raw_id
+            revision
+            parents
+            message
+            date
+            author
+            updated_on
+
+        """
+        from rhodecode.lib.vcs.backends.base import BaseChangeset
+
+        empty = False
+        if cs_cache is None:
+            # use no-cache version here
+            try:
+                scm_repo = self.scm_instance(cache=False, config=config)
+            except VCSError:
+                scm_repo = None
+            cs_cache, empty = self._get_commit_cache_from_scm(scm_repo)
+
+        if isinstance(cs_cache, BaseChangeset):
+            cs_cache = cs_cache.__json__()
+
+        cs_cache, updated_on = self._get_new_commit_cache(cs_cache, empty)
+        self.changeset_cache = cs_cache
+        self.updated_on = updated_on
+        Session().add(self)
+        Session().commit()
 
     @property
     def tip(self):
@@ -2634,19 +2658,25 @@ class Repository(Base, BaseModel):
             return instance
 
     def _get_instance(self, cache=True, config=None, repo_state_uid=None):
+        return self._create_instance(
+            safe_str(self.repo_full_path), self.repo_type,
+            config or self._config, cache=cache, repo_state_uid=repo_state_uid)
+
+    @classmethod
+    def _create_instance(cls, repo_path, repo_type, config, cache=True,
+                         repo_state_uid=None):
         log.debug('Initializing %s instance `%s` with cache flag set to: %s',
-                  self.repo_type, self.repo_path, cache)
-        config = config or self._config
+                  repo_type, repo_path, cache)
         custom_wire = {
             'cache': cache,  # controls the vcs.remote cache
             'repo_state_uid': repo_state_uid
         }
         repo = get_vcs_instance(
-            repo_path=safe_str(self.repo_full_path),
+            repo_path=repo_path,
             config=config,
             with_wire=custom_wire,
             create=False,
-            _vcs_alias=self.repo_type)
+            _vcs_alias=repo_type)
         if repo is not None:
             repo.count()  # cache rebuild
         return repo
@@ -2968,6 +2998,29 @@ class RepoGroup(Base, BaseModel):
                        self.parent_group else [])
         return RepoGroup.url_sep().join(path_prefix + [group_name])
 
+    @classmethod
+    def _get_latest_commit_cache(cls, children):
+        """
+        Returns the newest commit cache of `children`, an iterable of
+        (source_repo_id, changeset_cache) of repositories and groups inside
+        a repository group, and the last update date for it.
+        """
+        from rhodecode.lib.vcs.utils.helpers import parse_datetime
+        empty_date = datetime.datetime.fromtimestamp(0)
+
+        latest_repo_cs_cache = {}
+        for source_repo_id, repo_cs_cache in children:
+            date_latest = latest_repo_cs_cache.get('date', empty_date)
+            date_current = repo_cs_cache.get('date', empty_date)
+            current_timestamp = datetime_to_time(parse_datetime(date_latest))
+            if current_timestamp < datetime_to_time(parse_datetime(date_current)):
+                latest_repo_cs_cache = dict(repo_cs_cache)
+                latest_repo_cs_cache['source_repo_id'] = source_repo_id
+
+        _date_latest = parse_datetime(latest_repo_cs_cache.get('date') or empty_date)
+        latest_repo_cs_cache['updated_on'] = time.time()
+        return latest_repo_cs_cache, _date_latest
+
     def update_commit_cache(self, config=None):
         """
         Update cache of last commit for newest repository inside this repository group.
@@ -2983,31 +3036,15 @@ class RepoGroup(Base, BaseModel):
             author
 
         """
-        from rhodecode.lib.vcs.utils.helpers import parse_datetime
-        empty_date = datetime.datetime.fromtimestamp(0)
-
         def repo_groups_and_repos(root_gr):
             for _repo in root_gr.repositories:
-                yield _repo
+                yield _repo.repo_id, _repo.changeset_cache
             for child_group in root_gr.children.all():
-                yield child_group
+                group_cs_cache = child_group.changeset_cache
+                yield group_cs_cache.get('source_repo_id'), group_cs_cache
 
-        latest_repo_cs_cache = {}
-        for obj in repo_groups_and_repos(self):
-            repo_cs_cache = obj.changeset_cache
-            date_latest = latest_repo_cs_cache.get('date', empty_date)
-            date_current = repo_cs_cache.get('date', empty_date)
-            current_timestamp = datetime_to_time(parse_datetime(date_latest))
-            if current_timestamp < datetime_to_time(parse_datetime(date_current)):
-                latest_repo_cs_cache = repo_cs_cache
-                if hasattr(obj, 'repo_id'):
-                    latest_repo_cs_cache['source_repo_id'] = obj.repo_id
-                else:
-                    latest_repo_cs_cache['source_repo_id'] = repo_cs_cache.get('source_repo_id')
-
-        _date_latest = parse_datetime(latest_repo_cs_cache.get('date') or empty_date)
-
-        latest_repo_cs_cache['updated_on'] = time.time()
+        latest_repo_cs_cache, _date_latest = self._get_latest_commit_cache(
+            repo_groups_and_repos(self))
         self.changeset_cache = latest_repo_cs_cache
         self.updated_on = _date_latest
         Session().add(self)
@@ -3662,6 +3699,7 @@ class CacheKey(Base, BaseModel):
     # namespaces used to register process/thread aware caches
     REPO_INVALIDATION_NAMESPACE = 'repo_cache:{repo_id}'
     SETTINGS_INVALIDATION_NAMESPACE = 'system_settings'
+    REPO_RESOLUTION_INVALIDATION_NAMESPACE = 'repo_resolution'
 
     cache_id = Column("cache_id", Integer(), nullable=False, unique=True, default=None, primary_key=True)
     cache_key = Column("cache_key", String(255), nullable=True, unique=None, default=None)
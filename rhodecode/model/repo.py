@@ -25,6 +25,7 @@ import time
 import logging
 import traceback
 import datetime
+from multiprocessing.pool import ThreadPool
 
 from pyramid.threadlocal import get_current_request
 from zope.cachedescriptors.property import Lazy as LazyProperty
@@ -32,13 +33,16 @@ from zope.cachedescriptors.property import Lazy as LazyProperty
 from rhodecode import events
 from rhodecode.lib.auth import HasUserGroupPermissionAny
 from rhodecode.lib.caching_query import FromCache
+from rhodecode.lib.ext_json import json
 from rhodecode.lib.exceptions import AttachedForksError, AttachedPullRequestsError
 from rhodecode.lib import hooks_base
+from rhodecode.lib.repo_resolution import invalidate_repo_resolution
 from rhodecode.lib.user_log_filter import user_log_filter
 from rhodecode.lib.utils import make_db_config
 from rhodecode.lib.utils2 import (
     safe_str, safe_unicode, remove_prefix, obfuscate_url_pw,
     get_current_rhodecode_user, safe_int, action_logger_generic)
+from rhodecode.lib.vcs import VCSError
 from rhodecode.lib.vcs.backends import get_backend
 from rhodecode.model import BaseModel
 from rhodecode.model.db import (
@@ -193,11 +197,76 @@ class RepoModel(BaseModel):
         return repo_log
 
     @classmethod
-    def update_commit_cache(cls, repositories=None):
-        if not repositories:
-            repositories = Repository.getAll()
-        for repo in repositories:
-            repo.update_commit_cache()
+    def _fetch_commit_caches(cls, repos, workers):
+        """
+        Fetches head commits of `repos`, a list of (repo_id, repo_path,
+        repo_type, config), using `workers` threads. Returns a dict of
+        repo_id to (cs_cache, empty), repositories that failed are skipped.
+        """
+        def fetch(repo_data):
+            repo_id, repo_path, repo_type, config = repo_data
+            try:
+                try:
+                    scm_repo = Repository._create_instance(
+                        repo_path, repo_type, config, cache=False)
+                except VCSError:
+                    scm_repo = None
+                return repo_id, Repository._get_commit_cache_from_scm(scm_repo)
+            except Exception:
+                log.exception('Failed to fetch head commit of repo %s', repo_path)
+                return repo_id, None
+
+        pool = ThreadPool(min(workers, len(repos)) or 1)
+        try:
+            results = pool.map(fetch, repos)
+        finally:
+            pool.close()
+            pool.join()
+        return dict((repo_id, commit_cache) for repo_id, commit_cache in results
+                    if commit_cache is not None)
+
+    @classmethod
+    def update_commit_cache(cls, repositories=None, workers=8, batch_size=100):
+        """
+        Updates commit caches of `repositories`, or of all repositories.
+        Head commits of a batch of repositories are fetched in parallel by
+        `workers` threads, and stored with one bulk UPDATE per batch.
+        Returns ids of updated repositories.
+        """
+        if repositories:
+            repo_ids = [repo.repo_id for repo in repositories]
+        else:
+            repo_ids = [repo_id for repo_id, in Session().query(
+                Repository.repo_id).order_by(Repository.group_id.asc())]
+
+        updated = []
+        for start in range(0, len(repo_ids), batch_size):
+            batch_ids = repo_ids[start:start + batch_size]
+            # DB access stays in this thread, workers only talk to vcsserver
+            repos = Repository.query()\
+                .filter(Repository.repo_id.in_(batch_ids)).all()
+            commit_caches = cls._fetch_commit_caches(
+                [(repo.repo_id, safe_str(repo.repo_full_path), repo.repo_type,
+                  repo._config) for repo in repos], workers)
+
+            mappings = []
+            for repo in repos:
+                if repo.repo_id not in commit_caches:
+                    continue
+                cs_cache, empty = commit_caches[repo.repo_id]
+                cs_cache, updated_on = repo._get_new_commit_cache(cs_cache, empty)
+                mappings.append({
+                    'repo_id': repo.repo_id,
+                    '_changeset_cache': json.dumps(cs_cache),
+                    'updated_on': updated_on,
+                })
+
+            Session().bulk_update_mappings(Repository, mappings)
+            Session().commit()
+            updated.extend(mapping['repo_id'] for mapping in mappings)
+            log.debug('updated commit cache of %s/%s repositories',
+                      start + len(batch_ids), len(repo_ids))
+        return updated
 
     def get_repos_as_dict(self, repo_list=None, admin=False,
                           super_user_actions=False, short_name=None):
@@ -486,6 +555,7 @@ class RepoModel(BaseModel):
                 # rename repository
                 self._rename_filesystem_repo(
                     old=source_repo_name, new=new_name)
+                invalidate_repo_resolution()
 
             if affected_user_ids:
                 PermissionModel().trigger_permission_flush(affected_user_ids)
@@ -735,6 +805,7 @@ class RepoModel(BaseModel):
             try:
                 repo.archived = True
                 self.sa.add(repo)
+                invalidate_repo_resolution()
                 self.sa.commit()
             except Exception:
                 log.error(traceback.format_exc())
@@ -775,6 +846,7 @@ class RepoModel(BaseModel):
             events.trigger(events.RepoPreDeleteEvent(repo))
             try:
                 self.sa.delete(repo)
+                invalidate_repo_resolution()
                 if fs_remove:
                     self._delete_filesystem_repo(repo)
                 else:
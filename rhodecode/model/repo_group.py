@@ -31,6 +31,7 @@ import shutil
 import time
 import traceback
 import string
+import collections
 
 from zope.cachedescriptors.property import Lazy as LazyProperty
 
@@ -42,6 +43,8 @@ from rhodecode.model.db import (_hash_key, func, or_, in_filter_generator,
 from rhodecode.model.permission import PermissionModel
 from rhodecode.model.settings import VcsSettingsModel, SettingsModel
 from rhodecode.lib.caching_query import FromCache
+from rhodecode.lib.ext_json import json
+from rhodecode.lib.repo_resolution import invalidate_repo_resolution
 from rhodecode.lib.utils2 import action_logger_generic
 
 log = logging.getLogger(__name__)
@@ -569,6 +572,8 @@ class RepoGroupModel(BaseModel):
                 self.sa.add(obj)
 
             self._rename_group(old_path, new_path)
+            if old_path != new_path:
+                invalidate_repo_resolution()
 
             # Trigger update event.
             events.trigger(events.RepoGroupUpdateEvent(repo_group))
@@ -716,10 +721,63 @@ class RepoGroupModel(BaseModel):
 
     @classmethod
     def update_commit_cache(cls, repo_groups=None):
-        if not repo_groups:
-            repo_groups = RepoGroup.getAll()
-        for repo_group in repo_groups:
-            repo_group.update_commit_cache()
+        """
+        Updates commit caches of `repo_groups`, or of all repository groups.
+        Caches are computed from the stored caches of repositories, deepest
+        groups first so every group is computed once, with the new caches of
+        its children groups. Returns ids of updated groups.
+        """
+        groups = {}
+        children = collections.defaultdict(list)
+        for group_id, parent_id, cs_cache_raw in Session().query(
+                RepoGroup.group_id, RepoGroup.group_parent_id,
+                RepoGroup._changeset_cache):
+            groups[group_id] = parent_id
+            children[parent_id].append(
+                (group_id, RepoGroup._load_changeset_cache('', cs_cache_raw)))
+
+        repo_query = Session().query(
+            Repository.repo_id, Repository.group_id, Repository._changeset_cache)
+        if repo_groups:
+            group_ids = set(repo_group.group_id for repo_group in repo_groups)
+            repo_query = repo_query.filter(
+                or_(*in_filter_generator(Repository.group_id, list(group_ids))))
+        else:
+            group_ids = set(groups)
+
+        repos = collections.defaultdict(list)
+        for repo_id, group_id, cs_cache_raw in repo_query:
+            repos[group_id].append(
+                (repo_id, Repository._load_changeset_cache(repo_id, cs_cache_raw)))
+
+        def depth(group_id):
+            level = 0
+            while groups.get(group_id) is not None:
+                group_id = groups[group_id]
+                level += 1
+            return level
+
+        new_caches = {}
+        mappings = []
+        for group_id in sorted(group_ids, key=depth, reverse=True):
+            group_children = list(repos[group_id])
+            for child_id, cs_cache in children[group_id]:
+                cs_cache = new_caches.get(child_id, cs_cache)
+                group_children.append((cs_cache.get('source_repo_id'), cs_cache))
+
+            cs_cache, updated_on = RepoGroup._get_latest_commit_cache(
+                group_children)
+            new_caches[group_id] = cs_cache
+            mappings.append({
+                'group_id': group_id,
+                '_changeset_cache': json.dumps(cs_cache),
+                'updated_on': updated_on,
+            })
+
+        Session().bulk_update_mappings(RepoGroup, mappings)
+        Session().commit()
+        log.debug('updated commit cache of %s repository groups', len(mappings))
+        return [mapping['group_id'] for mapping in mappings]
 
     def get_repo_groups_as_dict(self, repo_group_list=None, admin=False,
                                 super_user_actions=False):
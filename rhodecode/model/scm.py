@@ -40,6 +40,7 @@ from rhodecode.lib.auth import (
     HasRepoPermissionAny, HasRepoGroupPermissionAny,
     HasUserGroupPermissionAny)
 from rhodecode.lib.exceptions import NonRelativePathError, IMCCommitError
+from rhodecode.lib.path_index import get_commit_path_index, get_path_index_store
 from rhodecode.lib import hooks_utils
 from rhodecode.lib.utils import (
     get_filesystem_repos, make_db_config)
@@ -493,12 +494,13 @@ class ScmModel(BaseModel):
             return []
 
         data = []
-        for node in dir_node:
-            if not node.is_file():
-                # we skip file-nodes
-                continue
-
-            last_commit = node.last_commit
+        nodes = [node for node in dir_node if node.is_file()]
+        # last commits of all files from one walk of the history
+        last_commits = commit.get_path_commits(
+            [node.path for node in nodes],
+            pre_load=['author', 'date', 'message', 'parents'])
+        for node in nodes:
+            last_commit = last_commits.get(node.path) or node.last_commit
             last_commit_date = last_commit.date
             data.append({
                 'name': node.name,
@@ -515,6 +517,26 @@ class ScmModel(BaseModel):
 
         return data
 
+    def _get_path_index(self, repo, commit):
+        """
+        Returns the path index of `commit`, or None if path indexes are
+        disabled, or it can't be built.
+        """
+        store = get_path_index_store()
+        if not store:
+            return None
+        try:
+            return get_commit_path_index(repo.repo_id, commit, store)
+        except Exception:
+            log.exception('Failed to get path index of %s', commit)
+            return None
+
+    def _paths_as_nodes(self, paths, node_type, flat=False):
+        if flat:
+            return [safe_unicode(path) for path in paths]
+        return [{"name": h.escape(safe_unicode(path)), "type": node_type}
+                for path in paths]
+
     def get_nodes(self, repo_name, commit_id, root_path='/', flat=True,
                   extended_info=False, content=False, max_file_bytes=None):
         """
@@ -536,6 +558,13 @@ class ScmModel(BaseModel):
             _repo = self._get_repo(repo_name)
             commit = _repo.scm_instance().get_commit(commit_id=commit_id)
             root_path = root_path.lstrip('/')
+            if not (extended_info or content):
+                path_index = self._get_path_index(_repo, commit)
+                if path_index is not None:
+                    dir_paths, file_paths = path_index.list_paths(root_path)
+                    return (self._paths_as_nodes(dir_paths, 'dir', flat),
+                            self._paths_as_nodes(file_paths, 'file', flat))
+
             for __, dirs, files in commit.walk(root_path):
 
                 for f in files:
@@ -599,36 +628,33 @@ class ScmModel(BaseModel):
         Generate files for quick filter in files view
         """
 
-        _files = list()
-        _dirs = list()
         try:
             _repo = self._get_repo(repo_name)
             commit = _repo.scm_instance().get_commit(commit_id=commit_id)
-            root_path = root_path.lstrip('/')
-            for __, dirs, files in commit.walk(root_path):
-
-                for f in files:
-
-                    _data = {
-                        "name": h.escape(f.unicode_path),
-                        "type": "file",
-                        }
-
-                    _files.append(_data)
-
-                for d in dirs:
-
-                    _data = {
-                        "name": h.escape(d.unicode_path),
-                        "type": "dir",
-                        }
-
-                    _dirs.append(_data)
+            dir_paths, file_paths = self.get_commit_paths(_repo, commit, root_path)
         except RepositoryError:
             log.exception("Exception in get_quick_filter_nodes")
             raise
 
-        return _dirs, _files
+        return (self._paths_as_nodes(dir_paths, 'dir'),
+                self._paths_as_nodes(file_paths, 'file'))
+
+    def get_commit_paths(self, repo, commit, root_path='/'):
+        """
+        Returns lists of all directory and file paths under `root_path` of
+        `commit`, from its path index if possible.
+        """
+        root_path = root_path.lstrip('/')
+        path_index = self._get_path_index(repo, commit)
+        if path_index is not None:
+            return path_index.list_paths(root_path)
+
+        dir_paths = []
+        file_paths = []
+        for __, dirs, files in commit.walk(root_path):
+            dir_paths.extend(d.path for d in dirs)
+            file_paths.extend(f.path for f in files)
+        return dir_paths, file_paths
 
     def get_node(self, repo_name, commit_id, file_path,
                  extended_info=False, content=False, max_file_bytes=None, cache=True):
@@ -719,19 +745,17 @@ class ScmModel(BaseModel):
             _repo = self._get_repo(repo_name)
             commit = _repo.scm_instance().get_commit(commit_id=commit_id)
             root_path = root_path.lstrip('/')
-            for __, dirs, files in commit.walk(root_path):
+            for f in commit.get_light_filenodes(root_path):
+                is_binary, md5, size, _content = f.metadata_uncached()
+                _data = {
+                    "name": f.unicode_path,
+                    "md5": md5,
+                    "extension": f.extension,
+                    "binary": is_binary,
+                    "size": size
+                }
 
-                for f in files:
-                    is_binary, md5, size, _content = f.metadata_uncached()
-                    _data = {
-                        "name": f.unicode_path,
-                        "md5": md5,
-                        "extension": f.extension,
-                        "binary": is_binary,
-                        "size": size
-                    }
-
-                    tree_info.append(_data)
+                tree_info.append(_data)
 
         except RepositoryError:
             log.exception("Exception in get_nodes")
@@ -22,66 +22,29 @@
 
 var NodeFilter = {};
 
-var fileBrowserListeners = function (node_list_url, url_base) {
+var fileBrowserListeners = function (node_search_url, url_base) {
     var $filterInput = $('#node_filter');
     var n_filter = $filterInput.get(0);
 
     NodeFilter.filterTimeout = null;
-    var nodes = null;
+    NodeFilter.searchRequest = null;
 
     NodeFilter.focus = function () {
         $filterInput.focus()
     };
 
-    NodeFilter.fetchNodes = function (callback) {
-        $.ajax(
-            {url: node_list_url, headers: {'X-PARTIAL-XHR': true}})
-            .done(function (data) {
-                nodes = data.nodes;
-                if (callback) {
-                    callback();
-                }
-            })
-            .fail(function (data) {
-                console.log('failed to load');
-            });
-    };
-
     NodeFilter.initFilter = function (e) {
-        if ($filterInput.hasClass('loading')) {
-            return
-        }
-
-        // in case we are already loaded, do nothing
-        if (!$filterInput.hasClass('init')) {
+        // matching is done on the server, nothing to preload
+        $filterInput.removeClass('init');
+        if (e !== undefined) {
             return NodeFilter.handleKey(e);
         }
-        var iconLoading = 'icon-spin animate-spin';
-        var iconSearch = 'icon-search';
-        $('.files-filter-box-path i').removeClass(iconSearch).addClass(iconLoading);
-        $filterInput.addClass('loading');
-
-        var callback = function (org) {
-            return function () {
-                if ($filterInput.hasClass('init')) {
-                    $filterInput.removeClass('init');
-                    $filterInput.removeClass('loading');
-                }
-                $('.files-filter-box-path i').removeClass(iconLoading).addClass(iconSearch);
-
-                // auto re-filter if we filled in the input
-                if (n_filter.value !== "") {
-                    NodeFilter.updateFilter(n_filter, e)()
-                }
-
-            }
-        };
-        // load node data
-        NodeFilter.fetchNodes(callback());
-
     };
 
     NodeFilter.resetFilter = function () {
+        if (NodeFilter.searchRequest) {
+            NodeFilter.searchRequest.abort();
+        }
         $('#tbody').show();
         $('#tbody_filtered').hide();
         $filterInput.val('');
@@ -165,105 +128,83 @@ var fileBrowserListeners = function (node_list_url, url_base) {
 
     };
 
-    NodeFilter.fuzzy_match = function (filepath, query) {
-        var highlight = [];
-        var order = 0;
-        for (var i = 0; i < query.length; i++) {
-            var match_position = filepath.indexOf(query[i]);
-            if (match_position !== -1) {
-                var prev_match_position = highlight[highlight.length - 1];
-                if (prev_match_position === undefined) {
-                    highlight.push(match_position);
-                } else {
-                    var current_match_position = prev_match_position + match_position + 1;
-                    highlight.push(current_match_position);
-                    order = order + current_match_position - prev_match_position;
-                }
-                filepath = filepath.substring(match_position + 1);
+    NodeFilter.renderResults = function (query, data) {
+        var match = [];
+        var typeObj = {
+            dir: 'icon-directory browser-dir',
+            file: 'icon-file-text browser-file'
+        };
+        for (var i = 0; i < data.results.length; i++) {
+            var n = data.results[i].name;
+            var t = data.results[i].type;
+            var n_hl = n.split("");
+            for (var k = 0; k < n_hl.length; k++) {
+                n_hl[k] = escapeHtml(n_hl[k]);
+            }
+            var pos = data.results[i].highlight;
+            for (var j = 0; j < pos.length; j++) {
+                n_hl[pos[j]] = "<em>" + n_hl[pos[j]] + "</em>";
+            }
+            n_hl = n_hl.join("");
+            var new_url = url_base.replace('__FPATH__', encodeURI(n));
+
+            var typeIcon = '<i class="{0}"></i>'.format(typeObj[t]);
+            match.push('<tr class="browser-result"><td><a class="match-link" href="{0}">{1}{2}</a></td><td colspan="5"></td></tr>'.format(new_url, typeIcon, n_hl));
+        }
+        var truncated_count = data.total - data.results.length;
+        if (truncated_count > 0) {
+            if (truncated_count === 1) {
+                match.push('<tr><td>{0} {1}</td><td colspan="5"></td></tr>'.format(truncated_count, _gettext('truncated result')));
             } else {
-                return false;
+                match.push('<tr><td>{0} {1}</td><td colspan="5"></td></tr>'.format(truncated_count, _gettext('truncated results')));
             }
         }
-        return {
-            'order': order,
-            'highlight': highlight
-        };
-    };
-
-    NodeFilter.sortPredicate = function (a, b) {
-        if (a.order < b.order) return -1;
-        if (a.order > b.order) return 1;
-        if (a.filepath < b.filepath) return -1;
-        if (a.filepath > b.filepath) return 1;
-        return 0;
+        if (match.length === 0) {
+            match.push('<tr><td>{0}</td><td colspan="5"></td></tr>'.format(_gettext('No matching files')));
+        }
+        $('#tbody').hide();
+        $('#tbody_filtered').show();
+        $('#tbody_filtered').html(match.join(""));
     };
 
     NodeFilter.updateFilter = function (elem, e) {
         return function () {
             // Reset timeout
             NodeFilter.filterTimeout = null;
-            var query = elem.value.toLowerCase();
-            var match = [];
-            var matches_max = 20;
-            if (query !== "") {
-                var results = [];
-                for (var k = 0; k < nodes.length; k++) {
-                    var result = NodeFilter.fuzzy_match(
-                            nodes[k].name.toLowerCase(), query);
-                    if (result) {
-                        result.type = nodes[k].type;
-                        result.filepath = nodes[k].name;
-                        results.push(result);
-                    }
-                }
-                results = results.sort(NodeFilter.sortPredicate);
-                var limit = matches_max;
-                if (results.length < matches_max) {
-                    limit = results.length;
-                }
-                for (var i = 0; i < limit; i++) {
-                    if (query && results.length > 0) {
-                        var n = results[i].filepath;
-                        var t = results[i].type;
-                        var n_hl = n.split("");
-                        var pos = results[i].highlight;
-                        for (var j = 0; j < pos.length; j++) {
-                            n_hl[pos[j]] = "<em>" + n_hl[pos[j]] + "</em>";
-                        }
-                        n_hl = n_hl.join("");
-                        var new_url = url_base.replace('__FPATH__', n);
-
-                        var typeObj = {
-                            dir: 'icon-directory browser-dir',
-                            file: 'icon-file-text browser-file'
-                        };
-
-                        var typeIcon = '<i class="{0}"></i>'.format(typeObj[t]);
-                        match.push('<tr class="browser-result"><td><a class="match-link" href="{0}">{1}{2}</a></td><td colspan="5"></td></tr>'.format(new_url, typeIcon, n_hl));
-                    }
-                }
-                if (results.length > limit) {
-                    var truncated_count = results.length - matches_max;
-                    if (truncated_count === 1) {
-                        match.push('<tr><td>{0} {1}</td><td colspan="5"></td></tr>'.format(truncated_count, _gettext('truncated result')));
-                    } else {
-                        match.push('<tr><td>{0} {1}</td><td colspan="5"></td></tr>'.format(truncated_count, _gettext('truncated results')));
-                    }
-                }
+            if (NodeFilter.searchRequest) {
+                NodeFilter.searchRequest.abort();
+                NodeFilter.searchRequest = null;
             }
-            if (query !== "") {
-                $('#tbody').hide();
-                $('#tbody_filtered').show();
-
-                if (match.length === 0) {
-                    match.push('<tr><td>{0}</td><td colspan="5"></td></tr>'.format(_gettext('No matching files')));
-                }
-                $('#tbody_filtered').html(match.join(""));
-            } else {
+            var query = elem.value;
+            if (query === "") {
                 $('#tbody').show();
                 $('#tbody_filtered').hide();
+                return;
             }
 
+            var iconLoading = 'icon-spin animate-spin';
+            var iconSearch = 'icon-search';
+            $('.files-filter-box-path i').removeClass(iconSearch).addClass(iconLoading);
+
+            NodeFilter.searchRequest = $.ajax({
+                url: node_search_url,
+                data: {'q': query},
+                headers: {'X-PARTIAL-XHR': true}
+            })
+            .done(function (data) {
+                // skip responses for an outdated query
+                if (elem.value === query) {
+                    NodeFilter.renderResults(query, data);
+                }
+            })
+            .fail(function (jqXHR, textStatus) {
+                if (textStatus !== 'abort') {
+                    console.log('failed to search files');
+                }
+            })
+            .always(function () {
+                $('.files-filter-box-path i').removeClass(iconLoading).addClass(iconSearch);
+            });
         };
     };
 
@@ -347,11 +288,15 @@ var getFileState = function() {
     var _node_list_url = pyroutes.url('repo_files_nodelist',
             {repo_name: templateContext.repo_name,
              commit_id: commit_id, f_path: f_path});
+    var _node_search_url = pyroutes.url('repo_files_nodesearch',
+            {repo_name: templateContext.repo_name,
+             commit_id: commit_id, f_path: f_path});
 
     return {
         f_path: f_path,
         commit_id: commit_id,
         node_list_url: _node_list_url,
+        node_search_url: _node_search_url,
         url_base: _url_base
     };
 };
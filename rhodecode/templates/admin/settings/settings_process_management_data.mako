@@ -9,7 +9,7 @@
             return proc.name
     %>
     <tr>
-        <td colspan="8">
+        <td colspan="9">
             <span id="processTimeStamp">${h.format_date(h.datetime.now())}</span>
         </td>
     </tr>
@@ -73,6 +73,12 @@
                 <td>
                     AGE: ${h.age_component(h.time_to_utcdatetime(proc_child.create_time))}
                 </td>
+                <td>
+                    <% worker_stats = c.worker_stats.get(proc_child.pid) %>
+                    % if worker_stats:
+                        REQ: ${worker_stats['requests']} | IN FLIGHT: ${worker_stats['in_flight']} | ERRORS: ${worker_stats['errors']}
+                    % endif
+                </td>
                 <td>
                     <a href="#restartProcess" onclick="restart(this, ${proc_child.pid});return false">
                         restart
@@ -211,7 +211,7 @@
             getFilesMetadata();
 
             // fuzzy file filter
-            fileBrowserListeners(state.node_list_url, state.url_base);
+            fileBrowserListeners(state.node_search_url, state.url_base);
 
             // switch to widget
             var initialCommitData = {
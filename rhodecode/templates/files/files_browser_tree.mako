@@ -29,7 +29,7 @@
         </tr>
 
         <% has_files = False %>
-        % for cnt,node in enumerate(c.file):
+        % for cnt,node in enumerate(c.file_tree_nodes):
         <% has_files = True %>
         <tr class="parity${(cnt % 2)}">
             <td class="td-componentname">
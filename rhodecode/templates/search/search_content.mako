@@ -35,14 +35,8 @@
     else:
         total_lines, matching_lines = h.get_matching_line_offsets(file_content, terms)
 
-    shown_matching_lines = 0
-    lines_of_interest = set()
-    for line_number in matching_lines:
-        if len(lines_of_interest) < max_lines:
-            lines_of_interest |= set(range(
-                max(line_number - line_context, 0),
-                min(line_number + line_context, total_lines + 1)))
-            shown_matching_lines += 1
+    lines_of_interest, shown_matching_lines = h.get_lines_of_interest(
+        matching_lines, total_lines, max_lines=max_lines, line_context=line_context)
     lexer = h.get_lexer_safe(mimetype=mimetype, filepath=filepath)
 
     html_formatter = h.SearchContentCodeHtmlFormatter(
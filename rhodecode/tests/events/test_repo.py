@@ -18,8 +18,10 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import mock
 import pytest
 
+import rhodecode
 from rhodecode.events import UserPermissionsChange
 from rhodecode.lib.utils2 import StrictAttributeDict
 from rhodecode.tests.events.conftest import EventCatcher
@@ -95,6 +97,38 @@ def test_vcs_repo_push_event_serialize(config_stub, repo_stub, scm_extras, Event
     assert data['repo']['permalink_url']
 
 
+def test_vcs_repo_push_event_caps_commits(config_stub, repo_stub, scm_extras):
+    commit_ids = repo_stub.scm_instance().commit_ids[:5]
+    pushed_commit_ids = commit_ids + ['tag=>v1.0', 'delete_branch=>old']
+    event = RepoPushEvent(repo_name=repo_stub.repo_name,
+                          pushed_commit_ids=pushed_commit_ids,
+                          extras=scm_extras)
+    with mock.patch.dict(rhodecode.CONFIG, {'events.push.max_commits': '2'}):
+        data = event.as_dict()
+
+    # most recent commits are kept, reference changes are never dropped
+    assert [c['raw_id'] for c in data['push']['commits']] == (
+        commit_ids[-2:] + ['tag=>v1.0', 'delete_branch=>old'])
+    assert data['push']['commits_total'] == 5
+    assert data['push']['commits_truncated'] is True
+
+    # push data is computed once, and shared by all consumers of the event
+    assert event.as_dict()['push'] is data['push']
+
+
+def test_vcs_repo_push_event_does_not_cap_ref_changes(
+        config_stub, repo_stub, scm_extras):
+    pushed_commit_ids = ['tag=>v{}'.format(x) for x in range(5)]
+    event = RepoPushEvent(repo_name=repo_stub.repo_name,
+                          pushed_commit_ids=pushed_commit_ids,
+                          extras=scm_extras)
+    with mock.patch.dict(rhodecode.CONFIG, {'events.push.max_commits': '2'}):
+        data = event.as_dict()
+
+    assert [c['raw_id'] for c in data['push']['commits']] == pushed_commit_ids
+    assert data['push']['commits_truncated'] is False
+
+
 def test_create_delete_repo_fires_events(backend):
     with EventCatcher() as event_catcher:
         repo = backend.create_repo()
@@ -21,6 +21,7 @@
 import pytest
 
 from rhodecode import events
+from rhodecode.integrations import delivery
 from rhodecode.lib.utils2 import AttributeDict
 from rhodecode.integrations.types.webhook import WebhookDataHandler
 
@@ -132,3 +133,115 @@ def test_webook_parse_url_for_push_event(
     urls = handler(repo_push_event, base_data)
     assert urls == [
         (url, headers, base_data) for url in expected_urls]
+
+
+class FakeTimer(object):
+    def __init__(self, interval, func, args):
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def start(self):
+        pass
+
+    def cancel(self):
+        self.cancelled = True
+
+    def fire(self):
+        self.func(*self.args)
+
+
+def test_delivery_coalescer_dispatches_right_away_without_window():
+    dispatched = []
+    coalescer = delivery.DeliveryCoalescer(
+        lambda calls, settings: dispatched.append(calls),
+        window=0, max_batch_size=10)
+    coalescer.add('integration', {}, [('http://a.com/x', {}, {})])
+    assert dispatched == [[('http://a.com/x', {}, {})]]
+
+
+def test_delivery_coalescer_batches_per_endpoint():
+    dispatched = []
+    timers = []
+
+    def timer_factory(*args):
+        timer = FakeTimer(*args)
+        timers.append(timer)
+        return timer
+
+    coalescer = delivery.DeliveryCoalescer(
+        lambda calls, settings: dispatched.append(calls),
+        window=1, max_batch_size=10, timer_factory=timer_factory)
+
+    coalescer.add('integration', {}, [('http://a.com/1', {}, {}),
+                                      ('http://b.com/1', {}, {})])
+    coalescer.add('integration', {}, [('http://a.com/2', {}, {})])
+    assert dispatched == []
+    assert coalescer.pending() == 3
+    assert len(timers) == 2
+
+    timers[0].fire()
+    assert dispatched == [[('http://a.com/1', {}, {}),
+                           ('http://a.com/2', {}, {})]]
+    coalescer.flush()
+    assert dispatched[1] == [('http://b.com/1', {}, {})]
+    assert coalescer.pending() == 0
+
+
+def test_delivery_coalescer_flushes_full_batch():
+    dispatched = []
+    coalescer = delivery.DeliveryCoalescer(
+        lambda calls, settings: dispatched.append(calls),
+        window=1, max_batch_size=2, timer_factory=FakeTimer)
+
+    coalescer.add('integration', {}, [('http://a.com/%s' % x, {}, {})
+                                      for x in range(3)])
+    assert len(dispatched) == 1
+    assert len(dispatched[0]) == 2
+    assert coalescer.pending() == 1
+
+
+def test_token_bucket_waits_when_exhausted():
+    now = [100.0]
+    sleeps = []
+    bucket = delivery.TokenBucket(
+        2, clock=lambda: now[0], sleep=sleeps.append)
+
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0.5
+    now[0] += 1.5
+    assert bucket.acquire() == 0
+    assert sleeps == [0.5]
+
+
+def test_deliver_calls_reuses_session_and_returns_failed():
+    sessions = []
+
+    def session_factory():
+        sessions.append(object())
+        return sessions[-1]
+
+    used = []
+
+    def call_func(session, url, headers, data):
+        used.append(session)
+        if url.endswith('fail'):
+            raise Exception('failed')
+
+    registry = delivery.EndpointRegistry(session_factory=session_factory)
+    calls = [('http://a.com/1', {}, {}), ('http://a.com/fail', {}, {}),
+             ('http://b.com/1', {}, {})]
+    failed = delivery.deliver_calls(
+        calls, call_func, delivery.get_delivery_settings({}), registry=registry)
+
+    assert failed == [('http://a.com/fail', {}, {})]
+    assert len(sessions) == 2
+    assert used[0] is used[1]
+
+
+@pytest.mark.parametrize('attempt, expected', [
+    (0, 10), (1, 20), (3, 80), (20, 3600),
+])
+def test_retry_countdown(attempt, expected):
+    assert delivery.retry_countdown(attempt, 10) == expected
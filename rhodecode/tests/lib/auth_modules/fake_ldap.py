@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+
+"""
+In-process stand-in for a LDAP directory and the `python-ldap` module.
+
+It resembles the subset of the :mod:`ldap` API used by the LDAP auth plugin,
+with configurable latencies to simulate a remote directory server.
+"""
+
+import re
+import time
+import collections
+
+
+class FakeLdapModule(object):
+    SCOPE_BASE = 0
+    SCOPE_ONELEVEL = 1
+    SCOPE_SUBTREE = 2
+    VERSION2 = 2
+    VERSION3 = 3
+    OPT_OFF = 0
+    OPT_ON = 1
+    OPT_DEBUG_LEVEL = 'OPT_DEBUG_LEVEL'
+    OPT_REFERRALS = 'OPT_REFERRALS'
+    OPT_RESTART = 'OPT_RESTART'
+    OPT_NETWORK_TIMEOUT = 'OPT_NETWORK_TIMEOUT'
+    OPT_TIMEOUT = 'OPT_TIMEOUT'
+    OPT_X_TLS_CACERTDIR = 'OPT_X_TLS_CACERTDIR'
+    OPT_X_TLS_REQUIRE_CERT = 'OPT_X_TLS_REQUIRE_CERT'
+
+    class LDAPError(Exception):
+        pass
+
+    class SERVER_DOWN(LDAPError):
+        pass
+
+    class TIMEOUT(LDAPError):
+        pass
+
+    class NO_SUCH_OBJECT(LDAPError):
+        pass
+
+    class INVALID_CREDENTIALS(LDAPError):
+        pass
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def set_option(self, option, value):
+        pass
+
+    def initialize(self, uri):
+        return FakeLdapObject(self, uri)
+
+
+class FakeLdapObject(object):
+    _host_pat = re.compile(r'\w+://([^:,\s]+)')
+    _filter_pat = re.compile(r'\((\w+)=([^()]*)\)\)$')
+
+    def __init__(self, module, uri):
+        self.module = module
+        self.directory = module.directory
+        self.uri = uri
+        # like libldap, multiple servers are tried in order on connect
+        self.hosts = self._host_pat.findall(uri)
+        self.host = None
+        self.connected = False
+        self.bound_dn = None
+        self.protocol = None
+        self.timeout = None
+
+    def _ensure_connected(self):
+        if self.connected and (
+                self.host in self.directory.down_hosts or
+                self in self.directory.killed_connections):
+            self.connected = False
+            raise self.module.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+
+        if not self.connected:
+            available = [
+                host for host in self.hosts
+                if host not in self.directory.down_hosts]
+            if not available:
+                raise self.module.SERVER_DOWN(
+                    {'desc': "Can't contact LDAP server"})
+            self.host = available[0]
+            self.directory.stats['connect'] += 1
+            time.sleep(self.directory.connect_latency)
+            self.connected = True
+
+    def set_option(self, option, value):
+        pass
+
+    def start_tls_s(self):
+        self._ensure_connected()
+
+    def simple_bind_s(self, dn, password):
+        self._ensure_connected()
+        self.directory.stats['bind'] += 1
+        time.sleep(self.directory.latency)
+        if self.directory.passwords.get(dn) != password:
+            raise self.module.INVALID_CREDENTIALS({'desc': 'Invalid credentials'})
+        self.bound_dn = dn
+
+    def search_ext_s(self, base, scope, filterstr, attrlist=None):
+        self._ensure_connected()
+        self.directory.stats['search'] += 1
+        time.sleep(self.directory.latency)
+
+        if base == '' and scope == self.module.SCOPE_BASE:
+            return [('', {})]
+        if scope == self.module.SCOPE_BASE:
+            if base not in self.directory.entries:
+                raise self.module.NO_SUCH_OBJECT({'desc': 'No such object'})
+            return [(base, self.directory.entries[base])]
+
+        attr, value = self._filter_pat.search(filterstr).groups()
+        return [
+            (dn, attrs) for dn, attrs in self.directory.entries.items()
+            if dn.endswith(base) and value in attrs.get(attr, [])]
+
+    def unbind_s(self):
+        self.directory.stats['unbind'] += 1
+        self.connected = False
+
+
+class FakeDirectory(object):
+    """
+    Holds the entries, service and user credentials, and counts the
+    operations executed against the directory.
+    """
+    base_dn = 'ou=users,dc=example,dc=com'
+    bind_dn = 'cn=admin,dc=example,dc=com'
+    bind_pass = 'secret'
+
+    def __init__(self, users=(), latency=0, connect_latency=0):
+        self.latency = latency
+        self.connect_latency = connect_latency
+        self.entries = {}
+        self.passwords = {self.bind_dn: self.bind_pass}
+        self.down_hosts = set()
+        self.killed_connections = set()
+        self.stats = collections.Counter()
+        for username, password in users:
+            self.add_user(username, password)
+
+    def add_user(self, username, password):
+        dn = 'uid={},{}'.format(username, self.base_dn)
+        self.entries[dn] = {
+            'uid': [username],
+            'mail': ['{}@example.com'.format(username)],
+        }
+        self.passwords[dn] = password
+        return dn
+
+    def ldap_module(self):
+        return FakeLdapModule(self)
+
+    def ldap_args(self, **kwargs):
+        args = {
+            'server': 'ldap-1.example.com',
+            'base_dn': self.base_dn,
+            'port': 389,
+            'bind_dn': self.bind_dn,
+            'bind_pass': self.bind_pass,
+            'tls_kind': 'PLAIN',
+            'search_scope': 'SUBTREE',
+            'attr_login': 'uid',
+        }
+        args.update(kwargs)
+        return args
+
+
+def build_servers(ldap_server_type, ldap_server, port, use_resolver=True):
+    """
+    Replacement of `AuthLdapBase._build_servers` without DNS lookups.
+    """
+    return ', '.join(
+        '{}://{}:{}'.format(ldap_server_type, host.strip(), port)
+        for host in ldap_server)
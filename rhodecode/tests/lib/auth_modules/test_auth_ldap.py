@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+
+import mock
+import pytest
+
+from rhodecode.authentication.base import AuthLdapBase
+from rhodecode.authentication.plugins import auth_ldap
+from rhodecode.lib.exceptions import (
+    LdapConnectionError, LdapPasswordError, LdapUsernameError)
+from rhodecode.tests.lib.auth_modules.fake_ldap import (
+    FakeDirectory, build_servers)
+
+
+@pytest.fixture()
+def directory(request):
+    directory = FakeDirectory(users=[('alice', 'alice-pass')])
+    patches = [
+        mock.patch.object(auth_ldap, 'ldap', directory.ldap_module()),
+        mock.patch.object(
+            auth_ldap.AuthLdap, '_build_servers', staticmethod(build_servers)),
+        mock.patch.dict('rhodecode.CONFIG', {'auth_ldap.pool_size': '2'}),
+    ]
+    for patch in patches:
+        patch.start()
+
+    @request.addfinalizer
+    def cleanup():
+        auth_ldap.clear_ldap_pools()
+        for patch in reversed(patches):
+            patch.stop()
+
+    return directory
+
+
+def authenticate(directory, username='alice', password='alice-pass', **kwargs):
+    kwargs.setdefault('use_pool', True)
+    aldap = auth_ldap.AuthLdap(**directory.ldap_args(**kwargs))
+    return aldap, aldap.authenticate_ldap(username, password)
+
+
+def test_service_connection_is_reused(directory):
+    for _ in range(5):
+        aldap, (dn, attrs) = authenticate(directory)
+        assert dn == 'uid=alice,{}'.format(directory.base_dn)
+        assert attrs['mail'] == ['alice@example.com']
+
+    # one pooled service connection, and one re-bound for each user
+    assert directory.stats['connect'] == 2
+    assert directory.stats['bind'] == 1 + 5
+    assert aldap.pool.idle_count() == 1
+    assert aldap.user_bind_pool.idle_count() == 1
+
+
+def test_without_pool_every_authentication_connects(directory):
+    for _ in range(5):
+        aldap, _result = authenticate(directory, use_pool=False)
+    assert aldap.pool is None
+    assert directory.stats['connect'] == 5
+    assert directory.stats['bind'] == 5 + 5
+
+
+def test_pool_disabled_by_config(directory):
+    with mock.patch.dict('rhodecode.CONFIG', {'auth_ldap.pool_size': '0'}):
+        aldap, _result = authenticate(directory)
+    assert aldap.pool is None
+
+
+@pytest.mark.parametrize('username, password, exception', [
+    ('alice', 'wrong', LdapPasswordError),
+    ('bob', 'bob-pass', LdapUsernameError),
+])
+def test_failed_authentication_keeps_pooled_connection(
+        directory, username, password, exception):
+    with pytest.raises(exception):
+        authenticate(directory, username=username, password=password)
+
+    aldap, _result = authenticate(directory)
+    assert aldap.pool.idle_count() == 1
+    assert aldap.user_bind_pool.idle_count() == 1
+    assert directory.stats['bind'] == 1 + (username == 'alice') + 1
+    assert directory.stats['connect'] == 2
+
+
+@pytest.mark.parametrize('pool_attr', ['pool', 'user_bind_pool'])
+def test_broken_pooled_connection_is_replaced(directory, pool_attr):
+    aldap, _result = authenticate(directory)
+    (pooled_conn, _last_used), = getattr(aldap, pool_attr)._idle
+    directory.killed_connections.add(pooled_conn)
+
+    aldap, (dn, _attrs) = authenticate(directory)
+    assert dn
+    (new_conn, _last_used), = getattr(aldap, pool_attr)._idle
+    assert new_conn is not pooled_conn
+
+
+def test_idle_connection_is_health_checked(directory):
+    clock = mock.Mock(return_value=1000)
+    aldap, _result = authenticate(directory)
+    for pool in [aldap.pool, aldap.user_bind_pool]:
+        pool._clock = clock
+        pool.clear()
+    authenticate(directory)
+
+    searches = directory.stats['search']
+    clock.return_value += aldap.pool.check_interval + 1
+    authenticate(directory)
+    # root DSE check of both connections, user search and attributes read
+    assert directory.stats['search'] == searches + 4
+
+    clock.return_value += aldap.pool.max_idle + 1
+    connects = directory.stats['connect']
+    authenticate(directory)
+    assert directory.stats['connect'] == connects + 2
+
+
+def test_failover_to_next_server(directory):
+    directory.down_hosts.add('ldap-1.example.com')
+    server = 'ldap-1.example.com, ldap-2.example.com'
+
+    aldap, (dn, _attrs) = authenticate(directory, server=server)
+    assert dn
+    (pooled_conn, _last_used), = aldap.pool._idle
+    assert pooled_conn.host == 'ldap-2.example.com'
+
+    # failed server is tried last for new connections
+    aldap.pool.clear()
+    aldap.user_bind_pool.clear()
+    directory.stats.clear()
+    authenticate(directory, server=server)
+    (pooled_conn, _last_used), = aldap.pool._idle
+    assert pooled_conn.host == 'ldap-2.example.com'
+    assert directory.stats['connect'] == 2
+
+
+def test_all_servers_down(directory):
+    directory.down_hosts.add('ldap-1.example.com')
+    with pytest.raises(LdapConnectionError):
+        authenticate(directory)
+
+
+def test_dynamic_binding_is_not_pooled():
+    plugin = auth_ldap.RhodeCodeAuthPlugin('stub_id')
+    settings = {
+        'host': 'ldap-1.example.com', 'port': 389,
+        'dn_user': 'uid=$login,ou=users,dc=example,dc=com', 'dn_pass': '',
+        'search_scope': 'SUBTREE', 'tls_kind': 'PLAIN',
+    }
+    with mock.patch.object(auth_ldap, 'AuthLdap') as auth_ldap_mock:
+        plugin.auth(None, 'alice', 'alice-pass', settings)
+        assert auth_ldap_mock.call_args[1]['use_pool'] is False
+
+        settings['dn_user'] = 'cn=admin,dc=example,dc=com'
+        settings['dn_pass'] = 'secret'
+        plugin.auth(None, 'alice', 'alice-pass', settings)
+        assert auth_ldap_mock.call_args[1]['use_pool'] is True
+
+
+def test_host_resolve_is_cached():
+    AuthLdapBase._resolved_hosts.clear()
+    with mock.patch('rhodecode.authentication.base.socket') as socket_mock:
+        socket_mock.gethostbyname.return_value = '10.0.0.1'
+        for _ in range(3):
+            servers = AuthLdapBase._build_servers(
+                'ldap', ['ldap-1.example.com'], 389)
+            assert servers == 'ldap://ldap-1.example.com:389'
+    AuthLdapBase._resolved_hosts.clear()
+
+    assert socket_mock.gethostbyname.call_count == 1
+    assert socket_mock.socket.call_count == 1
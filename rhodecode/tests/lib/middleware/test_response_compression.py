@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import zlib
+
+import mock
+import pytest
+from webob import Request, Response
+
+from rhodecode.lib.middleware import response_compression
+from rhodecode.lib.middleware.response_compression import (
+    ResponseCompressionTween, compress)
+
+JSON_BODY = '{"nodes": [%s]}' % ', '.join(
+    '{"name": "docs/file_%s.rst", "type": "file"}' % i for i in range(200))
+
+
+def gunzip(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def make_tween(response, **settings):
+    registry = mock.Mock(settings=settings)
+    return ResponseCompressionTween(lambda request: response, registry)
+
+
+def make_request(accept_encoding='gzip, deflate', method='GET'):
+    headers = {}
+    if accept_encoding:
+        headers['Accept-Encoding'] = accept_encoding
+    return Request.blank('/', method=method, headers=headers)
+
+
+def json_response(body=JSON_BODY, **kwargs):
+    if 'app_iter' in kwargs:
+        body = None
+    return Response(body, content_type='application/json', charset=None, **kwargs)
+
+
+def test_json_response_is_compressed():
+    response = make_tween(json_response())(make_request())
+
+    assert response.content_encoding == 'gzip'
+    assert response.vary == ('Accept-Encoding',)
+    assert response.content_length < len(JSON_BODY)
+    assert gunzip(response.body) == JSON_BODY
+
+
+def test_deflate_is_used_if_preferred():
+    request = make_request(accept_encoding='deflate, gzip;q=0.5')
+    response = make_tween(json_response())(request)
+
+    assert response.content_encoding == 'deflate'
+    assert zlib.decompress(response.body) == JSON_BODY
+
+
+@pytest.mark.parametrize('accept_encoding, method, response, settings', [
+    (None, 'GET', json_response(), {}),
+    ('br', 'GET', json_response(), {}),
+    ('gzip', 'HEAD', json_response(), {}),
+    ('gzip', 'GET', json_response(body='{}'), {}),
+    ('gzip', 'GET', json_response(status=404), {}),
+    ('gzip', 'GET', Response(JSON_BODY, content_type='text/html'), {}),
+    ('gzip', 'GET', json_response(), {'response_compression.enabled': 'false'}),
+    ('gzip', 'GET', json_response(),
+     {'response_compression.min_size': str(len(JSON_BODY) + 1)}),
+])
+def test_response_is_not_compressed(accept_encoding, method, response, settings):
+    request = make_request(accept_encoding=accept_encoding, method=method)
+    response = make_tween(response, **settings)(request)
+
+    assert not response.content_encoding
+
+
+def test_compressed_response_is_left_alone():
+    body = compress(JSON_BODY)
+    response = json_response(body=body)
+    response.content_encoding = 'gzip'
+
+    response = make_tween(response)(make_request())
+    assert response.body == body
+
+
+def test_streamed_response_is_compressed():
+    closed = []
+
+    class AppIter(object):
+        def __iter__(self):
+            return iter([JSON_BODY[:100], JSON_BODY[100:]])
+
+        def close(self):
+            closed.append(True)
+
+    response = json_response(app_iter=AppIter())
+    response = make_tween(response)(make_request())
+
+    assert response.content_encoding == 'gzip'
+    assert response.content_length is None
+    assert gunzip(''.join(response.app_iter)) == JSON_BODY
+    assert closed == [True]
+
+
+def test_strong_etag_is_weakened():
+    response = json_response()
+    response.etag = 'abc'
+
+    response = make_tween(response)(make_request())
+    assert response.headers['ETag'] == 'W/"abc"'
+
+
+def test_content_types_setting():
+    response = Response(JSON_BODY, content_type='text/csv')
+    tween = make_tween(response, **{
+        'response_compression.content_types': 'application/json, text/csv'})
+    assert tween(make_request()).content_encoding == 'gzip'
+
+
+@pytest.mark.parametrize('accept_encoding, settings, expected', [
+    ('gzip', {}, True),
+    ('deflate', {}, False),
+    (None, {}, False),
+    ('gzip', {'response_compression.enabled': 'false'}, False),
+])
+def test_accepts_precompressed(accept_encoding, settings, expected):
+    request = make_request(accept_encoding=accept_encoding)
+    request.registry = mock.Mock(settings=settings)
+    assert response_compression.accepts_precompressed(request) == expected
@@ -18,11 +18,13 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import base64
 from StringIO import StringIO
 
 import pytest
-from mock import patch, Mock
+from mock import patch, Mock, ANY
 
+from rhodecode.lib.ext_json import json
 from rhodecode.lib.middleware.simplesvn import SimpleSvn, SimpleSvnApp
 from rhodecode.lib.utils import get_rhodecode_base_path
 
@@ -202,8 +204,39 @@ class TestSimpleSvnApp(object):
         ]
         request_mock.assert_called_once_with(
             self.environment['REQUEST_METHOD'], expected_url,
-            data=self.data, headers=expected_request_headers, stream=False)
+            data=ANY, headers=expected_request_headers, stream=False)
+        # body of known length is streamed with its length, not buffered
+        data = request_mock.call_args[1]['data']
+        assert data.len == 130
+        assert data.read() == self.data
         response_mock.iter_content.assert_called_once_with(chunk_size=1024)
         args, _ = start_response.call_args
         assert args[0] == '200 OK'
         assert sorted(args[1]) == sorted(expected_response_headers)
+
+    def _call_with_body(self, body, **environ):
+        environment = dict(
+            self.environment, REQUEST_METHOD='POST',
+            CONTENT_LENGTH=str(len(body)), **environ)
+        environment['wsgi.input'] = StringIO(body)
+        response_mock = Mock(headers={}, status_code=200, reason='OK')
+        with patch('rhodecode.lib.middleware.simplesvn.requests.request',
+                   return_value=response_mock) as request_mock:
+            self.app(environment, Mock())
+        return request_mock.call_args[1]['data']
+
+    def test_call_streams_large_body(self):
+        body = 'x' * (1024 * 1024)
+        data = self._call_with_body(body)
+        assert not isinstance(data, str)
+        assert data.len == len(body)
+        assert data.read(10) == 'x' * 10
+        assert len(data.read()) == len(body) - 10
+
+    def test_call_adds_extras_to_create_txn_with_props(self):
+        body = '(create-txn-with-props (svn:log 4 test))'
+        with patch.object(SimpleSvnApp, 'rc_extras', {'username': 'user'}):
+            data = self._call_with_body(body)
+        rc_data = base64.urlsafe_b64encode(json.dumps({'username': 'user'}))
+        assert data == '{} rc-scm-extras {} {}))'.format(
+            body[:-2], len(rc_data), rc_data)
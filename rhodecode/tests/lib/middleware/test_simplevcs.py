@@ -19,6 +19,7 @@
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
 import base64
+from StringIO import StringIO
 
 import mock
 import pytest
@@ -429,6 +430,88 @@ class TestGenerateVcsResponse(object):
         return self.controller._invalidate_cache.called
 
 
+class TestPeekSvnTxnId(object):
+    merge_body = (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        '<D:merge xmlns:D="DAV:">'
+        '<D:source><D:href>/svn-repo/!svn/txn/12-c</D:href></D:source>'
+        '<D:no-auto-merge/><D:no-checkout/>'
+        '<D:prop><D:checked-in/><D:version-name/></D:prop>'
+        '<S:lock-token-list xmlns:S="svn:">{}</S:lock-token-list>'
+        '</D:merge>')
+
+    def lock_tokens(self, count):
+        return ''.join(
+            '<S:lock><S:lock-path>path/{0}</S:lock-path>'
+            '<S:lock-token>opaquelocktoken:{0}</S:lock-token></S:lock>'.format(i)
+            for i in range(count))
+
+    def test_extracts_txn_id_like_full_parse(self):
+        body = self.merge_body.format(self.lock_tokens(10))
+        expected = simplevcs.extract_svn_txn_id('repo', body)
+        assert expected
+
+        txn_id, stream = simplevcs.peek_svn_txn_id('repo', StringIO(body))
+        assert txn_id == expected
+        assert stream.read() == body
+
+    def test_reads_only_beginning_of_large_body(self):
+        body = self.merge_body.format(self.lock_tokens(50000))
+        wsgi_input = StringIO(body)
+
+        txn_id, stream = simplevcs.peek_svn_txn_id(
+            'repo', wsgi_input, chunk_size=1024)
+        assert txn_id == simplevcs.extract_svn_txn_id('repo', body)
+        assert wsgi_input.tell() <= 1024
+
+        # peeked data is replayed, followed by the rest of the input
+        assert stream.read(10) == body[:10]
+        assert stream.readline() == body[10:]
+        assert stream.read() == ''
+
+    def test_peek_is_bounded(self):
+        body = '<D:merge xmlns:D="DAV:">{}</D:merge>'.format('x' * 10000)
+        wsgi_input = StringIO(body)
+
+        txn_id, stream = simplevcs.peek_svn_txn_id(
+            'repo', wsgi_input, max_peek=100, chunk_size=30)
+        assert txn_id is None
+        assert wsgi_input.tell() == 100
+        assert stream.read() == body
+
+    @pytest.mark.parametrize('body', [
+        '',
+        'not xml',
+        '<D:merge xmlns:D="DAV:"><D:href>/svn-repo/!svn/txn/12-c</D:href>'
+        '</D:merge>',
+    ])
+    def test_no_txn_id(self, body):
+        txn_id, stream = simplevcs.peek_svn_txn_id('repo', StringIO(body))
+        assert txn_id is None
+        assert stream.read() == body
+
+
+class TestPeekedStream(object):
+
+    @pytest.mark.parametrize('head_size', [0, 1, 5, 11, 20])
+    def test_readline(self, head_size):
+        data = 'first\nsecond\nthird'
+        stream = simplevcs.PeekedStream(
+            data[:head_size], StringIO(data[head_size:]))
+        assert list(stream) == ['first\n', 'second\n', 'third']
+
+    @pytest.mark.parametrize('head_size', [0, 1, 5, 11, 20])
+    def test_read_sized(self, head_size):
+        data = 'first\nsecond\nthird'
+        stream = simplevcs.PeekedStream(
+            data[:head_size], StringIO(data[head_size:]))
+        assert stream.readline(3) == 'fir'
+        assert stream.read(4) == 'st\ns'
+        assert stream.readline(100) == 'econd\n'
+        assert stream.read(100) == 'third'
+        assert stream.read(100) == ''
+
+
 class TestInitializeGenerator(object):
 
     def test_drains_first_element(self):
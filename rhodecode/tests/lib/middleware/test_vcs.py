@@ -18,10 +18,19 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import io
+import gzip
+import zlib
+import resource
+
+import pytest
 from mock import patch, Mock
 
 import rhodecode
 from rhodecode.lib.middleware import vcs
+from rhodecode.lib.shared_stats import SharedStats
+from rhodecode.lib.middleware.simplegit import SimpleGit, GIT_PROTO_PAT
+from rhodecode.lib.middleware.simplehg import SimpleHg
 from rhodecode.lib.middleware.simplesvn import (
     SimpleSvn, DisabledSimpleSvnApp, SimpleSvnApp)
 from rhodecode.tests import SVN_REPO
@@ -111,6 +120,134 @@ def test_is_svn_allows_to_configure_the_magic_path(monkeypatch):
     assert vcs.is_svn(environ)
 
 
+@pytest.mark.parametrize('path', [
+    '/repo/info/refs',
+    '/group/repo.git/info/refs',
+    '/repo/info/lfs/objects/batch',
+    '/repo/info/lfs/',
+    '/repo/git-upload-pack',
+    '/repo/git-receive-pack',
+    '//info/refs',
+    '/info/refs',
+    '/repo/files/tip/info/refs/x',
+    '/repo\n/info/refs',
+    '/repo/changelog',
+    '/',
+])
+def test_is_git_matches_git_proto_pattern(path):
+    environ = {'PATH_INFO': path}
+    expected = GIT_PROTO_PAT.match(path)
+    result = vcs.is_git(environ)
+    assert bool(result) == bool(expected)
+    if expected:
+        assert result.groups() == expected.groups()
+
+
+class TestPathPrefixTrie(object):
+
+    @pytest.fixture()
+    def trie(self):
+        trie = vcs.PathPrefixTrie()
+        trie.add('_static', 'static')
+        trie.add('_admin', 'admin')
+        trie.add('_admin/ops/ping', 'ping', exact=True)
+        return trie
+
+    @pytest.mark.parametrize('path, expected', [
+        ('/_static', 'static'),
+        ('/_static/rhodecode/css/style.css', 'static'),
+        ('//_static/x', 'static'),
+        ('/_staticx/file', None),
+        ('/_admin/ops/ping', 'ping'),
+        ('/_admin/ops/ping/', 'admin'),
+        ('/_admin/ops/ping/more', 'admin'),
+        ('/_admin/settings', 'admin'),
+        ('/repo/_static', None),
+        ('/', None),
+        ('', None),
+    ])
+    def test_lookup(self, trie, path, expected):
+        assert trie.lookup(path) == expected
+
+
+class TestRequestClassifier(object):
+
+    @pytest.fixture()
+    def classifier(self):
+        return vcs.RequestClassifier(['hg', 'git', 'svn'])
+
+    @pytest.mark.parametrize('environ, expected', [
+        ({'PATH_INFO': '/_static/rhodecode/js/scripts.js'},
+         (vcs.REQUEST_KIND_STATIC, vcs.VCS_TYPE_SKIP)),
+        ({'PATH_INFO': '/_file_store/download/abc'},
+         (vcs.REQUEST_KIND_WEB, vcs.VCS_TYPE_SKIP)),
+        ({'PATH_INFO': '/_admin/ops/ping', 'REQUEST_METHOD': 'PROPFIND'},
+         (vcs.REQUEST_KIND_WEB, vcs.VCS_TYPE_SKIP)),
+        ({'PATH_INFO': '/_admin/api', 'REQUEST_METHOD': 'POST'},
+         (vcs.REQUEST_KIND_API, vcs.VCS_TYPE_SKIP)),
+        ({'PATH_INFO': '/repo/changelog', 'REQUEST_METHOD': 'GET'},
+         (vcs.REQUEST_KIND_WEB, vcs.VCS_TYPE_SKIP)),
+        ({'PATH_INFO': '/repo/info/refs', 'REQUEST_METHOD': 'GET'},
+         (vcs.REQUEST_KIND_VCS, 'git')),
+        ({'PATH_INFO': '/repo', 'REQUEST_METHOD': 'GET',
+          'QUERY_STRING': 'cmd=capabilities',
+          'HTTP_ACCEPT': 'application/mercurial-0.1'},
+         (vcs.REQUEST_KIND_VCS, 'hg')),
+        ({'PATH_INFO': '/repo/!svn/me', 'REQUEST_METHOD': 'POST'},
+         (vcs.REQUEST_KIND_VCS, 'svn')),
+    ])
+    def test_classify(self, classifier, environ, expected):
+        assert classifier.classify(environ) == expected
+        assert environ[vcs.REQUEST_KIND_KEY] == expected[0]
+        assert environ[vcs.VCS_TYPE_KEY] == expected[1]
+
+    def test_checks_only_enabled_backends_in_order(self):
+        environ = {
+            'PATH_INFO': '/repo/info/refs', 'REQUEST_METHOD': 'PROPFIND'}
+        assert vcs.RequestClassifier(['svn', 'git']).classify(dict(environ)) \
+            == (vcs.REQUEST_KIND_VCS, 'svn')
+        assert vcs.RequestClassifier(['hg']).classify(dict(environ)) \
+            == (vcs.REQUEST_KIND_WEB, vcs.VCS_TYPE_SKIP)
+
+    def test_without_vcs_detection(self, classifier):
+        environ = {'PATH_INFO': '/repo/info/refs', 'REQUEST_METHOD': 'GET'}
+        assert classifier.classify(environ, detect_vcs=False) == (
+            vcs.REQUEST_KIND_WEB, vcs.VCS_TYPE_SKIP)
+
+    def test_result_is_reused_from_environ(self, classifier):
+        environ = {'PATH_INFO': '/repo/info/refs', 'REQUEST_METHOD': 'GET'}
+        classifier.classify(environ)
+
+        with patch.object(classifier.trie, 'lookup') as lookup:
+            assert classifier.classify(environ) == (
+                vcs.REQUEST_KIND_VCS, 'git')
+            assert vcs.get_request_kind(environ) == vcs.REQUEST_KIND_VCS
+            assert not lookup.called
+
+    def test_custom_api_url(self):
+        classifier = vcs.RequestClassifier(['git'], api_url='/my-api')
+        assert classifier.classify({'PATH_INFO': '/my-api'}) == (
+            vcs.REQUEST_KIND_API, vcs.VCS_TYPE_SKIP)
+
+    @pytest.mark.parametrize('environ, expected', [
+        ({'PATH_INFO': '/repo/info/refs', 'REQUEST_METHOD': 'GET'},
+         SimpleGit),
+        ({'PATH_INFO': '/_static/repo/info/refs', 'REQUEST_METHOD': 'GET'},
+         None),
+        ({'PATH_INFO': '/repo/info/refs', vcs.VCS_TYPE_KEY: vcs.VCS_TYPE_SKIP},
+         None),
+        ({'PATH_INFO': '/repo', vcs.VCS_TYPE_KEY: 'hg'}, SimpleHg),
+    ])
+    def test_detect_vcs_request(self, environ, expected):
+        assert vcs.detect_vcs_request(environ, ['hg', 'git', 'svn']) == expected
+
+    def test_detect_vcs_request_uses_api_url(self):
+        environ = {'PATH_INFO': '/my-api', 'REQUEST_METHOD': 'POST'}
+        assert vcs.detect_vcs_request(
+            environ, ['hg', 'git', 'svn'], api_url='/my-api') is None
+        assert environ[vcs.REQUEST_KIND_KEY] == vcs.REQUEST_KIND_API
+
+
 class TestVCSMiddleware(object):
     def test_get_handler_app_retuns_svn_app_when_proxy_enabled(self, app):
         environ = {
@@ -149,3 +286,147 @@ class TestVCSMiddleware(object):
             assert isinstance(application, SimpleSvn)
             assert isinstance(application._create_wsgi_app(
                 Mock(), Mock(), Mock()), DisabledSimpleSvnApp)
+
+
+    def test_vcs_request_is_recorded_in_shared_stats(self, tmpdir):
+        stats = SharedStats(str(tmpdir.join('stats.mmap')))
+        stats.open()
+        middleware = vcs.VCSMiddleware(
+            Mock(), Mock(), {'appenlight': False, 'vcs.backends': ['git']},
+            appenlight_client=None)
+        middleware.use_gzip = False
+
+        vcs_handler = Mock(SCM='git', acl_repo_name='repo')
+        vcs_handler._get_by_id.side_effect = lambda path: path
+        vcs_handler.is_valid_and_existing_repo.return_value = True
+
+        def handle(environ, start_response):
+            start_response('200 OK', [])
+            return ['data']
+        vcs_handler.side_effect = handle
+
+        environ = {'PATH_INFO': '/repo/info/refs'}
+        with patch.object(middleware, '_get_handler_app',
+                          return_value=vcs_handler), \
+                patch.object(middleware, 'vcs_config', return_value=None), \
+                patch('rhodecode.lib.shared_stats.get_shared_stats',
+                      return_value=stats):
+            response = middleware(environ, Mock())
+            assert list(response) == ['data']
+            response.close()
+
+        data = stats.read()
+        assert data['totals']['requests'] == 1
+        assert data['totals']['in_flight'] == 0
+        assert data['endpoints']['vcs.git']['count'] == 1
+        stats.close()
+
+
+def _gzip(data):
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as f:
+        f.write(data)
+    return output.getvalue()
+
+
+class LazyGzipInput(object):
+    """
+    Non seekable input compressing `size` bytes of zeros on the fly.
+    """
+
+    def __init__(self, size, block_size=1024 * 1024):
+        self.left = size
+        self.block = b'\x00' * block_size
+        self.compressor = zlib.compressobj(
+            1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self.output = b''
+        self.finished = False
+
+    def read(self, size):
+        while len(self.output) < size and not self.finished:
+            if self.left > 0:
+                block = self.block[:min(self.left, len(self.block))]
+                self.left -= len(block)
+                self.output += self.compressor.compress(block)
+            else:
+                self.output += self.compressor.flush()
+                self.finished = True
+        data, self.output = self.output[:size], self.output[size:]
+        return data
+
+
+class TestGunzipStream(object):
+    data = b''.join(b'line %d of the pack\n' % i for i in range(20000))
+
+    @pytest.mark.parametrize('read_size', [1, 7, 1024, 64 * 1024, -1])
+    def test_read_in_chunks(self, read_size):
+        stream = vcs.GunzipStream(io.BytesIO(_gzip(self.data)), chunk_size=512)
+        chunks = []
+        while True:
+            chunk = stream.read(read_size)
+            if not chunk:
+                break
+            assert read_size < 0 or len(chunk) <= read_size
+            chunks.append(chunk)
+        assert b''.join(chunks) == self.data
+
+    def test_readline_and_iteration(self):
+        stream = vcs.GunzipStream(io.BytesIO(_gzip(self.data)), chunk_size=100)
+        assert stream.readline() == b'line 0 of the pack\n'
+        assert stream.readline(4) == b'line'
+        assert stream.readline() == b' 1 of the pack\n'
+        assert b''.join(stream) == self.data.split(b'\n', 2)[2]
+        assert stream.readline() == b''
+
+    def test_multiple_members_and_padding(self):
+        compressed = _gzip(b'first\n') + _gzip(b'second\n') + b'\x00' * 10
+        for chunk_size in [1, 3, 1024]:
+            stream = vcs.GunzipStream(
+                io.BytesIO(compressed), chunk_size=chunk_size)
+            assert stream.read() == b'first\nsecond\n'
+
+    def test_truncated_stream(self):
+        stream = vcs.GunzipStream(io.BytesIO(_gzip(self.data)[:-100]))
+        with pytest.raises(EOFError):
+            stream.read()
+
+    def test_large_stream_is_not_buffered(self):
+        size = 2 * 1024 * 1024 * 1024
+        read_size = 256 * 1024
+        stream = vcs.GunzipStream(LazyGzipInput(size))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        total = 0
+        while True:
+            chunk = stream.read(read_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            # only the requested data and a single input chunk are held
+            assert len(stream._buffer) <= read_size
+            assert len(stream._pending) <= stream.chunk_size
+
+        assert total == size
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in kilobytes
+        assert rss_after - rss_before < 64 * 1024
+
+
+def test_gunzip_middleware_wraps_input_without_reading_it():
+    wsgi_input = Mock(spec=['read'])
+    wsgi_input.read.return_value = b''
+    application = Mock()
+    environ = {
+        'HTTP_CONTENT_ENCODING': 'gzip',
+        'CONTENT_LENGTH': '100',
+        'wsgi.input': wsgi_input,
+    }
+
+    vcs.GunzipMiddleware(application)(environ, Mock())
+
+    assert isinstance(environ['wsgi.input'], vcs.GunzipStream)
+    assert environ['wsgi.input'].fileobj is wsgi_input
+    assert not wsgi_input.read.called
+    assert 'HTTP_CONTENT_ENCODING' not in environ
+    assert 'CONTENT_LENGTH' not in environ
+    assert application.called
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import os
+import time
+import shutil
+import threading
+
+import pytest
+
+from rhodecode.lib import archive_cache
+from rhodecode.lib.archive_cache import (
+    ArchiveCache, ArchiveCacheError, ArchiveLock, StreamingArchive)
+
+
+class ArchiveWriter(object):
+    """
+    Writes `chunks` into the archive, waiting for `proceed` after the first
+    one, and fails at the end if `error` is set.
+    """
+
+    def __init__(self, chunks, error=None):
+        self.chunks = chunks
+        self.error = error
+        self.proceed = threading.Event()
+
+    def __call__(self, path):
+        with open(path, 'wb') as f:
+            for idx, chunk in enumerate(self.chunks):
+                f.write(chunk)
+                f.flush()
+                if idx == 0:
+                    self.proceed.wait(5)
+        if self.error:
+            raise self.error
+
+
+@pytest.fixture()
+def cache_dir(tmpdir):
+    return str(tmpdir)
+
+
+def make_archive(writer, cache_path=None, tmp_dir=None):
+    return StreamingArchive(
+        writer, cache_path=cache_path, tmp_dir=tmp_dir, chunk_size=4,
+        poll_interval=0.001)
+
+
+def test_archive_is_streamed_while_generated(cache_dir):
+    writer = ArchiveWriter(['abcd', 'efgh', 'ij'])
+    cache_path = os.path.join(cache_dir, 'repo-abcdef.zip')
+    archive = make_archive(writer, cache_path=cache_path)
+    archive.start()
+
+    chunks = iter(archive)
+    # the first chunk arrives before the archive is complete
+    assert next(chunks) == 'abcd'
+    assert not os.path.exists(cache_path)
+
+    writer.proceed.set()
+    assert ''.join(chunks) == 'efghij'
+    with open(cache_path, 'rb') as f:
+        assert f.read() == 'abcdefghij'
+    assert os.listdir(cache_dir) == ['repo-abcdef.zip']
+
+
+def test_archive_without_cache_is_removed(cache_dir):
+    writer = ArchiveWriter(['abcd', 'ef'])
+    writer.proceed.set()
+    archive = make_archive(writer, tmp_dir=cache_dir)
+    archive.start()
+
+    assert ''.join(archive) == 'abcdef'
+    assert os.listdir(cache_dir) == []
+
+
+def test_error_before_first_chunk_is_raised(cache_dir):
+    writer = ArchiveWriter([], error=ValueError('bad archive kind'))
+    archive = make_archive(
+        writer, cache_path=os.path.join(cache_dir, 'repo-abcdef.zip'))
+
+    with pytest.raises(ValueError):
+        archive.start()
+    assert os.listdir(cache_dir) == []
+
+
+def test_failed_archive_is_not_cached(cache_dir):
+    writer = ArchiveWriter(['abcd', 'ef'], error=IOError('vcsserver down'))
+    writer.proceed.set()
+    archive = make_archive(
+        writer, cache_path=os.path.join(cache_dir, 'repo-abcdef.zip'))
+    archive.start()
+
+    chunks = []
+    with pytest.raises(IOError):
+        for chunk in archive:
+            chunks.append(chunk)
+    assert ''.join(chunks) == 'abcdef'
+    assert os.listdir(cache_dir) == []
+
+
+def test_archive_is_cached_when_client_goes_away(cache_dir):
+    writer = ArchiveWriter(['abcd', 'ef'])
+    cache_path = os.path.join(cache_dir, 'repo-abcdef.zip')
+    archive = make_archive(writer, cache_path=cache_path)
+    archive.start()
+
+    chunks = iter(archive)
+    assert next(chunks) == 'abcd'
+    chunks.close()
+    archive.close()
+
+    writer.proceed.set()
+    archive._finished.wait(5)
+    with open(cache_path, 'rb') as f:
+        assert f.read() == 'abcdef'
+
+
+def test_archive_settings():
+    assert archive_cache.get_archive_settings({}) == {
+        'cache_dir': None, 'streaming': True,
+        'max_size': 10240 * 1024 * 1024, 'max_age': 0,
+        'eviction_interval': 300}
+    assert archive_cache.get_archive_settings({
+        'archive_cache_dir': '/tmp/archives',
+        'archive_streaming': 'false',
+        'archive_cache_max_size': '100',
+        'archive_cache_max_age': '7',
+        'archive_cache_eviction_interval': '60',
+    }) == {
+        'cache_dir': '/tmp/archives', 'streaming': False,
+        'max_size': 100 * 1024 * 1024, 'max_age': 7 * 24 * 60 * 60,
+        'eviction_interval': 60}
+
+
+def test_lock_is_exclusive(cache_dir):
+    path = os.path.join(cache_dir, 'test.lock')
+    lock = ArchiveLock(path)
+    other = ArchiveLock(path)
+
+    assert lock.acquire(blocking=False)
+    assert other.is_locked()
+    assert not other.acquire(timeout=0.01)
+
+    lock.release()
+    assert not other.is_locked()
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def test_lock_recreates_removed_cache_dir(cache_dir):
+    cache = ArchiveCache(os.path.join(cache_dir, 'archives'))
+    lock = cache.get_lock('repo-abc.zip')
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+    shutil.rmtree(cache.cache_dir)
+    lock = cache.get_lock('repo-abc.zip')
+    assert lock.acquire(blocking=False)
+    lock.release()
+    assert os.path.isdir(cache.lock_dir)
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_archive_is_stored_after_cache_dir_removal(cache_dir, streaming):
+    cache = ArchiveCache(os.path.join(cache_dir, 'archives'))
+    shutil.rmtree(cache.cache_dir)
+
+    archive, cached = cache.get_archive(
+        'repo-abc.zip', write_archive('abcdef'), streaming)
+    assert not cached
+    assert ''.join(archive) == 'abcdef'
+    assert cache.lookup('repo-abc.zip')
+    assert cache.get_stats()['misses'] == 1
+
+
+def write_archive(content):
+    def archive_func(path):
+        with open(path, 'wb') as f:
+            f.write(content)
+    return archive_func
+
+
+def put_archive(cache, name, size, last_access):
+    path = cache.get_path(name)
+    with open(path, 'wb') as f:
+        f.write('x' * size)
+    os.utime(path, (last_access, last_access))
+    return path
+
+
+@pytest.mark.parametrize('streaming', [True, False])
+def test_archive_is_generated_once(cache_dir, streaming):
+    cache = ArchiveCache(cache_dir)
+    calls = []
+
+    def archive_func(path):
+        calls.append(path)
+        write_archive('abcdef')(path)
+
+    archive, cached = cache.get_archive('repo-abc.zip', archive_func, streaming)
+    assert not cached
+    assert ''.join(archive) == 'abcdef'
+
+    archive, cached = cache.get_archive('repo-abc.zip', archive_func, streaming)
+    assert cached
+    assert ''.join(archive) == 'abcdef'
+
+    assert len(calls) == 1
+    assert [a[0] for a in cache.get_archives()] == [
+        cache.get_path('repo-abc.zip')]
+    stats = cache.get_stats()
+    assert (stats['hits'], stats['misses'], stats['waits']) == (1, 1, 0)
+
+
+def test_cached_archive_range(cache_dir):
+    cache = ArchiveCache(cache_dir)
+    cache.get_archive('repo-abc.zip', write_archive('abcdef'), streaming=False)
+
+    archive, cached = cache.get_archive('repo-abc.zip', write_archive('other'))
+    assert cached
+    assert archive.size == 6
+    assert ''.join(archive.app_iter_range(2, 4)) == 'cd'
+
+
+def test_cached_archive_is_readable_after_eviction(cache_dir):
+    cache = ArchiveCache(cache_dir)
+    cache.get_archive('repo-abc.zip', write_archive('abcdef'), streaming=False)
+
+    archive, _cached = cache.get_archive('repo-abc.zip', write_archive('other'))
+    os.remove(cache.get_path('repo-abc.zip'))
+    assert ''.join(archive) == 'abcdef'
+
+
+def test_failed_archive_releases_lock(cache_dir):
+    cache = ArchiveCache(cache_dir)
+
+    def archive_func(path):
+        raise IOError('vcsserver down')
+
+    with pytest.raises(IOError):
+        cache.get_archive('repo-abc.zip', archive_func, streaming=False)
+    assert not cache.get_lock('repo-abc.zip').is_locked()
+    assert cache.get_archives() == []
+
+
+def test_lookup_marks_archive_as_used(cache_dir):
+    cache = ArchiveCache(cache_dir)
+    path = put_archive(cache, 'repo-abc.zip', 10, last_access=1000)
+
+    assert cache.lookup('repo-abc.zip') == path
+    assert os.stat(path).st_mtime > 1000
+    assert cache.lookup('repo-missing.zip') is None
+
+
+def test_concurrent_request_reads_archive_being_generated(cache_dir):
+    cache = ArchiveCache(cache_dir)
+    writer = ArchiveWriter(['abcd', 'efgh', 'ij'])
+
+    producer, cached = cache.get_archive('repo-abc.zip', writer)
+    assert not cached
+    follower, cached = cache.get_archive('repo-abc.zip', writer)
+    assert cached
+    assert isinstance(follower, archive_cache.FollowingArchive)
+    follower.poll_interval = 0.001
+
+    chunks = iter(follower)
+    assert next(chunks) == 'abcd'
+    writer.proceed.set()
+    assert ''.join(producer) == 'abcdefghij'
+    assert 'abcd' + ''.join(chunks) == 'abcdefghij'
+    assert cache.get_stats()['waits'] == 1
+
+
+def test_follower_of_failed_archive_raises(cache_dir):
+    cache = ArchiveCache(cache_dir)
+    writer = ArchiveWriter(['abcd', 'ef'], error=IOError('vcsserver down'))
+
+    producer, _cached = cache.get_archive('repo-abc.zip', writer)
+    follower, _cached = cache.get_archive('repo-abc.zip', writer)
+    follower.poll_interval = 0.001
+    writer.proceed.set()
+
+    with pytest.raises(IOError):
+        ''.join(producer)
+    with pytest.raises(ArchiveCacheError):
+        ''.join(follower)
+
+
+def test_waiting_request_gets_cached_archive(cache_dir):
+    cache = ArchiveCache(cache_dir)
+    lock = cache.get_lock('repo-abc.zip')
+    assert lock.acquire(blocking=False)
+
+    def store():
+        time.sleep(0.05)
+        write_archive('abcdef')(cache.get_path('repo-abc.zip'))
+        lock.release()
+
+    thread = threading.Thread(target=store)
+    thread.start()
+    # nothing to follow, so the request waits for the lock
+    archive, cached = cache.get_archive(
+        'repo-abc.zip', write_archive('other'), streaming=False)
+    thread.join()
+
+    assert cached
+    assert ''.join(archive) == 'abcdef'
+
+
+def test_eviction_removes_least_recently_used(cache_dir):
+    now = time.time()
+    cache = ArchiveCache(cache_dir, max_size=25, clock=lambda: now)
+    put_archive(cache, 'repo-old.zip', 10, last_access=now - 300)
+    put_archive(cache, 'repo-mid.zip', 10, last_access=now - 200)
+    put_archive(cache, 'repo-new.zip', 10, last_access=now - 100)
+
+    assert cache.evict() == [cache.get_path('repo-old.zip')]
+    assert sorted(os.path.basename(a[0]) for a in cache.get_archives()) == [
+        'repo-mid.zip', 'repo-new.zip']
+    stats = cache.get_stats()
+    assert (stats['evictions'], stats['evicted_size']) == (1, 10)
+    assert stats['last_eviction'] == now
+
+
+def test_eviction_removes_old_archives(cache_dir):
+    now = time.time()
+    cache = ArchiveCache(cache_dir, max_age=150, clock=lambda: now)
+    put_archive(cache, 'repo-old.zip', 10, last_access=now - 300)
+    put_archive(cache, 'repo-new.zip', 10, last_access=now - 100)
+
+    assert cache.evict() == [cache.get_path('repo-old.zip')]
+
+
+def test_eviction_is_throttled(cache_dir):
+    cache = ArchiveCache(cache_dir, eviction_interval=300)
+    assert cache.schedule_eviction()
+    assert not cache.schedule_eviction()
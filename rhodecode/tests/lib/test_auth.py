@@ -19,6 +19,8 @@
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
 import os
+import fnmatch
+import collections
 from hashlib import sha1
 
 import pytest
@@ -63,6 +65,60 @@ def test_perm_origin_dict():
         pod['thing'] = 'read'
 
 
+@pytest.mark.parametrize('branch_name, expected', [
+    ('master', ('`master`=>branch.push_force', 'branch.push_force')),
+    ('stable-1.0', ('`stable*`=>branch.push', 'branch.push')),
+    ('stable', ('`stable*`=>branch.push', 'branch.push')),
+    ('feature/b', ('`feature/[a-m]*`=>branch.none', 'branch.none')),
+    ('feature/z', ('`*`=>branch.merge', 'branch.merge')),
+    ('release.1', ('`release.?`=>branch.push', 'branch.push')),
+    ('release11', ('`*`=>branch.merge', 'branch.merge')),
+    ('line\nbreak', ('`*`=>branch.merge', 'branch.merge')),
+])
+def test_branch_perm_matcher_first_rule_wins(branch_name, expected):
+    rules = collections.OrderedDict()
+    rules['master'] = 'branch.push_force'
+    rules['stable*'] = 'branch.push'
+    rules['feature/[a-m]*'] = 'branch.none'
+    rules['release.?'] = 'branch.push'
+    rules['*'] = 'branch.merge'
+    assert auth.BranchPermMatcher(rules).match(branch_name) == expected
+
+
+def test_branch_perm_matcher_no_match():
+    rules = collections.OrderedDict()
+    rules['stable*'] = 'branch.push'
+    assert auth.BranchPermMatcher(rules).match('master') == ('', '')
+    assert auth.BranchPermMatcher({}).match('master') == ('', '')
+
+
+def test_branch_perm_matcher_many_rules_same_as_fnmatch():
+    rules = collections.OrderedDict()
+    for idx in range(250):
+        rules['team-{}/*'.format(idx)] = 'branch.push'
+    rules['team-*'] = 'branch.none'
+    matcher = auth.BranchPermMatcher(rules)
+
+    for branch_name in ['team-0/a', 'team-120/a', 'team-249/b', 'team-250/b']:
+        expected = next(
+            ('`{}`=>{}'.format(pattern, perm), perm)
+            for pattern, perm in rules.items()
+            if fnmatch.fnmatch(branch_name, pattern))
+        assert matcher.match(branch_name) == expected
+
+
+def test_get_branch_perm_matcher_is_cached_by_rules():
+    rules = collections.OrderedDict()
+    rules['stable*'] = 'branch.push'
+    matcher = auth.get_branch_perm_matcher(rules)
+    assert auth.get_branch_perm_matcher(rules.copy()) is matcher
+
+    rules['*'] = 'branch.none'
+    changed_matcher = auth.get_branch_perm_matcher(rules)
+    assert changed_matcher is not matcher
+    assert changed_matcher.match('master') == ('`*`=>branch.none', 'branch.none')
+
+
 def test_cached_perms_data(user_regular, backend_random):
     permissions = get_permissions(user_regular)
     repo_name = backend_random.repo.repo_name
@@ -106,3 +106,14 @@ class TestCaches(object):
         # once computed we have only one value (the same from cache)
         # after executing it 10x
         assert len(result) == 1
+
+    def test_made_keys_are_cleared_with_their_namespace(self):
+        namespace = 'cache_repo.test_make_key'
+        cache_region = rc_cache.get_or_create_region('cache_repo', namespace)
+        key = rc_cache.make_key(
+            cache_region.actual_backend, namespace, 'file_tree_entries:x')
+        cache_region.set(key, 'value')
+
+        assert cache_region.backend.list_keys(prefix=namespace) == [key]
+        assert rc_cache.clear_cache_namespace('cache_repo', namespace) == 1
+        assert cache_region.backend.list_keys(prefix=namespace) == []
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import datetime
+
+import mock
+import pytest
+
+from rhodecode.lib import file_tree
+from rhodecode.lib.file_tree import FileTreeEntry, get_dir_entries
+from rhodecode.lib.vcs.nodes import NodeKind
+
+
+class DictCache(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, commit_id, path):
+        return self.data.get((commit_id, path))
+
+    def set(self, commit_id, path, entries):
+        self.data[(commit_id, path)] = entries
+
+
+def make_node(commit, path, kind=NodeKind.FILE, size=10, url=None):
+    node = mock.Mock(path=path, size=size, url=url, commit=commit)
+    node.is_file.return_value = kind == NodeKind.FILE
+    node.is_submodule.return_value = kind == NodeKind.SUBMODULE
+    return node
+
+
+def make_commit(raw_id, parent=None, affected=(), alias='git',
+                files=('docs/index.rst', 'docs/api.rst'), parents=None):
+    commit = mock.Mock(
+        raw_id=raw_id, short_id=raw_id[:4], idx=0, author=u'joe',
+        message=u'commit {}'.format(raw_id), affected_files=list(affected),
+        date=datetime.datetime(2020, 1, 1))
+    commit.repository.alias = alias
+    commit.parents = parents if parents is not None else (
+        [parent] if parent else [])
+    commit.get_node.return_value = [
+        make_node(commit, 'docs/api', kind=NodeKind.DIR),
+        make_node(commit, 'docs/lib', kind=NodeKind.SUBMODULE,
+                  url='https://example.com/lib')] + [
+        make_node(commit, path, size=len(path)) for path in files]
+    commit.get_path_commits.side_effect = lambda paths, pre_load: dict(
+        (path, commit) for path in paths)
+    return commit
+
+
+def last_commits(entries):
+    return dict(
+        (e.path, e.last_commit.raw_id) for e in entries if e.is_file())
+
+
+def test_compute_entries():
+    commit = make_commit('c1')
+    entries = get_dir_entries(commit, '/docs/')
+
+    commit.get_node.assert_called_once_with('docs')
+    assert [(e.kind, e.path, e.name) for e in entries] == [
+        (NodeKind.DIR, 'docs/api', u'api'),
+        (NodeKind.SUBMODULE, 'docs/lib', u'lib'),
+        (NodeKind.FILE, 'docs/index.rst', u'index.rst'),
+        (NodeKind.FILE, 'docs/api.rst', u'api.rst'),
+    ]
+    assert entries[1].url == 'https://example.com/lib'
+    assert entries[2].size == len('docs/index.rst')
+    assert entries[2].last_commit.message == u'commit c1'
+    commit.get_path_commits.assert_called_once_with(
+        ['docs/index.rst', 'docs/api.rst'], pre_load=mock.ANY)
+    assert not commit.get_path_commit.called
+
+
+def test_cached_entries_need_no_vcs_calls():
+    cache = DictCache()
+    get_dir_entries(make_commit('c1'), 'docs', cache=cache)
+
+    commit = make_commit('c1')
+    entries = get_dir_entries(commit, 'docs', cache=cache)
+    assert not commit.get_node.called
+    assert last_commits(entries) == {
+        'docs/index.rst': 'c1', 'docs/api.rst': 'c1'}
+
+
+def test_unchanged_directory_is_taken_from_parent():
+    cache = DictCache()
+    parent = make_commit('c1')
+    get_dir_entries(parent, 'docs', cache=cache)
+
+    commit = make_commit('c2', parent=parent, affected=['setup.py'])
+    entries = get_dir_entries(commit, 'docs', cache=cache)
+
+    assert not commit.get_node.called
+    assert not commit.get_path_commits.called
+    assert last_commits(entries) == {
+        'docs/index.rst': 'c1', 'docs/api.rst': 'c1'}
+    assert cache.get('c2', 'docs') == cache.get('c1', 'docs')
+
+
+def test_changed_files_get_new_metadata():
+    cache = DictCache()
+    root = make_commit('c1')
+    get_dir_entries(root, 'docs', cache=cache)
+
+    middle = make_commit('c2', parent=root, affected=['docs/api.rst'])
+    commit = make_commit(
+        'c3', parent=middle, affected=['docs/index.rst', 'docs/new.rst'],
+        files=('docs/index.rst', 'docs/api.rst', 'docs/new.rst'))
+    entries = get_dir_entries(commit, 'docs', cache=cache)
+
+    assert not commit.get_path_commits.called
+    assert last_commits(entries) == {
+        'docs/index.rst': 'c3', 'docs/api.rst': 'c2', 'docs/new.rst': 'c3'}
+    assert [e.path for e in entries][:2] == ['docs/api', 'docs/lib']
+
+
+def test_files_missing_in_ancestor_entries_are_looked_up_together():
+    cache = DictCache()
+    parent = make_commit('c1')
+    cache.set('c1', 'docs', [])
+
+    commit = make_commit('c2', parent=parent, affected=['docs/index.rst'])
+    entries = get_dir_entries(commit, 'docs', cache=cache)
+
+    commit.get_path_commits.assert_called_once_with(
+        ['docs/api.rst'], pre_load=mock.ANY)
+    assert last_commits(entries) == {
+        'docs/index.rst': 'c2', 'docs/api.rst': 'c2'}
+
+
+def test_removed_files_are_dropped():
+    cache = DictCache()
+    parent = make_commit('c1')
+    get_dir_entries(parent, 'docs', cache=cache)
+
+    commit = make_commit(
+        'c2', parent=parent, affected=['docs/api.rst'],
+        files=('docs/index.rst',))
+    entries = get_dir_entries(commit, 'docs', cache=cache)
+    assert last_commits(entries) == {'docs/index.rst': 'c1'}
+
+
+@pytest.mark.parametrize('alias, parents_count', [
+    ('svn', 1),
+    ('git', 2),
+])
+def test_entries_are_computed_without_incremental_support(
+        alias, parents_count):
+    cache = DictCache()
+    parent = make_commit('c1')
+    get_dir_entries(parent, 'docs', cache=cache)
+
+    commit = make_commit(
+        'c2', alias=alias, parents=[parent] * parents_count,
+        affected=['setup.py'])
+    entries = get_dir_entries(commit, 'docs', cache=cache)
+
+    assert commit.get_path_commits.call_count == 1
+    assert last_commits(entries) == {
+        'docs/index.rst': 'c2', 'docs/api.rst': 'c2'}
+
+
+def test_ancestors_are_checked_up_to_the_limit():
+    cache = DictCache()
+    commit = make_commit('c0')
+    get_dir_entries(commit, 'docs', cache=cache)
+    for idx in range(1, 4):
+        commit = make_commit('c{}'.format(idx), parent=commit)
+
+    with mock.patch.object(file_tree, 'MAX_ANCESTORS', 2):
+        get_dir_entries(commit, 'docs', cache=cache)
+    assert commit.get_path_commits.called
+
+    commit = make_commit('c4', parent=commit)
+    with mock.patch.object(file_tree, 'MAX_ANCESTORS', 2):
+        get_dir_entries(commit, 'docs', cache=cache)
+    assert not commit.get_path_commits.called
+
+
+def test_entry_tuple_round_trip():
+    entry = FileTreeEntry(
+        NodeKind.FILE, 'docs/index.rst', size=10,
+        last_commit=file_tree.make_commit_info(make_commit('c1')))
+    restored = FileTreeEntry.from_tuple(entry.as_tuple())
+    assert restored.as_tuple() == entry.as_tuple()
+    assert restored.last_commit.short_id == 'c1'
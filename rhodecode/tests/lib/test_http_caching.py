@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import datetime
+
+import pytest
+from webob import Request, Response
+
+from rhodecode.lib import http_caching
+
+ETAG = http_caching.make_etag('abcdef', 'docs/index.rst')
+LAST_MODIFIED = datetime.datetime(2020, 5, 1, 12, 30, 15, 500)
+BODY = ''.join(chr(i % 256) for i in range(1000))
+
+
+def make_request(method='GET', **headers):
+    return Request.blank('/', method=method, headers=headers)
+
+
+def get_response(request, immutable=True, content_length=len(BODY)):
+    response = Response(app_iter=iter([BODY[:300], BODY[300:]]))
+    response.content_length = content_length
+    http_caching.set_caching_headers(
+        response, etag=ETAG, last_modified=LAST_MODIFIED, immutable=immutable)
+    return request.get_response(response)
+
+
+def test_etag_depends_on_all_parts():
+    assert http_caching.make_etag('abcdef', 'docs/index.rst') == ETAG
+    assert http_caching.make_etag('abcdef', 'docs/index.rst', True) != ETAG
+    assert http_caching.make_etag('abcdeg', 'docs/index.rst') != ETAG
+
+
+@pytest.mark.parametrize('method, headers, expected', [
+    ('GET', {}, False),
+    ('GET', {'If-None-Match': '"{}"'.format(ETAG)}, True),
+    ('HEAD', {'If-None-Match': '"{}"'.format(ETAG)}, True),
+    ('GET', {'If-None-Match': '"other", "{}"'.format(ETAG)}, True),
+    ('GET', {'If-None-Match': '"other"'}, False),
+    ('POST', {'If-None-Match': '"{}"'.format(ETAG)}, False),
+    ('GET', {'If-Modified-Since': 'Fri, 01 May 2020 12:30:15 GMT'}, True),
+    ('GET', {'If-Modified-Since': 'Fri, 01 May 2020 12:30:14 GMT'}, False),
+    # If-None-Match takes precedence
+    ('GET', {'If-None-Match': '"other"',
+             'If-Modified-Since': 'Fri, 01 May 2020 12:30:15 GMT'}, False),
+])
+def test_is_not_modified(method, headers, expected):
+    request = make_request(method=method, **headers)
+    assert http_caching.is_not_modified(
+        request, etag=ETAG, last_modified=LAST_MODIFIED,
+        immutable=True) == expected
+
+
+def test_mutable_content_ignores_if_modified_since():
+    # commit dates of a moved branch can go back in time
+    request = make_request(**{
+        'If-Modified-Since': 'Fri, 01 May 2020 12:30:15 GMT'})
+    assert not http_caching.is_not_modified(
+        request, etag=ETAG, last_modified=LAST_MODIFIED)
+    assert get_response(request, immutable=False).status_int == 200
+
+
+def test_immutable_response():
+    response = get_response(make_request())
+
+    assert response.status_int == 200
+    assert response.body == BODY
+    assert response.etag == ETAG
+    assert response.headers['Last-Modified'] == 'Fri, 01 May 2020 12:30:15 GMT'
+    assert response.headers['Cache-Control'] == \
+        'private, max-age=31536000, immutable'
+
+
+def test_mutable_response_is_revalidated():
+    response = get_response(make_request(), immutable=False)
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert response.etag == ETAG
+    assert 'Last-Modified' not in response.headers
+
+
+def test_ranges_are_advertised_only_with_content_length():
+    assert get_response(make_request()).accept_ranges == 'bytes'
+    response = get_response(make_request(), content_length=None)
+    assert response.accept_ranges is None
+
+
+def test_range_response():
+    response = get_response(make_request(Range='bytes=250-349'))
+
+    assert response.status_int == 206
+    assert response.headers['Content-Range'] == 'bytes 250-349/1000'
+    assert response.body == BODY[250:350]
+
+
+def test_range_with_outdated_if_range_gets_full_response():
+    response = get_response(
+        make_request(Range='bytes=250-349', **{'If-Range': '"other"'}))
+
+    assert response.status_int == 200
+    assert response.body == BODY
+
+
+def test_not_modified_response():
+    response = http_caching.not_modified_response(
+        etag=ETAG, last_modified=LAST_MODIFIED, immutable=True)
+
+    assert response.status_int == 304
+    assert response.etag == ETAG
+    assert 'immutable' in response.headers['Cache-Control']
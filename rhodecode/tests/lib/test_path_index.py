@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import os
+
+import mock
+import pytest
+
+from rhodecode.lib import path_index
+from rhodecode.lib.path_index import (
+    KIND_DIR, KIND_FILE, PathIndex, PathIndexStore, build_index,
+    get_commit_path_index)
+
+FILES = [
+    'README.rst',
+    'docs/index.rst',
+    'docs/api/models.rst',
+    'docs/api/views.rst',
+    'docs-old/index.rst',
+    'setup.py',
+    u'src/ł\xf3dź.py',
+    'src/app/__init__.py',
+    'src/app/models.py',
+]
+DIRS = ['docs', 'docs/api', 'docs-old', 'src', 'src/app']
+
+
+def make_index(restart_interval=2):
+    return PathIndex(build_index(DIRS, FILES, restart_interval=restart_interval))
+
+
+@pytest.mark.parametrize('restart_interval', [1, 2, 3, 16])
+def test_index_contains_sorted_paths(restart_interval):
+    index = make_index(restart_interval)
+
+    expected = sorted(
+        [(p, KIND_DIR) for p in DIRS] +
+        [(p.encode('utf8'), KIND_FILE) for p in FILES])
+    assert list(index) == expected
+    assert len(index) == len(expected)
+
+
+@pytest.mark.parametrize('restart_interval', [1, 2, 3, 16])
+@pytest.mark.parametrize('root_path, expected_dirs, expected_files', [
+    ('', DIRS, FILES),
+    ('/', DIRS, FILES),
+    ('docs', ['docs/api'], [
+        'docs/index.rst', 'docs/api/models.rst', 'docs/api/views.rst']),
+    ('/docs/api/', [], ['docs/api/models.rst', 'docs/api/views.rst']),
+    ('src', ['src/app'], [
+        u'src/ł\xf3dź.py', 'src/app/__init__.py',
+        'src/app/models.py']),
+    ('setup.py', [], []),
+    ('missing', [], []),
+])
+def test_list_paths(restart_interval, root_path, expected_dirs, expected_files):
+    dirs, files = make_index(restart_interval).list_paths(root_path)
+
+    assert sorted(dirs) == sorted(expected_dirs)
+    assert sorted(files) == sorted(p.encode('utf8') for p in expected_files)
+
+
+def test_list_dir():
+    index = make_index()
+    assert index.list_dir('') == (
+        ['docs', 'docs-old', 'src'], ['README.rst', 'setup.py'])
+    assert index.list_dir('docs') == (['docs/api'], ['docs/index.rst'])
+
+
+def test_empty_index():
+    index = PathIndex(build_index([], []))
+    assert list(index) == []
+    assert index.list_paths('docs') == ([], [])
+
+
+def test_derive_from_parent_index():
+    dirs, files = make_index().derive(
+        added_paths=['docs/api/forms.rst', 'lib/utils.py'],
+        removed_paths=['docs-old/index.rst', 'src/app/__init__.py',
+                       'src/app/models.py'])
+
+    assert sorted(files) == sorted(
+        [p.encode('utf8') for p in FILES
+         if not p.startswith(('docs-old', 'src/app'))] +
+        ['docs/api/forms.rst', 'lib/utils.py'])
+    assert sorted(dirs) == ['docs', 'docs/api', 'lib', 'src']
+
+
+def test_invalid_data_is_rejected():
+    with pytest.raises(ValueError):
+        PathIndex('x' * 64)
+
+
+@pytest.fixture()
+def store(tmpdir):
+    return PathIndexStore(str(tmpdir), max_per_repo=2)
+
+
+def test_store_round_trip(store):
+    assert store.get(1, 'abc') is None
+    store.put(1, 'abc', build_index(DIRS, FILES))
+
+    index = store.get(1, 'abc')
+    assert len(index) == len(DIRS) + len(FILES)
+    assert store.get(2, 'abc') is None
+
+
+def test_store_keeps_recently_used_indexes(store):
+    for key in ['a', 'b']:
+        store.put(1, key, build_index([], [key]))
+    repo_dir = os.path.join(store.index_dir, '1')
+    os.utime(os.path.join(repo_dir, 'a.idx'), (1000, 1000))
+    os.utime(os.path.join(repo_dir, 'b.idx'), (2000, 2000))
+
+    store.put(1, 'c', build_index([], ['c']))
+    assert sorted(os.listdir(repo_dir)) == ['b.idx', 'c.idx']
+
+
+def test_store_removes_broken_index(store):
+    store.put(1, 'abc', build_index(DIRS, FILES))
+    path = os.path.join(store.index_dir, '1', 'abc.idx')
+    with open(path, 'wb') as f:
+        f.write('x' * 64)
+
+    assert store.get(1, 'abc') is None
+    assert not os.path.exists(path)
+
+
+def make_commit(tree_id, alias='git', parents=(), paths=None,
+                added=(), removed=(), submodules=()):
+    commit = mock.Mock(
+        tree_id=tree_id, parents=list(parents), added_paths=list(added),
+        removed_paths=list(removed), changed_submodule_paths=list(submodules))
+    commit.repository.alias = alias
+    commit.get_paths.return_value = paths
+    return commit
+
+
+def test_commit_index_is_built_once(store):
+    commit = make_commit('tree1', paths=(DIRS, FILES))
+
+    index = get_commit_path_index(1, commit, store)
+    assert len(index) == len(DIRS) + len(FILES)
+    assert len(get_commit_path_index(1, commit, store)) == len(index)
+    assert commit.get_paths.call_count == 1
+
+
+def test_commit_index_is_derived_from_parent(store):
+    parent = make_commit('tree1', paths=(DIRS, FILES))
+    get_commit_path_index(1, parent, store)
+
+    commit = make_commit(
+        'tree2', parents=[parent], added=['lib/utils.py'],
+        removed=['setup.py'])
+    dirs, files = get_commit_path_index(1, commit, store).list_paths('')
+
+    assert not commit.get_paths.called
+    assert 'lib/utils.py' in files
+    assert 'setup.py' not in files
+    assert 'lib' in dirs
+
+
+def test_commit_index_is_listed_when_submodules_change(store):
+    parent = make_commit('tree1', paths=(DIRS, FILES))
+    get_commit_path_index(1, parent, store)
+
+    # a submodule is an added path, but not a file of the listing
+    commit = make_commit(
+        'tree2', parents=[parent], added=['.gitmodules', 'vendor/lib'],
+        submodules=['vendor/lib'], paths=(DIRS, FILES + ['.gitmodules']))
+    dirs, files = get_commit_path_index(1, commit, store).list_paths('')
+
+    assert commit.get_paths.call_count == 1
+    assert '.gitmodules' in files
+    assert 'vendor/lib' not in files
+    assert 'vendor' not in dirs
+
+
+@pytest.mark.parametrize('alias, parents_count', [
+    ('svn', 1),
+    ('git', 2),
+])
+def test_commit_index_is_listed_without_incremental_support(
+        store, alias, parents_count):
+    parent = make_commit('tree1', paths=(DIRS, FILES))
+    get_commit_path_index(1, parent, store)
+
+    commit = make_commit(
+        'tree2', alias=alias, parents=[parent] * parents_count,
+        paths=(['lib'], ['lib/utils.py']))
+    assert list(get_commit_path_index(1, commit, store)) == [
+        ('lib', KIND_DIR), ('lib/utils.py', KIND_FILE)]
+
+
+def test_path_index_settings():
+    settings = path_index.get_path_index_settings({'cache_dir': '/data'})
+    assert settings == {
+        'enabled': True, 'dir': '/data/path_index', 'max_per_repo': 100}
+
+    settings = path_index.get_path_index_settings({
+        'path_index.enabled': 'false', 'path_index.dir': '/index',
+        'path_index.max_per_repo': '10'})
+    assert settings == {
+        'enabled': False, 'dir': '/index', 'max_per_repo': 10}
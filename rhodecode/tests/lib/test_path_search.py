@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import time
+
+import mock
+import pytest
+
+from rhodecode.lib import path_search
+from rhodecode.lib.path_search import PathSearch, fuzzy_match, get_path_search
+
+FILES = [
+    'README.rst',
+    'docs/index.rst',
+    'docs/api/index.rst',
+    'docs/api/models.rst',
+    'setup.py',
+    'setup.cfg',
+    u'src/ł\xf3dź.py',
+    'src/app/__init__.py',
+    'src/app/models.py',
+    'src/[tmp]-1.txt',
+]
+DIRS = ['docs', 'docs/api', 'src', 'src/app']
+
+
+@pytest.fixture()
+def search():
+    return PathSearch(DIRS, FILES)
+
+
+@pytest.mark.parametrize('path, query, expected', [
+    ('docs/index.rst', 'dix', [0, 5, 9]),
+    ('docs/index.rst', 'docs', [0, 1, 2, 3]),
+    ('docs/index.rst', 'xd', None),
+    ('docs/index.rst', '', []),
+])
+def test_fuzzy_match(path, query, expected):
+    assert fuzzy_match(path, query) == expected
+
+
+def test_search_ranks_closest_matches_first(search):
+    results, total = search.search('models')
+    assert [r['name'] for r in results] == [
+        'src/app/models.py', 'docs/api/models.rst']
+    assert total == 2
+
+
+def test_search_prefers_matches_in_file_name(search):
+    results, _total = search.search('index')
+    assert [r['name'] for r in results][:2] == [
+        'docs/index.rst', 'docs/api/index.rst']
+
+
+def test_search_is_case_insensitive(search):
+    results, _total = search.search('ReadMe')
+    assert results == [
+        {'name': u'README.rst', 'type': 'file', 'highlight': [0, 1, 2, 3, 4, 5]}]
+
+
+def test_search_returns_dirs(search):
+    results, _total = search.search('docsapi')
+    assert results[0] == {
+        'name': u'docs/api', 'type': 'dir',
+        'highlight': [0, 1, 2, 3, 5, 6, 7]}
+
+
+def test_search_limit(search):
+    results, total = search.search('s', limit=3)
+    assert len(results) == 3
+    assert total == len(DIRS) + len(FILES)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('[tmp]', ['src/[tmp]-1.txt']),
+    ('p]-1', ['src/[tmp]-1.txt']),
+    ('set.', ['setup.py', 'setup.cfg']),
+    ('.*', []),
+    ('', []),
+])
+def test_search_special_characters(search, query, expected):
+    results, _total = search.search(query)
+    assert [r['name'] for r in results] == expected
+
+
+def test_search_unicode_highlight_is_in_characters(search):
+    results, _total = search.search(u'ł\xf3d')
+    assert results == [{
+        'name': u'src/ł\xf3dź.py', 'type': 'file', 'highlight': [4, 5, 6]}]
+
+
+def test_search_skips_paths_without_access(search):
+    path_filter = mock.Mock()
+    path_filter.path_access_allowed.side_effect = \
+        lambda path: not path.startswith('src/app')
+
+    results, total = search.search('models', path_filter=path_filter)
+    assert [r['name'] for r in results] == ['docs/api/models.rst']
+    assert total == 1
+
+
+def test_get_path_search_is_cached():
+    get_paths = mock.Mock(return_value=(DIRS, FILES))
+    with mock.patch.object(path_search, '_searches', path_search.LRUCache(2)):
+        first = get_path_search((1, 'abc', '/'), get_paths)
+        assert get_path_search((1, 'abc', '/'), get_paths) is first
+        assert get_paths.call_count == 1
+
+        assert get_path_search((1, 'abc', '/docs'), get_paths) is not first
+        assert get_paths.call_count == 2
+
+
+def test_search_of_non_matching_unicode_query_is_linear():
+    search = PathSearch([], [u'\xe9' * 26, u'a/' + u'\xe9' * 60])
+    start = time.time()
+    results, total = search.search(u'\xe9' * 100)
+    assert (results, total) == ([], 0)
+    assert time.time() - start < 1
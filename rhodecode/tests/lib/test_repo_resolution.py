@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import collections
+
+import mock
+import pytest
+
+from rhodecode.lib import repo_resolution
+from rhodecode.lib.repo_resolution import (
+    RepoResolution, RepoResolutionCache, DefaultUser)
+from rhodecode.model.db import Repository
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeLoaders(object):
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.repos = {}
+        self.invalid = False
+
+    def repo(self, repo_name, base_path):
+        self.calls['repo'] += 1
+        return self.repos.get(repo_name)
+
+    def repo_name_by_id(self, repo_id):
+        self.calls['repo_name_by_id'] += 1
+        for repo in self.repos.values():
+            if repo.repo_id == repo_id:
+                return repo.repo_name
+
+    def default_user(self):
+        self.calls['default_user'] += 1
+        return DefaultUser(1, 'default', True, True)
+
+    def check_invalidation(self):
+        self.calls['check_invalidation'] += 1
+        invalid, self.invalid = self.invalid, False
+        return invalid
+
+
+def make_repo(repo_name, repo_id=1, state=Repository.STATE_CREATED,
+              valid=True, base_path='/repos'):
+    return RepoResolution(
+        repo_id=repo_id, repo_name=repo_name, repo_type='git',
+        repo_path='{}/{}'.format(base_path, repo_name), repo_state=state,
+        archived=False, locked=(None, None, None), valid=valid)
+
+
+@pytest.fixture()
+def loaders():
+    return FakeLoaders()
+
+
+@pytest.fixture()
+def cache(loaders):
+    return RepoResolutionCache(
+        check_interval=5,
+        loaders={
+            'repo': loaders.repo,
+            'repo_name_by_id': loaders.repo_name_by_id,
+            'default_user': loaders.default_user,
+        },
+        check_invalidation=loaders.check_invalidation,
+        clock=FakeClock())
+
+
+def test_repo_is_loaded_once(cache, loaders):
+    loaders.repos['group/repo'] = make_repo('group/repo')
+
+    for _ in range(3):
+        resolved = cache.get_repo('group/repo', '/repos')
+        assert resolved.repo_id == 1
+        assert resolved.valid
+
+    assert loaders.calls['repo'] == 1
+    # first check registers the process, later ones are within the interval
+    assert loaders.calls['check_invalidation'] == 1
+
+
+@pytest.mark.parametrize('repo', [
+    None,
+    make_repo('repo', valid=False),
+    make_repo('repo', state=Repository.STATE_PENDING),
+])
+def test_missing_invalid_or_pending_repos_are_not_cached(cache, loaders, repo):
+    if repo:
+        loaders.repos['repo'] = repo
+
+    for _ in range(2):
+        assert cache.get_repo('repo', '/repos') == repo
+    assert loaders.calls['repo'] == 2
+
+
+def test_repo_is_reloaded_for_other_base_path(cache, loaders):
+    loaders.repos['repo'] = make_repo('repo')
+    cache.get_repo('repo', '/repos')
+    cache.get_repo('repo', '/other')
+
+    assert loaders.calls['repo'] == 2
+
+
+def test_invalidation_is_checked_after_interval(cache, loaders):
+    loaders.repos['repo'] = make_repo('repo')
+    cache.get_repo('repo', '/repos')
+
+    # renamed in another process
+    loaders.repos = {'renamed': make_repo('renamed')}
+    loaders.invalid = True
+
+    cache._clock.now += 4
+    assert cache.get_repo('repo', '/repos').repo_name == 'repo'
+
+    cache._clock.now += 1
+    assert cache.get_repo('repo', '/repos') is None
+    assert loaders.calls['check_invalidation'] == 2
+
+
+def test_failing_invalidation_check_clears_cache(cache, loaders):
+    loaders.repos['repo'] = make_repo('repo')
+    cache.get_repo('repo', '/repos')
+
+    cache._check_invalidation = mock.Mock(side_effect=Exception('db down'))
+    cache._clock.now += 5
+    cache.get_repo('repo', '/repos')
+
+    assert loaders.calls['repo'] == 2
+
+
+def test_repo_name_by_id(cache, loaders):
+    loaders.repos['repo'] = make_repo('repo', repo_id=11)
+
+    assert cache.get_repo_name_by_id(11) == 'repo'
+    assert cache.get_repo_name_by_id(11) == 'repo'
+    assert cache.get_repo_name_by_id(12) is None
+    assert cache.get_repo_name_by_id(12) is None
+    assert loaders.calls['repo_name_by_id'] == 3
+
+
+def test_default_user_is_refreshed_after_interval(cache, loaders):
+    user = cache.get_default_user()
+    assert cache.get_default_user() is user
+    assert loaders.calls['default_user'] == 1
+
+    cache._clock.now += 5
+    assert cache.get_default_user() is not user
+    assert loaders.calls['default_user'] == 2
+
+
+def test_default_user_is_cleared_on_invalidation(cache, loaders):
+    cache.get_default_user()
+    loaders.invalid = True
+    cache._clock.now += 5
+    cache.validate()
+
+    assert cache._default_user is None
+
+
+def test_default_user_auth_user():
+    user = DefaultUser(1, 'default', True, True)
+    with mock.patch('rhodecode.lib.auth.AuthUser') as auth_user:
+        user.AuthUser()
+    auth_user.assert_called_once_with(user_id=1, username='default')
+
+
+def test_invalidate_repo_resolution_clears_local_cache(cache, loaders):
+    loaders.repos['repo'] = make_repo('repo')
+    cache.get_repo('repo', '/repos')
+
+    with mock.patch.object(repo_resolution, '_cache', cache), \
+            mock.patch('rhodecode.model.db.Session'):
+        repo_resolution.invalidate_repo_resolution()
+
+    cache.get_repo('repo', '/repos')
+    assert loaders.calls['repo'] == 2
+
+
+def test_resolution_settings():
+    assert repo_resolution.get_resolution_settings({}) == {
+        'enabled': True, 'check_interval': 5}
+    assert repo_resolution.get_resolution_settings({
+        'vcs.repo_resolution_cache': 'false',
+        'vcs.repo_resolution_cache_check_interval': '0',
+    }) == {'enabled': False, 'check_interval': 0}
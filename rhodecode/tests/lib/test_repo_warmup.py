@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import mock
+import pytest
+
+from rhodecode.lib import repo_warmup
+
+
+class FakeRegion(object):
+    actual_backend = None
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture()
+def region():
+    region = FakeRegion()
+    with mock.patch.object(repo_warmup, '_get_region', return_value=region):
+        yield region
+
+
+@pytest.fixture()
+def warmup_task():
+    repo = mock.Mock(repo_id=7)
+    with mock.patch('rhodecode.CELERY_ENABLED', True), \
+            mock.patch('rhodecode.model.db.Repository.get_by_repo_name',
+                       return_value=repo), \
+            mock.patch('rhodecode.lib.celerylib.tasks.warm_repo_caches') as task:
+        yield task
+
+
+def test_schedule_warmup(region, warmup_task):
+    token = repo_warmup.schedule_warmup('repo')
+
+    warmup_task.apply_async.assert_called_once_with(
+        args=(7, token), countdown=5)
+    assert repo_warmup.claim_warmup(7, token)
+    # claimed only once
+    assert not repo_warmup.claim_warmup(7, token)
+
+
+def test_burst_of_pushes_is_warmed_up_once(region, warmup_task):
+    tokens = [repo_warmup.schedule_warmup('repo') for _ in range(3)]
+
+    assert warmup_task.apply_async.call_count == 3
+    claimed = [repo_warmup.claim_warmup(7, token) for token in tokens]
+    assert claimed == [False, False, True]
+
+
+def test_warmups_of_repos_sharing_a_keyspace_are_independent(
+        region, warmup_task):
+    repos = {'repo-a': mock.Mock(repo_id=7), 'repo-b': mock.Mock(repo_id=8)}
+    with mock.patch('rhodecode.model.db.Repository.get_by_repo_name',
+                    side_effect=repos.get):
+        token_a = repo_warmup.schedule_warmup('repo-a')
+        token_b = repo_warmup.schedule_warmup('repo-b')
+
+    # the region fixture is shared by all repos, like a redis backend
+    assert repo_warmup.claim_warmup(7, token_a)
+    assert repo_warmup.claim_warmup(8, token_b)
+
+
+@pytest.mark.parametrize('celery_enabled, config', [
+    (False, {}),
+    (True, {'vcs.post_push_warmup': 'false'}),
+])
+def test_schedule_warmup_disabled(region, warmup_task, celery_enabled, config):
+    with mock.patch('rhodecode.CELERY_ENABLED', celery_enabled), \
+            mock.patch('rhodecode.CONFIG', config):
+        assert repo_warmup.schedule_warmup('repo') is None
+    assert not warmup_task.apply_async.called
+    assert region.data == {}
+
+
+def test_schedule_warmup_failure_doesnt_raise(region, warmup_task):
+    warmup_task.apply_async.side_effect = IOError('broker down')
+    assert repo_warmup.schedule_warmup('repo') is None
+
+
+def test_failing_warmup_task_doesnt_stop_others():
+    calls = []
+
+    class Failing(repo_warmup.WarmupTask):
+        human_name = 'failing'
+
+        def run(self):
+            raise Exception('vcsserver down')
+
+    class Working(repo_warmup.WarmupTask):
+        human_name = 'working'
+
+        def run(self):
+            calls.append((self.db_repo, self.request, self.rc_config))
+
+    repo = mock.Mock(repo_name='repo')
+    warmup = repo_warmup.RepoWarmup()
+    warmup.tasks = [Failing, Working]
+    with mock.patch('rhodecode.model.settings.SettingsModel') as settings:
+        settings().get_all_settings.return_value = {'key': 'value'}
+        executed = warmup.execute(repo, mock.sentinel.request)
+
+    assert executed == ['working']
+    assert calls == [(repo, mock.sentinel.request, {'key': 'value'})]
+
+
+def test_warmup_settings():
+    assert repo_warmup.get_warmup_settings({}) == {
+        'enabled': True, 'delay': 5}
+    assert repo_warmup.get_warmup_settings({
+        'vcs.post_push_warmup': 'false',
+        'vcs.post_push_warmup_delay': '30',
+    }) == {'enabled': False, 'delay': 30}
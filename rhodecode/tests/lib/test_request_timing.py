@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import mock
+import pytest
+
+from rhodecode.lib import request_timing
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def timing():
+    environ = {}
+    timing = request_timing.start_timing(environ, 'git', 'POST /repo')
+    timing._clock = FakeClock()
+    timing.start = timing._clock()
+    yield timing
+    request_timing.finish_timing(environ)
+
+
+def test_spans_are_summed_up_by_name(timing):
+    for duration in [1.0, 2.0]:
+        with timing.span('auth'):
+            timing._clock.now += duration
+    with timing.span('vcsserver'):
+        timing._clock.now += 0.5
+
+    assert timing.totals().items() == [
+        ('auth', (2, 3.0)),
+        ('vcsserver', (1, 0.5)),
+    ]
+    assert timing.format_spans() == 'auth=3.0000s(2), vcsserver=0.5000s(1)'
+
+
+def test_timing_span_uses_environ_or_thread_local(timing):
+    with request_timing.timing_span('check_permission', {
+            request_timing.ENVIRON_KEY: timing}):
+        pass
+    # code without access to environ, like the vcsserver client
+    with request_timing.timing_span('remote_call.branches'):
+        pass
+    assert timing.totals().keys() == ['check_permission', 'remote_call.branches']
+
+
+def test_timing_span_without_timing_is_noop():
+    environ = {}
+    with request_timing.timing_span('auth', environ):
+        pass
+    assert environ == {}
+
+
+def test_report_timing_sends_statsd_timers_in_ms(timing):
+    with timing.span('auth'):
+        timing._clock.now += 0.25
+    timing._clock.now += 0.75
+
+    statsd = mock.Mock()
+    request_timing.report_timing(timing, statsd=statsd)
+    statsd.timing.assert_has_calls([
+        mock.call('rhodecode.vcs.git.total', 1000.0),
+        mock.call('rhodecode.vcs.git.auth', 250.0),
+    ])
+
+
+@pytest.mark.parametrize('threshold, logged', [
+    (0, False),
+    (0.5, True),
+    (2.0, False),
+])
+def test_report_timing_slow_request_log(timing, threshold, logged):
+    timing._clock.now += 1.0
+    with mock.patch.object(request_timing.log, 'warning') as warning:
+        request_timing.report_timing(timing, slow_threshold=threshold)
+    assert warning.called == logged
+
+
+def test_get_slow_request_threshold():
+    assert request_timing.get_slow_request_threshold({}) == 0
+    assert request_timing.get_slow_request_threshold(
+        {'vcs.slow_request_threshold_ms': '1500'}) == 1.5
+
+
+def test_timed_response_finishes_timing_on_close():
+    environ = {}
+    request_timing.start_timing(environ, 'hg')
+    response = mock.MagicMock()
+    response.__iter__.return_value = iter(['a', 'b'])
+
+    timed_response = request_timing.TimedResponse(response, environ)
+    with mock.patch.object(request_timing, 'report_timing') as report, \
+            mock.patch.object(
+                request_timing, 'client_from_config', return_value=None):
+        assert list(timed_response) == ['a', 'b']
+        assert not report.called
+        timed_response.close()
+
+    assert report.called
+    assert response.close.called
+    assert request_timing.ENVIRON_KEY not in environ
+    assert request_timing.get_timing() is None
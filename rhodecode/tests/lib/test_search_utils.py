@@ -98,3 +98,57 @@ def test_get_matching_line_offsets_using_markers():
                                                markers=['__1__(.*?)__2__'])
     assert total_lines == 6
     assert matched_offsets == {3: [(5, 19)], 6: [(0, 14)]}
+
+
+@pytest.mark.parametrize('test_text, expected_output', [
+    ('', ([0], 0)),
+    ('one', ([0, 3], 1)),
+    ('one\n', ([0, 4], 1)),
+    ('one\ntwo', ([0, 4, 7], 2)),
+    ('one\r\ntwo\rthree\n\n', ([0, 5, 9, 15, 16], 4)),
+    (u'one\ntwo\x0bthree', ([0, 4, 8, 13], 3)),
+    ('one\x0btwo', ([0, 7], 1)),
+])
+def test_get_line_starts(test_text, expected_output):
+    starts, total_lines = search_utils.get_line_starts(test_text)
+    assert (list(starts), total_lines) == expected_output
+    assert total_lines == len(test_text.splitlines())
+
+
+@pytest.mark.parametrize('test_text, terms, expected_output', [
+    ('', 'text', (0, {})),
+    ('text\n', 'text', (1, {1: [(0, 4)]})),
+    ('a text\r\nsome text\r\n', 'text', (2, {1: [(2, 6)], 2: [(5, 9)]})),
+    ('some\ntext', '"some text"', (2, {})),
+    ('Some-Text\nsome text', '"some text" text',
+     (2, {1: [(0, 9), (5, 9)], 2: [(0, 9), (5, 9)]})),
+    (u'zażółć text\u2028text', 'text', (2, {1: [(7, 11)], 2: [(0, 4)]})),
+    ('text', '""', (1, {})),
+])
+def test_get_matching_line_offsets_line_breaks(
+        test_text, terms, expected_output):
+    assert search_utils.get_matching_line_offsets(
+        test_text, terms=terms) == expected_output
+
+
+def test_get_matching_line_offsets_markers_across_lines():
+    text = 'a __1__text\r__1__b__2__\nc __1__d__2__'
+    total_lines, matched_offsets = search_utils.get_matching_line_offsets(
+        text, terms=None, markers=['__1__(.*?)__2__'])
+    assert total_lines == 3
+    assert matched_offsets == {2: [(0, 11)], 3: [(2, 13)]}
+
+
+def test_get_lines_of_interest():
+    matching_lines = {40: [(0, 1)], 3: [(0, 1)], 20: [(0, 1)]}
+    lines, shown = search_utils.get_lines_of_interest(
+        matching_lines, 41, max_lines=10, line_context=3)
+    assert shown == 2
+    assert lines == set(range(0, 6)) | set(range(17, 23))
+
+
+def test_get_lines_of_interest_end_of_file():
+    lines, shown = search_utils.get_lines_of_interest(
+        {1: [(0, 1)], 5: [(0, 1)]}, 5, max_lines=10, line_context=2)
+    assert shown == 2
+    assert lines == {0, 1, 2, 3, 4, 5}
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+import os
+
+import mock
+import pytest
+
+from rhodecode.lib import shared_stats
+from rhodecode.lib.shared_stats import SharedStats, BUCKETS_MS, OTHER_ENDPOINT
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class LivePids(object):
+    def __init__(self, *pids):
+        self.pids = set(pids)
+
+    def __call__(self, pid):
+        return pid in self.pids
+
+
+@pytest.fixture()
+def live_pids():
+    return LivePids(os.getpid())
+
+
+@pytest.fixture()
+def stats_file(tmpdir):
+    return os.path.join(str(tmpdir), 'shared_stats', 'stats.mmap')
+
+
+@pytest.fixture()
+def make_stats(stats_file, live_pids):
+    created = []
+
+    def factory(**kwargs):
+        kwargs.setdefault('max_workers', 4)
+        kwargs.setdefault('max_endpoints', 3)
+        stats = SharedStats(
+            stats_file, clock=FakeClock(), pid_alive=live_pids, **kwargs)
+        created.append(stats)
+        return stats
+
+    yield factory
+    for stats in created:
+        stats.close()
+
+
+def test_request_counts(make_stats):
+    stats = make_stats()
+    stats.request_started()
+    stats.request_started()
+    stats.request_finished('home', 0.02)
+
+    data = stats.read()
+    assert data['totals']['requests'] == 1
+    assert data['totals']['in_flight'] == 1
+    assert data['totals']['errors'] == 0
+    assert data['totals']['workers'] == 1
+    assert data['workers'][0]['pid'] == os.getpid()
+
+    stats.request_finished('home', 0.3, error=True)
+    data = stats.read()
+    assert data['totals']['requests'] == 2
+    assert data['totals']['in_flight'] == 0
+    assert data['totals']['errors'] == 1
+
+
+def test_endpoint_histogram(make_stats):
+    stats = make_stats()
+    for duration in [0.001, 0.005, 0.2, 60]:
+        stats.request_started()
+        stats.request_finished('repo_summary', duration)
+
+    endpoint = stats.read()['endpoints']['repo_summary']
+    histogram = dict(zip(stats.read()['buckets_ms'], endpoint['histogram']))
+    assert endpoint['count'] == 4
+    assert endpoint['avg_time'] == pytest.approx(60.206 / 4)
+    assert histogram[5] == 2
+    assert histogram[250] == 1
+    assert histogram['inf'] == 1
+    assert len(endpoint['histogram']) == len(BUCKETS_MS) + 1
+
+
+def test_endpoints_over_limit_are_counted_as_other(make_stats):
+    stats = make_stats(max_endpoints=3)
+    for name in ['a', 'b', 'c', 'd', 'a']:
+        stats.request_finished(name, 0.01)
+
+    endpoints = stats.read()['endpoints']
+    assert endpoints.keys() == ['a', 'b', OTHER_ENDPOINT]
+    assert endpoints['a']['count'] == 2
+    assert endpoints[OTHER_ENDPOINT]['count'] == 2
+
+
+def test_vcsserver_calls(make_stats):
+    stats = make_stats()
+    stats.vcsserver_call(0.5)
+    stats.vcsserver_call(0.25)
+
+    totals = stats.read()['totals']
+    assert totals['vcsserver_calls'] == 2
+    assert totals['vcsserver_time'] == 0.75
+
+
+def test_workers_are_aggregated(make_stats, live_pids):
+    worker, other_worker = make_stats(), make_stats()
+    worker.request_finished('home', 0.01)
+
+    live_pids.pids.add(1001)
+    with mock.patch('os.getpid', return_value=1001):
+        other_worker.request_finished('home', 0.01)
+
+    data = make_stats().read()
+    assert data['totals']['workers'] == 2
+    assert data['totals']['requests'] == 2
+    assert data['endpoints']['home']['count'] == 2
+    assert sorted(w['pid'] for w in data['workers']) == sorted(
+        [os.getpid(), 1001])
+
+
+def test_forked_worker_claims_new_slot(make_stats, live_pids):
+    stats = make_stats()
+    stats.request_finished('home', 0.01)
+
+    live_pids.pids.add(1001)
+    with mock.patch('os.getpid', return_value=1001):
+        stats.request_finished('home', 0.01)
+
+    workers = dict((w['pid'], w) for w in stats.read()['workers'])
+    assert workers[os.getpid()]['requests'] == 1
+    assert workers[1001]['requests'] == 1
+
+
+def test_slots_of_dead_workers_are_reused(make_stats, live_pids):
+    live_pids.pids.add(1001)
+    with mock.patch('os.getpid', return_value=1001):
+        make_stats(max_workers=1).request_finished('home', 0.01)
+
+    # no free slot while the worker is alive
+    stats = make_stats(max_workers=1)
+    stats.request_finished('home', 0.01)
+    assert stats.read()['workers'][0]['pid'] == 1001
+
+    live_pids.pids.remove(1001)
+    stats = make_stats(max_workers=1)
+    stats.request_finished('summary', 0.01)
+
+    data = stats.read()
+    assert [w['pid'] for w in data['workers']] == [os.getpid()]
+    assert data['totals']['requests'] == 1
+    assert data['endpoints'].keys() == ['summary']
+
+
+@pytest.mark.parametrize('old_endpoints, new_endpoints', [
+    (3, 5),
+    (5, 1),
+])
+def test_file_is_replaced_on_layout_change(
+        make_stats, old_endpoints, new_endpoints):
+    old_stats = make_stats(max_endpoints=old_endpoints)
+    old_stats.request_finished('home', 0.01)
+
+    stats = make_stats(max_endpoints=new_endpoints)
+    assert stats.read()['totals']['requests'] == 0
+    assert os.path.getsize(stats.path) == stats.size
+    assert len(os.listdir(os.path.dirname(stats.path))) == 1
+
+    # workers of the previous layout keep using their own file
+    old_stats.request_finished('home', 0.01)
+    assert old_stats.read()['endpoints']['home']['count'] == 2
+    assert stats.read()['totals']['requests'] == 0
+
+
+def test_stats_settings():
+    settings = shared_stats.get_stats_settings(
+        {'cache_dir': '/tmp/cache', '__file__': '/etc/rhodecode.ini'})
+    assert settings['enabled']
+    assert settings['max_workers'] == 64
+    assert settings['file'].startswith('/tmp/cache/shared_stats/stats_')
+
+    settings = shared_stats.get_stats_settings({
+        'shared_stats.enabled': 'false',
+        'shared_stats.file': '/tmp/stats.mmap',
+        'shared_stats.max_endpoints': '8',
+    })
+    assert settings == {
+        'enabled': False, 'file': '/tmp/stats.mmap',
+        'max_workers': 64, 'max_endpoints': 8}
+
+
+def _wsgi_app(status, body=('ok',)):
+    def app(environ, start_response):
+        start_response(status, [('Content-Type', 'text/plain')])
+        return list(body)
+    return app
+
+
+@pytest.mark.parametrize('status, errors', [
+    ('200 OK', 0),
+    ('404 Not Found', 0),
+    ('500 Internal Server Error', 1),
+])
+def test_middleware_records_request_when_response_is_closed(
+        make_stats, status, errors):
+    stats = make_stats()
+    app = shared_stats.SharedStatsMiddleware(_wsgi_app(status), 'vcs.git')
+    start_response = mock.Mock()
+
+    with mock.patch.object(shared_stats, 'get_shared_stats', return_value=stats):
+        response = app({}, start_response)
+        assert stats.read()['totals']['in_flight'] == 1
+        assert list(response) == ['ok']
+        response.close()
+
+    data = stats.read()
+    assert data['totals']['in_flight'] == 0
+    assert data['totals']['requests'] == 1
+    assert data['totals']['errors'] == errors
+    assert data['endpoints']['vcs.git']['count'] == 1
+    assert start_response.call_args[0][0] == status
+
+
+def test_middleware_records_failed_request(make_stats):
+    stats = make_stats()
+
+    def failing_app(environ, start_response):
+        raise ValueError('failed')
+
+    app = shared_stats.SharedStatsMiddleware(failing_app, 'vcs.hg')
+    with mock.patch.object(shared_stats, 'get_shared_stats', return_value=stats):
+        with pytest.raises(ValueError):
+            app({}, mock.Mock())
+
+    data = stats.read()
+    assert data['totals']['in_flight'] == 0
+    assert data['totals']['errors'] == 1
+    assert data['endpoints']['vcs.hg']['count'] == 1
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+LDAP authentication benchmark
+
+Compares authentications with and without the pool of service-bound LDAP
+connections, against an in-process fake directory which simulates network
+latencies of a remote LDAP server.
+
+Usage:
+
+    python ldap_auth_pool.py --auths=200 --connect-latency=0.02 --latency=0.005
+"""
+
+import time
+import argparse
+
+import mock
+
+import rhodecode
+from rhodecode.authentication.plugins import auth_ldap
+from rhodecode.tests.lib.auth_modules.fake_ldap import (
+    FakeDirectory, build_servers)
+
+
+def run(directory, auths, use_pool):
+    auth_ldap.clear_ldap_pools()
+    directory.stats.clear()
+
+    start = time.time()
+    for _ in range(auths):
+        aldap = auth_ldap.AuthLdap(**directory.ldap_args(use_pool=use_pool))
+        aldap.authenticate_ldap('alice', 'alice-pass')
+    total = time.time() - start
+
+    auth_ldap.clear_ldap_pools()
+    return total, dict(directory.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures LDAP authentication with and without pooling')
+    parser.add_argument('--auths', default=200, type=int,
+                        help='Number of authentications for each mode')
+    parser.add_argument('--connect-latency', default=0.02, type=float,
+                        help='Simulated seconds to open a connection')
+    parser.add_argument('--latency', default=0.005, type=float,
+                        help='Simulated seconds of each bind or search')
+    args = parser.parse_args()
+
+    directory = FakeDirectory(
+        users=[('alice', 'alice-pass')], latency=args.latency,
+        connect_latency=args.connect_latency)
+
+    patches = [
+        mock.patch.object(auth_ldap, 'ldap', directory.ldap_module()),
+        mock.patch.object(
+            auth_ldap.AuthLdap, '_build_servers', staticmethod(build_servers)),
+        mock.patch.object(rhodecode, 'CONFIG', {}),
+    ]
+    for patch in patches:
+        patch.start()
+    try:
+        results = {}
+        for use_pool in [False, True]:
+            results[use_pool] = run(directory, args.auths, use_pool)
+    finally:
+        for patch in reversed(patches):
+            patch.stop()
+
+    for use_pool, (total, stats) in sorted(results.items()):
+        print('{:8} per auth: {:.4f}s total: {:.4f}s operations: {}'.format(
+            'pooled' if use_pool else 'regular', total / args.auths, total,
+            ', '.join('{}={}'.format(k, v) for k, v in sorted(stats.items()))))
+
+    print('speedup: {:.2f}x'.format(results[False][0] / results[True][0]))
+
+
+if __name__ == '__main__':
+    main()
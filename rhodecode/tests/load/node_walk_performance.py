@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Node walk benchmark
+
+Compares ``FileNode`` objects, as created by ``commit.walk()``, with
+``LightFileNode`` objects from ``commit.get_light_filenodes()`` over a
+synthetic tree. It reports the time to create the nodes and to sum their
+sizes and extensions, like the repository stats do, and the memory of the
+nodes. Sizes come from an in memory commit, so only the cost of the node
+objects is measured, not the one of vcsserver calls.
+
+Usage:
+
+    python node_walk_performance.py --files=300000
+"""
+
+import argparse
+import random
+import sys
+import timeit
+
+from rhodecode.lib.vcs.nodes import FileNode, LightFileNode
+
+
+class SyntheticCommit(object):
+    short_id = 'synthetic'
+
+    def __init__(self, sizes):
+        self.sizes = sizes
+
+    def get_file_size(self, path):
+        return self.sizes[path]
+
+
+def build_sizes(count, seed=0):
+    rand = random.Random(seed)
+    dirs = ['src', 'docs', 'tests', 'lib', 'vendor', 'tools', 'config']
+    exts = ['py', 'js', 'rst', 'txt', 'css', 'html']
+    sizes = {}
+    for idx in range(count):
+        path = '/'.join(
+            rand.choice(dirs) for _ in range(rand.randint(1, 5)))
+        name = '{}/module_{}.{}'.format(path, idx, rand.choice(exts))
+        sizes[name] = rand.randint(0, 100000)
+    return sizes
+
+
+def make_file_nodes(commit):
+    return [FileNode(path, commit=commit) for path in commit.sizes]
+
+
+def make_light_nodes(commit):
+    # sizes are preloaded with the listing
+    return [LightFileNode(path, commit, size=size)
+            for path, size in commit.sizes.iteritems()]
+
+
+def summarize(nodes):
+    size = 0
+    extensions = {}
+    for node in nodes:
+        size += node.size
+        extensions[node.extension] = extensions.get(node.extension, 0) + 1
+    return size, extensions
+
+
+def nodes_memory(nodes):
+    total = 0
+    for node in nodes:
+        total += sys.getsizeof(node)
+        node_dict = getattr(node, '__dict__', None)
+        if node_dict is not None:
+            total += sys.getsizeof(node_dict)
+    return total
+
+
+def measure(make_nodes, commit, runs):
+    timings = timeit.repeat(
+        lambda: summarize(make_nodes(commit)), number=1, repeat=runs)
+    nodes = make_nodes(commit)
+    summarize(nodes)
+    return min(timings), nodes_memory(nodes)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures time and memory of nodes of tree walks')
+    parser.add_argument('--files', default=300000, type=int,
+                        help='Number of files in the synthetic tree')
+    parser.add_argument('--runs', default=3, type=int,
+                        help='Number of runs for each measurement')
+    args = parser.parse_args()
+
+    commit = SyntheticCommit(build_sizes(args.files))
+    print('{:15} {:>10} {:>12} {:>14}'.format(
+        'nodes', 'time', 'memory', 'bytes/node'))
+    for name, make_nodes in [('FileNode', make_file_nodes),
+                             ('LightFileNode', make_light_nodes)]:
+        duration, memory = measure(make_nodes, commit, args.runs)
+        print('{:15} {:>9.0f}ms {:>10.1f}MB {:>14}'.format(
+            name, duration * 1000, memory / 1024.0 / 1024,
+            memory // args.files))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+Response compression benchmark
+
+Without `--url` it compresses JSON payloads shaped like the file search
+nodes, refs and repositories grid of a large repository, and reports the
+size and the time to compress and to transfer them over a link of
+`--bandwidth` Mbit/s, for every zlib level and for precompressed bodies.
+
+With `--url` it fetches a live endpoint with and without compression, e.g.
+for the file search of a repository::
+
+    python response_compression.py \\
+        --url='http://localhost:10020/repo/nodelist/tip/?auth_token=...' \\
+        --header='X-Requested-With: XMLHttpRequest'
+
+Usage:
+
+    python response_compression.py --files=100000 --bandwidth=20
+"""
+
+import argparse
+import json
+import random
+import timeit
+import urllib2
+
+from rhodecode.lib.middleware.response_compression import (
+    PRECOMPRESSED_LEVEL, compress, iter_compressed)
+
+LEVELS = [1, 5, 9]
+CHUNK_SIZE = 64 * 1024
+
+
+def build_nodes(count, seed=0):
+    rand = random.Random(seed)
+    dirs = ['src', 'docs', 'tests', 'lib', 'vendor', 'tools', 'config']
+    nodes = []
+    for idx in range(count):
+        path = '/'.join(
+            rand.choice(dirs) for _ in range(rand.randint(1, 5)))
+        nodes.append({
+            'name': '{}/module_{}.py'.format(path, idx), 'type': 'file'})
+    return {'nodes': nodes}
+
+
+def build_refs(count, seed=0):
+    rand = random.Random(seed)
+    results = []
+    for idx in range(count):
+        commit_id = '%040x' % rand.getrandbits(160)
+        results.append({
+            'id': 'feature/branch-{}'.format(idx), 'text': 'feature/branch-{}'.format(idx),
+            'raw_id': commit_id, 'type': 'branch', 'idx': 0, 'at': 'feature/branch-{}'.format(idx),
+            'files_url': '/repo/files/{}/?at=feature/branch-{}'.format(commit_id, idx)})
+    return {'more': False, 'results': [{'text': 'Branches', 'children': results}]}
+
+
+def build_repos(count, seed=0):
+    rand = random.Random(seed)
+    data = []
+    for idx in range(count):
+        data.append({
+            'name': '<a href="/group/repo-{0}">group/repo-{0}</a>'.format(idx),
+            'desc': 'Repository number {} of the group'.format(idx),
+            'last_change': '<span class="tooltip" title="2020-0{}-01">months ago</span>'.format(
+                rand.randint(1, 9)),
+            'last_changeset': '<div class="changeset">r{}:{}</div>'.format(
+                idx, '%012x' % rand.getrandbits(48)),
+            'owner': '<div class="rc-user">admin</div>', 'state': 'repo_state_created'})
+    return {'data': data, 'draw': 1, 'recordsTotal': count, 'recordsFiltered': count}
+
+
+def measure(body, level, runs):
+    timings = timeit.repeat(
+        lambda: compress(body, 'gzip', level), number=1, repeat=runs)
+    return len(compress(body, 'gzip', level)), min(timings)
+
+
+def measure_streamed(body, level, runs):
+    chunks = [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+    timings = timeit.repeat(
+        lambda: ''.join(iter_compressed(chunks, 'gzip', level)),
+        number=1, repeat=runs)
+    return min(timings)
+
+
+def transfer_time(size, bandwidth):
+    return size * 8 / (bandwidth * 10 ** 6)
+
+
+def run_payloads(args):
+    payloads = [
+        ('nodelist', build_nodes(args.files)),
+        ('refs', build_refs(args.refs)),
+        ('repos grid', build_repos(args.repos)),
+    ]
+    print('{:12} {:>9} {:>11} {:>10} {:>10} {:>10}'.format(
+        'payload', 'level', 'bytes', 'compress', 'transfer', 'total'))
+    for name, data in payloads:
+        body = json.dumps(data)
+        plain = transfer_time(len(body), args.bandwidth)
+        print('{:12} {:>9} {:>11} {:>9.1f}ms {:>9.1f}ms {:>9.1f}ms'.format(
+            name, 'none', len(body), 0, plain * 1000, plain * 1000))
+
+        for level in LEVELS:
+            size, compress_time = measure(body, level, args.runs)
+            transfer = transfer_time(size, args.bandwidth)
+            print('{:12} {:>9} {:>11} {:>9.1f}ms {:>9.1f}ms {:>9.1f}ms'.format(
+                name, level, size, compress_time * 1000, transfer * 1000,
+                (compress_time + transfer) * 1000))
+
+        size, _compress_time = measure(body, PRECOMPRESSED_LEVEL, 1)
+        transfer = transfer_time(size, args.bandwidth)
+        print('{:12} {:>9} {:>11} {:>9.1f}ms {:>9.1f}ms {:>9.1f}ms'.format(
+            name, 'cached', size, 0, transfer * 1000, transfer * 1000))
+
+        streamed = measure_streamed(body, args.level, args.runs)
+        print('{:12} {:>9} {:>11} {:>9.1f}ms'.format(
+            name, 'stream-{}'.format(args.level), '', streamed * 1000))
+
+
+def fetch(url, headers, accept_encoding):
+    request = urllib2.Request(url)
+    for header in headers:
+        key, value = header.split(':', 1)
+        request.add_header(key.strip(), value.strip())
+    if accept_encoding:
+        request.add_header('Accept-Encoding', accept_encoding)
+
+    start = timeit.default_timer()
+    response = urllib2.urlopen(request)
+    body = response.read()
+    total = timeit.default_timer() - start
+    return len(body), response.info().get('Content-Encoding'), total
+
+
+def run_url(args):
+    for accept_encoding in [None, 'gzip']:
+        results = [fetch(args.url, args.header, accept_encoding)
+                   for _ in range(args.runs)]
+        size, encoding, _total = results[-1]
+        print('{:10} bytes: {:>10} encoding: {:8} best: {:.1f}ms'.format(
+            accept_encoding or 'identity', size, encoding or '-',
+            min(r[2] for r in results) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures bytes and latency of compressed JSON responses')
+    parser.add_argument('--files', default=100000, type=int,
+                        help='Number of files in the nodelist payload')
+    parser.add_argument('--refs', default=5000, type=int,
+                        help='Number of branches in the refs payload')
+    parser.add_argument('--repos', default=5000, type=int,
+                        help='Number of rows in the repositories grid payload')
+    parser.add_argument('--level', default=5, type=int,
+                        help='Level used for streamed compression')
+    parser.add_argument('--bandwidth', default=20.0, type=float,
+                        help='Client bandwidth in Mbit/s')
+    parser.add_argument('--runs', default=5, type=int,
+                        help='Number of runs for each measurement')
+    parser.add_argument('--url', default=None,
+                        help='Measure a live endpoint instead of sample payloads')
+    parser.add_argument('--header', default=[], action='append',
+                        help='Extra header of the --url requests, `Key: value`')
+    args = parser.parse_args()
+
+    if args.url:
+        run_url(args)
+    else:
+        run_payloads(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+
+"""
+Search highlight benchmark
+
+Compares the per line matching of search results, as done before for every
+result on the search page, with ``get_matching_line_offsets`` which matches
+a whole file in a single pass, on large synthetic files. Both are checked to
+return the same offsets.
+
+Usage:
+
+    python search_highlight_performance.py --lines=200000 --hits=20
+"""
+
+import argparse
+import random
+import timeit
+
+from rhodecode.lib.index.search_utils import (
+    HL_BEG_MARKER, HL_END_MARKER, HL_MARKER_RE, extract_phrases,
+    get_matching_line_offsets, get_matching_markers_offsets,
+    get_matching_phrase_offsets, normalize_text_for_matching)
+
+TERM = 'needle'
+
+
+def per_line_offsets(text, terms=None, markers=None):
+    matching_lines = {}
+    line_index = 0
+    if terms:
+        phrases = [normalize_text_for_matching(phrase)
+                   for phrase in extract_phrases(terms)]
+        for line_index, line in enumerate(text.splitlines(), start=1):
+            match_offsets = get_matching_phrase_offsets(
+                normalize_text_for_matching(line), phrases)
+            if match_offsets:
+                matching_lines[line_index] = match_offsets
+    else:
+        markers = markers or [HL_MARKER_RE]
+        for line_index, line in enumerate(text.splitlines(), start=1):
+            match_offsets = get_matching_markers_offsets(line, markers=markers)
+            if match_offsets:
+                matching_lines[line_index] = match_offsets
+    return line_index, matching_lines
+
+
+def build_text(line_count, hits, marked, seed=0):
+    rand = random.Random(seed)
+    words = ['def', 'return', 'self', 'value', 'import', 'class', 'data',
+             'for', 'in', 'if', 'else', '(', ')', ':', '=', '+', 'None']
+    hit_lines = set(rand.sample(range(line_count), min(hits, line_count)))
+    lines = []
+    for idx in range(line_count):
+        line = [rand.choice(words) for _ in range(rand.randint(0, 12))]
+        if idx in hit_lines:
+            term = TERM
+            if marked:
+                term = HL_BEG_MARKER + TERM + HL_END_MARKER
+            line.insert(rand.randint(0, len(line)), term)
+        lines.append('    ' * rand.randint(0, 3) + ' '.join(line))
+    return u'\n'.join(lines)
+
+
+def measure(func, runs):
+    return min(timeit.repeat(func, number=1, repeat=runs))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures matching of search results in large files')
+    parser.add_argument('--lines', default=200000, type=int,
+                        help='Number of lines of the synthetic file')
+    parser.add_argument('--hits', default=20, type=int,
+                        help='Number of lines with a match')
+    parser.add_argument('--runs', default=3, type=int,
+                        help='Number of runs for each measurement')
+    args = parser.parse_args()
+
+    print('{:10} {:>12} {:>12} {:>10}'.format(
+        'mode', 'per line', 'single pass', 'speedup'))
+    for mode, marked in [('terms', False), ('markers', True)]:
+        text = build_text(args.lines, args.hits, marked)
+        terms = None if marked else TERM
+        expected = per_line_offsets(text, terms)
+        assert get_matching_line_offsets(text, terms) == expected
+
+        per_line = measure(lambda: per_line_offsets(text, terms), args.runs)
+        single_pass = measure(
+            lambda: get_matching_line_offsets(text, terms), args.runs)
+        print('{:10} {:>10.0f}ms {:>10.0f}ms {:>9.1f}x'.format(
+            mode, per_line * 1000, single_pass * 1000,
+            per_line / single_pass))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+SSH wrapper startup time measurement tool
+
+Compares the startup of the regular `rc-ssh-wrapper` with the `--slim` mode.
+Each run executes the wrapper in `test` mode, which bootstraps the environment,
+queries the database and exits without starting any VCS tunnel.
+
+Usage:
+
+    python ssh_wrapper_startup.py \
+        --ini=/path/to/rhodecode.ini \
+        --wrapper=rc-ssh-wrapper --user-id=2 --runs=20
+"""
+
+import argparse
+import os
+import subprocess32
+import time
+
+
+def mean(container):
+    """Return the mean of the container."""
+    if not container:
+        return -1.0
+    return sum(container) / len(container)
+
+
+def run_wrapper(args, slim):
+    command = [args.wrapper, args.ini, '--mode=test',
+               '--user-id={}'.format(args.user_id), '--key-id=0']
+    if slim:
+        command.append('--slim')
+
+    env = os.environ.copy()
+    env['SSH_CONNECTION'] = '127.0.0.1 22 127.0.0.1 22'
+    env['SSH_ORIGINAL_COMMAND'] = ''
+
+    start = time.time()
+    subprocess32.call(
+        command, env=env, stdout=subprocess32.PIPE, stderr=subprocess32.PIPE)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures startup time of the ssh wrapper')
+    parser.add_argument('--ini', required=True, help='RhodeCode .ini file')
+    parser.add_argument('--wrapper', default='rc-ssh-wrapper',
+                        help='Path to the rc-ssh-wrapper executable')
+    parser.add_argument('--user-id', default=2, type=int,
+                        help='ID of the user to run the wrapper for')
+    parser.add_argument('--runs', default=10, type=int,
+                        help='Number of runs for each mode')
+    args = parser.parse_args()
+
+    results = {}
+    for slim in [False, True]:
+        # one warm-up run to fill OS file caches and .pyc files
+        run_wrapper(args, slim)
+        results[slim] = [run_wrapper(args, slim) for _ in range(args.runs)]
+
+    for slim, timings in sorted(results.items()):
+        print('{:8} mean: {:.4f}s min: {:.4f}s max: {:.4f}s'.format(
+            'slim' if slim else 'regular',
+            mean(timings), min(timings), max(timings)))
+
+    print('speedup: {:.2f}x'.format(mean(results[False]) / mean(results[True])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2010-2020 RhodeCode GmbH
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License, version 3
+# (only), as published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# This program is dual-licensed. If you wish to learn more about the
+# RhodeCode Enterprise Edition, including its added features, Support services,
+# and proprietary license terms, please see https://rhodecode.com/licenses/
+
+"""
+VCS request detection micro-benchmark
+
+Runs the request classifier over a mix of UI, static, API and VCS requests,
+and compares it with the previous detection, which re-built its lookup
+tables, split the whole path, ran the git regex and logged every single
+protocol check for every request. Debug logging is disabled, like in
+production setups.
+
+Usage:
+
+    python vcs_request_detection.py --requests=200000
+"""
+
+import argparse
+import logging
+import random
+import timeit
+import urlparse
+
+import rhodecode
+from rhodecode.lib.middleware import vcs
+from rhodecode.lib.middleware.simplegit import GIT_PROTO_PAT
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ['hg', 'git', 'svn']
+
+# (weight, environ) of a realistic mix of traffic
+TRAFFIC = [
+    (30, {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/_static/rhodecode/css/style.css'}),
+    (10, {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/_static/rhodecode/js/scripts.min.js'}),
+    (15, {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/group/sub-group/repo/changelog'}),
+    (10, {'REQUEST_METHOD': 'GET', 'QUERY_STRING': 'at=master',
+          'PATH_INFO': '/group/repo/files/5a2a2b4e1f0d9c2d1a8c3b6e4f5a6b7c8d9e0f1a'
+                       '/docs/api/reference/very/deep/path/to/a/file.rst'}),
+    (5, {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}),
+    (5, {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/_admin/ops/ping'}),
+    (5, {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/_admin/api'}),
+    (5, {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/_admin/notifications'}),
+    (6, {'REQUEST_METHOD': 'GET', 'QUERY_STRING': 'service=git-upload-pack',
+         'PATH_INFO': '/group/repo/info/refs'}),
+    (3, {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/group/repo/git-upload-pack'}),
+    (3, {'REQUEST_METHOD': 'GET', 'QUERY_STRING': 'cmd=capabilities',
+         'HTTP_ACCEPT': 'application/mercurial-0.1', 'PATH_INFO': '/hg-repo'}),
+    (3, {'REQUEST_METHOD': 'PROPFIND', 'PATH_INFO': '/svn-repo/trunk',
+         'HTTP_DAV': 'http://subversion.tigris.org/xmlns/dav/svn/depth'}),
+]
+
+
+def legacy_is_git(environ):
+    is_git_path = GIT_PROTO_PAT.match(environ['PATH_INFO'])
+    log.debug(
+        'request path: `%s` detected as GIT PROTOCOL %s', environ['PATH_INFO'],
+        is_git_path is not None)
+    return is_git_path
+
+
+def legacy_is_hg(environ):
+    is_hg_path = False
+    http_accept = environ.get('HTTP_ACCEPT')
+    if http_accept and http_accept.startswith('application/mercurial'):
+        query = urlparse.parse_qs(environ['QUERY_STRING'])
+        if 'cmd' in query:
+            is_hg_path = True
+    log.debug(
+        'request path: `%s` detected as HG PROTOCOL %s', environ['PATH_INFO'],
+        is_hg_path)
+    return is_hg_path
+
+
+def legacy_is_svn(environ):
+    http_dav = environ.get('HTTP_DAV', '')
+    magic_path_segment = rhodecode.CONFIG.get(
+        'rhodecode_subversion_magic_path', '/!svn')
+    is_svn_path = (
+        'subversion' in http_dav or
+        magic_path_segment in environ['PATH_INFO']
+        or environ['REQUEST_METHOD'] in ['PROPFIND', 'PROPPATCH'])
+    log.debug(
+        'request path: `%s` detected as SVN PROTOCOL %s', environ['PATH_INFO'],
+        is_svn_path)
+    return is_svn_path
+
+
+def legacy_detect_vcs_request(environ, backends):
+    checks = {
+        'hg': legacy_is_hg,
+        'git': legacy_is_git,
+        'svn': legacy_is_svn,
+    }
+    white_list = [
+        '_file_store', '_static', '_admin/ops/ping', '_admin/ops/status',
+        '_admin/channelstream/connect',
+    ]
+    path_info = environ['PATH_INFO']
+    path_elem = vcs.get_path_elem(path_info)
+    if path_elem in white_list:
+        log.debug('path `%s` in whitelist, skipping...', path_info)
+        return None
+    if path_info.lstrip('/') in white_list:
+        log.debug('full url path `%s` in whitelist, skipping...', path_info)
+        return None
+    log.debug('request start: checking if request for `%s` is of VCS type '
+              'in order: %s', path_elem, backends)
+    for vcs_type in backends:
+        if checks[vcs_type](environ):
+            return vcs_type
+    return None
+
+
+def build_requests(count, seed=0):
+    rand = random.Random(seed)
+    population = []
+    for weight, environ in TRAFFIC:
+        population.extend([environ] * weight)
+    return [rand.choice(population) for _ in range(count)]
+
+
+def run_legacy(requests):
+    for environ in requests:
+        legacy_detect_vcs_request(dict(environ), BACKENDS)
+
+
+def run_classifier(requests):
+    classifier = vcs.get_request_classifier(BACKENDS)
+    for environ in requests:
+        classifier.classify(dict(environ))
+
+
+def check_results(requests):
+    classifier = vcs.get_request_classifier(BACKENDS)
+    for environ in requests:
+        _kind, vcs_type = classifier.classify(dict(environ))
+        legacy = legacy_detect_vcs_request(dict(environ), BACKENDS)
+        assert (legacy or vcs.VCS_TYPE_SKIP) == vcs_type, environ
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measures VCS request detection on mixed traffic')
+    parser.add_argument('--requests', default=100000, type=int,
+                        help='Number of requests in the traffic sample')
+    parser.add_argument('--runs', default=5, type=int,
+                        help='Number of runs for each implementation')
+    args = parser.parse_args()
+
+    requests = build_requests(args.requests)
+    check_results(requests[:1000])
+
+    results = {}
+    for name, func in [('legacy', run_legacy), ('classifier', run_classifier)]:
+        timings = timeit.repeat(
+            lambda: func(requests), number=1, repeat=args.runs)
+        results[name] = min(timings)
+        print('{:10} best: {:.4f}s {:.2f}us/request'.format(
+            name, results[name], results[name] / len(requests) * 10 ** 6))
+
+    print('speedup: {:.2f}x'.format(results['legacy'] / results['classifier']))
+
+
+if __name__ == '__main__':
+    main()
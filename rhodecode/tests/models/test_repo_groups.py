@@ -221,3 +221,26 @@ class TestRepoGroups(object):
         assert g2.full_path == 'X1_NEW/X1_PRIM/X2'
         assert g3.full_path == 'X1_NEW/X1_PRIM/X2/X3'
         assert r.repo_name == 'X1_NEW/X1_PRIM/X2/X3/X3_REPO'
+
+    def test_update_commit_cache_of_nested_groups(self):
+        g1 = fixture.create_repo_group('C1')
+        g2 = fixture.create_repo_group('C1/C2')
+        g3 = fixture.create_repo_group('C1/C2/C3')
+
+        r = fixture.create_repo('C1/C2/C3/C3_REPO', repo_group=g3.group_id)
+        r.changeset_cache = {
+            'raw_id': 'a' * 40, 'revision': 1, 'date': '2020-01-01T10:00:00'}
+        Session().add(r)
+        Session().commit()
+        repo_id = r.repo_id
+        group_ids = [g3.group_id, g2.group_id, g1.group_id]
+
+        # parents are passed first, but computed after their children
+        updated = RepoGroupModel.update_commit_cache(repo_groups=[g1, g2, g3])
+
+        assert updated == group_ids
+        Session().expire_all()
+        for group_id in group_ids:
+            cs_cache = RepoGroup.get(group_id).changeset_cache
+            assert cs_cache['raw_id'] == 'a' * 40
+            assert cs_cache['source_repo_id'] == repo_id
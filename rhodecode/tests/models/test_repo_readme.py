@@ -18,8 +18,12 @@
 # RhodeCode Enterprise Edition, including its added features, Support services,
 # and proprietary license terms, please see https://rhodecode.com/licenses/
 
+import mock
 import pytest
+from dogpile.cache import make_region
 
+from rhodecode.apps._base import render_readme
+from rhodecode.lib.markup_renderer import MarkupRenderer
 from rhodecode.lib.vcs import nodes
 from rhodecode.model.repo import ReadmeFinder
 
@@ -104,3 +108,33 @@ def test_prefers_subdirectory_with_priority(commit_util):
     finder = ReadmeFinder()
     filenode = finder.search(commit)
     assert filenode.path == 'Doc/Readme.rst'
+
+
+def test_render_readme_is_cached_by_content(commit_util):
+    rendered = []
+
+    def plain(source):
+        rendered.append(source)
+        return u'<p>{}</p>'.format(len(rendered))
+
+    region = make_region().configure('dogpile.cache.memory')
+    commit = commit_util.commit_with_files(['README'])
+    fork_commit = commit_util.commit_with_files(['README', 'LIESMICH'])
+    changed_commit = commit_util.vcsbackend.create_repo(commits=[
+        {'message': 'Adding a readme',
+         'added': [nodes.FileNode('README', content='Changed')]},
+    ]).get_commit()
+
+    with mock.patch('rhodecode.lib.rc_cache.get_or_create_region',
+                    return_value=region), \
+            mock.patch.object(MarkupRenderer, 'get_renderer',
+                              return_value=plain):
+        html = render_readme(commit, commit.get_node('README'))
+        assert render_readme(
+            fork_commit, fork_commit.get_node('README')) == html
+        assert rendered == ['']
+
+        changed_html = render_readme(
+            changed_commit, changed_commit.get_node('README'))
+        assert changed_html != html
+        assert rendered == ['', 'Changed']
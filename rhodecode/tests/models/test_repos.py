@@ -26,6 +26,7 @@ import tempfile
 
 from rhodecode.lib.exceptions import AttachedForksError
 from rhodecode.lib.utils import make_db_config
+from rhodecode.lib.vcs.backends.base import EmptyCommit
 from rhodecode.model.db import Repository
 from rhodecode.model.meta import Session
 from rhodecode.model.repo import RepoModel
@@ -170,3 +171,32 @@ class TestRepoModel(object):
             repo.update_commit_cache(config=config)
             scm.assert_called_with(
                 cache=False, config=config)
+
+    def test_update_commit_cache_of_many_repos(self, backend):
+        repos = [backend.create_repo(number_of_commits=2),
+                 backend.create_repo()]
+        for repo in repos:
+            repo.update_commit_cache(cs_cache={'raw_id': '0'})
+        repo_ids = [repo.repo_id for repo in repos]
+
+        updated = RepoModel.update_commit_cache(
+            repositories=repos, workers=2, batch_size=1)
+
+        assert sorted(updated) == sorted(repo_ids)
+        Session().expire_all()
+        repo, empty_repo = [Repository.get(repo_id) for repo_id in repo_ids]
+        assert repo.changeset_cache['raw_id'] == \
+            repo.scm_instance().get_commit().raw_id
+        assert empty_repo.changeset_cache['raw_id'] == EmptyCommit().raw_id
+
+    def test_update_commit_cache_of_many_repos_skips_failed(self, backend):
+        repo = backend.create_repo(number_of_commits=1)
+        repo.update_commit_cache(cs_cache={'raw_id': '0'})
+        repo_id = repo.repo_id
+
+        with mock.patch.object(Repository, '_get_commit_cache_from_scm',
+                               side_effect=Exception('vcsserver down')):
+            assert RepoModel.update_commit_cache(repositories=[repo]) == []
+
+        Session().expire_all()
+        assert Repository.get(repo_id).changeset_cache['raw_id'] == '0'
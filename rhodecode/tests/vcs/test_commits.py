@@ -70,6 +70,83 @@ class TestCommitsInNonEmptyRepo(BackendTestMixin):
         result = list(self.tip.walk('file_0.txt'))
         assert result == []
 
+    def test_get_paths_matches_walk(self):
+        self.imc.add(FileNode('docs/api/index.txt', content='Docs\n'))
+        self.imc.add(FileNode('docs/readme.txt', content='Readme\n'))
+        commit = self.imc.commit(
+            message=u'Add docs', author=u'joe <joe@rhodecode.com>')
+
+        dir_paths, file_paths = commit.get_paths()
+
+        walked_dirs, walked_files = [], []
+        for __, dirs, files in commit.walk():
+            walked_dirs.extend(d.path for d in dirs)
+            walked_files.extend(f.path for f in files)
+        assert sorted(dir_paths) == sorted(walked_dirs) == [
+            'docs', 'docs/api']
+        assert sorted(file_paths) == sorted(walked_files)
+
+    @pytest.mark.parametrize('batch', [1, 256])
+    def test_get_path_commits_match_get_path_commit(self, batch):
+        self.imc.add(FileNode('docs/api/index.txt', content='Docs\n'))
+        self.imc.add(FileNode('docs/a[b].txt', content='Glob\n'))
+        self.imc.commit(message=u'Add docs', author=u'joe <joe@rhodecode.com>')
+        self.imc.change(FileNode('file_1.txt', content='Changed\n'))
+        commit = self.imc.commit(
+            message=u'Change file', author=u'joe <joe@rhodecode.com>')
+
+        paths = ['file_0.txt', 'file_1.txt', 'file_4.txt',
+                 'docs/a[b].txt', 'docs/api/index.txt']
+        commit.PATH_COMMITS_BATCH = batch
+        path_commits = commit.get_path_commits(paths)
+
+        assert sorted(path_commits) == sorted(paths)
+        for path in paths:
+            assert path_commits[path].raw_id == \
+                commit.get_path_commit(path).raw_id
+        assert path_commits['file_1.txt'].raw_id == commit.raw_id
+
+    @pytest.mark.backends("git", "hg")
+    def test_get_file_id(self):
+        self.imc.change(FileNode('file_1.txt', content='Changed\n'))
+        commit = self.imc.commit(
+            message=u'Change file', author=u'joe <joe@rhodecode.com>')
+        parent = commit.parents[0]
+
+        file_id = commit.get_file_id('file_0.txt')
+        if self.repo.alias != 'git':
+            assert file_id is None
+            return
+        assert file_id == parent.get_file_id('file_0.txt')
+        assert commit.get_file_id('file_1.txt') != \
+            parent.get_file_id('file_1.txt')
+        # ids of listed nodes are kept, and match a lookup by path
+        listed = dict((node.path, commit.get_file_id(node.path))
+                      for node in commit.get_nodes(''))
+        fresh = self.repo.get_commit(commit.raw_id)
+        for path, listed_id in listed.items():
+            assert listed_id == fresh.get_file_id(path)
+
+    def test_light_filenodes_match_walk(self):
+        self.imc.add(FileNode('docs/api/index.txt', content='Docs\n'))
+        self.imc.add(FileNode('docs/readme.txt', content='Readme file\n'))
+        commit = self.imc.commit(
+            message=u'Add docs', author=u'joe <joe@rhodecode.com>')
+
+        walked = dict(
+            (f.path, (f.size, f.mode))
+            for f in commit.get_filenodes_generator())
+        light = dict(
+            (f.path, (f.size, f.mode))
+            for f in commit.get_light_filenodes(pre_load=['size']))
+        assert light == walked
+
+        assert sorted(
+            f.path for f in commit.get_light_filenodes('docs/api')) == [
+            'docs/api/index.txt']
+        assert list(commit.get_light_filenodes('docs/readme.txt')) == []
+        assert commit.get_node('docs').size == len('Docs\nReadme file\n')
+
     @pytest.mark.backends("git", "hg")
     def test_new_branch(self):
         self.imc.add(FileNode('docs/index.txt',
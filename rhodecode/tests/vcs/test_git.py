@@ -1171,6 +1171,55 @@ class TestDiscoverGitVersion(object):
         assert version == ''
 
 
+class TestChangedSubmodulePaths(object):
+    def test_lists_added_changed_and_removed_submodules(self):
+        repository = mock.MagicMock()
+        repository._remote.tree_changes.return_value = [
+            ((None, 'setup.py'), (None, 0o100644), (None, 'a1')),
+            ((None, 'added'), (None, 0o160000), (None, 'a2')),
+            (('changed', 'changed'), (0o100644, 0o160000), ('a3', 'a4')),
+            (('removed', None), (0o160000, None), ('a5', None)),
+        ]
+        commit = GitCommit(repository=repository, raw_id='abcdef12', idx=1)
+        commit.parents = [mock.Mock(raw_id='parent12')]
+
+        assert commit.changed_submodule_paths == ['added', 'changed', 'removed']
+        assert commit.added_paths == ['added', 'setup.py']
+        repository._remote.tree_changes.assert_called_once_with(
+            'parent12', 'abcdef12')
+
+
+class TestGetPathCommits(object):
+    def test_walks_common_directory_of_paths(self):
+        repository = mock.Mock()
+        paths = ['docs/file_{}.txt'.format(i) for i in range(10000)]
+        repository.run_git_command.return_value = (
+            '\x01' + 'a' * 40 + '\0\ndocs/file_1.txt\0docs/api/index.txt\0'
+            '\x01' + 'b' * 40 + '\0\n' + '\0'.join(paths) + '\0', '')
+        repository.get_commit.side_effect = \
+            lambda commit_id, pre_load: mock.Mock(raw_id=commit_id)
+        commit = GitCommit(repository=repository, raw_id='abcdef12', idx=1)
+
+        path_commits = commit.get_path_commits(paths + ['docs/api'])
+
+        cmd = repository.run_git_command.call_args[0][0]
+        assert cmd[cmd.index('--') + 1:] == ['docs']
+        assert path_commits['docs/file_1.txt'].raw_id == 'a' * 40
+        assert path_commits['docs/api'].raw_id == 'a' * 40
+        assert path_commits['docs/file_2.txt'].raw_id == 'b' * 40
+        assert len(path_commits) == 10001
+
+    def test_walks_whole_history_for_top_level_paths(self):
+        repository = mock.Mock()
+        repository.run_git_command.return_value = ('', '')
+        commit = GitCommit(repository=repository, raw_id='abcdef12', idx=1)
+
+        assert commit.get_path_commits(['setup.py', 'docs/index.rst']) == {}
+
+        cmd = repository.run_git_command.call_args[0][0]
+        assert cmd[-1] == '--'
+
+
 class TestGetSubmoduleUrl(object):
     def test_submodules_file_found(self):
         commit = GitCommit(repository=mock.Mock(), raw_id='abcdef12', idx=1)
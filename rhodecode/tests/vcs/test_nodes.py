@@ -20,10 +20,12 @@
 
 import stat
 
+import mock
 import pytest
 
 from rhodecode.lib.vcs.nodes import DirNode
 from rhodecode.lib.vcs.nodes import FileNode
+from rhodecode.lib.vcs.nodes import LightFileNode
 from rhodecode.lib.vcs.nodes import Node
 from rhodecode.lib.vcs.nodes import NodeError
 from rhodecode.lib.vcs.nodes import NodeKind
@@ -263,6 +265,59 @@ class TestNodeContent(object):
         assert tar_node.mimetype == 'application/x-tar'
 
 
+class TestLightFileNode(object):
+
+    def test_has_no_instance_dict(self):
+        node = LightFileNode('docs/index.rst', mock.Mock())
+        assert not hasattr(node, '__dict__')
+        with pytest.raises(AttributeError):
+            node.content = 'foo'
+
+    def test_path_attributes(self):
+        node = LightFileNode(u'docs/\u0142\xf3d\u017a.rst', mock.Mock())
+        assert node.path == 'docs/\xc5\x82\xc3\xb3d\xc5\xba.rst'
+        assert node.unicode_path == u'docs/\u0142\xf3d\u017a.rst'
+        assert node.name == u'\u0142\xf3d\u017a.rst'
+        assert node.extension == u'rst'
+        assert node.is_file()
+        assert not node.is_dir()
+
+    def test_preloaded_attributes_dont_call_commit(self):
+        commit = mock.Mock()
+        node = LightFileNode(
+            'setup.py', commit, mode=0100755, size=10, is_binary=False)
+        assert (node.mode, node.size, node.is_binary) == (0100755, 10, False)
+        assert commit.mock_calls == []
+
+    def test_attributes_are_fetched_once(self):
+        commit = mock.Mock()
+        commit.get_file_size.return_value = 42
+        node = LightFileNode('setup.py', commit)
+
+        assert node.size == 42
+        assert node.size == 42
+        commit.get_file_size.assert_called_once_with('setup.py')
+
+    def test_metadata_uncached(self):
+        commit = mock.Mock()
+        commit.get_file_content.return_value = 'foo\0bar'
+        node = LightFileNode('image.png', commit)
+
+        is_binary, md5, size, content = node.metadata_uncached()
+        assert is_binary
+        assert size == 7
+        assert content == 'foo\0bar'
+        assert md5 == node.md5
+
+    def test_get_file_node(self):
+        commit = mock.Mock()
+        node = LightFileNode('setup.py', commit, mode=0100755)
+        file_node = node.get_file_node()
+        assert isinstance(file_node, FileNode)
+        assert file_node.path == 'setup.py'
+        assert file_node.commit is commit
+
+
 @pytest.mark.usefixtures("vcs_repository_support")
 class TestNodesCommits(BackendTestMixin):
 
@@ -23,7 +23,7 @@ import logging
 from pyramid.httpexceptions import HTTPException, HTTPBadRequest
 
 from rhodecode.lib.middleware.vcs import (
-    detect_vcs_request, VCS_TYPE_KEY, VCS_TYPE_SKIP)
+    get_request_classifier, VCS_TYPE_SKIP)
 
 
 log = logging.getLogger(__name__)
@@ -36,20 +36,15 @@ def vcs_detection_tween_factory(handler, registry):
         Do detection of vcs type, and save results for other layers to re-use
         this information
         """
-        vcs_server_enabled = request.registry.settings.get('vcs.server.enable')
-        vcs_handler = vcs_server_enabled and detect_vcs_request(
-            request.environ, request.registry.settings.get('vcs.backends'))
+        settings = request.registry.settings
+        classifier = get_request_classifier(
+            settings.get('vcs.backends'), settings.get('rhodecode.api.url'))
+        _kind, vcs_type = classifier.classify(
+            request.environ, detect_vcs=settings.get('vcs.server.enable'))
 
-        if vcs_handler:
-            # save detected VCS type for later re-use
-            request.environ[VCS_TYPE_KEY] = vcs_handler.SCM
-            request.vcs_call = vcs_handler.SCM
-
-            log.debug('Processing request with `%s` handler', handler)
-            return handler(request)
-
-        # mark that we didn't detect an VCS, and we can skip detection later on
-        request.environ[VCS_TYPE_KEY] = VCS_TYPE_SKIP
+        if vcs_type != VCS_TYPE_SKIP:
+            # detected VCS type is saved in the environ for later re-use
+            request.vcs_call = vcs_type
 
         log.debug('Processing request with `%s` handler', handler)
         return handler(request)
@@ -116,6 +111,8 @@ def includeme(config):
                           'pyramid.events.ContextFound')
     config.add_tween('rhodecode.tweens.vcs_detection_tween_factory')
     config.add_tween('rhodecode.tweens.sanity_check_factory')
+    config.add_tween(
+        'rhodecode.lib.middleware.response_compression.ResponseCompressionTween')
 
     # This needs to be the LAST item
     config.add_tween('rhodecode.lib.middleware.request_wrapper.RequestWrapperTween')